@@ -0,0 +1,79 @@
+"""
+Archive Reprocess Benchmark
+Extraction and analysis throughput over a WARC archive of listing pages:
+no network, so the numbers depend on the CPU alone and repeat run to run
+"""
+
+import sys
+import os
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.archive_reprocess import reprocess_archives
+from core.extraction_spec import compile_spec, save_spec
+from core.warc_archive import WARCWriter
+
+SITE = 'https://shop.example.com'
+ITEMS_PER_PAGE = 40
+
+
+def listing_page(page):
+    items = ''.join(
+        f'<li class="product"><a href="/product/{page}-{i}">Product {page}-{i}</a>'
+        f'<span class="price">{(page * 7 + i) % 500}.99 EUR</span><p>Description of product {i}</p></li>'
+        for i in range(ITEMS_PER_PAGE)
+    )
+    return (f'<html><head><title>Catalogue page {page}</title></head><body><nav><a href="/">Home</a></nav>'
+            f'<h1>Catalogue</h1><ul class="items">{items}</ul>'
+            f'<a rel="next" href="/list?page={page + 1}">Next</a></body></html>').encode('utf-8')
+
+
+def build_archive(directory, pages):
+    """One response per listing page, as a crawl would have captured them"""
+    start = time.perf_counter()
+    with WARCWriter(directory, prefix='bench') as writer:
+        for page in range(1, pages + 1):
+            writer.write_exchange(f'{SITE}/list?page={page}', 200, {'Content-Type': 'text/html; charset=utf-8'},
+                                  listing_page(page))
+        stats = writer.metrics()
+    return stats, time.perf_counter() - start
+
+
+def run_benchmark(pages=400):
+    print("=" * 80)
+    print("ARCHIVE REPROCESS BENCHMARK")
+    print("=" * 80)
+
+    analysis = {
+        'metadata': {'url': f'{SITE}/list', 'domain': 'shop.example.com'},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }
+    with tempfile.TemporaryDirectory(prefix='bench_reprocess_') as temp_dir:
+        archive = os.path.join(temp_dir, 'warc')
+        stats, elapsed = build_archive(archive, pages)
+        print(f"\nArchived {stats['responses']} pages in {elapsed:.2f}s "
+              f"({stats['bytes'] / 1024 / 1024:.1f} MB compressed)")
+        spec = save_spec(compile_spec(analysis, max_pages=pages, rate_limit=0), os.path.join(temp_dir, 'spec.json'))
+
+        workers = os.cpu_count() or 1
+        print(f"\n{'Run':<34} {'Pages/s':>10} {'Records':>10} {'Seconds':>10}")
+        print("-" * 68)
+        for label, analyses, pool in [
+            ('extraction, in process', None, None),
+            (f'extraction, {workers} workers', None, workers),
+            ('analysis + extraction, in process', 'analyses_a', None),
+            (f'analysis + extraction, {workers} workers', 'analyses_b', workers),
+        ]:
+            summary = reprocess_archives(
+                archive, analyses_dir=os.path.join(temp_dir, analyses) if analyses else None, spec=spec,
+                outputs=[os.path.join(temp_dir, 'records.jsonl')], workers=pool
+            )
+            assert summary['records'] == pages * ITEMS_PER_PAGE, summary
+            print(f"{label:<34} {summary['pages_per_second']:>10} {summary['records']:>10} {summary['seconds']:>10}")
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
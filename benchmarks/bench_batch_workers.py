@@ -0,0 +1,70 @@
+"""
+Batch Worker Benchmark
+Measures analysis throughput of the process-pool parsing stage against the
+in-process path on synthetic listing pages (no network involved)
+"""
+
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.batch_analyzer import analyze_in_worker
+
+
+def build_listing_page(n, items=60):
+    """Product listing with cards, a sidebar and pagination"""
+    cards = ''.join(
+        f'<div class="product-card"><a href="/p/{n}/{i}"><img src="/img/{i}.jpg" alt="Item {i}"></a>'
+        f'<h3 class="title">Product {n}.{i}</h3><span class="price">${i}.99</span>'
+        f'<p class="desc">Description of product {i} with a few words of copy.</p></div>'
+        for i in range(items)
+    )
+    nav = ''.join(f'<li><a href="/c/{c}">Category {c}</a></li>' for c in range(20))
+    return (
+        f'<html><head><title>Listing {n}</title></head><body>'
+        f'<nav><ul>{nav}</ul></nav><main><div class="grid">{cards}</div>'
+        f'<a class="next" href="/shop?page={n + 1}">Next</a></main></body></html>'
+    ).encode('utf-8')
+
+
+def run_benchmark(pages=32, workers=None):
+    """Analyze the same pages in-process and in a process pool"""
+    workers = workers or os.cpu_count() or 1
+    jobs = [
+        (f'https://shop.example.com/shop?page={n}', build_listing_page(n), 'utf-8', {'status_code': 200})
+        for n in range(pages)
+    ]
+    columns = list(zip(*jobs))
+
+    print("=" * 80)
+    print("BATCH WORKER BENCHMARK")
+    print("=" * 80)
+    print(f"\nPages: {pages}  |  Workers: {workers}  |  CPUs: {os.cpu_count()}")
+
+    start = time.perf_counter()
+    serial = [analyze_in_worker(*job) for job in jobs]
+    serial_time = time.perf_counter() - start
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Warm the pool so process start-up is not billed to the first pages
+        list(pool.map(analyze_in_worker, *[column[:workers] for column in columns]))
+
+        start = time.perf_counter()
+        pooled = list(pool.map(analyze_in_worker, *columns))
+        pooled_time = time.perf_counter() - start
+
+    assert all(result is not None for result in serial + pooled), "Analysis failed"
+
+    print(f"   in-process   {serial_time:7.2f} s   {pages / serial_time:6.1f} pages/s")
+    print(f"   {workers:2d} workers   {pooled_time:7.2f} s   {pages / pooled_time:6.1f} pages/s")
+    print(f"\nSpeedup: {serial_time / pooled_time:.1f}x")
+    print("=" * 80)
+    return serial_time, pooled_time
+
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    run_benchmark(pages, workers)
@@ -0,0 +1,91 @@
+"""
+Columnar Load Benchmark
+Writes the same scraped records through the CSV and Parquet sinks, then compares
+how long DataAnalyzer-style loading takes and how much memory the frames use
+(all columns, and a two-column projection)
+"""
+
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+
+from core.record_sinks import CSVSink, ParquetSink
+
+
+def build_records(rows=200000):
+    """Product-like records: a few text columns, numbers and a sparse column"""
+    for i in range(rows):
+        record = {
+            'title': f'Product {i}',
+            'url': f'https://shop.example.com/p/{i}',
+            'description': f'Great value and fast shipping, item {i} of the spring catalog.',
+            'price': f'{(i % 500) + 0.99:.2f}',
+            'rank': str(i % 7),
+            'category': ['Lamps', 'Desks', 'Chairs', 'Shelves'][i % 4]
+        }
+        if i % 10 == 0:
+            record['badge'] = 'sale'
+        yield record
+
+
+def _measure(load):
+    """Best-effort wall time and peak Python allocations of one load"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    frame = load()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return frame, elapsed, peak
+
+
+def run_benchmark(rows=200000, columns=('title', 'price')):
+    print("=" * 80)
+    print("COLUMNAR LOAD BENCHMARK")
+    print("=" * 80)
+    print(f"\nRows: {rows}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'records.csv')
+        parquet_path = os.path.join(tmp, 'records.parquet')
+        for sink_type, path in [(CSVSink, csv_path), (ParquetSink, parquet_path)]:
+            start = time.perf_counter()
+            with sink_type(path, buffer_records=10000) as sink:
+                sink.write_many(build_records(rows))
+            print(f"   write {os.path.basename(path):16} {time.perf_counter() - start:7.2f} s"
+                  f"  {os.path.getsize(path) / 1024 / 1024:7.1f} MB")
+
+        loads = [
+            ('csv', lambda: pd.read_csv(csv_path, encoding='utf-8-sig')),
+            ('parquet', lambda: pd.read_parquet(parquet_path)),
+            ('csv usecols', lambda: pd.read_csv(csv_path, encoding='utf-8-sig', usecols=list(columns))),
+            ('parquet columns', lambda: pd.read_parquet(parquet_path, columns=list(columns)))
+        ]
+
+        print()
+        frames = {}
+        timings = {}
+        for name, load in loads:
+            frames[name], timings[name], peak = _measure(load)
+            size = frames[name].memory_usage(deep=True).sum()
+            print(f"   load {name:16} {timings[name] * 1000:9.1f} ms  peak {peak / 1024 / 1024:7.1f} MB"
+                  f"  frame {size / 1024 / 1024:7.1f} MB")
+
+    # Same values and dtypes either way
+    pd.testing.assert_frame_equal(frames['csv'], frames['parquet'])
+    pd.testing.assert_frame_equal(frames['csv usecols'], frames['parquet columns'])
+
+    print(f"\nFull load: {timings['csv'] / timings['parquet']:.1f}x faster  |  "
+          f"{len(columns)} columns: {timings['csv usecols'] / timings['parquet columns']:.1f}x faster")
+    print("=" * 80)
+    return timings
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    run_benchmark(rows)
@@ -0,0 +1,126 @@
+"""
+Replay Throughput Benchmark
+End-to-end analyzer and scraper throughput (fetch + parse + extract) over a
+recorded site replayed with simulated latency and injected failures: no
+network, and the same requests fail on every run, so results repeat
+"""
+
+import sys
+import os
+import asyncio
+import io
+import tempfile
+import time
+from contextlib import redirect_stdout
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.batch_analyzer import BatchAnalyzer
+from core.extraction_spec import compile_spec, save_spec
+from core.fetch_backend import ReplayBackend
+from core.retry_policy import RetryPolicy
+from core.scraper_runtime import ScraperRuntime
+from core.warc_archive import WARCWriter
+
+SITE = 'https://shop.example.com'
+ITEMS_PER_PAGE = 30
+
+
+def listing_page(page, pages):
+    items = ''.join(
+        f'<li class="product"><a href="/product/{page}-{i}">Product {page}-{i}</a>'
+        f'<span class="price">{(page * 7 + i) % 500}.99 EUR</span></li>'
+        for i in range(ITEMS_PER_PAGE)
+    )
+    next_link = f'<a rel="next" href="/list?page={page + 1}">Next</a>' if page < pages else ''
+    return (f'<html><head><title>Catalogue page {page}</title></head><body><h1>Catalogue</h1>'
+            f'<ul class="items">{items}</ul>{next_link}</body></html>').encode('utf-8')
+
+
+def page_url(page):
+    return f'{SITE}/list' if page == 1 else f'{SITE}/list?page={page}'
+
+
+def record_site(directory, pages):
+    """The listing as an --archive run would have recorded it"""
+    with WARCWriter(directory, prefix='bench') as writer:
+        for page in range(1, pages + 1):
+            writer.write_exchange(page_url(page), 200, {'Content-Type': 'text/html; charset=utf-8'},
+                                  listing_page(page, pages))
+
+
+def run_batch(recording, pages, concurrency, **replay):
+    """(pages/s, failed pages, injected errors) of analyzing every page"""
+    backend = ReplayBackend(recording, **replay)
+    batch = BatchAnalyzer(concurrency=concurrency, per_host=concurrency, backend=backend,
+                          retry_policy=RetryPolicy(attempts=4, base_delay=0.05, max_delay=0.2))
+
+    async def run():
+        return [analysis async for analysis in batch.analyze(page_url(page) for page in range(1, pages + 1))]
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        analyses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for analysis in analyses if 'error' in analysis)
+    return pages / elapsed, failed, backend.metrics()['injected_errors']
+
+
+def run_scraper(recording, spec, pages, **replay):
+    """(pages/s, records, injected errors) of crawling the listing through its next links"""
+    backend = ReplayBackend(recording, **replay)
+    runtime = ScraperRuntime(spec, keep_records=True)
+    runtime.set_backend(backend)
+    runtime.fetcher.retry_policy = RetryPolicy(attempts=4, base_delay=0.05, max_delay=0.2)
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        records = runtime.scrape()
+    elapsed = time.perf_counter() - start
+    return pages / elapsed, len(records), backend.metrics()['injected_errors']
+
+
+def run_benchmark(pages=60):
+    print("=" * 80)
+    print("REPLAY THROUGHPUT BENCHMARK")
+    print("=" * 80)
+
+    analysis = {
+        'metadata': {'url': page_url(1), 'domain': 'shop.example.com'},
+        'semantic_analysis': {'pagination': {'detected': True, 'type': 'next_prev'}},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }
+    scenarios = [
+        ('no latency', {}),
+        ('20-60 ms latency', {'latency': (0.02, 0.06)}),
+        ('20-60 ms, 10% connection errors', {'latency': (0.02, 0.06), 'error_rate': 0.1}),
+        ('20-60 ms, 10% 503s', {'latency': (0.02, 0.06), 'error_rate': 0.1, 'error': 503}),
+    ]
+
+    with tempfile.TemporaryDirectory(prefix='bench_replay_') as temp_dir:
+        recording = os.path.join(temp_dir, 'warc')
+        record_site(recording, pages)
+        spec = save_spec(compile_spec(analysis, max_pages=pages, rate_limit=0), os.path.join(temp_dir, 'spec.json'))
+        print(f"\nRecorded pages: {pages}  |  Items per page: {ITEMS_PER_PAGE}")
+
+        # Untimed first pass, so the first scenario does not pay for warming up the analysis passes
+        run_batch(recording, pages, 8)
+
+        print("\nBatch analyzer (concurrency 8)")
+        print(f"{'Scenario':<34} {'Pages/s':>10} {'Failed':>8} {'Injected':>10}")
+        print("-" * 66)
+        for label, replay in scenarios:
+            rate, failed, injected = run_batch(recording, pages, 8, **replay)
+            print(f"{label:<34} {rate:>10.1f} {failed:>8} {injected:>10}")
+
+        print("\nScraper runtime (next-link crawl)")
+        print(f"{'Scenario':<34} {'Pages/s':>10} {'Records':>8} {'Injected':>10}")
+        print("-" * 66)
+        for label, replay in scenarios:
+            rate, records, injected = run_scraper(recording, spec, pages, **replay)
+            print(f"{label:<34} {rate:>10.1f} {records:>8} {injected:>10}")
+
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
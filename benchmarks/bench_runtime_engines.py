@@ -0,0 +1,73 @@
+"""
+Runtime Engine Benchmark
+Compares the BeautifulSoup engine with the compiled-XPath lxml engine on a
+synthetic listing page (parse + extraction, records must be identical)
+"""
+
+import sys
+import os
+import io
+import json
+import time
+from contextlib import redirect_stdout
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.extraction_spec import compile_spec
+from core.fetcher import Fetcher
+from core.scraper_runtime import ScraperRuntime
+
+
+def build_listing_page(items=2000):
+    """Product cards with a title, description, a few links and data attributes"""
+    cards = ''.join(
+        f'<div class="card product" data-sku="SKU{i}" data-rank="{i % 7}">'
+        f'<h3>Product {i}</h3><p>Great value &amp; fast shipping, item {i}.</p>'
+        f'<a href="/p/{i}">Details</a><a href="/p/{i}#reviews">Reviews</a>'
+        f'<img src="/img/{i}.jpg" alt="Product {i}"></div>'
+        for i in range(items)
+    )
+    return f'<html><head><title>Catalog</title></head><body><div class="grid">{cards}</div></body></html>'.encode()
+
+
+def build_spec():
+    return compile_spec({
+        'metadata': {'url': 'https://shop.example.com/catalog/', 'domain': 'shop.example.com'},
+        'scraping_strategy': {'selectors': [{'type': 'card_elements', 'selector': 'div.grid > div.card'}]}
+    })
+
+
+def run_benchmark(items=2000, repeat=3):
+    """Time both engines and check they agree"""
+    html = build_listing_page(items)
+    spec = build_spec()
+
+    print("=" * 80)
+    print("RUNTIME ENGINE BENCHMARK")
+    print("=" * 80)
+    print(f"\nItems: {items}  |  Page size: {len(html) / 1024:.0f} KB")
+
+    timings = {}
+    outputs = {}
+    for engine in ['bs4', 'lxml']:
+        runtime = ScraperRuntime(spec, fetcher=Fetcher(use_cache=False), engine=engine)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                outputs[engine] = runtime.extract_data(runtime.parse_page(html))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[engine] = best
+        print(f"   {engine:10} {best * 1000:9.1f} ms")
+
+    # Compare serialized, so key order (CSV column order) counts too
+    assert json.dumps(outputs['bs4']) == json.dumps(outputs['lxml']), "Engines extracted different records"
+
+    print(f"\nSpeedup: {timings['bs4'] / timings['lxml']:.1f}x ({len(outputs['lxml'])} records, identical)")
+    print("=" * 80)
+    return timings
+
+
+if __name__ == '__main__':
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run_benchmark(items)
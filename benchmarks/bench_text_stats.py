@@ -0,0 +1,82 @@
+"""
+Text Statistics Benchmark
+Compares per-candidate get_text() calls with the cached DOMIndex text statistics
+on a deeply nested synthetic page (the shape that makes main-content detection quadratic)
+"""
+
+import sys
+import os
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bs4 import BeautifulSoup
+
+from core.dom_index import DOMIndex
+
+CANDIDATE_TAGS = ['p', 'div', 'span', 'article', 'section']
+
+
+def build_nested_page(depth=300, paragraphs=5):
+    """Nest `depth` content wrappers, each holding a few paragraphs of text"""
+    body = ''
+    for level in range(depth):
+        text = ''.join(
+            f'<p>Paragraph {level}.{i} with some <em>story</em> text for the reader.</p>'
+            for i in range(paragraphs)
+        )
+        body = f'<div class="content level-{level}"><span>Level {level}</span>{text}{body}</div>'
+    return f'<html><body><main>{body}</main></body></html>'
+
+
+def stats_with_get_text(soup):
+    """Previous approach: serialize every candidate's subtree"""
+    results = []
+    for tag in CANDIDATE_TAGS:
+        for elem in soup.find_all(tag):
+            text = elem.get_text(strip=True)
+            results.append((len(text), len(text.split())))
+    return results
+
+
+def stats_with_index(soup):
+    """Cached approach: one bottom-up pass, constant-time lookups"""
+    index = DOMIndex(soup)
+    results = []
+    for tag in CANDIDATE_TAGS:
+        for elem in index.find_all(tag):
+            results.append((index.text_length(elem), index.word_count(elem)))
+    return results
+
+
+def run_benchmark(depth=300, repeat=3):
+    """Time both approaches and check they agree"""
+    html = build_nested_page(depth)
+    soup = BeautifulSoup(html, 'lxml')
+
+    print("=" * 80)
+    print("TEXT STATISTICS BENCHMARK")
+    print("=" * 80)
+    print(f"\nNesting depth: {depth}  |  Page size: {len(html) / 1024:.0f} KB")
+
+    timings = {}
+    outputs = {}
+    for name, func in [('get_text', stats_with_get_text), ('dom_index', stats_with_index)]:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = func(soup)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+        print(f"   {name:10} {best * 1000:9.1f} ms")
+
+    assert outputs['get_text'] == outputs['dom_index'], "Cached statistics differ from get_text()"
+
+    print(f"\nSpeedup: {timings['get_text'] / timings['dom_index']:.1f}x (results identical)")
+    print("=" * 80)
+    return timings
+
+
+if __name__ == '__main__':
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    run_benchmark(depth)
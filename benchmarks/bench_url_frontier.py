@@ -0,0 +1,99 @@
+"""
+URL Frontier Benchmark
+Memory per URL of a Python set of URL strings versus the frontier's Bloom
+filter, the filter's measured false-positive rate, and frontier throughput
+"""
+
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.url_frontier import BloomFilter, URLFrontier, canonicalize_url
+
+
+def build_urls(count, start=0):
+    """Product, category and paginated listing URLs of one shop"""
+    for i in range(start, start + count):
+        kind = i % 3
+        if kind == 0:
+            yield f'https://shop.example.com/products/item-{i}?ref=listing&utm_source=mail'
+        elif kind == 1:
+            yield f'https://shop.example.com/category/{i % 500}/page/{i}'
+        else:
+            yield f'https://shop.example.com/search?q=lamp+{i}&page={i % 40}'
+
+
+def _allocated(build):
+    """Objects built by `build` and the bytes they keep allocated"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, allocated
+
+
+def run_benchmark(count=200000, error_rate=0.001):
+    print("=" * 80)
+    print("URL FRONTIER BENCHMARK")
+    print("=" * 80)
+    urls = [canonicalize_url(url) for url in build_urls(count)]
+    print(f"\nURLs: {count}  |  average length {sum(map(len, urls)) / count:.0f} characters")
+
+    # The set owns its strings, as a crawler's visited set does
+    seen_set, set_bytes = _allocated(lambda: {canonicalize_url(url) for url in build_urls(count)})
+    print(f"\n   set of strings   {set_bytes / count:8.1f} bytes/URL")
+
+    def fill_bloom():
+        bloom = BloomFilter(count, error_rate)
+        for url in urls:
+            bloom.add(url)
+        return bloom
+
+    bloom, bloom_bytes = _allocated(fill_bloom)
+    print(f"   Bloom filter     {bloom_bytes / count:8.1f} bytes/URL  "
+          f"({bloom.hashes} hashes, target false positives {error_rate:.2%})")
+    print(f"   reduction        {set_bytes / bloom_bytes:8.1f}x")
+
+    unseen = [canonicalize_url(url) for url in build_urls(count, start=count)]
+    assert all(url in bloom for url in urls), "Bloom filter lost a URL"
+    false_positives = sum(url in bloom for url in unseen)
+    print(f"\n   measured false positives {false_positives / count:.3%} "
+          f"(expected {bloom.false_positive_rate():.3%})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'frontier.sqlite')
+        with URLFrontier(path, capacity=count, error_rate=error_rate) as frontier:
+            start = time.perf_counter()
+            for offset in range(0, count, 1000):
+                frontier.add_many(build_urls(1000, start=offset))
+            added = time.perf_counter() - start
+
+            start = time.perf_counter()
+            duplicates = frontier.add_many(build_urls(count))
+            rejected = time.perf_counter() - start
+            assert duplicates == 0
+
+            start = time.perf_counter()
+            while frontier.pop_many(1000):
+                pass
+            popped = time.perf_counter() - start
+            metrics = frontier.metrics()
+        disk = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+
+    print(f"\n   frontier add     {count / added:10.0f} URLs/s")
+    print(f"   duplicate check  {count / rejected:10.0f} URLs/s "
+          f"({metrics['disk_checks']} disk checks, {metrics['false_positives']} false positives)")
+    print(f"   pop              {count / popped:10.0f} URLs/s")
+    print(f"   on disk          {disk / count:10.1f} bytes/URL (exact store and queue)")
+    print("=" * 80)
+    return {'set_bytes': set_bytes, 'bloom_bytes': bloom_bytes, 'false_positives': false_positives}
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+    run_benchmark(count, error_rate)
@@ -0,0 +1,96 @@
+"""
+Work Queue Benchmark
+Crawl throughput of a paginated listing fanned out over 1, 2, 4 and 8 worker
+processes sharing one SQLite queue (local server with a fixed per-page latency)
+"""
+
+import sys
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.distributed_crawl import collect_records, enqueue_crawl, start_workers
+from core.extraction_spec import compile_spec
+from core.work_queue import WorkQueue
+
+
+def start_listing_server(pages, latency):
+    """Listing of `pages` pages of 20 items; every response takes `latency` seconds"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            page = int(self.path.rsplit('=', 1)[1]) if 'page=' in self.path else 1
+            items = ''.join(
+                f'<li><a href="/item/{page}-{i}">Item {page}-{i}</a> {page * 100 + i} EUR</li>' for i in range(20)
+            ) if page <= pages else ''
+            body = f'<html><body><ul class="items">{items}</ul></body></html>'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f'http://127.0.0.1:{httpd.server_address[1]}'
+
+
+def crawl_with_workers(temp_dir, workers, pages, latency):
+    """Seconds from enqueueing the crawl to its last page, with `workers` processes already waiting"""
+    # A new server (new port) per run, so no page comes from the HTTP cache of an earlier run
+    httpd, site = start_listing_server(pages, latency)
+    spec = compile_spec({
+        'metadata': {'url': f'{site}/list', 'domain': '127.0.0.1'},
+        'semantic_analysis': {'pagination': {'detected': True, 'type': 'numbered',
+                                             'sample_urls': ['/list?page=2', '/list?page=3']}},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }, max_pages=pages, rate_limit=0)
+
+    queue_path = os.path.join(temp_dir, f'queue_{workers}.sqlite')
+    queue = WorkQueue(queue_path)
+    processes = start_workers(queue_path, workers, job='bench', cwd=temp_dir, idle_timeout=60)
+    # Start-up (imports) is not billed to the crawl
+    while len(queue.workers()) < workers:
+        time.sleep(0.05)
+
+    start = time.perf_counter()
+    enqueue_crawl(queue, spec, job='bench', window=workers)
+    queue.wait('bench', poll_interval=0.02)
+    elapsed = time.perf_counter() - start
+
+    for process, _ in processes:
+        process.terminate()
+        process.wait()
+    httpd.shutdown()
+    assert len(collect_records(queue, 'bench')) == pages * 20, "Crawl incomplete"
+    queue.close()
+    return elapsed
+
+
+def run_benchmark(pages=40, latency=0.2, worker_counts=(1, 2, 4, 8)):
+    print("=" * 80)
+    print("WORK QUEUE BENCHMARK")
+    print("=" * 80)
+    print(f"\nPages: {pages}  |  Latency: {latency * 1000:.0f} ms/page  |  CPUs: {os.cpu_count()}")
+
+    timings = {}
+    with tempfile.TemporaryDirectory(prefix='bench_queue_') as temp_dir:
+        for workers in worker_counts:
+            timings[workers] = crawl_with_workers(temp_dir, workers, pages, latency)
+            print(f"   {workers} worker{'s' if workers > 1 else ' '}   {timings[workers]:7.2f} s   "
+                  f"{pages / timings[workers]:6.1f} pages/s   ({timings[worker_counts[0]] / timings[workers]:.1f}x)")
+
+    print("=" * 80)
+    return timings
+
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    run_benchmark(pages, latency)
@@ -0,0 +1,236 @@
+"""
+Analysis Cache
+Stores analysis results keyed on a hash of the normalized page HTML
+"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import time
+from functools import lru_cache
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, '.cache', 'analysis')
+
+COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.S)
+INTERTAG_WHITESPACE_PATTERN = re.compile(r'>\s+<')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def local_imports(path):
+    """
+    Source files of a module and of the project modules it imports, directly or not
+
+    Imports are read from the source, in both forms used in core/ ('core.dom_index'
+    and the bare 'dom_index' of a script run from within core/); third-party and
+    standard library modules are left out.
+    """
+    root = os.path.dirname(os.path.abspath(path))
+    seen, pending = set(), [os.path.abspath(path)]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        with open(current, 'rb') as f:
+            tree = ast.parse(f.read(), current)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module] + [f'{node.module}.{alias.name}' for alias in node.names]
+            else:
+                continue
+            for name in names:
+                parts = name.split('.')
+                if parts[0] == os.path.basename(root):
+                    parts = parts[1:]
+                candidate = os.path.join(root, *parts) + '.py'
+                if parts and os.path.isfile(candidate):
+                    pending.append(candidate)
+    return sorted(seen)
+
+
+@lru_cache(maxsize=None)
+def source_fingerprint(path):
+    """
+    Short hash of an analyzer's source and of every project module it imports,
+    so editing the analyzer or any of its helpers invalidates its results
+    """
+    digest = hashlib.sha256()
+    for source in local_imports(path):
+        digest.update(os.path.basename(source).encode('utf-8'))
+        digest.update(b'\0')
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()[:12]
+
+
+def normalize_html(html):
+    """
+    Reduce HTML to a canonical form before hashing
+
+    Comments and whitespace between tags are dropped and other whitespace
+    runs collapsed, so pages that differ only in formatting share a key.
+    """
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    html = COMMENT_PATTERN.sub('', html)
+    html = INTERTAG_WHITESPACE_PATTERN.sub('><', html)
+    return WHITESPACE_PATTERN.sub(' ', html).strip()
+
+
+class AnalysisCache:
+    """One JSON file per analysis, evicted by age and least recent use"""
+
+    def __init__(self, cache_dir=None, max_entries=500, max_age_days=30):
+        """
+        Args:
+            cache_dir: Directory holding cached analyses
+            max_entries: Entries kept before the least recently used are dropped
+            max_age_days: Entries unused for this long are removed (None keeps them)
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stored': 0,
+            'evicted': 0
+        }
+
+    @staticmethod
+    def make_key(url, html, version=''):
+        """
+        Cache key for a page
+
+        Args:
+            url: Page URL (links in the analysis are resolved against it)
+            html: Page HTML, str or bytes
+            version: Analyzer fingerprint, keeps v1/v2 results and old code apart
+        """
+        digest = hashlib.sha256()
+        digest.update(version.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(url.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(normalize_html(html).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _expired(self, path):
+        if self.max_age_days is None:
+            return False
+        # Keys are content hashes, so an entry never goes stale; age is time since last use
+        return time.time() - os.path.getmtime(path) > self.max_age_days * 86400
+
+    def get(self, key):
+        """Stored analysis for key, or None"""
+        path = self._path(key)
+
+        try:
+            if self._expired(path):
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                analysis = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.stats['misses'] += 1
+            return None
+
+        # Access time drives LRU eviction
+        os.utime(path)
+        self.stats['hits'] += 1
+        return analysis
+
+    def put(self, key, analysis):
+        """Store an analysis and evict if the cache is over capacity"""
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(analysis, f, ensure_ascii=False, default=str)
+        os.replace(temp_path, path)
+
+        self.stats['stored'] += 1
+        self.evict()
+
+    def entries(self):
+        """Cached entry paths, least recently used first"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:  # Evicted by another process meanwhile
+                continue
+        return [path for _, path in sorted(entries)]
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        evicted = 0
+        paths = []
+
+        for path in self.entries():
+            try:
+                expired = self._expired(path)
+            except FileNotFoundError:
+                continue
+            if expired:
+                self._remove(path)
+                evicted += 1
+            else:
+                paths.append(path)
+
+        while self.max_entries is not None and len(paths) > self.max_entries:
+            self._remove(paths.pop(0))
+            evicted += 1
+
+        self.stats['evicted'] += evicted
+        return evicted
+
+    def clear(self):
+        """Remove every entry"""
+        for path in self.entries():
+            self._remove(path)
+
+
+_shared_caches = {}
+
+
+def get_analysis_cache(cache_dir=None, **kwargs):
+    """Shared AnalysisCache instance per directory"""
+    cache_dir = os.path.abspath(cache_dir or DEFAULT_CACHE_DIR)
+    if cache_dir not in _shared_caches:
+        _shared_caches[cache_dir] = AnalysisCache(cache_dir, **kwargs)
+    return _shared_caches[cache_dir]
+
+
+if __name__ == '__main__':
+    import sys
+
+    cache = AnalysisCache(sys.argv[2] if len(sys.argv) > 2 else None)
+    if len(sys.argv) > 1 and sys.argv[1] == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        print(f"Entries: {len(cache.entries())}  |  Dir: {cache.cache_dir}")
+    else:
+        print("Usage: python -m core.analysis_cache <stats|clear> [cache_dir]")
@@ -0,0 +1,178 @@
+"""
+Archive Reprocess
+Runs the pages of WARC archives through analysis and extraction again in a
+process pool, without any network: a changed strategy or spec is tried on a
+whole crawl without fetching the site again, and every run sees the same pages
+"""
+
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from core.extraction_spec import spec_hash
+from core.fetcher import Fetcher
+from core.intelligent_analyzer_v2 import analyze_html
+from core.record_sinks import open_sink
+from core.scraper_runtime import ScraperRuntime
+from core.warc_archive import iter_responses
+
+
+# Extraction runtimes of this worker process by spec, built on first use
+_runtimes = {}
+_devnull = None
+
+
+def _runtime(spec):
+    key = spec if isinstance(spec, str) else spec_hash(spec)
+    if key not in _runtimes:
+        # Never fetches: the fetcher only exists because the runtime expects one
+        _runtimes[key] = ScraperRuntime(spec, fetcher=Fetcher(use_cache=False), keep_records=False)
+    return _runtimes[key]
+
+
+def reprocess_pages(pages, spec=None, analyze=True):
+    """
+    Process-pool entry point: analyze and extract a batch of archived pages
+
+    Args:
+        pages: List of (url, body, encoding, technical_details)
+        spec: Extraction spec (path or dict) to extract records with, or None
+        analyze: Run the analysis passes
+
+    Returns:
+        List of (url, analysis or None, records or None, error or None)
+    """
+    global _devnull
+    if _devnull is None:
+        _devnull = open(os.devnull, 'w')
+    runtime = _runtime(spec) if spec is not None else None
+    results = []
+    # The runtime prints a progress line per page; thousands of them would only slow the batch down
+    with redirect_stdout(_devnull):
+        for url, body, encoding, technical_details in pages:
+            try:
+                analysis = analyze_html(url, body, technical_details, encoding) if analyze else None
+                records = runtime.extract_data(runtime.parse_page(body)) if runtime is not None else None
+                results.append((url, analysis, records, None))
+            except Exception as e:
+                results.append((url, None, None, str(e) or type(e).__name__))
+    return results
+
+
+def _page_batches(paths, batch_size, stats):
+    """Batches of reprocess_pages() input from the archived HTML pages"""
+    batch = []
+    for response in iter_responses(paths):
+        stats['responses'] += 1
+        if not response.is_html():
+            stats['skipped'] += 1
+            continue
+        technical_details = {
+            'status_code': response.status,
+            'content_length': len(response.body),
+            'content_type': response.content_type,
+            'server': response.headers.get('Server', 'Unknown'),
+            'archived_at': response.date
+        }
+        batch.append((response.url, response.body, response.encoding(), technical_details))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reprocess_archives(paths, analyses_dir=None, spec=None, outputs=None, workers=None, batch_size=32):
+    """
+    Run archived pages through analysis and extraction again, without any network
+
+    Only 2xx HTML responses are processed. Batches are parsed in a process
+    pool and their results written in archive order, so two runs over the
+    same archive give the same output.
+
+    Args:
+        paths: WARC files and/or directories of them
+        analyses_dir: Directory receiving one analysis JSON per page (None skips the analysis)
+        spec: Extraction spec (path or dict); its records go to `outputs`
+        outputs: Record sink paths (.csv, .jsonl, .parquet, ...) or sinks
+        workers: Size of the process pool (None runs everything in this process)
+        batch_size: Pages per pool task
+
+    Returns:
+        Dict of counts (responses, skipped, pages, analyzed, records, failed), the
+        errors per URL, the written analysis files and the elapsed seconds
+    """
+    if isinstance(spec, str):
+        spec = os.path.abspath(spec)
+    analyze = analyses_dir is not None
+    if analyze:
+        os.makedirs(analyses_dir, exist_ok=True)
+    sinks = [open_sink(sink) if isinstance(sink, str) else sink for sink in outputs or []] if spec is not None else []
+
+    stats = {'responses': 0, 'skipped': 0, 'pages': 0, 'analyzed': 0, 'records': 0, 'failed': 0, 'errors': []}
+    files = []
+
+    def write(results):
+        for url, analysis, records, error in results:
+            stats['pages'] += 1
+            if error is not None:
+                stats['failed'] += 1
+                stats['errors'].append({'url': url, 'error': error})
+                continue
+            if analysis is not None:
+                domain = analysis['metadata']['domain'].replace('.', '_').replace(':', '_')
+                path = os.path.join(analyses_dir, f'{domain}_{len(files):05d}_analysis.json')
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(analysis, f, indent=2, ensure_ascii=False, default=str)
+                files.append(path)
+                stats['analyzed'] += 1
+            if records:
+                for sink in sinks:
+                    sink.write_many(records)
+                stats['records'] += len(records)
+
+    start = time.perf_counter()
+    batches = _page_batches(paths, batch_size, stats)
+    try:
+        if not workers:
+            for batch in batches:
+                write(reprocess_pages(batch, spec, analyze))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # A bounded window of batches in flight, written back in submission order
+                in_flight = deque()
+                for batch in batches:
+                    in_flight.append(pool.submit(reprocess_pages, batch, spec, analyze))
+                    if len(in_flight) >= 2 * workers:
+                        write(in_flight.popleft().result())
+                while in_flight:
+                    write(in_flight.popleft().result())
+    finally:
+        for sink in sinks:
+            sink.close()
+
+    elapsed = time.perf_counter() - start
+    return dict(stats, files=files, seconds=round(elapsed, 3),
+                pages_per_second=round(stats['pages'] / elapsed, 1) if elapsed else None)
+
+
+if __name__ == '__main__':
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+
+    if args and ('analyses' in options or 'spec' in options):
+        summary = reprocess_archives(
+            args, analyses_dir=options.get('analyses'), spec=options.get('spec'),
+            outputs=[path for path in options.get('output', '').split(',') if path],
+            workers=int(options.get('workers', os.cpu_count() or 1))
+        )
+        print(f"Reprocessed {summary['pages']} pages ({summary['analyzed']} analyzed, {summary['records']} records, "
+              f"{summary['failed']} failed) in {summary['seconds']}s: {summary['pages_per_second']} pages/s")
+    else:
+        print("Usage: python -m core.archive_reprocess <archive_dir|file.warc.gz ...> [--analyses=DIR] "
+              "[--spec=spec.json --output=records.csv[,records.jsonl]] [--workers=N]")
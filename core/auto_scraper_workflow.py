@@ -10,23 +10,38 @@ Professional automated web scraping workflow:
 
 import sys
 import os
+import glob
+import json
 from datetime import datetime
 import subprocess
 
-# Add scripts directory to path
-sys.path.insert(0, os.path.dirname(__file__))
+# Add the project root to path, so the workflow runs as a script and imports the core package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-from intelligent_analyzer import IntelligentAnalyzer
-from scraper_generator import ScraperGenerator
-from data_analyzer import DataAnalyzer
-from pdf_generator import PDFReportGenerator
+from core.intelligent_analyzer import IntelligentAnalyzer
+from core.scraper_generator import ScraperGenerator
+from core.data_analyzer import DataAnalyzer
+from core.pdf_generator import PDFReportGenerator
+from core.analysis_cache import get_analysis_cache
+from core.scraper_runner import ScraperRunner
+from core.distributed_crawl import run_distributed_crawl
+from core.record_sinks import COLUMNAR_AVAILABLE
+from core.warc_archive import archive_files, open_warc_writer
 
 
 class AutoScraperWorkflow:
     """Complete automated scraping workflow"""
     
-    def __init__(self, url, output_dir=None):
+    def __init__(self, url, output_dir=None, use_analysis_cache=True, scraper_mode='inprocess', max_pages=10,
+                 rate_limit=1.0, resume=False, incremental=False, workers=1, archive=False, replay=None):
         self.url = url
+        self.scraper_mode = scraper_mode
+        self.resume = resume
+        self.incremental = incremental
+        self.workers = workers
+        self.max_pages = max_pages
+        self.rate_limit = rate_limit
+        self.analysis_cache = get_analysis_cache() if use_analysis_cache else None
         self.output_dir = output_dir or os.path.join(os.path.dirname(__file__), '..', 'outputs')
         os.makedirs(self.output_dir, exist_ok=True)
         
@@ -34,11 +49,31 @@ class AutoScraperWorkflow:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         domain = url.split('/')[2].replace('.', '_')
         self.base_name = f"{domain}_{timestamp}"
+        if resume:
+            # Continue the latest interrupted crawl of this site, under its file names
+            suffix = '.queue.sqlite' if workers > 1 else '.checkpoint.json'
+            checkpoints = sorted(glob.glob(os.path.join(self.output_dir, f'scraped_{domain}_*{suffix}')))
+            if checkpoints:
+                self.base_name = os.path.basename(checkpoints[-1])[len('scraped_'):-len(suffix)]
         
         # File paths
         self.analysis_file = os.path.join(self.output_dir, f'{self.base_name}_analysis.json')
         self.scraper_file = os.path.join(self.output_dir, f'{self.base_name}_scraper.py')
+        self.spec_file = None  # Will be set by the generator
         self.data_file = None  # Will be set by scraper
+        self.checkpoint_file = os.path.join(self.output_dir, f'scraped_{self.base_name}.checkpoint.json')
+        # Page tasks of a crawl fanned out over workers (a --resume run keeps the finished ones)
+        self.queue_file = os.path.join(self.output_dir, f'scraped_{self.base_name}.queue.sqlite')
+        # Page hashes and record fingerprints of earlier runs, shared by every run of the site
+        self.state_file = os.path.join(self.output_dir, f'scraped_{domain}.pages.sqlite')
+        # Raw responses of every --archive run of the site, to re-extract offline with archive_reprocess
+        self.archive_dir = os.path.join(self.output_dir, f'warc_{domain}') if archive else None
+        # Recorded responses every step fetches from instead of the network (True: the site's archive)
+        if replay is True:
+            replay = os.path.join(self.output_dir, f'warc_{domain}')
+        self.replay = os.path.abspath(replay) if replay else None
+        self.data_frame = None  # Extracted records handed to the data analysis
+        self.page_content = None  # Raw first page kept from step 1
         self.data_analysis_file = os.path.join(self.output_dir, f'{self.base_name}_data_analysis.json')
         self.pdf_report = os.path.join(self.output_dir, f'{self.base_name}_report.pdf')
         
@@ -76,13 +111,21 @@ class AutoScraperWorkflow:
         print("🔹" * 50)
         
         try:
-            analyzer = IntelligentAnalyzer(self.url)
+            archive = open_warc_writer(self.archive_dir, prefix='analysis')
+            analyzer = IntelligentAnalyzer(self.url, analysis_cache=self.analysis_cache, archive=archive,
+                                           backend=self.replay)
             analysis = analyzer.run_full_analysis(self.analysis_file)
+            if archive is not None:
+                archive.close()
             
             if analysis:
+                self.page_content = analyzer.response.content
+                if analyzer.cache_hit:
+                    print("\n✅ Page unchanged since a previous run, analysis loaded from cache")
                 self.log_step('html_analysis', 'success', {
                     'analysis_file': self.analysis_file,
-                    'total_elements': analysis['structure'].get('total_elements', 0)
+                    'total_elements': analysis['structure'].get('total_elements', 0),
+                    'cache_hit': analyzer.cache_hit
                 })
                 self.results['files_generated'].append(self.analysis_file)
                 return True
@@ -103,13 +146,19 @@ class AutoScraperWorkflow:
         
         try:
             generator = ScraperGenerator(self.analysis_file)
-            scraper_path = generator.generate_full_scraper(self.scraper_file)
+            scraper_path = generator.generate_full_scraper(
+                self.scraper_file,
+                max_pages=self.max_pages,
+                rate_limit=self.rate_limit
+            )
             
             if scraper_path and os.path.exists(scraper_path):
+                self.spec_file = generator.get_spec_path(self.scraper_file)
                 self.log_step('scraper_generation', 'success', {
-                    'scraper_file': self.scraper_file
+                    'scraper_file': self.scraper_file,
+                    'spec_file': self.spec_file
                 })
-                self.results['files_generated'].append(self.scraper_file)
+                self.results['files_generated'].extend([self.scraper_file, self.spec_file])
                 return True
             else:
                 self.log_step('scraper_generation', 'failed', {'error': 'Scraper file not created'})
@@ -127,50 +176,100 @@ class AutoScraperWorkflow:
         print("🔹" * 50)
         
         try:
-            # Get Python path from venv
+            # Subprocess mode prefers the project's venv interpreter when present
             venv_python = os.path.join(os.path.dirname(__file__), '..', '.venv', 'Scripts', 'python.exe')
             
-            if not os.path.exists(venv_python):
-                venv_python = 'python'  # Fallback to system python
+            # The scraper streams its records into the exports page by page; Parquet keeps
+            # the column types for downstream jobs (DataAnalyzer reads it with column pruning)
+            self.data_file = os.path.join(self.output_dir, f'scraped_{self.base_name}.csv')
+            exports = [self.data_file, os.path.join(self.output_dir, f'scraped_{self.base_name}.jsonl')]
+            if COLUMNAR_AVAILABLE:
+                exports.append(os.path.join(self.output_dir, f'scraped_{self.base_name}.parquet'))
             
-            # Run the scraper
-            result = subprocess.run(
-                [venv_python, self.scraper_file],
-                cwd=self.output_dir,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
+            if self.workers > 1:
+                # One task per listing page, fetched by worker processes sharing the queue file
+                result = run_distributed_crawl(
+                    self.spec_file,
+                    self.queue_file,
+                    url=self.url,
+                    workers=self.workers,
+                    max_pages=self.max_pages,
+                    job=self.base_name,
+                    outputs=exports,
+                    timeout=300,
+                    python=venv_python if os.path.exists(venv_python) else None,
+                    cwd=self.output_dir,
+                    archive=self.archive_dir,
+                    replay=self.replay,
+                    # The first page comes from step 1; unchanged pages are skipped as in a single-process run
+                    html=self.page_content,
+                    incremental=self.state_file if self.incremental else None
+                )
+                if not result['timed_out']:
+                    # Finished: a later --resume starts over
+                    for suffix in ('', '-wal', '-shm'):
+                        if os.path.exists(self.queue_file + suffix):
+                            os.remove(self.queue_file + suffix)
+            else:
+                runner = ScraperRunner(
+                    self.scraper_file,
+                    mode=self.scraper_mode,
+                    timeout=300,  # 5 minute timeout; records extracted until then are kept
+                    python=venv_python if os.path.exists(venv_python) else None,
+                    cwd=self.output_dir,
+                    outputs=exports,
+                    # A crawl cut off by the timeout continues from here on a --resume run
+                    checkpoint=self.checkpoint_file,
+                    resume=self.resume and os.path.exists(self.checkpoint_file),
+                    # Unchanged pages are skipped; only new or changed records come back
+                    incremental=self.state_file if self.incremental else None,
+                    archive=self.archive_dir,
+                    replay=self.replay
+                )
+                # The first page comes from step 1, only further pages hit the network
+                result = runner.run(html=self.page_content)
+            # Rate limiting, adaptive concurrency, retries and open circuit breakers end up in the workflow results
+            self.results['fetch_metrics'] = result['metrics']
+            if result['changes']:
+                self.results['changes'] = result['changes']
             
-            print(result.stdout)
+            if result['output']:
+                print(result['output'])
+            if result['timed_out'] and os.path.exists(self.checkpoint_file):
+                print("\n💡 Rerun with --resume to continue the crawl from its checkpoint")
+            if result['timed_out'] and os.path.exists(self.queue_file):
+                print("\n💡 Rerun with --resume to let the workers finish the remaining pages")
             
-            # Find the generated CSV file (check even if return code != 0, as data might have been saved)
-            import glob
-            csv_files = glob.glob(os.path.join(self.output_dir, 'scraped_*.csv'))
-            if csv_files:
-                # Get the most recent one
-                self.data_file = max(csv_files, key=os.path.getmtime)
-                
+            records = result['records']
+            if not records and result['changes']:
+                print("\n✅ Nothing new or changed since the last run")
                 self.log_step('scraper_execution', 'success', {
-                    'data_file': self.data_file,
-                    'output': result.stdout[:500]
+                    'items': 0,
+                    'mode': result['mode'],
+                    'changes': result['changes']
                 })
-                self.results['files_generated'].append(self.data_file)
                 return True
-            
-            if result.returncode == 0:
+            if not records:
                 self.log_step('scraper_execution', 'warning', {
-                    'message': 'Scraper ran but no CSV file found',
-                    'output': result.stdout[:500]
-                })
-                return False
-            else:
-                self.log_step('scraper_execution', 'failed', {
-                    'error': result.stderr[:500],
-                    'return_code': result.returncode
+                    'message': 'Scraper ran but extracted no items',
+                    'mode': result['mode']
                 })
-                print(f"\n❌ Scraper failed with error:\n{result.stderr}")
                 return False
+            
+            # The exports are artifacts; step 4 works on the in-memory frame
+            self.data_frame = result['dataframe']
+            
+            self.log_step('scraper_execution', 'warning' if result['timed_out'] else 'success', {
+                'data_file': self.data_file,
+                'items': len(records),
+                'mode': result['mode'],
+                'reused_fetch': self.page_content is not None,
+                'timed_out': result['timed_out'],
+                'resumable': os.path.exists(self.checkpoint_file) or os.path.exists(self.queue_file),
+                'changes': result['changes']
+            })
+            self.results['files_generated'].extend(exports)
+            return True
         
         except Exception as e:
             self.log_step('scraper_execution', 'failed', {'error': str(e)})
@@ -183,13 +282,13 @@ class AutoScraperWorkflow:
         print("STEP 4: ANALYZING SCRAPED DATA")
         print("🔹" * 50)
         
-        if not self.data_file or not os.path.exists(self.data_file):
-            print("⚠️  No data file to analyze")
-            self.log_step('data_analysis', 'skipped', {'reason': 'No data file'})
+        if self.data_frame is None:
+            print("⚠️  No data to analyze")
+            self.log_step('data_analysis', 'skipped', {'reason': 'No data extracted'})
             return False
         
         try:
-            analyzer = DataAnalyzer(self.data_file)
+            analyzer = DataAnalyzer(self.data_file, dataframe=self.data_frame)
             analysis = analyzer.run_full_analysis(self.data_analysis_file)
             
             if analysis:
@@ -261,6 +360,51 @@ class AutoScraperWorkflow:
             file_size = os.path.getsize(file_path) / 1024 if os.path.exists(file_path) else 0
             print(f"   📄 {os.path.basename(file_path)} ({file_size:.1f} KB)")
         
+        # Adaptive concurrency reached per host
+        concurrency = self.results.get('fetch_metrics', {}).get('concurrency')
+        if concurrency:
+            print("\n🚦 Concurrency per host:")
+            for host, state in concurrency['hosts'].items():
+                print(f"   {host}: limit {state['limit']:.0f} (peak {state['peak_in_flight']} in flight, "
+                      f"{state['increases']} increases, {state['decreases']} decreases)")
+        
+        # Pages done by each worker of a distributed crawl
+        queue = self.results.get('fetch_metrics', {}).get('queue')
+        if queue:
+            print(f"\n👷 Workers ({len(queue['workers'])}):")
+            for worker in queue['workers']:
+                print(f"   {worker['id']} on {worker['host']}: {worker['completed']} pages, {worker['failed']} failed")
+        
+        # What an incremental run found changed
+        changes = self.results.get('changes')
+        if changes:
+            pages, records = changes['pages'], changes['records']
+            print("\n🔄 Changes since the last run:")
+            print(f"   Pages: {pages['new']} new, {pages['changed']} changed, "
+                  f"{pages['unchanged']} unchanged (skipped without parsing)")
+            print(f"   Records: {records['new']} new, {records['changed']} changed, "
+                  f"{records['unchanged']} unchanged, {records['removed']} removed")
+        
+        # Retried requests and hosts whose circuit breaker tripped
+        retries = self.results.get('fetch_metrics', {}).get('retries')
+        if retries and (retries['retries'] or retries['exhausted']):
+            print(f"\n🔁 Retries: {retries['retries']} ({retries['recovered']} recovered, "
+                  f"{retries['exhausted']} still failing, {retries['wait_seconds']:.1f}s backing off)")
+        breakers = self.results.get('fetch_metrics', {}).get('circuit_breaker')
+        if breakers and breakers['open']:
+            print("\n⛔ Circuit open (host down, requests failed fast):")
+            for host in breakers['open']:
+                state = breakers['hosts'][host]
+                print(f"   {host}: {state['failures']} failures, {state['rejected']} requests skipped")
+        
+        # Archived responses, ready to be extracted again without the network
+        if self.archive_dir and os.path.isdir(self.archive_dir):
+            print(f"\n🗄️  Archive: {self.archive_dir} ({len(archive_files(self.archive_dir))} WARC files)")
+            if self.spec_file:
+                print("   Re-extract offline, from the project root:")
+                print(f"   python -m core.archive_reprocess {self.archive_dir} "
+                      f"--spec={self.spec_file} --output=reextracted.csv")
+        
         # Final PDF location
         if os.path.exists(self.pdf_report):
             print(f"\n🎉 FINAL REPORT:")
@@ -291,7 +435,6 @@ class AutoScraperWorkflow:
         
         # Save workflow results
         results_file = os.path.join(self.output_dir, f'{self.base_name}_workflow.json')
-        import json
         with open(results_file, 'w', encoding='utf-8') as f:
             json.dump(self.results, f, indent=2, ensure_ascii=False)
         
@@ -312,17 +455,33 @@ class AutoScraperWorkflow:
 
 def main():
     """Main entry point"""
-    if len(sys.argv) < 2:
-        print("Usage: python auto_scraper_workflow.py <url> [output_directory]")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    
+    if len(args) < 1:
+        print("Usage: python auto_scraper_workflow.py <url> [output_directory] [--no-analysis-cache] [--subprocess] [--max-pages=N] [--rate-limit=SECONDS] [--resume] [--incremental] [--workers=N] [--archive] [--replay[=WARC_DIR]]")
         print("\nExample:")
         print("  python auto_scraper_workflow.py https://example.com")
         print("  python auto_scraper_workflow.py https://example.com F:/Scrapper/outputs")
         return
     
-    url = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    url = args[0]
+    output_dir = args[1] if len(args) > 1 else None
+    options = dict(flag[2:].split('=', 1) for flag in flags if '=' in flag)
     
-    workflow = AutoScraperWorkflow(url, output_dir)
+    workflow = AutoScraperWorkflow(
+        url,
+        output_dir,
+        use_analysis_cache='--no-analysis-cache' not in flags,
+        scraper_mode='subprocess' if '--subprocess' in flags else 'inprocess',
+        max_pages=int(options.get('max-pages', 10)),
+        rate_limit=float(options.get('rate-limit', 1.0)),
+        resume='--resume' in flags,
+        incremental='--incremental' in flags,
+        workers=int(options.get('workers', 1)),
+        archive='--archive' in flags,
+        replay=options.get('replay') or '--replay' in flags
+    )
     workflow.run()
 
 
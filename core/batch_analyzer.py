@@ -0,0 +1,511 @@
+"""
+Batch Analyzer
+Asynchronous analysis of many URLs with bounded global and per-host concurrency
+(fixed, or adapted to each host's responses by a ConcurrencyController), retries
+behind per-host circuit breakers, and site crawls that follow internal links
+(or start from the site's sitemaps) through a URL frontier
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+import aiohttp
+
+from core.fetch_backend import open_backend
+from core.fetcher import Fetcher
+from core.intelligent_analyzer_v2 import IntelligentAnalyzerV2, analyze_html
+from core.professional_logger import get_logger
+from core.rate_limiter import host_key
+from core.retry_policy import CircuitBreaker, RetryPolicy
+from core.site_discovery import SiteDiscovery
+from core.url_frontier import URLFrontier
+from core.warc_archive import open_warc_writer
+
+
+def _failed_result(url, error):
+    """Result dict for a URL that could not be fetched or analyzed"""
+    return {
+        'metadata': {
+            'url': url,
+            'domain': urlparse(url).netloc,
+            'analyzed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'analyzer_version': '2.0'
+        },
+        'error': error
+    }
+
+
+def analyze_in_worker(url, body, encoding, technical_details):
+    """
+    Process-pool entry point: parse and analyze one page
+
+    Only the raw body bytes cross into the worker and only the compact
+    analysis dict crosses back, so no parse tree is ever pickled.
+    """
+    return analyze_html(url, body, technical_details, encoding)
+
+
+async def fetch_page_async(session, url, timeout=30, archive=None):
+    """
+    Fetch one page with aiohttp
+
+    Args:
+        archive: WARCWriter receiving the response (error responses included)
+
+    Returns:
+        Tuple of (raw body bytes, charset or None, technical_details dict)
+    """
+    start_time = time.time()
+
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=True) as response:
+        body = await response.read()
+        duration = time.time() - start_time
+        if archive is not None:
+            archive.write_exchange(
+                str(response.url), response.status, response.headers, body, response.reason,
+                request_headers=response.request_info.headers, fetched_at=start_time
+            )
+        response.raise_for_status()
+
+        technical_details = {
+            'status_code': response.status,
+            'content_length': len(body),
+            'content_type': response.headers.get('Content-Type', ''),
+            'server': response.headers.get('Server', 'Unknown'),
+            'load_time_ms': round(duration * 1000, 2)
+        }
+        if response.history:
+            technical_details['redirects'] = len(response.history)
+            technical_details['final_url'] = str(response.url)
+
+        return body, response.charset, technical_details
+
+
+class BatchAnalyzer:
+    """Fetches pages concurrently and hands them to the analysis passes"""
+
+    def __init__(self, concurrency=10, per_host=2, timeout=30, workers=None, logger=None, rate_limiter=None,
+                 concurrency_controller=None, retry_policy=None, circuit_breaker=None, archive=None, backend=None):
+        """
+        Args:
+            concurrency: Maximum requests in flight overall
+            per_host: Maximum requests in flight per host
+            timeout: Per-request timeout in seconds
+            workers: Parse and analyze in a process pool of this size
+                     (None runs the passes in a thread next to the event loop)
+            logger: Logger instance
+            rate_limiter: RateLimiter pacing requests per host (None leaves only the concurrency limits)
+            concurrency_controller: ConcurrencyController replacing the fixed per_host limit
+                                    with one adapted to each host's latency and errors
+            retry_policy: RetryPolicy retrying timeouts, connection errors and 429/5xx
+            circuit_breaker: CircuitBreaker failing the URLs of a host that is down at once
+            archive: WARCWriter or directory receiving every fetched response, for
+                     reprocessing offline (see archive_reprocess)
+            backend: FetchBackend, or path of recorded responses to replay instead of
+                     going to the network (see fetch_backend)
+        """
+        self.archive = open_warc_writer(archive, prefix='batch')
+        self.backend = open_backend(backend) if backend is not None else None
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.concurrency_controller = concurrency_controller
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.workers = workers
+        self.logger = logger or get_logger()
+
+        self.stats = {
+            'requested': 0,
+            'analyzed': 0,
+            'failed': 0
+        }
+
+    def _headers(self):
+        """Analyzer headers, leaving content negotiation to aiohttp"""
+        headers = dict(IntelligentAnalyzerV2.REQUEST_HEADERS)
+        headers.pop('Accept-Encoding', None)
+        headers.pop('Connection', None)
+        return headers
+
+    async def _analyze_one(self, session, url, global_slots, host_slots, pending_slots, executor):
+        """Fetch under the concurrency limits, then analyze off the event loop"""
+        async with pending_slots:
+            return await self._fetch_and_analyze(session, url, global_slots, host_slots, executor)
+
+    async def _fetch_and_analyze(self, session, url, global_slots, host_slots, executor=None):
+        """Fetch one page and run the analysis passes on its body"""
+        try:
+            body, encoding, technical_details = await self._fetch_with_retries(session, url, global_slots, host_slots)
+
+            self.logger.log_url_fetch(
+                url,
+                technical_details['status_code'],
+                technical_details['load_time_ms'] / 1000,
+                technical_details['content_length']
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats['failed'] += 1
+            self.logger.error(f"Batch fetch failed for {url}: {str(e)}")
+            return _failed_result(url, str(e) or type(e).__name__)
+
+        try:
+            analysis = await self._run_analysis(url, body, encoding, technical_details, executor)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A crashed worker process surfaces here as BrokenProcessPool
+            self.logger.error(f"Batch analysis failed for {url}: {str(e)}")
+            analysis = None
+
+        if analysis is None:
+            self.stats['failed'] += 1
+            return _failed_result(url, 'Analysis failed')
+
+        self.stats['analyzed'] += 1
+        return analysis
+
+    async def _fetch_with_retries(self, session, url, global_slots, host_slots):
+        """
+        Fetch one page, retrying transient failures with jittered backoff
+
+        The circuit breaker is asked before every attempt, so a host that went
+        down fails its remaining URLs at once with CircuitOpenError.
+        """
+        policy, breaker = self.retry_policy, self.circuit_breaker
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.before_request(url)
+            try:
+                result = await self._fetch_limited(session, url, global_slots, host_slots)
+            except Exception as e:
+                # HTTP errors carry their status; anything else failed on the network
+                status = getattr(e, 'status', None)
+                retry_after = (getattr(e, 'headers', None) or {}).get('Retry-After') if status else None
+                if self.rate_limiter is not None and status in (429, 503):
+                    self.rate_limiter.retry_after(url, retry_after)
+                if breaker is not None:
+                    breaker.record(url, status=status, error=None if status else e)
+                delay = None
+                if policy is not None:
+                    delay = policy.next_delay(url, attempt, status=status, error=None if status else e,
+                                              retry_after=retry_after)
+                if delay is None:
+                    raise
+            except BaseException as e:
+                # Cancelled: frees a half-open probe without judging the host
+                if breaker is not None:
+                    breaker.record(url, error=e)
+                raise
+            else:
+                status = result[2]['status_code']
+                if breaker is not None:
+                    breaker.record(url, status=status)
+                if policy is not None and attempt:
+                    policy.next_delay(url, attempt, status=status)
+                return result
+            self.logger.warning(f"Retrying {url} in {delay:.2f}s (attempt {attempt + 2}/{policy.attempts})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _fetch_limited(self, session, url, global_slots, host_slots):
+        # Take the host slot first so a busy host never holds a global slot idle
+        if self.concurrency_controller is not None:
+            return await self._fetch_adaptive(session, url, global_slots)
+        async with host_slots[urlparse(url).netloc]:
+            return await self._fetch(session, url, global_slots)
+
+    async def _fetch(self, session, url, global_slots, ticket=None):
+        if self.rate_limiter is not None:
+            await self.rate_limiter.wait_async(url)
+        async with global_slots:
+            if ticket is not None:
+                # Only now is the request on the wire: the rate-limit wait is not host load
+                self.concurrency_controller.start(ticket)
+            return await fetch_page_async(session, url, self.timeout, self.archive)
+
+    async def _fetch_adaptive(self, session, url, global_slots):
+        """_fetch() under the host's adaptive limit, reporting the outcome back to it"""
+        controller = self.concurrency_controller
+        ticket = await controller.acquire_async(url, start=False)
+        try:
+            result = await self._fetch(session, url, global_slots, ticket)
+        except BaseException as e:
+            controller.release(ticket, status=getattr(e, 'status', None), error=e)
+            raise
+        technical_details = result[2]
+        controller.release(
+            ticket, status=technical_details['status_code'], latency=technical_details['load_time_ms'] / 1000
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.pace(url, controller.interval(url))
+        return result
+
+    def metrics(self):
+        """Request counts plus rate limiter, concurrency controller, retry, breaker, archive and backend state"""
+        metrics = {'stats': dict(self.stats)}
+        if self.rate_limiter is not None:
+            metrics['rate_limiter'] = dict(self.rate_limiter.stats)
+        if self.concurrency_controller is not None:
+            metrics['concurrency'] = self.concurrency_controller.metrics()
+        if self.retry_policy is not None:
+            metrics['retries'] = self.retry_policy.metrics()
+        if self.circuit_breaker is not None:
+            metrics['circuit_breaker'] = self.circuit_breaker.metrics()
+        if self.archive is not None:
+            metrics['archive'] = self.archive.metrics()
+        if self.backend is not None:
+            metrics['backend'] = self.backend.metrics()
+        return metrics
+
+    async def _run_analysis(self, url, body, encoding, technical_details, executor=None):
+        """Run the CPU-bound analysis passes in the batch's process pool or a worker thread"""
+        loop = asyncio.get_running_loop()
+        if executor is not None:
+            return await loop.run_in_executor(
+                executor, analyze_in_worker, url, body, encoding, technical_details
+            )
+        return await loop.run_in_executor(
+            None, lambda: analyze_html(url, body, technical_details, encoding, logger=self.logger)
+        )
+
+    @contextlib.asynccontextmanager
+    async def _batch(self):
+        """
+        Session, concurrency limits and process pool of one batch; yields analyze_one(url)
+
+        The pool belongs to the batch, so batches running side by side never
+        share or tear down each other's pool; it is shut down on a worker thread,
+        since waiting for its processes would block the event loop.
+        """
+        global_slots = asyncio.Semaphore(self.concurrency)
+        host_slots = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        # Bound fetched-but-unanalyzed bodies so fast fetching cannot outrun the parsers
+        pending_slots = asyncio.Semaphore(self.concurrency + 2 * (self.workers or 1))
+
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+
+        per_host = self.concurrency_controller.max_limit if self.concurrency_controller else self.per_host
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=per_host)
+        try:
+            client_session = self.backend.client_session if self.backend is not None else aiohttp.ClientSession
+            async with client_session(headers=self._headers(), connector=connector) as session:
+                yield lambda url: self._analyze_one(session, url, global_slots, host_slots, pending_slots, executor)
+        finally:
+            if executor is not None:
+                await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    async def analyze(self, urls):
+        """
+        Analyze URLs, yielding each analysis dict as soon as it completes
+
+        Failed URLs yield a dict with 'metadata' and an 'error' message.
+        """
+        urls = list(urls)
+        self.stats['requested'] += len(urls)
+
+        async with self._batch() as analyze_one:
+            tasks = [asyncio.ensure_future(analyze_one(url)) for url in urls]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    async def crawl(self, start_urls, frontier=None, max_pages=100, max_depth=None):
+        """
+        Analyze a site by following its internal links, yielding each analysis as it completes
+
+        Links of every analyzed page go into the frontier, which dedupes them by
+        canonical URL; the most urgent (lowest priority value, by default the
+        shallowest) are fetched next, keeping up to `concurrency` pages in flight.
+        A page is completed in the frontier once the caller has taken its analysis
+        and asks for the next one, so a persistent frontier reopened after a crash
+        fetches again the pages that were in flight or not yet handled.
+
+        Args:
+            start_urls: Pages to start from (depth 0)
+            frontier: URLFrontier to crawl through (a persistent one lets a later crawl
+                      continue with the pages still queued); None uses a temporary one
+            max_pages: Pages to analyze
+            max_depth: Links are not followed beyond this depth (None: no limit)
+        """
+        own_frontier = frontier is None
+        if own_frontier:
+            frontier = URLFrontier()
+        frontier.add_many(start_urls)
+
+        in_flight = {}  # Task -> (URL, depth) of its page
+        started = 0
+        try:
+            async with self._batch() as analyze_one:
+                try:
+                    while True:
+                        while started < max_pages and len(in_flight) < self.concurrency:
+                            popped = frontier.pop()
+                            if popped is None:
+                                break
+                            url, depth = popped
+                            in_flight[asyncio.ensure_future(analyze_one(url))] = (url, depth)
+                            started += 1
+                            self.stats['requested'] += 1
+                        if not in_flight:
+                            break
+
+                        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            url, depth = in_flight.pop(task)
+                            analysis = task.result()
+                            links = analysis.get('structure', {}).get('links', {}).get('internal_urls', [])
+                            if links and (max_depth is None or depth < max_depth):
+                                frontier.add_many(links, depth=depth + 1, base=analysis['metadata']['url'])
+                            yield analysis
+                            frontier.complete(url)
+                finally:
+                    for task, (url, _) in in_flight.items():
+                        task.cancel()
+                        frontier.release(url)
+        finally:
+            if own_frontier:
+                frontier.close()
+
+
+async def analyze_urls(urls, concurrency=10, per_host=2, timeout=30, workers=None, logger=None, rate_limiter=None,
+                       concurrency_controller=None, retry_policy=None, circuit_breaker=None, archive=None,
+                       backend=None):
+    """
+    Analyze many URLs concurrently
+
+    Usage:
+        async for analysis in analyze_urls(urls, concurrency=20):
+            ...
+
+    Args:
+        urls: Iterable of URLs
+        concurrency: Maximum requests in flight overall
+        per_host: Maximum requests in flight per host
+        timeout: Per-request timeout in seconds
+        workers: Size of the parsing process pool (None keeps analysis in-process)
+        logger: Logger instance
+        rate_limiter: RateLimiter pacing requests per host
+        concurrency_controller: ConcurrencyController adapting the per-host limit
+        retry_policy: RetryPolicy retrying transient failures
+        circuit_breaker: CircuitBreaker failing fast on hosts that are down
+        archive: WARCWriter or directory receiving every fetched response
+        backend: FetchBackend or recorded responses to replay (None: the network)
+
+    Yields:
+        Analysis dicts in completion order
+    """
+    batch = BatchAnalyzer(
+        concurrency=concurrency, per_host=per_host, timeout=timeout, workers=workers, logger=logger,
+        rate_limiter=rate_limiter, concurrency_controller=concurrency_controller,
+        retry_policy=retry_policy, circuit_breaker=circuit_breaker, archive=archive, backend=backend
+    )
+    async for analysis in batch.analyze(urls):
+        yield analysis
+
+
+def _write_analyses(analyses, output_dir):
+    """Write one JSON file per analysis of an async iterator; returns the paths"""
+    os.makedirs(output_dir, exist_ok=True)
+
+    async def _run():
+        written = []
+        async for analysis in analyses:
+            domain = analysis['metadata']['domain'].replace('.', '_')
+            output_path = os.path.join(output_dir, f"{domain}_{len(written):05d}_analysis.json")
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(analysis, f, indent=2, ensure_ascii=False, default=str)
+            written.append(output_path)
+        return written
+
+    return asyncio.run(_run())
+
+
+def analyze_urls_to_dir(urls, output_dir, concurrency=10, per_host=2, workers=None, archive=None, backend=None):
+    """Blocking helper: analyze URLs and write one JSON file per result (archive: WARC dir, backend: replay)"""
+    return _write_analyses(
+        analyze_urls(urls, concurrency=concurrency, per_host=per_host, workers=workers,
+                     retry_policy=RetryPolicy(), circuit_breaker=CircuitBreaker(), archive=archive, backend=backend),
+        output_dir
+    )
+
+
+def crawl_site_to_dir(start_urls, output_dir, max_pages=100, frontier_path=None, concurrency=10, per_host=2,
+                      workers=None, sitemaps=False, max_depth=None, archive=None, backend=None):
+    """
+    Blocking helper: crawl from the start URLs and write one JSON file per analyzed page
+
+    Args:
+        frontier_path: SQLite file keeping the frontier between runs (None: temporary)
+        sitemaps: Queue the pages of the start sites' sitemaps first (see SiteDiscovery); with a
+                  frontier_path, pages whose lastmod did not move are not queued again next run
+        max_depth: Links are not followed beyond this depth (0: only the start and sitemap pages)
+        archive: Directory receiving the crawl's responses as WARC files
+        backend: FetchBackend or recorded responses to crawl instead of the network
+    """
+    frontier = URLFrontier(frontier_path) if frontier_path or sitemaps else None
+    batch = BatchAnalyzer(concurrency=concurrency, per_host=per_host, workers=workers, retry_policy=RetryPolicy(),
+                          circuit_breaker=CircuitBreaker(), archive=archive, backend=backend)
+    try:
+        if sitemaps:
+            fetcher = Fetcher(use_cache=False, backend=batch.backend) if batch.backend is not None else None
+            discovery = SiteDiscovery(frontier, fetcher=fetcher,
+                                      state=f'{frontier_path}.sitemaps' if frontier_path else None)
+            for site in sorted({host_key(url) for url in start_urls}):
+                discovery.discover(site)
+            discovery.state.close()
+        return _write_analyses(batch.crawl(start_urls, frontier=frontier, max_pages=max_pages, max_depth=max_depth),
+                               output_dir)
+    finally:
+        if frontier is not None:
+            frontier.close()
+        if batch.archive is not None:
+            batch.archive.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    # --archive=DIR: keep every response in WARC files there (see archive_reprocess)
+    archive = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--archive=')), None)
+    # --replay=PATH: analyze the responses recorded there instead of fetching (see fetch_backend)
+    backend = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--replay=')), None)
+    argv = [arg for arg in sys.argv if not arg.startswith(('--archive=', '--replay='))]
+
+    if len(argv) > 3 and argv[1] == '--crawl':
+        # --sitemaps: crawl the pages listed in the site's sitemaps instead of following links
+        sitemaps = '--sitemaps' in argv
+        args = [arg for arg in argv if arg != '--sitemaps']
+        max_pages = int(args[4]) if len(args) > 4 else 100
+        frontier_path = args[5] if len(args) > 5 else None
+        files = crawl_site_to_dir([args[2]], args[3], max_pages=max_pages, frontier_path=frontier_path,
+                                  sitemaps=sitemaps, max_depth=0 if sitemaps else None, archive=archive,
+                                  backend=backend)
+        print(f"Crawled {len(files)} pages into {args[3]}")
+    elif len(argv) > 2:
+        with open(argv[1], 'r', encoding='utf-8') as f:
+            url_list = [line.strip() for line in f if line.strip()]
+        concurrency = int(argv[3]) if len(argv) > 3 else 10
+        workers = int(argv[4]) if len(argv) > 4 else None
+        files = analyze_urls_to_dir(url_list, argv[2], concurrency=concurrency, workers=workers, archive=archive,
+                                    backend=backend)
+        print(f"Analyzed {len(files)} URLs into {argv[2]}")
+    else:
+        print("Usage: python -m core.batch_analyzer <urls.txt> <output_dir> [concurrency] [workers] [--archive=DIR] "
+              "[--replay=PATH]")
+        print("       python -m core.batch_analyzer --crawl <start_url> <output_dir> [max_pages] [frontier.sqlite] "
+              "[--sitemaps] [--archive=DIR] [--replay=PATH]")
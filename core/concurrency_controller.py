@@ -0,0 +1,324 @@
+"""
+Concurrency Controller
+Adaptive per-host concurrency limits (additive increase, multiplicative decrease)
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+from core.rate_limiter import host_key
+
+
+# Responses that mean "slow down" rather than "this page is broken"
+OVERLOAD_STATUSES = (429, 503)
+
+
+def is_overload(status=None, error=None):
+    """True for outcomes that ask the client to back off: 429/503 and timeouts"""
+    if status in OVERLOAD_STATUSES:
+        return True
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or 'timeout' in type(error).__name__.lower()
+
+
+class HostLimit:
+    """AIMD state of one host"""
+
+    def __init__(self, host, initial, clock):
+        self.host = host
+        self.limit = float(initial)
+        self.in_flight = 0            # Slots taken, including requests still waiting for the rate limiter
+        self.sending = 0              # Requests actually on the wire
+        self.peak_in_flight = 0
+        self.saturated = False        # The limit was fully used by requests on the wire since it last changed
+        self.healthy_responses = 0    # Healthy responses since the limit last changed
+        self.latency = None           # EWMA of response times, seconds
+        self.baseline = None          # Lowest recent response time, seconds
+        self.error_rate = 0.0         # EWMA of failed requests (0..1)
+        self.last_decrease = clock()
+        self.waiters = deque()
+        self.stats = {
+            'requests': 0,
+            'errors': 0,
+            'overloads': 0,
+            'increases': 0,
+            'decreases': 0
+        }
+
+    def metrics(self):
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'sending': self.sending,
+            'peak_in_flight': self.peak_in_flight,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'baseline_ms': round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            **self.stats
+        }
+
+
+class Ticket:
+    """Slot taken by acquire_async(), handed back to start() and release()"""
+
+    __slots__ = ('state', 'acquired', 'started')
+
+    def __init__(self, state, acquired):
+        self.state = state
+        self.acquired = acquired
+        self.started = None
+
+
+class ConcurrencyController:
+    """
+    Per-host concurrency limits that adapt to how each host responds
+
+    Every completed request nudges the host's limit: while response times stay
+    near the host's baseline and errors are rare, a saturated limit grows by
+    about one request per round trip; a 429, 503 or timeout cuts it by
+    `decrease` at most once per round trip (only requests sent after the last
+    cut can cut it again). Waiting for a slot works from any event loop.
+
+    Only requests on the wire count towards saturation: a caller that paces
+    requests after taking the slot acquires with start=False and calls
+    start() once the rate limiter lets the request go, so a host held back by
+    its token bucket does not look busy. interval() turns the limit back into
+    pacing for the rate limiter: the spacing between requests the limit
+    sustains at the host's response time.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=16, increase=1.0, decrease=0.5,
+                 latency_tolerance=2.0, error_threshold=0.2, history=200, clock=time.monotonic, logger=None):
+        """
+        Args:
+            initial: Starting limit for a host not seen before
+            min_limit: Limits never drop below this
+            max_limit: Limits never grow beyond this
+            increase: Requests added to a saturated limit per window of healthy responses
+            decrease: Factor applied to the limit on a 429/503/timeout
+            latency_tolerance: Response times above baseline * tolerance stop the growth
+            error_threshold: Error rate (EWMA) above which growth stops
+            history: Decisions kept for metrics
+            clock: Monotonic time source (injectable for tests)
+            logger: Logger receiving limit decreases
+        """
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= initial <= max_limit")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.error_threshold = error_threshold
+        self.clock = clock
+        self.logger = logger
+
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.decisions = deque(maxlen=history)
+
+    def host(self, url):
+        """State of the URL's host"""
+        key = host_key(url)
+        with self._lock:
+            if key not in self._hosts:
+                self._hosts[key] = HostLimit(key, self.initial, self.clock)
+            return self._hosts[key]
+
+    def limit(self, url):
+        """Requests the URL's host may have in flight right now"""
+        return max(self.min_limit, int(self.host(url).limit))
+
+    def interval(self, url):
+        """
+        Seconds between requests that keep the host's limit busy at its response time
+
+        Paces for one step above the current limit, so a healthy host still
+        fills the limit and the controller can probe for more.
+
+        Returns:
+            latency / (limit + increase), or None before the first healthy response
+        """
+        state = self.host(url)
+        with self._lock:
+            if state.latency is None:
+                return None
+            return state.latency / min(self.max_limit, max(self.min_limit, state.limit + self.increase))
+
+    def _try_acquire(self, state):
+        if state.in_flight >= max(self.min_limit, int(state.limit)):
+            return False
+        state.in_flight += 1
+        return True
+
+    def _start(self, ticket):
+        state = ticket.state
+        ticket.started = self.clock()
+        state.sending += 1
+        state.peak_in_flight = max(state.peak_in_flight, state.sending)
+        if state.sending >= int(state.limit):
+            state.saturated = True
+
+    async def acquire_async(self, url, start=True):
+        """
+        Wait for a slot on the URL's host
+
+        Args:
+            url: URL about to be requested
+            start: Count the request as sent right away; pass False when it still
+                   waits for the rate limiter and call start() when it goes out
+
+        Returns:
+            Ticket to hand back to release()
+        """
+        state = self.host(url)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire(state):
+                    ticket = Ticket(state, self.clock())
+                    if start:
+                        self._start(ticket)
+                    return ticket
+                waiter = loop.create_future()
+                state.waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if (loop, waiter) in state.waiters:
+                        state.waiters.remove((loop, waiter))
+                raise
+
+    def start(self, ticket):
+        """The request holding the ticket goes out now (after acquire_async(url, start=False))"""
+        if ticket.started is None:
+            with self._lock:
+                self._start(ticket)
+
+    def _wake(self, state):
+        # Wake as many waiters as there are free slots; they re-check the limit themselves
+        free = max(self.min_limit, int(state.limit)) - state.in_flight
+        while free > 0 and state.waiters:
+            loop, waiter = state.waiters.popleft()
+            if waiter.done() or loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(_resolve, waiter)
+            free -= 1
+
+    def release(self, ticket, status=None, error=None, latency=None):
+        """
+        Free the slot taken by acquire_async() and learn from the outcome
+
+        Args:
+            ticket: Value returned by acquire_async()
+            status: HTTP status code of the response
+            error: Exception raised instead of a response
+            latency: Response time in seconds (defaults to the time since the request started)
+        """
+        state = ticket.state
+        now = self.clock()
+        if latency is None:
+            latency = now - (ticket.started if ticket.started is not None else ticket.acquired)
+        with self._lock:
+            state.in_flight -= 1
+            if ticket.started is not None:
+                state.sending -= 1
+            if not isinstance(error, asyncio.CancelledError):
+                self._observe(state, now - latency, latency, status, error)
+            self._wake(state)
+
+    def record(self, url, latency, status=None, error=None):
+        """Learn from a request that was sent without taking a slot (sequential fetches)"""
+        state = self.host(url)
+        with self._lock:
+            self._observe(state, self.clock() - latency, latency, status, error)
+
+    def _observe(self, state, started, latency, status, error):
+        state.stats['requests'] += 1
+        # A known status decides (a 404 is not the host struggling); otherwise any error counts
+        failed = status >= 500 if status is not None else error is not None
+        state.error_rate += 0.1 * ((1.0 if failed else 0.0) - state.error_rate)
+        if failed:
+            state.stats['errors'] += 1
+
+        if is_overload(status, error):
+            state.stats['overloads'] += 1
+            # Requests sent before the last cut saw the old limit; one cut per round trip
+            if started >= state.last_decrease:
+                reason = f'HTTP {status}' if status in OVERLOAD_STATUSES else type(error).__name__
+                self._set_limit(state, state.limit * self.decrease, 'decrease', reason)
+                state.last_decrease = self.clock()
+            return
+        if failed:
+            return
+
+        state.latency = latency if state.latency is None else state.latency + 0.2 * (latency - state.latency)
+        # The baseline follows the fastest responses and drifts up slowly so it can recover
+        state.baseline = latency if state.baseline is None else min(latency, state.baseline * 1.01)
+
+        healthy = (state.latency <= state.baseline * self.latency_tolerance
+                   and state.error_rate <= self.error_threshold)
+        # Only grow a limit that is actually used, otherwise it creeps up while idle
+        if state.saturated and healthy and state.limit < self.max_limit:
+            # One full window of healthy responses is one round trip
+            state.healthy_responses += 1
+            if state.healthy_responses >= int(state.limit):
+                self._set_limit(state, state.limit + self.increase, 'increase', 'healthy')
+
+    def _set_limit(self, state, limit, action, reason):
+        old = state.limit
+        state.limit = min(self.max_limit, max(float(self.min_limit), limit))
+        if state.limit == old:
+            return  # Already at the floor or ceiling: nothing to record
+        state.saturated = state.sending >= int(state.limit)
+        state.healthy_responses = 0
+        state.stats['increases' if action == 'increase' else 'decreases'] += 1
+        self.decisions.append({
+            'host': state.host,
+            'action': action,
+            'reason': reason,
+            'from': int(old),
+            'to': int(state.limit),
+            'at': self.clock()
+        })
+        if self.logger and action == 'decrease':
+            self.logger.info(f"Concurrency for {state.host}: {int(old)} -> {int(state.limit)} ({reason})")
+
+    def metrics(self):
+        """Current limits, latencies and decision counts per host, plus recent decisions"""
+        with self._lock:
+            return {
+                'hosts': {key: state.metrics() for key, state in self._hosts.items()},
+                'decisions': list(self.decisions)
+            }
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+if __name__ == '__main__':
+    # Simulated host that starts answering 429 beyond 6 concurrent requests
+    async def _demo():
+        controller = ConcurrencyController(initial=2, max_limit=12)
+
+        async def fetch(i):
+            ticket = await controller.acquire_async('https://example.com/')
+            busy = ticket.state.sending > 6
+            await asyncio.sleep(0.02)
+            controller.release(ticket, status=429 if busy else 200)
+
+        await asyncio.gather(*(fetch(i) for i in range(400)))
+        return controller.metrics()
+
+    metrics = asyncio.run(_demo())
+    print(metrics['hosts'])
+    for decision in metrics['decisions'][-10:]:
+        print(f"   {decision['action']:8} {decision['from']:>2} -> {decision['to']:<2} ({decision['reason']})")
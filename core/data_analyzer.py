@@ -17,9 +17,20 @@ import os
 class DataAnalyzer:
     """Analyzes scraped data and generates insights"""
     
-    def __init__(self, data_file):
+    def __init__(self, data_file=None, output_dir=None, dataframe=None, columns=None):
+        """
+        Args:
+            data_file: Parquet, Feather, CSV, JSON or JSON Lines file with scraped records
+            output_dir: Directory for the charts folder (defaults to the data file's directory)
+            dataframe: Records already in memory; used instead of reading data_file
+            columns: Only load these columns (Parquet and Feather read nothing else)
+        """
+        if data_file is None and dataframe is None:
+            raise ValueError("Provide a data file or a DataFrame")
+        
         self.data_file = data_file
-        self.df = None
+        self.columns = columns
+        self.df = dataframe
         self.analysis_results = {
             'file': data_file,
             'analyzed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -29,22 +40,44 @@ class DataAnalyzer:
         }
         
         # Create charts directory
-        self.charts_dir = os.path.join(os.path.dirname(data_file), 'charts')
+        if output_dir is None:
+            output_dir = os.path.dirname(data_file) if data_file else os.getcwd()
+        self.charts_dir = os.path.join(output_dir, 'charts')
         os.makedirs(self.charts_dir, exist_ok=True)
     
     def load_data(self):
-        """Load data from CSV or JSON"""
+        """
+        Load data from Parquet/Feather, CSV, JSON or JSON Lines (a DataFrame passed in is used as-is)
+        
+        Parquet and Feather keep the column types written by the scraper, so
+        nothing is re-inferred, and only the requested columns are read.
+        """
+        if self.df is not None:
+            print(f"\n📖 Using {len(self.df)} in-memory records")
+            return True
+        
         print(f"\n📖 Loading data from: {self.data_file}")
         
         try:
-            if self.data_file.endswith('.csv'):
-                self.df = pd.read_csv(self.data_file, encoding='utf-8-sig')
+            # pandas picks the compression from a '.gz' suffix
+            data_file = self.data_file[:-3] if self.data_file.endswith('.gz') else self.data_file
+            if data_file.endswith('.parquet'):
+                self.df = pd.read_parquet(self.data_file, columns=self.columns)
+            elif data_file.endswith(('.feather', '.arrow')):
+                self.df = pd.read_feather(self.data_file, columns=self.columns)
+            elif data_file.endswith('.csv'):
+                self.df = pd.read_csv(self.data_file, encoding='utf-8-sig', usecols=self.columns)
+            elif data_file.endswith(('.jsonl', '.ndjson')):
+                self.df = pd.read_json(self.data_file, lines=True, dtype=False, convert_dates=False)
             elif self.data_file.endswith('.json'):
                 with open(self.data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                 self.df = pd.DataFrame(data)
             else:
-                raise ValueError("Unsupported file format. Use CSV or JSON.")
+                raise ValueError("Unsupported file format. Use Parquet, Feather, CSV, JSON or JSON Lines.")
+            
+            if self.columns is not None:
+                self.df = self.df[list(self.columns)]
             
             print(f"   ✅ Loaded {len(self.df)} rows, {len(self.df.columns)} columns")
             return True
@@ -342,9 +375,9 @@ class DataAnalyzer:
         return self.analysis_results
 
 
-def analyze_data(data_file, output_file=None):
+def analyze_data(data_file, output_file=None, dataframe=None, columns=None):
     """Convenience function"""
-    analyzer = DataAnalyzer(data_file)
+    analyzer = DataAnalyzer(data_file, dataframe=dataframe, columns=columns)
     return analyzer.run_full_analysis(output_file)
 
 
@@ -354,6 +387,7 @@ if __name__ == '__main__':
     if len(sys.argv) > 1:
         data_file = sys.argv[1]
         output_file = sys.argv[2] if len(sys.argv) > 2 else None
-        analyze_data(data_file, output_file)
+        columns = sys.argv[3].split(',') if len(sys.argv) > 3 else None
+        analyze_data(data_file, output_file, columns=columns)
     else:
-        print("Usage: python data_analyzer.py <data.csv|data.json> [analysis.json]")
+        print("Usage: python data_analyzer.py <data.parquet|.feather|.csv|.json|.jsonl[.gz]> [analysis.json] [col1,col2,...]")
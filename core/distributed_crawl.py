@@ -0,0 +1,445 @@
+"""
+Distributed Crawl
+Fans a domain crawl out over a WorkQueue: one task per listing page, run by
+worker processes on this or other machines that pace each host together
+through the queue, records collected in page order
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from bs4 import UnicodeDammit
+
+from core.extraction_spec import spec_hash
+from core.fetch_backend import ReplayBackend
+from core.incremental_state import open_incremental_state
+from core.rate_limiter import RateLimiter, TokenBucket
+from core.record_sinks import open_sink
+from core.scraper_runner import project_environment, records_to_dataframe
+from core.scraper_runtime import DEFAULT_CONCURRENCY, ScraperRuntime
+from core.url_frontier import canonicalize_url
+from core.warc_archive import WARCWriter
+from core.work_queue import QueueWorker, open_work_queue
+
+
+PAGE_TASK = 'scrape_page'
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket whose schedule lives in the queue database, so all workers draw from one bucket per host"""
+
+    def __init__(self, queue, host, rate, burst=1):
+        super().__init__(rate, burst)
+        self.queue = queue
+        self.host = host
+
+    def reserve(self):
+        if not self.interval:
+            # Unthrottled host: only a Retry-After pause (kept locally as well) holds requests back
+            return super().reserve()
+        return self.queue.reserve_host(self.host, self.interval, self.burst)
+
+    def block_for(self, seconds):
+        super().block_for(seconds)
+        self.queue.block_host(self.host, seconds)
+
+
+class QueueRateLimiter(RateLimiter):
+    """
+    RateLimiter pacing each host through the work queue
+
+    The spec's rate then holds for the whole crawl, however many workers
+    fetch from the host; each worker still applies robots.txt delays and its
+    concurrency controller's pacing to the interval it reserves with.
+    """
+
+    def __init__(self, queue, rate=1.0, burst=1, respect_robots=True):
+        super().__init__(rate=rate, burst=burst, respect_robots=respect_robots)
+        self.queue = queue
+
+    def _new_bucket(self, key):
+        return SharedTokenBucket(self.queue, key, self.rate, self.burst)
+
+
+# Runtimes of this worker process by spec, so pacing and connections carry over from page to page
+_runtimes = {}
+
+
+def _runtime(spec, queue):
+    key = spec if isinstance(spec, str) else spec_hash(spec)
+    if key not in _runtimes:
+        _runtimes[key] = ScraperRuntime(spec, keep_records=False)
+    runtime = _runtimes[key]
+    runtime.reload_if_changed()
+    limiter = runtime.rate_limiter
+    # Built (or rebuilt by a reload) per process: swap in one that paces through the queue
+    if limiter is not None and not isinstance(limiter, QueueRateLimiter):
+        runtime.rate_limiter = QueueRateLimiter(queue, rate=limiter.rate, burst=limiter.burst,
+                                                respect_robots=limiter.respect_robots)
+        if runtime.fetcher is not None and runtime.fetcher.rate_limiter is limiter:
+            runtime.fetcher.rate_limiter = runtime.rate_limiter
+    return runtime
+
+
+# WARC writers of this worker process by directory: every worker appends to files of its own
+_archives = {}
+
+
+def _archive(directory):
+    if directory and directory not in _archives:
+        _archives[directory] = WARCWriter(directory, prefix='worker')
+    return _archives.get(directory)
+
+
+# Recordings replayed by this worker process, indexed once per path (bodies are read on request)
+_backends = {}
+
+
+def _backend(path):
+    if path and path not in _backends:
+        _backends[path] = ReplayBackend(path)
+    return _backends.get(path)
+
+
+def _incremental(runtime, options):
+    """Join the coordinator's incremental run ({'path', 'run'}; None turns incremental mode off)"""
+    if options is None:
+        if runtime.incremental is not None:
+            runtime.set_incremental(None)
+        return None
+    state = runtime.incremental
+    if state is None or state.path != options['path']:
+        state = runtime.set_incremental(options['path'])
+    state.attach_run(options['run'])
+    return state
+
+
+def _task_key(job, url):
+    return f'{job}:{canonicalize_url(url) or url}'
+
+
+def scrape_page_task(payload, worker):
+    """
+    Handler of PAGE_TASK: fetch one listing page and extract its records
+
+    A page that cannot be fetched (past the end of a numbered listing, or still
+    failing after the fetcher's retries) yields no records. In a next-links
+    crawl the page's next link becomes the following task, so the chain is
+    picked up by whichever worker is free; in a numbered crawl a page with
+    records queues the pages up to one window past it. In an incremental crawl the result
+    also carries the page's signature and change counts, since its records
+    are only the new or changed ones.
+    """
+    runtime = _runtime(payload['spec'], worker.queue)
+    runtime.fetcher.archive = _archive(payload.get('archive'))
+    backend = _backend(payload.get('replay'))
+    if backend is not None and runtime.fetcher.backend is not backend:
+        runtime.set_backend(backend)
+    incremental = _incremental(runtime, payload.get('incremental'))
+    url = payload['url']
+    if payload.get('html') is not None:
+        # The first page as the caller already fetched it
+        response, content = None, payload['html']
+    else:
+        response = runtime.fetch_response(url)
+        if response is None:
+            return {'records': [], 'next_url': None, 'error': 'fetch failed'}
+        content = response.content
+
+    items, signature, next_url = runtime.extract_page(url, content, response)
+    page, max_pages = payload['page'], payload['max_pages']
+    if payload['follow'] and next_url and signature and page < max_pages:
+        worker.spawn(
+            PAGE_TASK, dict(payload, url=next_url, page=page + 1, html=None),
+            key=_task_key(worker.current['job'], next_url)
+        )
+    elif payload.get('window') and signature:
+        # In ascending order and skipping pages already queued, so task ids stay in page order
+        for following in range(page + 1, min(page + payload['window'], max_pages) + 1):
+            following_url = runtime.page_url(following, payload['start_url'])
+            worker.spawn(
+                PAGE_TASK, dict(payload, url=following_url, page=following, html=None),
+                key=_task_key(worker.current['job'], following_url)
+            )
+    result = {'records': items, 'next_url': next_url}
+    if incremental is not None:
+        result['signature'] = signature
+        result['changes'] = incremental.counts
+    return result
+
+
+HANDLERS = {PAGE_TASK: scrape_page_task}
+
+
+def enqueue_crawl(queue, spec, url=None, max_pages=None, job=None, archive=None, replay=None, html=None,
+                  incremental=None, window=None):
+    """
+    Queue the pages of a domain crawl
+
+    With a URL template the first `window` pages are queued at once, so the
+    workers fetch in parallel, and every page with records queues the pages up
+    to `window` past it: a listing shorter than max_pages costs at most one
+    window of requests past its end. A next-links listing starts with its
+    first page and grows one task per page. Pages are keyed by job and canonical URL, so
+    enqueueing the same crawl again (a rerun after a crash) adds nothing and
+    finished pages are not fetched twice.
+
+    Args:
+        queue: WorkQueue or its database path
+        spec: Spec file path (absolute, on a filesystem the workers share) or spec dict
+        url: Start page (defaults to the spec's url)
+        max_pages: Pages to crawl (defaults to the pagination rule's max_pages)
+        job: Job id (defaults to a new one)
+        archive: Directory (shared by the workers) receiving the fetched pages as WARC files
+        replay: Recording (WARC or mirror directory) the workers fetch from instead of the network
+        html: Already-fetched start page (str or bytes), extracted without fetching it again
+        incremental: {'path': state database, 'run': run id} of the incremental run the
+                     workers record their pages in (see run_distributed_crawl())
+        window: Pages queued ahead of the last page with records (defaults to the
+                pagination rule's concurrency)
+
+    Returns:
+        The job id
+    """
+    queue = open_work_queue(queue)
+    spec = os.path.abspath(spec) if isinstance(spec, str) else spec
+    runtime = ScraperRuntime(spec, keep_records=False)
+    url = url or runtime.base_url
+    pagination = runtime.spec.get('pagination') or {}
+    if max_pages is None:
+        max_pages = pagination.get('max_pages', 1)
+    job = job or uuid.uuid4().hex[:12]
+
+    if pagination.get('url_template'):
+        window = window or pagination.get('concurrency') or DEFAULT_CONCURRENCY
+        urls = [url] + [runtime.page_url(page, url) for page in range(2, min(window, max_pages) + 1)]
+    else:
+        window = None
+        urls = [url]
+    if isinstance(html, bytes):
+        # Task payloads are JSON: decode the way the runtime's parser would
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    payloads = [
+        {'spec': spec, 'url': page_url, 'start_url': url, 'page': page, 'max_pages': max_pages,
+         'follow': bool(pagination) and not pagination.get('url_template'), 'window': window,
+         'archive': os.path.abspath(archive) if archive else None,
+         'replay': os.path.abspath(replay) if replay else None,
+         'html': html if page == 1 else None,
+         'incremental': incremental}
+        for page, page_url in enumerate(urls, 1)
+    ]
+    # Handed out in the order added: the listing fills in from the front
+    queue.put_many(PAGE_TASK, payloads, job=job, keys=[_task_key(job, payload['url']) for payload in payloads])
+    return job
+
+
+class PageStream:
+    """
+    Records of a crawl job in page order, handed out while the workers are still at it
+
+    Pages are queued in page order, so a page is ready once every task before
+    it is done. The listing ends, as in a single-process crawl, at the first
+    page that failed, is empty or repeats the page before it.
+    """
+
+    def __init__(self, queue, job):
+        self.queue = open_work_queue(queue)
+        self.job = job
+        self.after = 0           # Last task handed out
+        self.previous = None
+        self.ended = False
+        self.pages = 0
+        self.changes = None      # Summed change counts of an incremental crawl
+
+    def poll(self):
+        """Records of the pages that became ready since the last poll"""
+        records = []
+        while not self.ended:
+            tasks = self.queue.outcomes(self.job, PAGE_TASK, after=self.after)
+            if not tasks:
+                break
+            for task_id, state, _, result in tasks:
+                if state != 'done':
+                    self.ended = state == 'failed'
+                    return records
+                signature = result.get('signature', result['records'])
+                if not signature or signature == self.previous:
+                    self.ended = True
+                    return records
+                records.extend(result['records'])
+                self._count(result.get('changes'))
+                self.previous = signature
+                self.after = task_id
+                self.pages += 1
+        return records
+
+    def _count(self, changes):
+        if changes is None:
+            return
+        if self.changes is None:
+            self.changes = {group: dict.fromkeys(counts, 0) for group, counts in changes.items()}
+        for group, counts in changes.items():
+            for name, count in counts.items():
+                self.changes[group][name] += count
+
+
+def collect_records(queue, job):
+    """Records of a finished crawl job, in page order"""
+    return PageStream(queue, job).poll()
+
+
+def run_worker(queue, job=None, worker_id=None, batch=1, idle_timeout=0):
+    """
+    Work on the queue's crawl tasks until the job (or the whole queue) is done
+
+    Args:
+        queue: WorkQueue or its database path
+        job: Only this job's tasks
+        worker_id: Name in the queue's workers table
+        batch: Tasks leased at a time
+        idle_timeout: Seconds to wait for tasks while the queue is empty
+
+    Returns:
+        The worker's counts of completed, failed and lost tasks
+    """
+    return QueueWorker(queue, HANDLERS, worker_id=worker_id, job=job, batch=batch).run(idle_timeout=idle_timeout)
+
+
+def start_workers(queue_path, count, job=None, python=None, cwd=None, log_dir=None, idle_timeout=0):
+    """
+    Start worker processes on this machine
+
+    Workers on other machines run the same command against the shared queue
+    file: python -m core.distributed_crawl worker <queue.sqlite> [job] [--wait=SECONDS]
+
+    Returns:
+        List of (Popen, log file path)
+    """
+    log_dir = log_dir or tempfile.mkdtemp(prefix='crawl_workers_')
+    workers = []
+    for index in range(count):
+        log_path = os.path.join(log_dir, f'worker_{index}.log')
+        command = [python or sys.executable, '-m', 'core.distributed_crawl', 'worker', os.path.abspath(queue_path)]
+        if job:
+            command.append(job)
+        if idle_timeout:
+            command.append(f'--wait={idle_timeout}')
+        with open(log_path, 'w', encoding='utf-8') as log:
+            process = subprocess.Popen(command, cwd=cwd, env=project_environment(), stdout=log,
+                                       stderr=subprocess.STDOUT)
+        workers.append((process, log_path))
+    return workers
+
+
+def run_distributed_crawl(spec, queue_path, url=None, workers=4, max_pages=None, job=None, outputs=None,
+                          timeout=None, python=None, cwd=None, archive=None, replay=None, html=None,
+                          incremental=None, keep_records=True):
+    """
+    Crawl a domain with `workers` processes sharing one queue
+
+    Records go into the outputs page by page, in page order, as soon as the
+    pages before them are done.
+
+    Args:
+        spec: Spec file path or spec dict
+        queue_path: Queue database (reusing it with the same job continues an interrupted crawl)
+        url, max_pages, job, archive, replay, html: As for enqueue_crawl()
+        workers: Worker processes to start on this machine (0: only workers started elsewhere),
+                 and the window of numbered pages queued ahead (see enqueue_crawl())
+        outputs: Files to write the records to (.csv, .jsonl, .parquet, ...)
+        timeout: Seconds to wait for the job; workers still running are then stopped
+        python: Interpreter for the workers (defaults to the current one)
+        cwd: Working directory of the workers
+        incremental: State database of earlier runs (shared by the workers); pages unchanged
+                     since then are skipped and only new or changed records come back
+        keep_records: Also return the records (False: only the outputs get them)
+
+    Returns:
+        Dict shaped like ScraperRunner.run(): records, dataframe, mode ('distributed'),
+        the workers' output, queue metrics and failed pages, the change summary of an
+        incremental crawl (None otherwise) and whether it timed out
+    """
+    with open_work_queue(queue_path) as queue:
+        state = None
+        if incremental:
+            state = open_incremental_state(os.path.abspath(incremental))
+            # A rerun of an interrupted job continues its unfinished run
+            rerun = job is not None and any(queue.counts(job).values())
+            incremental = {'path': state.path, 'run': state.begin_run(resume=rerun)}
+        job = enqueue_crawl(queue, spec, url=url, max_pages=max_pages, job=job, archive=archive, replay=replay,
+                            html=html, incremental=incremental, window=workers or None)
+        processes = start_workers(queue_path, workers, job=job, python=python, cwd=cwd)
+
+        started = time.monotonic()
+        stream = PageStream(queue, job)
+        sinks = [open_sink(path) for path in outputs or []]
+        records = []
+        try:
+            while True:
+                finished = queue.is_finished(job)
+                page_records = stream.poll()
+                for sink in sinks:
+                    sink.write_many(page_records)
+                if keep_records:
+                    records.extend(page_records)
+                if finished or (timeout is not None and time.monotonic() - started >= timeout):
+                    break
+                time.sleep(0.2)
+        finally:
+            for sink in sinks:
+                sink.close()
+
+        for process, _ in processes:
+            remaining = None if timeout is None else max(1.0, timeout - (time.monotonic() - started))
+            try:
+                process.wait(timeout=remaining if finished else 0)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+        output = []
+        for index, (process, log_path) in enumerate(processes):
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as log:
+                output.append(f"--- worker {index} (exit code {process.returncode}) ---\n{log.read()}")
+
+        changes = None
+        if state is not None:
+            # The workers' counts of the pages that made it into the listing
+            state.counts.update(stream.changes or {})
+            changes = state.finish_run(complete=finished)
+            state.close()
+
+        return {
+            'mode': 'distributed',
+            'job': job,
+            'records': records,
+            'dataframe': records_to_dataframe(records),
+            'output': '\n'.join(output),
+            'metrics': {'queue': queue.metrics(), 'failed_pages': queue.failures(job)},
+            'changes': changes,
+            'timed_out': not finished
+        }
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+
+    if len(args) > 1 and args[0] == 'worker':
+        counts = run_worker(args[1], job=args[2] if len(args) > 2 else None,
+                            idle_timeout=float(options.get('wait', 0)))
+        print(f"Worker done: {counts['completed']} pages, {counts['failed']} failed, {counts['lost']} lost leases")
+    elif len(args) > 2 and args[0] == 'crawl':
+        result = run_distributed_crawl(
+            args[1], args[2], workers=int(args[3]) if len(args) > 3 else 4, outputs=args[4:],
+            archive=options.get('archive'), replay=options.get('replay'), incremental=options.get('incremental')
+        )
+        print(f"Job {result['job']}: {len(result['records'])} records, queue {result['metrics']['queue']['tasks']}")
+    else:
+        print("Usage: python -m core.distributed_crawl crawl <spec.json> <queue.sqlite> [workers] [output.csv ...] "
+              "[--archive=DIR] [--replay=DIR] [--incremental=pages.sqlite]")
+        print("       python -m core.distributed_crawl worker <queue.sqlite> [job] [--wait=SECONDS]")
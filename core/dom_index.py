@@ -0,0 +1,303 @@
+"""
+DOM Index
+Single-pass index over a parsed BeautifulSoup tree shared by all analysis passes
+"""
+
+import re
+from collections import Counter, defaultdict
+
+from bs4 import Tag, NavigableString, CData
+
+
+class DOMIndex:
+    """One traversal of the document, many cheap lookups"""
+
+    # String types get_text() collects for ordinary tags (script/style/template differ)
+    TEXT_STRING_TYPES = frozenset([NavigableString, CData])
+
+    def __init__(self, soup):
+        """
+        Build the index with a single depth-first walk
+
+        Args:
+            soup: Parsed BeautifulSoup document
+        """
+        self.soup = soup
+
+        self.elements = []                   # every Tag in document order
+        self.position = {}                   # id(tag) -> document position
+        self.depth = {}                      # id(tag) -> depth below the document root
+        self.child_count = {}                # id(tag) -> number of child nodes
+        self.child_tag_count = {}            # id(tag) -> number of child tags
+        self.subtree_depth = {}              # id(tag) -> deepest node (tag or string) below it
+        self.subtree_size = {}               # id(tag) -> number of tags in its subtree
+        self.structure_id = {}               # id(tag) -> structural hash of its subtree
+        self.shape_id = {}                   # id(tag) -> class-free structural hash
+        self.text_stats = {}                 # id(tag) -> (text length, words, text pieces)
+
+        self.by_tag = defaultdict(list)      # tag name -> elements
+        self.by_class = defaultdict(list)    # class name -> elements
+        self.by_id = {}                      # id value -> first element
+        self.ids = []                        # (element, id value) in document order
+        self.with_class = []                 # elements carrying a class attribute
+        self.data_attrs = defaultdict(list)  # data-* attribute -> [(element, value)]
+
+        self.tag_counts = Counter()
+        self.class_counts = Counter()
+
+        self._class_pattern_cache = {}
+        self._signatures = {}                # structural signature -> structure id
+        self._shapes = {}                    # class-free signature -> shape id
+
+        self._build()
+
+    def _build(self):
+        """Walk the tree once, recording forward data on entry and subtree data on exit"""
+        # Stack entries: (node, depth, exiting)
+        stack = [(self.soup, 0, False)]
+
+        while stack:
+            node, depth, exiting = stack.pop()
+
+            if exiting:
+                self._on_exit(node, depth)
+                continue
+
+            if node is not self.soup:
+                self._on_enter(node, depth)
+
+            stack.append((node, depth, True))
+            for child in reversed(node.contents):
+                if isinstance(child, Tag):
+                    stack.append((child, depth + 1, False))
+
+    def _on_enter(self, elem, depth):
+        """Record per-element data in document order"""
+        key = id(elem)
+        self.position[key] = len(self.elements)
+        self.depth[key] = depth
+        self.elements.append(elem)
+
+        self.by_tag[elem.name].append(elem)
+        self.tag_counts[elem.name] += 1
+
+        attrs = elem.attrs
+        if 'class' in attrs:
+            self.with_class.append(elem)
+            for cls in attrs['class']:
+                self.class_counts[cls] += 1
+                self.by_class[cls].append(elem)
+
+        if 'id' in attrs:
+            elem_id = attrs['id']
+            self.ids.append((elem, elem_id))
+            if elem_id not in self.by_id:
+                self.by_id[elem_id] = elem
+
+        for attr, value in attrs.items():
+            if attr.startswith('data-'):
+                self.data_attrs[attr].append((elem, value))
+
+    def _on_exit(self, node, depth):
+        """Aggregate subtree data once all children have been visited"""
+        deepest = depth
+        child_tags = 0
+        size = 1
+        child_structures = Counter()
+        child_shapes = set()
+        text_length = words = pieces = 0
+
+        for child in node.contents:
+            if isinstance(child, Tag):
+                child_key = id(child)
+                child_tags += 1
+                size += self.subtree_size[child_key]
+                child_structures[self.structure_id[child_key]] += 1
+                child_shapes.add(self.shape_id[child_key])
+                deepest = max(deepest, self.subtree_depth[child_key])
+
+                child_length, child_words, child_pieces = self.text_stats[child_key]
+                text_length += child_length
+                words += child_words
+                pieces += child_pieces
+            else:
+                deepest = max(deepest, depth + 1)
+
+                if type(child) in self.TEXT_STRING_TYPES:
+                    stripped = child.strip()
+                    if stripped:
+                        text_length += len(stripped)
+                        words += len(stripped.split())
+                        pieces += 1
+
+        key = id(node)
+        self.subtree_depth[key] = deepest
+        self.subtree_size[key] = size
+        self.child_count[key] = len(node.contents)
+        self.child_tag_count[key] = child_tags
+        self.text_stats[key] = (text_length, words, pieces)
+
+        # Structural hash: tag + class signature + the multiset of child structures
+        # (one child and five identical ones differ; their order does not matter).
+        # Signatures are interned to small integers so equal subtrees share an id.
+        # The class-free variant matches items whose class names are obfuscated per item.
+        signature = (
+            node.name,
+            ' '.join(sorted(set(node.attrs.get('class', [])))),
+            tuple(sorted(child_structures.items()))
+        )
+        self.structure_id[key] = self._signatures.setdefault(signature, len(self._signatures))
+
+        shape = (node.name, tuple(sorted(child_shapes)))
+        self.shape_id[key] = self._shapes.setdefault(shape, len(self._shapes))
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def find_all(self, names):
+        """Elements with any of the given tag names, in document order"""
+        if isinstance(names, str):
+            return list(self.by_tag.get(names, []))
+
+        if len(names) == 1:
+            return list(self.by_tag.get(names[0], []))
+
+        merged = []
+        for name in set(names):
+            merged.extend(self.by_tag.get(name, []))
+        merged.sort(key=lambda elem: self.position[id(elem)])
+        return merged
+
+    def find_by_class_pattern(self, pattern, flags=re.I):
+        """
+        Elements whose class matches a regex, like find_all(class_=re.compile(...))
+
+        Args:
+            pattern: Regular expression searched in each class name
+            flags: Regex flags
+
+        Returns:
+            Matching elements in document order
+        """
+        cache_key = (pattern, flags)
+        if cache_key in self._class_pattern_cache:
+            return self._class_pattern_cache[cache_key]
+
+        regex = re.compile(pattern, flags)
+
+        if ' ' in pattern:
+            # Pattern can span class boundaries, match against the joined value too
+            matches = [
+                elem for elem in self.with_class
+                if any(regex.search(cls) for cls in elem['class'])
+                or regex.search(' '.join(elem['class']))
+            ]
+        else:
+            # Match the class vocabulary once, then union the element lists
+            seen = set()
+            matches = []
+            for cls, elems in self.by_class.items():
+                if not regex.search(cls):
+                    continue
+                for elem in elems:
+                    if id(elem) not in seen:
+                        seen.add(id(elem))
+                        matches.append(elem)
+            matches.sort(key=lambda elem: self.position[id(elem)])
+
+        self._class_pattern_cache[cache_key] = matches
+        return matches
+
+    def find_by_id_pattern(self, pattern, flags=re.I):
+        """First element whose id matches a regex, like find(id=re.compile(...))"""
+        regex = re.compile(pattern, flags)
+        for elem, elem_id in self.ids:
+            if regex.search(elem_id):
+                return elem
+        return None
+
+    def find_with_attr(self, name, attr):
+        """Elements of a tag that carry an attribute, like find_all(name, attr=True)"""
+        return [elem for elem in self.by_tag.get(name, []) if attr in elem.attrs]
+
+    def find_by_string(self, names, pattern, flags=re.I):
+        """Elements whose .string matches a regex, like find_all(name, string=re.compile(...))"""
+        regex = re.compile(pattern, flags)
+        matches = []
+        for elem in self.find_all(names):
+            text = elem.string
+            if text is not None and regex.search(text):
+                matches.append(elem)
+        return matches
+
+    def sibling_groups(self, min_repeats=3):
+        """
+        Group the child tags of every element into runs of repeated structure
+
+        Siblings sharing a tag and class signature form a group even when their
+        children differ slightly (an optional badge, a missing image). The
+        remaining siblings are grouped by their class-free structural hash,
+        which catches items whose class names are unique per item.
+
+        Args:
+            min_repeats: Minimum group size to report
+
+        Returns:
+            List of (parent, [children]) tuples in document order of the parent
+        """
+        groups = []
+
+        for parent in self.elements:
+            if self.child_tag_count[id(parent)] < min_repeats:
+                continue
+
+            children = [child for child in parent.contents if isinstance(child, Tag)]
+
+            by_classes = defaultdict(list)
+            for child in children:
+                child_classes = ' '.join(sorted(set(child.attrs.get('class', []))))
+                if child_classes:
+                    by_classes[(child.name, child_classes)].append(child)
+
+            grouped = set()
+            for members in by_classes.values():
+                if len(members) >= min_repeats:
+                    groups.append((parent, members))
+                    grouped.update(id(member) for member in members)
+
+            by_shape = defaultdict(list)
+            for child in children:
+                if id(child) not in grouped:
+                    by_shape[self.shape_id[id(child)]].append(child)
+
+            for members in by_shape.values():
+                if len(members) >= min_repeats:
+                    groups.append((parent, members))
+
+        return groups
+
+    def text_length(self, elem):
+        """Length of elem.get_text(strip=True) without re-serializing the subtree"""
+        if elem.interesting_string_types != self.TEXT_STRING_TYPES:
+            return len(elem.get_text(strip=True))
+        return self.text_stats[id(elem)][0]
+
+    def word_count(self, elem):
+        """Word count of elem.get_text(strip=True) without re-serializing the subtree"""
+        if elem.interesting_string_types != self.TEXT_STRING_TYPES:
+            return len(elem.get_text(strip=True).split())
+
+        _, words, pieces = self.text_stats[id(elem)]
+        # get_text(strip=True) joins stripped pieces with no separator, so the
+        # last word of one piece runs into the first word of the next
+        return words - pieces + 1 if pieces else 0
+
+    def max_depth(self, root=None):
+        """Deepest node below root (body when present), counted in levels"""
+        if root is None:
+            root = self.soup.body if self.soup.body else self.soup
+
+        if root is self.soup:
+            return self.subtree_depth[id(root)]
+        return self.subtree_depth[id(root)] - self.depth[id(root)]
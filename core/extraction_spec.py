@@ -0,0 +1,291 @@
+"""
+Extraction Spec
+Compiles an analysis' scraping strategy into a compact declarative spec
+(item selectors, field rules, pagination rule) run by the shared ScraperRuntime
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+from functools import reduce
+from math import gcd
+
+
+SPEC_VERSION = 1
+
+# Field rules per item rule type, matching what per-site generated scrapers extracted.
+# value: 'text' | 'attr:<name>' | 'classes' | 'data_attributes' (spread into the record)
+# source: CSS selector inside the item (field skipped when nothing matches)
+# all: collect every match as a list (field skipped when empty)
+LIST_ITEM_FIELDS = [
+    {'name': 'text', 'value': 'text'},
+    {'name': 'link', 'source': 'a[href]', 'value': 'attr:href', 'absolute': True},
+    {'name': 'link_text', 'source': 'a[href]', 'value': 'text'},
+    {'name': 'image', 'source': 'img[src]', 'value': 'attr:src', 'absolute': True},
+    {'name': 'image_alt', 'source': 'img[src]', 'value': 'attr:alt', 'default': ''},
+    {'name': 'data-*', 'value': 'data_attributes'},
+]
+
+REPEATED_ITEM_FIELDS = [
+    {'name': 'content', 'value': 'text'},
+    {'name': 'title', 'source': 'h1, h2, h3, h4, h5, h6', 'value': 'text'},
+    {'name': 'links', 'source': 'a[href]', 'value': 'attr:href', 'absolute': True, 'all': True},
+    {'name': 'classes', 'value': 'classes'},
+]
+
+GENERIC_FIELDS = [
+    {'name': 'content', 'value': 'text'},
+    {'name': 'classes', 'value': 'classes'},
+    {'name': 'id', 'value': 'attr:id', 'default': ''},
+    {'name': 'title', 'source': 'h1, h2, h3', 'value': 'text'},
+    {'name': 'link', 'source': 'a[href]', 'value': 'attr:href', 'absolute': True},
+]
+
+# Strategy selector types (V1 and V2 analyzers) and the item rule they compile to
+RULE_TYPES = {
+    'list_items': 'list_items',
+    'repeated_items': 'repeated_items',
+    'repeated_elements': 'repeated_items',
+    'card_elements': 'repeated_items',
+    'table': 'table',
+}
+
+VALUE_KINDS = ('text', 'classes', 'data_attributes')
+
+PAGINATION_TYPES = ('numbered', 'next_prev')
+
+# Link texts that mark a "next page" link (besides rel="next")
+NEXT_KEYWORDS = ['next', 'next page', 'older', 'more', '›', '»', '>', '→']
+
+NUMBER_PATTERN = re.compile(r'(?<![0-9])[0-9]{1,6}(?![0-9])')
+PAGE_PARAMETER_PATTERN = re.compile(r'(?:[?&](?:page|p|pg|paged)=|/page/)([0-9]{1,6})(?![0-9])', re.I)
+# What comes right before the number in a template
+PAGE_PREFIX_PATTERN = re.compile(r'(?:[?&](?:page|p|pg|paged)=|/page/)$', re.I)
+OFFSET_PREFIX_PATTERN = re.compile(r'[?&](?:start|offset|skip|from|first|o)=$', re.I)
+
+# Smallest gap between unnamed numbers read as item offsets rather than a sample of page numbers
+MIN_OFFSET_STEP = 10
+
+
+def _item_rule(selector_info):
+    rule_type = RULE_TYPES.get(selector_info.get('type'))
+    selector = selector_info.get('selector', '')
+    if not rule_type or not selector:
+        return None
+
+    if rule_type == 'table':
+        return {'type': 'table', 'selector': selector}
+
+    if rule_type == 'list_items':
+        return {'type': 'list_items', 'selector': selector, 'fields': LIST_ITEM_FIELDS}
+
+    return {'type': 'repeated_items', 'selector': selector, 'fields': REPEATED_ITEM_FIELDS, 'require': 'content'}
+
+
+def infer_url_template(sample_urls):
+    """
+    URL template shared by numbered pagination links
+
+    Pagination widgets often skip pages (?page=2, 4, 6), so numbers are only
+    read as offsets behind an offset parameter (start=, offset=, ...), or,
+    behind no known parameter, when they start at 0 or are MIN_OFFSET_STEP
+    or more apart; page parameters (page=, p=, /page/) always number pages.
+
+    Returns:
+        Tuple of (href with a '{page}' placeholder, step), or (None, None)
+        when the links do not follow one predictable pattern. A step of 1
+        means page numbers; a larger step means item offsets (page k uses (k - 1) * step).
+    """
+    numbers_by_template = {}
+    for href in sample_urls:
+        for match in NUMBER_PATTERN.finditer(href):
+            template = href[:match.start()] + '{page}' + href[match.end():]
+            numbers_by_template.setdefault(template, set()).add(int(match.group()))
+
+    # Prefer the position that varies across the most links
+    candidates = [(len(numbers), template) for template, numbers in numbers_by_template.items() if len(numbers) > 1]
+    if candidates:
+        template = max(candidates)[1]
+        numbers = sorted(numbers_by_template[template])
+        step = reduce(gcd, (b - a for a, b in zip(numbers, numbers[1:])))
+        prefix = template[:template.index('{page}')]
+        if PAGE_PREFIX_PATTERN.search(prefix):
+            step = 1
+        elif not OFFSET_PREFIX_PATTERN.search(prefix) and numbers[0] != 0 and step < MIN_OFFSET_STEP:
+            step = 1
+        return template, step
+
+    # A single link still qualifies when it names its page parameter
+    for href in sample_urls:
+        match = PAGE_PARAMETER_PATTERN.search(href)
+        if match:
+            return href[:match.start(1)] + '{page}' + href[match.end(1):], 1
+
+    return None, None
+
+
+def _pagination_rule(analysis, max_pages):
+    strategy = analysis.get('scraping_strategy', {})
+    # V2 keeps the detected pattern in semantic_analysis, V1 only flags it in the strategy
+    pagination = analysis.get('semantic_analysis', {}).get('pagination', {})
+
+    if pagination.get('detected'):
+        sample_urls = pagination.get('sample_urls', [])
+        rule_type = pagination.get('type') or 'next_prev'
+    elif (strategy.get('pagination') or {}).get('detected'):
+        sample_urls, rule_type = [], 'next_prev'
+    else:
+        return None
+
+    url_template, page_step = infer_url_template(sample_urls) if rule_type == 'numbered' else (None, None)
+    return {
+        'type': rule_type,
+        'sample_urls': sample_urls,
+        # Predictable URLs are fetched concurrently, otherwise next links are followed one by one
+        'url_template': url_template,
+        'page_step': page_step,
+        'next_keywords': NEXT_KEYWORDS,
+        'max_pages': max_pages,
+        # Pages per wave at first; waves grow up to max_concurrency while the host keeps up
+        'concurrency': 4,
+        'max_concurrency': 16
+    }
+
+
+def compile_spec(analysis, max_pages=1, rate_limit=1.0, burst=1):
+    """
+    Compile an analysis into an extraction spec
+
+    Args:
+        analysis: Analysis dict from IntelligentAnalyzer or IntelligentAnalyzerV2
+        max_pages: Pages to crawl when pagination was detected (1 scrapes the start page only)
+        rate_limit: Seconds between requests to the site
+        burst: Requests allowed back to back before the pacing applies
+
+    Returns:
+        JSON-serializable spec dict
+    """
+    source = analysis.get('metadata', analysis)
+    strategy = analysis.get('scraping_strategy', {})
+
+    rules = [rule for rule in map(_item_rule, strategy.get('selectors', [])) if rule]
+
+    # Without a detected selector, fall back to article-like blocks
+    if not strategy.get('selectors'):
+        rules.append({
+            'type': 'generic',
+            'selector': 'article[class], div[class]',
+            'limit': 50,
+            'fields': GENERIC_FIELDS,
+            'require': 'content',
+            'min_length': 51
+        })
+
+    # Deep copy so callers can edit a spec without touching the shared field rules
+    return copy.deepcopy({
+        'spec_version': SPEC_VERSION,
+        'url': source['url'],
+        'domain': source['domain'],
+        'rules': rules,
+        'pagination': _pagination_rule(analysis, max_pages),
+        'rate_limit': {'delay': rate_limit, 'burst': burst}
+    })
+
+
+def validate_spec(spec):
+    """Raise ValueError when a spec cannot be run by this runtime version"""
+    if spec.get('spec_version') != SPEC_VERSION:
+        raise ValueError(f"Unsupported spec version {spec.get('spec_version')!r} (expected {SPEC_VERSION})")
+
+    for rule in spec.get('rules', []):
+        if rule.get('type') not in ('list_items', 'repeated_items', 'generic', 'table'):
+            raise ValueError(f"Unknown rule type {rule.get('type')!r}")
+        if not rule.get('selector'):
+            raise ValueError(f"Rule {rule['type']!r} has no selector")
+        for field in rule.get('fields', []):
+            value = field.get('value', '')
+            if value not in VALUE_KINDS and not value.startswith('attr:'):
+                raise ValueError(f"Unknown value kind {value!r} for field {field.get('name')!r}")
+
+    rate_limit = spec.get('rate_limit')
+    if rate_limit and (rate_limit.get('delay', 0) < 0 or rate_limit.get('burst', 1) < 1):
+        raise ValueError("rate_limit needs a non-negative delay and a burst of at least 1")
+
+    pagination = spec.get('pagination')
+    if pagination:
+        if pagination.get('type') not in PAGINATION_TYPES:
+            raise ValueError(f"Unknown pagination type {pagination.get('type')!r}")
+        if pagination.get('url_template') and '{page}' not in pagination['url_template']:
+            raise ValueError("Pagination url_template needs a '{page}' placeholder")
+        concurrency = pagination.get('concurrency') or 1
+        if concurrency < 1 or (pagination.get('max_concurrency') or concurrency) < concurrency:
+            raise ValueError("Pagination needs a concurrency of at least 1 and a max_concurrency not below it")
+    return spec
+
+
+def spec_hash(spec):
+    """Short content hash of a spec, stable across key order and formatting"""
+    canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def save_spec(spec, path):
+    """Write a spec as formatted JSON (atomically, so a hot-reloading runtime never reads half a file)"""
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(temp_path, path)
+    return path
+
+
+def load_spec(path):
+    """Read and validate a spec file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return validate_spec(json.load(f))
+
+
+def diff_specs(old, new, path=''):
+    """
+    Differences between two specs
+
+    Returns:
+        List of (path, old_value, new_value); missing values are None
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in list(old) + [key for key in new if key not in old]:
+            changes.extend(diff_specs(old.get(key), new.get(key), f'{path}.{key}' if path else key))
+        return changes
+
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changes = []
+        for i, (old_item, new_item) in enumerate(zip(old, new)):
+            changes.extend(diff_specs(old_item, new_item, f'{path}[{i}]'))
+        return changes
+
+    return [] if old == new else [(path, old, new)]
+
+
+def compile_spec_file(analysis_file, output_file):
+    """Convenience function"""
+    with open(analysis_file, 'r', encoding='utf-8') as f:
+        return save_spec(compile_spec(json.load(f)), output_file)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 3 and sys.argv[1] == 'diff':
+        changes = diff_specs(load_spec(sys.argv[2]), load_spec(sys.argv[3]))
+        for change_path, old_value, new_value in changes:
+            print(f"{change_path}: {old_value!r} -> {new_value!r}")
+        print(f"{len(changes)} change(s)")
+    elif len(sys.argv) > 2:
+        compile_spec_file(sys.argv[1], sys.argv[2])
+        print(f"Spec written to {sys.argv[2]}")
+    else:
+        print("Usage: python -m core.extraction_spec <analysis.json> <spec.json>")
+        print("       python -m core.extraction_spec diff <old_spec.json> <new_spec.json>")
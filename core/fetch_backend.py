@@ -0,0 +1,377 @@
+"""
+Fetch Backend
+Where the fetch layer's requests go: the network, or responses recorded
+earlier (WARC archives written with archive=, or a wget-style mirror
+directory) replayed with configurable latency and injected errors, so the
+analyzers, scrapers, tests and benchmarks run the same way offline
+"""
+
+import asyncio
+import io
+import mimetypes
+import os
+import random
+import threading
+import time
+from http.client import responses as HTTP_REASONS
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+import urllib3
+from multidict import CIMultiDict, CIMultiDictProxy
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from yarl import URL
+
+from core.warc_archive import archive_files, index_responses, read_response
+
+
+# Kinds of failure ReplayBackend can inject besides an HTTP status
+INJECTED_ERRORS = ('connection', 'timeout')
+
+
+class FetchBackend:
+    """
+    Transport behind a Fetcher or BatchAnalyzer
+
+    Serves both fetch paths: synchronous requests through the transport
+    adapter mounted on the requests.Session, and async ones through an
+    aiohttp-compatible client session.
+    """
+
+    name = 'base'
+
+    def mount(self, session):
+        """Route a requests.Session through this backend; returns the session"""
+        raise NotImplementedError
+
+    def client_session(self, **kwargs):
+        """Async client session, taking the keyword arguments of aiohttp.ClientSession"""
+        raise NotImplementedError
+
+    def metrics(self):
+        return {'backend': self.name}
+
+
+class LiveBackend(FetchBackend):
+    """The network: requests' own HTTPAdapter and aiohttp"""
+
+    name = 'live'
+
+    def mount(self, session):
+        # Also undoes a replay backend mounted on the session before
+        session.mount('https://', HTTPAdapter())
+        session.mount('http://', HTTPAdapter())
+        return session
+
+    def client_session(self, **kwargs):
+        return aiohttp.ClientSession(**kwargs)
+
+
+class StoredResponse:
+    """Status, headers and body served for a URL"""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason or HTTP_REASONS.get(status, '')
+        self.headers = headers
+        self.body = body
+
+
+class ReplayBackend(FetchBackend):
+    """
+    Serves stored responses instead of going to the network
+
+    Sources are WARC files or directories of them, and mirror directories
+    laid out like `wget --mirror`: <root>/<host[:port]>/<path>, index.html for
+    a path ending in '/', the query string kept in the file name
+    (list?page=2). A URL that was not recorded gets a 404. Only an index of
+    the WARC sources is kept in memory; each response is read from its file
+    when it is requested.
+
+    Whether a request is delayed or fails is drawn from the seed, the URL and
+    how often the URL was requested before, so concurrent runs inject the
+    same errors into the same requests whatever order they come in.
+    """
+
+    name = 'replay'
+
+    def __init__(self, sources, latency=0.0, error_rate=0.0, error='connection', seed=0, missing_status=404):
+        """
+        Args:
+            sources: WARC file, WARC directory or mirror directory, or a list of them
+            latency: Seconds each response takes, or a (min, max) range drawn per request
+            error_rate: Fraction of requests that fail instead of being served
+            error: How they fail: 'connection', 'timeout' or an HTTP status (503, 429, ...)
+            seed: Seed of the latency and error draws
+            missing_status: Status served for URLs that were not recorded
+        """
+        if error not in INJECTED_ERRORS and not isinstance(error, int):
+            raise ValueError(f"Unknown injected error '{error}', use one of {INJECTED_ERRORS} or an HTTP status")
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = error
+        self.seed = seed
+        self.missing_status = missing_status
+
+        self._archived = {}  # URL -> (file, offset, position) of its response in the WARC sources (a later record wins)
+        self._mirrors = []
+        self._requests = {}  # URL -> times requested, for the draws
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'requests': 0,
+            'served': 0,
+            'missing': 0,
+            'injected_errors': 0
+        }
+
+        for source in [sources] if isinstance(sources, str) else sources:
+            if os.path.isdir(source) and not archive_files(source):
+                self._mirrors.append(source)
+                continue
+            for url, location in index_responses(source):
+                self._archived[_strip_fragment(url)] = location
+
+    def __len__(self):
+        """Responses recorded in the WARC sources (mirror files are looked up when requested)"""
+        return len(self._archived)
+
+    def lookup(self, url):
+        """StoredResponse recorded for a URL, or None"""
+        url = _strip_fragment(url)
+        location = self._archived.get(url)
+        if location is not None:
+            response = read_response(*location)
+            if response is not None:
+                return StoredResponse(response.status, response.reason, response.headers, response.body)
+
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if path.endswith('/'):
+            path += 'index.html'
+        name = path.lstrip('/') + (f'?{parts.query}' if parts.query else '')
+        for root in self._mirrors:
+            file_path = os.path.join(root, parts.netloc, *name.split('/'))
+            if os.path.isdir(file_path):
+                file_path = os.path.join(file_path, 'index.html')
+            if os.path.isfile(file_path):
+                with open(file_path, 'rb') as f:
+                    body = f.read()
+                headers = CaseInsensitiveDict({'Content-Type': _guess_type(path),
+                                               'Content-Length': str(len(body))})
+                return StoredResponse(200, 'OK', headers, body)
+        return None
+
+    def plan(self, url):
+        """
+        (delay seconds, injected error or None, StoredResponse) of the next request for a URL
+
+        The error is 'connection', 'timeout' or the StoredResponse carries the injected status.
+        """
+        with self._lock:
+            count = self._requests.get(url, 0)
+            self._requests[url] = count + 1
+            self.stats['requests'] += 1
+
+        rng = random.Random(f'{self.seed}|{url}|{count}')
+        if isinstance(self.latency, (tuple, list)):
+            delay = rng.uniform(*self.latency)
+        else:
+            delay = self.latency
+
+        if self.error_rate and rng.random() < self.error_rate:
+            with self._lock:
+                self.stats['injected_errors'] += 1
+            if isinstance(self.error, int):
+                return delay, None, StoredResponse(self.error, None, CaseInsensitiveDict({'Content-Length': '0'}), b'')
+            return delay, self.error, None
+
+        stored = self.lookup(url)
+        with self._lock:
+            self.stats['served' if stored is not None else 'missing'] += 1
+        if stored is None:
+            stored = StoredResponse(self.missing_status, None, CaseInsensitiveDict({'Content-Length': '0'}), b'')
+        return delay, None, stored
+
+    def mount(self, session):
+        adapter = ReplayAdapter(self)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def client_session(self, **kwargs):
+        return ReplayClientSession(self, **kwargs)
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, backend=self.name, recorded=len(self._archived))
+
+
+def _strip_fragment(url):
+    return url.split('#', 1)[0]
+
+
+def _guess_type(path):
+    """Content type of a mirrored file; extensionless pages are HTML"""
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding == 'gzip':
+        return 'application/gzip'
+    return content_type or 'text/html'
+
+
+def _timeout_seconds(timeout):
+    """Read timeout of a requests timeout (seconds or (connect, read)) or an aiohttp.ClientTimeout"""
+    if isinstance(timeout, tuple):
+        timeout = timeout[1]
+    if isinstance(timeout, aiohttp.ClientTimeout):
+        timeout = timeout.total
+    return timeout
+
+
+class ReplayAdapter(HTTPAdapter):
+    """requests transport adapter answering from a ReplayBackend"""
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        delay, error, stored = self.backend.plan(request.url)
+        limit = _timeout_seconds(timeout)
+        if limit is not None and delay > limit:
+            time.sleep(limit)
+            raise requests.ReadTimeout(f"Replayed response for {request.url} took longer than {limit}s",
+                                       request=request)
+        if delay:
+            time.sleep(delay)
+        if error == 'connection':
+            raise requests.ConnectionError(f"Injected connection error for {request.url}", request=request)
+        if error == 'timeout':
+            raise requests.ReadTimeout(f"Injected timeout for {request.url}", request=request)
+
+        raw = urllib3.HTTPResponse(
+            body=io.BytesIO(stored.body), headers=dict(stored.headers), status=stored.status,
+            reason=stored.reason, preload_content=False, decode_content=False,
+            request_method=request.method, request_url=request.url
+        )
+        return self.build_response(request, raw)
+
+
+class ReplayClientResponse:
+    """The part of aiohttp.ClientResponse the fetch layer reads"""
+
+    def __init__(self, url, stored, request_headers):
+        self.url = URL(url)
+        self.status = stored.status
+        self.reason = stored.reason
+        self.headers = CIMultiDictProxy(CIMultiDict(stored.headers.items()))
+        self.history = ()
+        self.request_info = aiohttp.RequestInfo(self.url, 'GET', CIMultiDictProxy(CIMultiDict(request_headers)),
+                                                self.url)
+        self.content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+        self.charset = get_encoding_from_headers(CaseInsensitiveDict(stored.headers)) \
+            if 'charset' in self.headers.get('Content-Type', '').lower() else None
+        self._body = stored.body
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None):
+        return self._body.decode(encoding or self.charset or 'utf-8', 'replace')
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(self.request_info, self.history, status=self.status,
+                                              message=self.reason, headers=self.headers)
+
+    def release(self):
+        pass
+
+
+class _ReplayRequest:
+    """`async with session.get(...) as response` of a ReplayClientSession"""
+
+    def __init__(self, session, url, headers, timeout):
+        self.session = session
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+
+    async def __aenter__(self):
+        backend = self.session.backend
+        delay, error, stored = backend.plan(self.url)
+        limit = _timeout_seconds(self.timeout) or _timeout_seconds(self.session.timeout)
+        if limit is not None and delay > limit:
+            await asyncio.sleep(limit)
+            raise asyncio.TimeoutError()
+        if delay:
+            await asyncio.sleep(delay)
+        if error == 'connection':
+            raise aiohttp.ClientConnectionError(f"Injected connection error for {self.url}")
+        if error == 'timeout':
+            raise asyncio.TimeoutError()
+        headers = dict(self.session.headers)
+        headers.update(self.headers or {})
+        return ReplayClientResponse(self.url, stored, headers)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class ReplayClientSession:
+    """aiohttp.ClientSession stand-in answering from a ReplayBackend"""
+
+    def __init__(self, backend, headers=None, timeout=None, connector=None, **kwargs):
+        self.backend = backend
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        # Created for the network by the caller; nothing is ever sent through it
+        self._connector = connector
+        self.closed = False
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        return _ReplayRequest(self, str(url), headers, timeout)
+
+    async def close(self):
+        if self._connector is not None:
+            await self._connector.close()
+        self.closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def open_backend(backend=None, **kwargs):
+    """
+    Convenience function: the backend passed in, a ReplayBackend of a
+    recording path, or the live backend for None
+
+    Args:
+        backend: FetchBackend, WARC/mirror path (or list of them), or None
+        **kwargs: ReplayBackend options (latency, error_rate, error, seed, ...)
+    """
+    if backend is None:
+        return LiveBackend()
+    if isinstance(backend, FetchBackend):
+        return backend
+    return ReplayBackend(backend, **kwargs)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 2:
+        replay = ReplayBackend(sys.argv[1])
+        session = replay.mount(requests.Session())
+        for url in sys.argv[2:]:
+            response = session.get(url)
+            print(f"{response.status_code}  {len(response.content):>9}  {url}")
+    else:
+        print("Usage: python -m core.fetch_backend <archive_dir|file.warc.gz|mirror_dir> <url ...>")
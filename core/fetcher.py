@@ -0,0 +1,366 @@
+"""
+Fetcher
+Shared HTTP fetch layer used by the analyzers and generated scrapers
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+
+import aiohttp
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from core.fetch_backend import open_backend
+from core.http_cache import get_http_cache
+from core.professional_logger import get_logger
+from core.rate_limiter import host_key
+
+
+class Fetcher:
+    """One place where every page request is made"""
+
+    def __init__(self, session=None, headers=None, timeout=30, cache=None, use_cache=True, logger=None,
+                 rate_limiter=None, concurrency_controller=None, retry_policy=None, circuit_breaker=None, archive=None,
+                 backend=None):
+        """
+        Args:
+            session: requests.Session to reuse (a new one is created otherwise)
+            headers: Default request headers
+            timeout: Request timeout in seconds
+            cache: HTTPCache instance (defaults to the shared on-disk cache)
+            use_cache: Set False to always go to the network
+            logger: ScraperLogger receiving fetch and cache events
+            rate_limiter: RateLimiter pacing requests per host (None sends them unthrottled)
+            concurrency_controller: ConcurrencyController adapting how many requests
+                                    get_many() keeps in flight per host
+            retry_policy: RetryPolicy retrying timeouts, connection errors and 429/5xx
+                          with jittered backoff (None makes a single attempt)
+            circuit_breaker: CircuitBreaker failing requests to a host that keeps
+                             failing with CircuitOpenError instead of sending them
+            archive: WARCWriter receiving every response handed out, cache hits included,
+                     so the archive alone can replay the run
+            backend: FetchBackend the requests go through, or the path of recorded responses
+                     to replay (None goes to the network; see fetch_backend)
+        """
+        self.session = session or requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        self.timeout = timeout
+        self.cache = (cache or get_http_cache()) if use_cache else None
+        self.logger = logger or get_logger()
+        self.rate_limiter = rate_limiter
+        self.concurrency_controller = concurrency_controller
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.archive = archive
+        self.backend = None
+        if backend is not None:
+            self.set_backend(backend)
+
+    def set_backend(self, backend):
+        """
+        Send the requests of both fetch paths through a FetchBackend
+
+        Args:
+            backend: FetchBackend, or WARC/mirror path(s) to replay (None goes back to the network)
+
+        Returns:
+            The backend
+        """
+        self.backend = open_backend(backend)
+        self.backend.mount(self.session)
+        return self.backend
+
+    def _archived(self, response):
+        """Append a response to the WARC archive (a full disk never fails the fetch)"""
+        if self.archive is not None:
+            try:
+                self.archive.write_response(response)
+            except OSError as e:
+                self.logger.warning(f"Could not archive {response.url}: {e}")
+        return response
+
+    def _load_robots(self, url):
+        """Fetch a host's robots.txt once so its Crawl-delay applies before the first request"""
+        if self.rate_limiter is None or not self.rate_limiter.needs_robots(url):
+            return
+
+        robots_url = host_key(url) + '/robots.txt'
+        try:
+            self.rate_limiter.wait(robots_url)
+            response = self.session.get(robots_url, timeout=self.timeout)
+        except requests.RequestException:
+            return
+        if response.status_code == 200:
+            user_agent = self.session.headers.get('User-Agent', '*')
+            self.rate_limiter.apply_robots(url, response.text, user_agent)
+
+    def _record(self, url, latency, status=None, error=None):
+        """Let the concurrency controller and circuit breaker learn from a sequential request"""
+        if self.concurrency_controller is not None:
+            self.concurrency_controller.record(url, latency, status=status, error=error)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(url, status=status, error=error)
+
+    def _before_request(self, url):
+        """Fail fast with CircuitOpenError while the URL's host breaker is open"""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request(url)
+
+    def _backoff(self, url, attempt, response=None, error=None):
+        """Seconds to wait before retrying a finished attempt, or None when it stands"""
+        if self.retry_policy is None:
+            return None
+        if response is not None:
+            return self.retry_policy.next_delay(
+                url, attempt, status=response.status_code, retry_after=response.headers.get('Retry-After')
+            )
+        return self.retry_policy.next_delay(url, attempt, error=error)
+
+    def _retry_delay(self, url, attempt, response=None, error=None):
+        """_backoff(), sleeping through the delay when there is one"""
+        delay = self._backoff(url, attempt, response, error)
+        if delay is not None:
+            self.logger.warning(f"Retrying {url} in {delay:.2f}s (attempt {attempt + 2}/{self.retry_policy.attempts})")
+            self.retry_policy.sleep(delay)
+        return delay
+
+    def _after_response(self, url, response):
+        if self.rate_limiter is not None and response.status_code in (429, 503):
+            self.rate_limiter.retry_after(url, response.headers.get('Retry-After'))
+
+    def get(self, url, **kwargs):
+        """
+        GET a URL through the cache, paced by the rate limiter
+
+        Only requests that reach the network wait for the host's rate limit;
+        fresh cache hits are returned immediately. With a retry policy, failed
+        attempts are repeated after a jittered backoff (a GET is idempotent);
+        the last response is returned even when it is still a 5xx.
+
+        Args:
+            url: URL to fetch
+            **kwargs: Extra arguments for requests (headers, allow_redirects, ...)
+
+        Returns:
+            requests.Response (from_cache tells whether the body came from disk)
+
+        Raises:
+            CircuitOpenError: The host's circuit breaker is open
+        """
+        kwargs.setdefault('timeout', self.timeout)
+
+        entry, validators = None, {}
+        if self.cache is not None:
+            cached, entry, validators = self.cache.prepare(url)
+            if cached is not None:
+                self.logger.log_cache_event('hit', url)
+                return self._archived(cached)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(validators)
+
+        if self.rate_limiter is not None:
+            self._load_robots(url)
+        attempt = 0
+        while True:
+            self._before_request(url)
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, **kwargs)
+            except requests.RequestException as e:
+                self._record(url, time.monotonic() - start, error=e)
+                if self._retry_delay(url, attempt, error=e) is None:
+                    raise
+            except BaseException as e:
+                # Interrupted: frees a half-open probe without judging the host
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(url, error=e)
+                raise
+            else:
+                self._record(url, time.monotonic() - start, status=response.status_code)
+                self._after_response(url, response)
+                if self._retry_delay(url, attempt, response=response) is None:
+                    break
+            attempt += 1
+
+        if self.cache is None:
+            response.from_cache = False
+            return self._archived(response)
+
+        response = self.cache.complete(url, entry, validators, response)
+        self.logger.log_cache_event(response.cache_status, url)
+        return self._archived(response)
+
+    def get_many(self, urls, concurrency=4, headers=None):
+        """
+        GET several URLs concurrently with an async client
+
+        Goes through the same cache as get(). Requests carry the session's headers.
+        With a concurrency controller, each host additionally gets its own adaptive limit.
+        Called from a coroutine (where asyncio.run() is not allowed), it runs
+        its own event loop on a worker thread and blocks until it is done;
+        await get_many_async() instead not to block the caller's loop.
+
+        Args:
+            urls: URLs to fetch
+            concurrency: Maximum requests in flight overall
+            headers: Extra request headers per URL ({url: {header: value}})
+
+        Returns:
+            List in the order of urls holding a requests.Response, or the
+            exception raised for that URL
+        """
+        urls = list(urls)
+        for url in urls:
+            self._load_robots(url)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._get_many(urls, concurrency, headers or {}))
+
+        outcome = {}
+
+        def run():
+            try:
+                outcome['responses'] = asyncio.run(self._get_many(urls, concurrency, headers or {}))
+            except BaseException as e:
+                outcome['error'] = e
+
+        worker = threading.Thread(target=run, name='fetcher-get-many')
+        worker.start()
+        worker.join()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['responses']
+
+    async def get_many_async(self, urls, concurrency=4, headers=None):
+        """
+        get_many() as a coroutine, on the caller's event loop
+
+        robots.txt of the hosts not seen before is fetched on a worker thread.
+        """
+        urls = list(urls)
+        for url in urls:
+            await asyncio.to_thread(self._load_robots, url)
+        return await self._get_many(urls, concurrency, headers or {})
+
+    async def _get_many(self, urls, concurrency, headers):
+        semaphore = asyncio.Semaphore(concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        client_session = self.backend.client_session if self.backend is not None else aiohttp.ClientSession
+        async with client_session(headers=dict(self.session.headers), timeout=timeout) as session:
+            return await asyncio.gather(
+                *(self._get_async(session, semaphore, url, headers.get(url)) for url in urls),
+                return_exceptions=True
+            )
+
+    async def _get_async(self, session, semaphore, url, headers=None):
+        entry, validators = None, {}
+        if self.cache is not None:
+            cached, entry, validators = self.cache.prepare(url)
+            if cached is not None:
+                self.logger.log_cache_event('hit', url)
+                return self._archived(cached)
+        request_headers = dict(headers or {})
+        request_headers.update(validators)
+
+        attempt = 0
+        while True:
+            self._before_request(url)
+            try:
+                converted = await self._attempt_async(session, semaphore, url, request_headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(url, error=e)
+                delay = self._backoff(url, attempt, error=e)
+                if delay is None:
+                    raise
+            except BaseException as e:
+                # Cancelled: frees a half-open probe without judging the host
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(url, error=e)
+                raise
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(url, status=converted.status_code)
+                self._after_response(url, converted)
+                delay = self._backoff(url, attempt, response=converted)
+                if delay is None:
+                    break
+            self.logger.warning(f"Retrying {url} in {delay:.2f}s (attempt {attempt + 2}/{self.retry_policy.attempts})")
+            # The backoff holds no slot, so other hosts keep going meanwhile
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        if self.cache is None:
+            converted.from_cache = False
+            return self._archived(converted)
+
+        converted = self.cache.complete(url, entry, validators, converted)
+        self.logger.log_cache_event(converted.cache_status, url)
+        return self._archived(converted)
+
+    async def _attempt_async(self, session, semaphore, url, headers):
+        """One request under the concurrency limits"""
+        controller = self.concurrency_controller
+        # Take the host slot first so a host at its limit never holds a global slot idle
+        ticket = await controller.acquire_async(url, start=False) if controller is not None else None
+        try:
+            async with semaphore:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.wait_async(url)
+                if ticket is not None:
+                    # Only now is the request on the wire: the rate-limit wait is not host load
+                    controller.start(ticket)
+                start = datetime.datetime.now()
+                async with session.get(url, headers=headers, allow_redirects=True) as response:
+                    body = await response.read()
+                    converted = build_response(url, response, body, datetime.datetime.now() - start)
+        except BaseException as e:
+            if ticket is not None:
+                controller.release(ticket, error=e)
+            raise
+        if ticket is not None:
+            controller.release(ticket, status=converted.status_code, latency=converted.elapsed.total_seconds())
+            if self.rate_limiter is not None:
+                self.rate_limiter.pace(url, controller.interval(url))
+        return converted
+
+    def metrics(self):
+        """Rate limiter counters, concurrency limits, retries, circuit breaker states, archive and backend counts"""
+        metrics = {}
+        if self.rate_limiter is not None:
+            metrics['rate_limiter'] = dict(self.rate_limiter.stats)
+        if self.concurrency_controller is not None:
+            metrics['concurrency'] = self.concurrency_controller.metrics()
+        if self.retry_policy is not None:
+            metrics['retries'] = self.retry_policy.metrics()
+        if self.circuit_breaker is not None:
+            metrics['circuit_breaker'] = self.circuit_breaker.metrics()
+        if self.archive is not None:
+            metrics['archive'] = self.archive.metrics()
+        if self.backend is not None:
+            metrics['backend'] = self.backend.metrics()
+        return metrics
+
+    def close(self):
+        self.session.close()
+
+
+def build_response(url, response, body, elapsed):
+    """requests.Response holding an aiohttp response, so both fetch paths return the same type"""
+    converted = requests.Response()
+    converted.status_code = response.status
+    converted.reason = response.reason
+    converted.headers = CaseInsensitiveDict(response.headers)
+    converted._content = body
+    converted.url = str(response.url) or url
+    converted.encoding = get_encoding_from_headers(converted.headers)
+    converted.elapsed = elapsed
+    return converted
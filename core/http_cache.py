@@ -0,0 +1,406 @@
+"""
+HTTP Cache
+On-disk response cache with Cache-Control/Expires freshness, ETag/Last-Modified
+revalidation, a TTL fallback and size-capped LRU eviction
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, '.cache', 'http')
+
+# Headers describing the wire encoding; bodies are stored decoded
+HOP_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive'}
+
+
+def parse_cache_control(value):
+    """Directives of a Cache-Control header as {name: argument or None}"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip().strip('"') or None
+    return directives
+
+
+def _http_date(value):
+    """Epoch seconds of an HTTP-date, or None when missing or malformed"""
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers):
+    """
+    Seconds a response stays fresh according to the server (RFC 9111)
+
+    s-maxage wins over max-age (the cache directory is shared by every fetcher
+    and process using it), which wins over Expires - Date; no-cache means the
+    response must be revalidated before every use.
+
+    Returns:
+        Lifetime in seconds, or None when the server gives no freshness information
+    """
+    directives = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            lifetime = _seconds(directives[name])
+            return 0 if lifetime is None else lifetime
+    if headers.get('Expires') is not None:
+        expires = _http_date(headers.get('Expires'))
+        if expires is None:
+            return 0  # An invalid Expires ("0", "-1") means already expired
+        date = _http_date(headers.get('Date'))
+        return max(0, expires - (date if date is not None else time.time()))
+    return None
+
+
+class HTTPCache:
+    """Stores response bodies on disk and revalidates them with conditional requests"""
+
+    def __init__(self, cache_dir=None, ttl=3600, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            cache_dir: Directory for the index database and body files
+            ttl: Seconds an entry is served without contacting the server when the
+                 response carries no Cache-Control max-age/s-maxage/no-cache or Expires
+            max_bytes: Total body size kept on disk before LRU eviction
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.stats = {
+            'hits': 0,
+            'revalidated': 0,
+            'misses': 0,
+            'stored': 0,
+            'evicted': 0
+        }
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.cache_dir, 'bodies'), exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, 'index.sqlite'), timeout=30, check_same_thread=False
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY, url TEXT, final_url TEXT, status INTEGER, headers TEXT,'
+            ' etag TEXT, last_modified TEXT, stored_at REAL, accessed_at REAL, size INTEGER)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at)')
+        self._db.commit()
+
+    @staticmethod
+    def cache_key(url):
+        """Stable key for a request URL"""
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, 'bodies', key[:2], key)
+
+    # ------------------------------------------------------------------
+    # Entries
+    # ------------------------------------------------------------------
+
+    def lookup(self, url):
+        """Stored entry for url as a dict, or None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT key, url, final_url, status, headers, etag, last_modified, stored_at, size'
+                ' FROM entries WHERE key = ?',
+                (self.cache_key(url),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        key, url, final_url, status, headers, etag, last_modified, stored_at, size = row
+        if not os.path.exists(self._body_path(key)):
+            self.delete(url)
+            return None
+
+        return {
+            'key': key,
+            'url': url,
+            'final_url': final_url,
+            'status': status,
+            'headers': json.loads(headers),
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': stored_at,
+            'size': size
+        }
+
+    def is_fresh(self, entry):
+        """
+        Entry can be served without revalidation
+
+        The server's Cache-Control/Expires decide; the TTL only applies to
+        responses without freshness information.
+        """
+        headers = CaseInsensitiveDict(entry['headers'])
+        lifetime = freshness_lifetime(headers)
+        if lifetime is None:
+            return time.time() - entry['stored_at'] < self.ttl
+        # Age the response already had when it was stored (from an upstream cache)
+        age = (_seconds(headers.get('Age')) or 0) + time.time() - entry['stored_at']
+        return age < lifetime
+
+    def store(self, url, response):
+        """Write a successful response to the cache"""
+        if response.status_code != 200 or 'no-store' in parse_cache_control(response.headers.get('Cache-Control')):
+            return False
+
+        key = self.cache_key(url)
+        body = response.content
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_HEADERS}
+
+        body_path = self._body_path(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial body
+        temp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+        os.replace(temp_path, body_path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    key, url, response.url or url, response.status_code, json.dumps(headers),
+                    response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                    now, now, len(body)
+                )
+            )
+            self._db.commit()
+
+        self.stats['stored'] += 1
+        self.evict()
+        return True
+
+    def touch(self, entry, refreshed=False, headers=None):
+        """
+        Mark an entry as recently used, restarting its freshness when revalidated
+
+        Args:
+            entry: Entry from lookup()
+            refreshed: The server confirmed the entry (304)
+            headers: Headers of the 304, updating the stored ones (new Cache-Control, Expires, Date, ...)
+        """
+        now = time.time()
+        with self._lock:
+            if refreshed:
+                stored = dict(entry['headers'])
+                for name, value in (headers or {}).items():
+                    if name.lower() in HOP_HEADERS:
+                        continue
+                    for existing in [key for key in stored if key.lower() == name.lower()]:
+                        del stored[existing]
+                    stored[name] = value
+                entry['headers'] = stored
+                self._db.execute(
+                    'UPDATE entries SET accessed_at = ?, stored_at = ?, headers = ? WHERE key = ?',
+                    (now, now, json.dumps(stored), entry['key'])
+                )
+            else:
+                self._db.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, entry['key']))
+            self._db.commit()
+
+    def delete(self, url):
+        """Remove an entry and its body"""
+        key = self.cache_key(url)
+        with self._lock:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._db.commit()
+        try:
+            os.remove(self._body_path(key))
+        except FileNotFoundError:
+            pass
+
+    def total_size(self):
+        """Bytes of body data currently cached"""
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        with self._lock:
+            rows = self._db.execute('SELECT key, size FROM entries ORDER BY accessed_at').fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                try:
+                    os.remove(self._body_path(key))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+            self._db.commit()
+
+        self.stats['evicted'] += evicted
+        return evicted
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            keys = [row[0] for row in self._db.execute('SELECT key FROM entries')]
+            self._db.execute('DELETE FROM entries')
+            self._db.commit()
+        for key in keys:
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ------------------------------------------------------------------
+    # Fetching
+    # ------------------------------------------------------------------
+
+    def build_response(self, entry, request_url):
+        """Rebuild a requests.Response from a stored entry"""
+        with open(self._body_path(entry['key']), 'rb') as f:
+            body = f.read()
+
+        response = requests.models.Response()
+        response._content = body
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.url = entry['final_url'] or request_url
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.elapsed = timedelta(0)
+        response.from_cache = True
+        response.cache_status = 'hit'
+        return response
+
+    def conditional_headers(self, entry):
+        """Validator headers for revalidating an entry"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def prepare(self, url):
+        """
+        First half of a cached GET
+
+        Returns:
+            Tuple of (cached response or None, entry, validator headers); when a
+            fresh entry answers the request the response is returned and no
+            request is needed, otherwise send the validators with the request
+        """
+        entry = self.lookup(url)
+
+        if entry is not None and self.is_fresh(entry):
+            self.touch(entry)
+            self.stats['hits'] += 1
+            return self.build_response(entry, url), entry, {}
+
+        validators = self.conditional_headers(entry) if entry is not None else {}
+        return None, entry, validators
+
+    def complete(self, url, entry, validators, response):
+        """Second half of a cached GET: answer a 304 from disk or store the new response"""
+        if entry is not None and validators and response.status_code == 304:
+            self.touch(entry, refreshed=True, headers=response.headers)
+            self.stats['revalidated'] += 1
+            cached = self.build_response(entry, url)
+            cached.elapsed = response.elapsed
+            cached.cache_status = 'revalidated'
+            return cached
+
+        self.stats['misses'] += 1
+        response.from_cache = False
+        response.cache_status = 'miss'
+        self.store(url, response)
+        return response
+
+    def get(self, session, url, **kwargs):
+        """
+        GET through the cache
+
+        Fresh entries (per Cache-Control/Expires, else the TTL) are served
+        from disk; no-cache and max-age=0 entries never are. Stale entries with
+        validators are revalidated with If-None-Match/If-Modified-Since and a
+        304 is answered from disk. Everything else goes to the network and is stored.
+
+        Args:
+            session: requests.Session (or the requests module) used on a miss
+            url: URL to fetch
+            **kwargs: Passed to session.get()
+
+        Returns:
+            requests.Response with from_cache and cache_status
+            ('hit', 'revalidated' or 'miss') set
+        """
+        cached, entry, validators = self.prepare(url)
+        if cached is not None:
+            return cached
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(validators)
+
+        response = session.get(url, headers=headers, **kwargs)
+        return self.complete(url, entry, validators, response)
+
+
+_shared_caches = {}
+
+
+def get_http_cache(cache_dir=None, **kwargs):
+    """Shared HTTPCache instance per directory"""
+    cache_dir = os.path.abspath(cache_dir or DEFAULT_CACHE_DIR)
+    if cache_dir not in _shared_caches:
+        _shared_caches[cache_dir] = HTTPCache(cache_dir, **kwargs)
+    return _shared_caches[cache_dir]
+
+
+if __name__ == '__main__':
+    import sys
+
+    cache = HTTPCache(sys.argv[2] if len(sys.argv) > 2 else None)
+    if len(sys.argv) > 1 and sys.argv[1] == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+    elif len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        with cache._lock:
+            count = cache._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        print(f"Entries: {count}  |  Size: {cache.total_size() / 1024:.1f} KB  |  Dir: {cache.cache_dir}")
+    else:
+        print("Usage: python -m core.http_cache <stats|clear> [cache_dir]")
@@ -0,0 +1,348 @@
+"""
+Incremental State
+Per-URL content hashes, HTTP validators and record fingerprints from earlier
+runs, so a re-scrape skips unchanged pages and emits only new or changed records
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from core.analysis_cache import normalize_html
+
+
+def content_hash(content):
+    """Hash of a page body that ignores comments and formatting whitespace"""
+    return hashlib.sha256(normalize_html(content).encode('utf-8')).hexdigest()
+
+
+def record_hash(record):
+    """Short fingerprint of a record's fields (key order does not matter)"""
+    encoded = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()[:16]
+
+
+def _counters():
+    return {
+        'pages': {'new': 0, 'changed': 0, 'unchanged': 0, 'not_modified': 0},
+        'records': {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+    }
+
+
+class IncrementalState:
+    """
+    What the previous runs of a crawl saw, page by page and record by record
+
+    A page is unchanged when the server answers 304 to the validators of the
+    last run or its normalized body hashes to the stored value; such a page is
+    neither parsed nor extracted. Its record fingerprints and next-page link
+    are kept, so pagination continues exactly as if it had been parsed.
+
+    Records are identified by `key_fields` when given (a changed price under
+    the same URL is then "changed") and by their whole content otherwise;
+    exact duplicates count once. A record is emitted when its identity is new
+    or its content differs from the stored one.
+    """
+
+    def __init__(self, path, key_fields=None, autocommit=True):
+        """
+        Args:
+            path: SQLite database file kept between runs
+            key_fields: Record fields identifying a record across runs (None: the whole record)
+            autocommit: Commit after every page; a checkpointed crawl turns this off and
+                        calls commit() right after each checkpoint, so the state never
+                        runs ahead of the outputs it resumes
+        """
+        self.path = path
+        self.key_fields = list(key_fields or [])
+        self.autocommit = autocommit
+        self.run_id = None
+        self.counts = _counters()
+        self._owns_run = True  # Counts are saved with the run (not for a run begun by another process)
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                record_hashes TEXT,
+                next_url TEXT,
+                last_run INTEGER,
+                changed_run INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                page TEXT NOT NULL,
+                last_run INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS records_page ON records (page);
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at TEXT,
+                finished_at TEXT,
+                summary TEXT
+            );
+        ''')
+
+    # ------------------------------------------------------------------
+    # Runs
+    # ------------------------------------------------------------------
+
+    def begin_run(self, resume=False):
+        """
+        Start a run (resume=True continues the last unfinished one); returns its id
+
+        Counters of a continued run pick up where it stopped.
+        """
+        with self._lock:
+            self._owns_run = True
+            row = self._db.execute('SELECT id, finished_at, summary FROM runs ORDER BY id DESC LIMIT 1').fetchone()
+            if resume and row is not None and row[1] is None:
+                self.run_id = row[0]
+                self.counts = json.loads(row[2]) if row[2] else _counters()
+                return self.run_id
+            self.counts = _counters()
+            cursor = self._db.execute(
+                'INSERT INTO runs (started_at) VALUES (?)', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+            self._db.commit()
+            self.run_id = cursor.lastrowid
+            return self.run_id
+
+    def attach_run(self, run_id):
+        """
+        Work on a run begun by another process (the coordinator of a distributed crawl)
+
+        Counts start at zero and stay with this object: the coordinator sums
+        them from its workers and closes the run with finish_run().
+        """
+        with self._lock:
+            self.run_id = run_id
+            self.counts = _counters()
+            self._owns_run = False
+        return self.run_id
+
+    def previous_runs(self):
+        """Finished runs, oldest first, with their summaries"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, started_at, finished_at, summary FROM runs WHERE finished_at IS NOT NULL ORDER BY id'
+            ).fetchall()
+        return [
+            {'run': run, 'started_at': started, 'finished_at': finished, **json.loads(summary)}
+            for run, started, finished, summary in rows
+        ]
+
+    def finish_run(self, complete=True):
+        """
+        Close the run and return its change summary
+
+        Args:
+            complete: The crawl reached its end. Only then are records that were
+                      not seen again on the pages of this run counted as removed
+                      (and forgotten, so they are new if they come back).
+        """
+        with self._lock:
+            if complete:
+                removed = self._db.execute(
+                    'SELECT COUNT(*) FROM records WHERE last_run < ?'
+                    ' AND page IN (SELECT url FROM pages WHERE last_run = ?)', (self.run_id, self.run_id)
+                ).fetchone()[0]
+                self._db.execute(
+                    'DELETE FROM records WHERE last_run < ? AND page IN (SELECT url FROM pages WHERE last_run = ?)',
+                    (self.run_id, self.run_id)
+                )
+                self.counts['records']['removed'] = removed
+            self._db.execute(
+                'UPDATE runs SET finished_at = ?, summary = ? WHERE id = ?',
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), json.dumps(self.counts), self.run_id)
+            )
+            self._db.commit()
+        return self.summary()
+
+    def summary(self):
+        """Pages new/changed/unchanged (not_modified: answered by a 304) and records new/changed/unchanged/removed"""
+        return {'run': self.run_id, 'pages': dict(self.counts['pages']), 'records': dict(self.counts['records'])}
+
+    # ------------------------------------------------------------------
+    # Pages
+    # ------------------------------------------------------------------
+
+    def _page(self, url):
+        row = self._db.execute(
+            'SELECT content_hash, etag, last_modified, record_hashes, next_url FROM pages WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'content_hash': row[0],
+            'etag': row[1],
+            'last_modified': row[2],
+            'record_hashes': json.loads(row[3]),
+            'next_url': row[4]
+        }
+
+    def request_headers(self, url):
+        """If-None-Match / If-Modified-Since from the page's last response"""
+        with self._lock:
+            page = self._page(url)
+        headers = {}
+        if page is not None and page['etag']:
+            headers['If-None-Match'] = page['etag']
+        if page is not None and page['last_modified']:
+            headers['If-Modified-Since'] = page['last_modified']
+        return headers
+
+    def check_page(self, url, content, response=None):
+        """
+        Compare a fetched page with the last run
+
+        Args:
+            url: Page URL
+            content: Body (str or bytes; ignored for a 304)
+            response: requests.Response it came from, when there is one
+
+        Returns:
+            Dict with 'status' ('new', 'changed' or 'unchanged'), the body's
+            'content_hash', and the last run's 'record_hashes' and 'next_url'
+        """
+        with self._lock:
+            page = self._page(url)
+        not_modified = response is not None and response.status_code == 304
+        digest = None if not_modified else content_hash(content)
+
+        if page is None:
+            status = 'new'
+        elif not_modified or digest == page['content_hash']:
+            status = 'unchanged'
+        else:
+            status = 'changed'
+        return {
+            'status': status,
+            'not_modified': not_modified and page is not None,
+            'content_hash': digest if digest is not None else (page or {}).get('content_hash'),
+            'record_hashes': page['record_hashes'] if page else [],
+            'next_url': page['next_url'] if page else None
+        }
+
+    def skip_page(self, url, check):
+        """An unchanged page: its stored records count as seen in this run"""
+        with self._lock:
+            self._db.execute('UPDATE pages SET last_run = ? WHERE url = ?', (self.run_id, url))
+            self._db.execute('UPDATE records SET last_run = ? WHERE page = ?', (self.run_id, url))
+            self.counts['pages']['unchanged'] += 1
+            if check['not_modified']:
+                self.counts['pages']['not_modified'] += 1
+            self.counts['records']['unchanged'] += len(check['record_hashes'])
+            self._save_counts()
+
+    def _key(self, record, digest):
+        if not self.key_fields or not any(field in record for field in self.key_fields):
+            return digest
+        return record_hash({field: record.get(field) for field in self.key_fields})
+
+    def record_page(self, url, check, records, response=None, next_url=None):
+        """
+        Store a new or changed page and its records
+
+        Args:
+            url: Page URL
+            check: Result of check_page() for this page
+            records: Every record extracted from the page
+            response: requests.Response supplying the validators for the next run
+            next_url: The page's next-page link, reused while the page stays unchanged
+
+        Returns:
+            Tuple of (records to emit: those new or changed since the last run,
+            fingerprints of all the page's records)
+        """
+        hashes = [record_hash(record) for record in records]
+        headers = response.headers if response is not None else {}
+        emitted = []
+        with self._lock:
+            counts = self.counts['records']
+            for record, digest in zip(records, hashes):
+                key = self._key(record, digest)
+                row = self._db.execute('SELECT content_hash, last_run FROM records WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    counts['new'] += 1
+                    emitted.append(record)
+                elif row[0] != digest:
+                    counts['changed'] += 1
+                    emitted.append(record)
+                elif row[1] != self.run_id:
+                    counts['unchanged'] += 1
+                self._db.execute(
+                    'INSERT OR REPLACE INTO records (key, content_hash, page, last_run) VALUES (?, ?, ?, ?)',
+                    (key, digest, url, self.run_id)
+                )
+
+            self._db.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, check['content_hash'], headers.get('ETag'), headers.get('Last-Modified'),
+                 json.dumps(hashes), next_url, self.run_id, self.run_id)
+            )
+            self.counts['pages'][check['status']] += 1
+            self._save_counts()
+        return emitted, hashes
+
+    def _save_counts(self):
+        # Kept with the run so a resumed run reports the whole crawl
+        if self._owns_run:
+            self._db.execute('UPDATE runs SET summary = ? WHERE id = ?', (json.dumps(self.counts), self.run_id))
+        if self.autocommit:
+            self._db.commit()
+
+    def commit(self):
+        """Make the pages recorded so far permanent"""
+        with self._lock:
+            self._db.commit()
+
+    def page_count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_incremental_state(state, key_fields=None):
+    """Convenience function: IncrementalState for a path (an existing IncrementalState is returned as-is)"""
+    if isinstance(state, IncrementalState):
+        return state
+    return IncrementalState(state, key_fields=key_fields)
+
+
+def format_summary(summary):
+    """One-line description of a run's changes"""
+    pages, records = summary['pages'], summary['records']
+    return (f"pages: {pages['new']} new, {pages['changed']} changed, {pages['unchanged']} unchanged "
+            f"({pages['not_modified']} not modified)  |  records: {records['new']} new, {records['changed']} changed, "
+            f"{records['unchanged']} unchanged, {records['removed']} removed")
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        with IncrementalState(sys.argv[1]) as state:
+            print(f"{state.page_count()} pages tracked in {sys.argv[1]}")
+            for run in state.previous_runs():
+                print(f"   run {run['run']} ({run['started_at']}): {format_summary(run)}")
+    else:
+        print("Usage: python -m core.incremental_state <pages.sqlite>")
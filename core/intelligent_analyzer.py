@@ -3,7 +3,6 @@ Intelligent HTML Analyzer
 Automatically analyzes any webpage to learn its structure, class names, and scraping patterns
 """
 
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
 from collections import Counter
@@ -11,14 +10,27 @@ import json
 import re
 from datetime import datetime
 
+from core.dom_index import DOMIndex
+from core.fetcher import Fetcher
+from core.analysis_cache import AnalysisCache, source_fingerprint
+from core.retry_policy import CircuitBreaker, RetryPolicy
+
 
 class IntelligentAnalyzer:
     """Analyzes HTML pages to understand structure and generate scraping strategies"""
     
-    def __init__(self, url):
+    def __init__(self, url, fetcher=None, analysis_cache=None, archive=None, backend=None):
         self.url = url
         self.domain = urlparse(url).netloc
         self.soup = None
+        self.html = None
+        self.response = None
+        self.fetcher = fetcher
+        self.archive = archive  # WARCWriter keeping the fetched page (used by the default fetcher)
+        self.backend = backend  # FetchBackend or recording to replay instead of the network (default fetcher)
+        self.analysis_cache = analysis_cache
+        self.cache_hit = False
+        self._index = None
         self.analysis = {
             'url': url,
             'domain': self.domain,
@@ -28,8 +40,15 @@ class IntelligentAnalyzer:
             'scraping_strategy': {}
         }
     
-    def fetch_page(self):
-        """Fetch the HTML page with proper headers"""
+    @property
+    def index(self):
+        """Single-pass DOM index with cached text statistics"""
+        if self._index is None or self._index.soup is not self.soup:
+            self._index = DOMIndex(self.soup)
+        return self._index
+    
+    def fetch_page(self, parse=True):
+        """Fetch the HTML page with proper headers (parse=False leaves self.soup unset)"""
         print(f"\n[FETCH] Target: {self.url}")
         
         headers = {
@@ -42,11 +61,21 @@ class IntelligentAnalyzer:
         }
         
         try:
-            response = requests.get(self.url, headers=headers, timeout=30)
+            if self.fetcher is None:
+                # Timeouts, dropped connections and 5xx are retried with backoff; replayed pages skip the cache
+                self.fetcher = Fetcher(
+                    headers=headers, timeout=30, retry_policy=RetryPolicy(), circuit_breaker=CircuitBreaker(),
+                    archive=self.archive, backend=self.backend, use_cache=self.backend is None
+                )
+            response = self.fetcher.get(self.url)
             response.raise_for_status()
+            self.response = response
+            self.html = response.text
             # Use lxml-xml parser for better parsing
-            self.soup = BeautifulSoup(response.text, 'lxml')
-            print(f"   Page fetched successfully ({len(response.content)} bytes)")
+            if parse:
+                self.soup = BeautifulSoup(self.html, 'lxml')
+            source = " from cache" if response.from_cache else ""
+            print(f"   Page fetched successfully{source} ({len(response.content)} bytes)")
             return True
         except Exception as e:
             print(f"   Error fetching page: {e}")
@@ -82,25 +111,25 @@ class IntelligentAnalyzer:
         
         # Look for semantic HTML5 tags
         for tag in ['main', 'article', 'section']:
-            elements = self.soup.find_all(tag)
+            elements = self.index.find_all(tag)
             candidates.extend(elements)
         
         # Look for common class names
         common_classes = ['content', 'main', 'body', 'article', 'post', 'entry', 'container']
         for cls in common_classes:
-            elements = self.soup.find_all(class_=re.compile(cls, re.I))
+            elements = self.index.find_by_class_pattern(cls)
             candidates.extend(elements)
         
         # Look for common IDs
         common_ids = ['content', 'main', 'body', 'article', 'post']
         for id_name in common_ids:
-            element = self.soup.find(id=re.compile(id_name, re.I))
+            element = self.index.find_by_id_pattern(id_name)
             if element:
                 candidates.append(element)
         
         # Return the element with most content
         if candidates:
-            return max(candidates, key=lambda x: len(x.get_text(strip=True)))
+            return max(candidates, key=self.index.text_length)
         
         return None
     
@@ -182,24 +211,28 @@ class IntelligentAnalyzer:
     
     def _find_text_blocks(self):
         """Find significant text content blocks"""
-        blocks = []
+        candidates = []
         
         for tag in ['p', 'div', 'span', 'article', 'section']:
-            elements = self.soup.find_all(tag)
+            elements = self.index.find_all(tag)
             for elem in elements:
-                text = elem.get_text(strip=True)
-                if len(text) > 100:  # Significant text
-                    blocks.append({
-                        'tag': tag,
-                        'classes': elem.get('class', []),
-                        'id': elem.get('id', ''),
-                        'text_length': len(text),
-                        'preview': text[:200]
-                    })
+                text_length = self.index.text_length(elem)
+                if text_length > 100:  # Significant text
+                    candidates.append((tag, elem, text_length))
         
         # Sort by text length and return top 10
-        blocks.sort(key=lambda x: x['text_length'], reverse=True)
-        return blocks[:10]
+        candidates.sort(key=lambda x: x[2], reverse=True)
+        
+        blocks = []
+        for tag, elem, text_length in candidates[:10]:
+            blocks.append({
+                'tag': tag,
+                'classes': elem.get('class', []),
+                'id': elem.get('id', ''),
+                'text_length': text_length,
+                'preview': elem.get_text(strip=True)[:200]
+            })
+        return blocks
     
     def analyze_links(self):
         """Analyze links on the page"""
@@ -341,15 +374,31 @@ class IntelligentAnalyzer:
     
     def run_full_analysis(self, output_path=None):
         """Run complete analysis workflow"""
-        if not self.fetch_page():
+        if not self.fetch_page(parse=self.analysis_cache is None):
             return None
         
+        cache_key = None
+        if self.analysis_cache is not None:
+            cache_key = AnalysisCache.make_key(self.url, self.html, source_fingerprint(__file__))
+            cached = self.analysis_cache.get(cache_key)
+            if cached is not None:
+                print("\n[CACHE] Identical page analyzed before, reusing stored analysis")
+                self.analysis = cached
+                self.cache_hit = True
+                if output_path:
+                    self.save_analysis(output_path)
+                return self.analysis
+            self.soup = BeautifulSoup(self.html, 'lxml')
+        
         self.analyze_structure()
         self.analyze_content_patterns()
         self.analyze_links()
         self.analyze_data_attributes()
         self.generate_scraping_strategy()
         
+        if cache_key is not None:
+            self.analysis_cache.put(cache_key, self.analysis)
+        
         if output_path:
             self.save_analysis(output_path)
         
@@ -372,6 +421,6 @@ if __name__ == '__main__':
         output = sys.argv[2] if len(sys.argv) > 2 else None
         analyze_url(url, output)
     else:
-        print("Usage: python intelligent_analyzer.py <url> [output.json]")
+        print("Usage: python -m core.intelligent_analyzer <url> [output.json]")
         print("\nExample:")
-        print("  python intelligent_analyzer.py https://example.com analysis.json")
+        print("  python -m core.intelligent_analyzer https://example.com analysis.json")
@@ -12,6 +12,11 @@ import re
 from datetime import datetime
 import time
 from core.professional_logger import get_logger
+from core.dom_index import DOMIndex
+from core.keyword_scorer import KeywordScorer
+from core.fetcher import Fetcher
+from core.analysis_cache import AnalysisCache, source_fingerprint
+from core.retry_policy import CircuitBreaker, RetryPolicy
 
 
 class IntelligentAnalyzerV2:
@@ -31,7 +36,30 @@ class IntelligentAnalyzerV2:
         'event': ['event', 'calendar', 'schedule', 'conference']
     }
     
-    def __init__(self, url, timeout=30, logger=None):
+    # Browser-like request headers shared by the sync and async fetch paths
+    REQUEST_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Cache-Control': 'max-age=0'
+    }
+    
+    # Compiled keyword scorers keyed by pattern table
+    _keyword_scorers = {}
+    
+    # Tags never treated as repeated item containers
+    STRUCTURE_SKIP_TAGS = {
+        'script', 'style', 'link', 'meta', 'br', 'hr', 'option', 'source',
+        'input', 'tr', 'td', 'th', 'thead', 'tbody', 'col', 'colgroup', 'path'
+    }
+    
+    # Class/id tokens that can be used verbatim in a CSS selector
+    CSS_IDENTIFIER = re.compile(r'^-?[_a-zA-Z][_a-zA-Z0-9-]*$')
+    
+    def __init__(self, url, timeout=30, logger=None, fetcher=None, analysis_cache=None, archive=None, backend=None):
         """
         Initialize analyzer
         
@@ -39,14 +67,27 @@ class IntelligentAnalyzerV2:
             url: Target URL to analyze
             timeout: Request timeout in seconds
             logger: Logger instance
+            fetcher: Shared Fetcher (defaults to one backed by the HTTP cache)
+            analysis_cache: AnalysisCache returning stored results for unchanged pages
+            archive: WARCWriter keeping the fetched page (used by the default fetcher)
+            backend: FetchBackend, or recorded responses to replay instead of the network
+                     (used by the default fetcher, which then bypasses the HTTP cache)
         """
         self.url = url
         self.timeout = timeout
         self.logger = logger or get_logger()
+        self._fetcher = fetcher
+        self.archive = archive
+        self.backend = backend
+        self.analysis_cache = analysis_cache
+        self.cache_hit = False
+        self._cache_key = None
         
         self.domain = urlparse(url).netloc
         self.soup = None
         self.response = None
+        self._index = None
+        self._repeated_groups = []
         
         self.analysis = {
             'metadata': {
@@ -65,34 +106,45 @@ class IntelligentAnalyzerV2:
         
         self.logger.info(f"Initialized analyzer for {url}")
     
-    def fetch_page(self):
-        """Fetch webpage with advanced error handling"""
-        self.logger.log_step(1, "Fetching webpage", "START")
+    @property
+    def fetcher(self):
+        """Fetch layer, created on first use so offline analysis never opens the cache"""
+        if self._fetcher is None:
+            # Timeouts, dropped connections and 5xx are retried with backoff instead of failing the analysis
+            self._fetcher = Fetcher(
+                headers=self.REQUEST_HEADERS, timeout=self.timeout, logger=self.logger,
+                retry_policy=RetryPolicy(), circuit_breaker=CircuitBreaker(logger=self.logger),
+                archive=self.archive, backend=self.backend, use_cache=self.backend is None
+            )
+        return self._fetcher
+    
+    @property
+    def index(self):
+        """Shared single-pass DOM index, rebuilt whenever the soup changes"""
+        if self._index is None or self._index.soup is not self.soup:
+            self._index = DOMIndex(self.soup)
+        return self._index
+    
+    def fetch_page(self, parse=True):
+        """
+        Fetch webpage with advanced error handling
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Cache-Control': 'max-age=0'
-        }
+        Args:
+            parse: Parse the response right away (run_full_analysis defers it
+                   until the analysis cache has been checked)
+        """
+        self.logger.log_step(1, "Fetching webpage", "START")
         
         try:
             start_time = time.time()
-            self.response = requests.get(
-                self.url,
-                headers=headers,
-                timeout=self.timeout,
-                allow_redirects=True
-            )
+            self.response = self.fetcher.get(self.url, allow_redirects=True)
             duration = time.time() - start_time
             
             self.response.raise_for_status()
             
             # Parse with lxml for better performance
-            self.soup = BeautifulSoup(self.response.text, 'lxml')
+            if parse:
+                self.load_html(self.response.text)
             
             # Log fetch details
             self.logger.log_url_fetch(
@@ -108,6 +160,7 @@ class IntelligentAnalyzerV2:
             self.analysis['technical_details']['content_type'] = self.response.headers.get('Content-Type', '')
             self.analysis['technical_details']['server'] = self.response.headers.get('Server', 'Unknown')
             self.analysis['technical_details']['load_time_ms'] = round(duration * 1000, 2)
+            self.analysis['technical_details']['cache_status'] = getattr(self.response, 'cache_status', 'miss')
             
             # Check for redirects
             if self.response.history:
@@ -119,7 +172,7 @@ class IntelligentAnalyzerV2:
             return True
             
         except requests.Timeout:
-            self.logger.error(f"Timeout while fetching {self.url}")
+            self.logger.error(f"Timeout while fetching {self.url} (after retries)")
             return False
         except requests.ConnectionError as e:
             self.logger.error(f"Connection error: {str(e)}")
@@ -131,13 +184,30 @@ class IntelligentAnalyzerV2:
             self.logger.exception(f"Unexpected error fetching page: {str(e)}")
             return False
     
+    def load_html(self, html, technical_details=None, encoding=None):
+        """
+        Parse an already-fetched page so the analysis passes can run without a request
+        
+        Args:
+            html: Page markup as text or raw bytes
+            technical_details: Optional fetch details (status_code, content_type, ...)
+            encoding: Charset of raw bytes when known from the response headers
+        """
+        if isinstance(html, bytes):
+            self.soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+        else:
+            self.soup = BeautifulSoup(html, 'lxml')
+        
+        if technical_details:
+            self.analysis['technical_details'].update(technical_details)
+    
     def analyze_structure(self):
         """Comprehensive HTML structure analysis"""
         self.logger.log_step(2, "Analyzing HTML structure", "START")
         
         # Basic element counting
-        all_tags = [tag.name for tag in self.soup.find_all()]
-        tag_counts = Counter(all_tags)
+        all_tags = self.index.elements
+        tag_counts = self.index.tag_counts
         
         self.analysis['structure']['total_elements'] = len(all_tags)
         self.analysis['structure']['unique_tags'] = len(tag_counts)
@@ -175,19 +245,7 @@ class IntelligentAnalyzerV2:
     
     def _calculate_dom_depth(self):
         """Calculate maximum DOM tree depth"""
-        def get_depth(element, current_depth=0):
-            if not element or not hasattr(element, 'children'):
-                return current_depth
-            
-            max_child_depth = current_depth
-            for child in element.children:
-                if hasattr(child, 'name'):
-                    child_depth = get_depth(child, current_depth + 1)
-                    max_child_depth = max(max_child_depth, child_depth)
-            
-            return max_child_depth
-        
-        return get_depth(self.soup.body if self.soup.body else self.soup)
+        return self.index.max_depth()
     
     def _analyze_semantic_html(self):
         """Analyze semantic HTML5 element usage"""
@@ -195,9 +253,9 @@ class IntelligentAnalyzerV2:
         semantic_usage = {}
         
         for tag in semantic_tags:
-            elements = self.soup.find_all(tag)
-            if elements:
-                semantic_usage[tag] = len(elements)
+            count = self.index.tag_counts.get(tag, 0)
+            if count:
+                semantic_usage[tag] = count
         
         self.analysis['structure']['semantic_html5'] = semantic_usage
         self.analysis['structure']['uses_semantic_html'] = len(semantic_usage) > 0
@@ -207,7 +265,7 @@ class IntelligentAnalyzerV2:
         headings = []
         
         for level in range(1, 7):
-            h_tags = self.soup.find_all(f'h{level}')
+            h_tags = self.index.find_all(f'h{level}')
             for h_tag in h_tags:
                 headings.append({
                     'level': level,
@@ -223,7 +281,7 @@ class IntelligentAnalyzerV2:
     
     def _analyze_forms(self):
         """Analyze forms on the page"""
-        forms = self.soup.find_all('form')
+        forms = self.index.find_all('form')
         form_data = []
         
         for form in forms:
@@ -242,7 +300,7 @@ class IntelligentAnalyzerV2:
     
     def _analyze_tables(self):
         """Analyze table structures"""
-        tables = self.soup.find_all('table')
+        tables = self.index.find_all('table')
         table_data = []
         
         for table in tables:
@@ -268,9 +326,9 @@ class IntelligentAnalyzerV2:
         
         # Semantic tags (highest priority)
         for tag in ['main', 'article']:
-            elements = self.soup.find_all(tag)
+            elements = self.index.find_all(tag)
             for elem in elements:
-                candidates.append(('semantic', elem, len(elem.get_text(strip=True))))
+                candidates.append(('semantic', elem, self.index.text_length(elem)))
         
         # Common class patterns
         content_patterns = [
@@ -279,17 +337,17 @@ class IntelligentAnalyzerV2:
         ]
         
         for pattern in content_patterns:
-            elements = self.soup.find_all(class_=re.compile(pattern, re.I))
+            elements = self.index.find_by_class_pattern(pattern)
             for elem in elements:
-                text_length = len(elem.get_text(strip=True))
+                text_length = self.index.text_length(elem)
                 if text_length > 500:  # Minimum content threshold
                     candidates.append(('class', elem, text_length))
         
         # Common ID patterns
         for pattern in content_patterns:
-            elem = self.soup.find(id=re.compile(pattern, re.I))
+            elem = self.index.find_by_id_pattern(pattern)
             if elem:
-                text_length = len(elem.get_text(strip=True))
+                text_length = self.index.text_length(elem)
                 if text_length > 500:
                     candidates.append(('id', elem, text_length))
         
@@ -304,6 +362,10 @@ class IntelligentAnalyzerV2:
         """Identify repeating content patterns with advanced detection"""
         self.logger.log_step(3, "Analyzing content patterns", "START")
         
+        # Group structurally identical siblings (feeds list, grid and card detection)
+        repeated_structures = self._detect_repeated_structures()
+        self.analysis['content_patterns']['repeated_structures'] = repeated_structures
+        
         # Find repeating class patterns
         class_patterns = self._find_class_patterns()
         self.analysis['content_patterns']['repeating_classes'] = class_patterns
@@ -324,18 +386,14 @@ class IntelligentAnalyzerV2:
         text_blocks = self._find_text_blocks_advanced()
         self.analysis['content_patterns']['text_blocks'] = text_blocks
         
+        self.logger.log_metric("Repeated Structures", len(repeated_structures))
         self.logger.log_metric("List Patterns", len(list_patterns))
         self.logger.log_metric("Card Patterns", len(card_patterns))
         self.logger.log_step(3, "Analyzing content patterns", "SUCCESS")
     
     def _find_class_patterns(self):
         """Find repeating class name patterns"""
-        class_counter = Counter()
-        
-        for elem in self.soup.find_all(class_=True):
-            classes = elem.get('class', [])
-            for cls in classes:
-                class_counter[cls] += 1
+        class_counter = self.index.class_counts
         
         # Filter: appear 4+ times but not too common (not layout classes)
         repeating = {
@@ -350,7 +408,7 @@ class IntelligentAnalyzerV2:
         patterns = []
         
         # Traditional lists
-        for list_tag in self.soup.find_all(['ul', 'ol']):
+        for list_tag in self.index.find_all(['ul', 'ol']):
             items = list_tag.find_all('li', recursive=False)
             if len(items) >= 3:
                 sample = items[0]
@@ -362,7 +420,7 @@ class IntelligentAnalyzerV2:
                     'item_classes': sample.get('class', []),
                     'has_links': bool(sample.find('a')),
                     'has_images': bool(sample.find('img')),
-                    'avg_text_length': sum(len(item.get_text(strip=True)) for item in items) // len(items)
+                    'avg_text_length': sum(self.index.text_length(item) for item in items) // len(items)
                 })
         
         # Div-based lists (modern patterns)
@@ -380,7 +438,7 @@ class IntelligentAnalyzerV2:
         patterns = []
         class_groups = defaultdict(list)
         
-        for div in self.soup.find_all('div', class_=True):
+        for div in self.index.find_with_attr('div', 'class'):
             class_sig = ' '.join(sorted(div.get('class', [])))
             if class_sig:
                 class_groups[class_sig].append(div)
@@ -395,62 +453,159 @@ class IntelligentAnalyzerV2:
                     'has_links': bool(sample.find('a')),
                     'has_images': bool(sample.find('img')),
                     'has_headings': bool(sample.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])),
-                    'avg_text_length': sum(len(d.get_text(strip=True)) for d in divs) // len(divs)
+                    'avg_text_length': sum(self.index.text_length(d) for d in divs) // len(divs)
                 })
         
         return sorted(patterns, key=lambda x: x['item_count'], reverse=True)[:10]
     
-    def _detect_grid_layouts(self):
-        """Detect CSS grid or flexbox layouts"""
+    def _detect_repeated_structures(self):
+        """Detect repeated item containers by grouping siblings with equal structural hashes"""
+        groups = []
+        
+        for parent, items in self.index.sibling_groups(min_repeats=3):
+            if items[0].name in self.STRUCTURE_SKIP_TAGS or parent.name == 'head':
+                continue
+            
+            avg_size = sum(self.index.subtree_size[id(item)] for item in items) / len(items)
+            if avg_size < 2:  # Bare leaves (e.g. <li>text</li>) are not item containers
+                continue
+            
+            # Prefer many, reasonably rich items over tiny navigation lists
+            score = len(items) * min(avg_size, 25)
+            groups.append((score, parent, items, avg_size))
+        
+        groups.sort(key=lambda x: x[0], reverse=True)
+        self._repeated_groups = groups[:10]
+        
         patterns = []
+        for score, parent, items, avg_size in self._repeated_groups:
+            sample = items[0]
+            
+            # Only classes shared by every item are usable for selection
+            shared = set(sample.get('class', []))
+            for item in items[1:]:
+                shared &= set(item.get('class', []))
+            item_classes = [cls for cls in sample.get('class', []) if cls in shared]
+            
+            selector = self._structure_selector(parent, sample, item_classes)
+            
+            try:
+                selector_matches = len(self.soup.select(selector))
+            except Exception:
+                selector_matches = 0
+            
+            patterns.append({
+                'type': 'repeated_structure',
+                'item_tag': sample.name,
+                'item_classes': item_classes,
+                'item_count': len(items),
+                'avg_item_size': round(avg_size, 1),
+                'container': {
+                    'tag': parent.name,
+                    'classes': parent.get('class', []),
+                    'id': parent.get('id', '')
+                },
+                'selector': selector,
+                'selector_matches': selector_matches,
+                'has_links': bool(sample.find('a')),
+                'has_images': bool(sample.find('img')),
+                'has_headings': bool(sample.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])),
+                'avg_text_length': sum(self.index.text_length(item) for item in items) // len(items),
+                'score': round(score, 1)
+            })
+        
+        return patterns
+    
+    def _css_step(self, elem, classes=None, use_id=True):
+        """Build one selector step for an element, returning (step, is_anchored)"""
+        elem_id = elem.get('id')
+        if use_id and elem_id and self.CSS_IDENTIFIER.match(elem_id):
+            return f"{elem.name}#{elem_id}", True
         
-        # Look for containers with display: grid or flex (via class names)
-        grid_keywords = ['grid', 'flex', 'row', 'col', 'column']
+        if classes is None:
+            classes = elem.get('class', [])
+        classes = [cls for cls in classes if self.CSS_IDENTIFIER.match(cls)]
+        if classes:
+            return f"{elem.name}.{'.'.join(classes)}", True
+        
+        return elem.name, False
+    
+    def _structure_selector(self, parent, sample, item_classes=None):
+        """CSS selector for the items of a repeated group, anchored at the nearest id/class ancestor"""
+        item_step, _ = self._css_step(sample, item_classes, use_id=False)
+        steps = [item_step]
+        
+        node = parent
+        for _ in range(4):
+            if node is None or node.name in ('[document]', 'html'):
+                break
+            step, anchored = self._css_step(node)
+            steps.append(step)
+            if anchored or node.name == 'body':
+                break
+            node = node.parent
+        
+        return ' > '.join(reversed(steps))
+    
+    def _detect_grid_layouts(self):
+        """Detect grid/flex style containers from the repeated-structure groups"""
+        patterns = []
+        seen = set()
         
-        for container in self.soup.find_all(['div', 'section', 'ul']):
-            classes = ' '.join(container.get('class', [])).lower()
+        for score, parent, items, avg_size in self._repeated_groups:
+            if len(items) < 4 or id(parent) in seen:
+                continue
+            seen.add(id(parent))
             
-            if any(keyword in classes for keyword in grid_keywords):
-                children = container.find_all(recursive=False)
-                
-                if len(children) >= 4:
-                    patterns.append({
-                        'type': 'grid_layout',
-                        'container_classes': container.get('class', []),
-                        'item_count': len(children),
-                        'child_tags': Counter([child.name for child in children])
-                    })
+            children = parent.find_all(recursive=False)
+            sample = items[0]
+            item_classes = [cls for cls in sample.get('class', [])
+                            if all(cls in item.get('class', []) for item in items)]
+            patterns.append({
+                'type': 'grid_layout',
+                'container_classes': parent.get('class', []),
+                'item_count': len(children),
+                'child_tags': Counter([child.name for child in children]),
+                # Structural path of the items, for containers without classes to select by
+                'selector': self._structure_selector(parent, sample, item_classes)
+            })
         
         return patterns[:5]
     
     def _find_card_patterns(self):
-        """Detect card/tile UI patterns"""
+        """Detect card/tile UI patterns from the repeated-structure groups"""
         card_patterns = []
         card_keywords = ['card', 'tile', 'box', 'item', 'panel']
         
-        for keyword in card_keywords:
-            elements = self.soup.find_all(class_=re.compile(keyword, re.I))
+        for score, parent, items, avg_size in self._repeated_groups:
+            sample = items[0]
             
-            if len(elements) >= 3:
-                sample = elements[0]
-                
-                # Analyze card structure
-                has_image = bool(sample.find('img'))
-                has_heading = bool(sample.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']))
-                has_link = bool(sample.find('a'))
-                has_button = bool(sample.find('button'))
-                
-                card_patterns.append({
-                    'keyword': keyword,
-                    'count': len(elements),
-                    'structure': {
-                        'has_image': has_image,
-                        'has_heading': has_heading,
-                        'has_link': has_link,
-                        'has_button': has_button
-                    },
-                    'classes': sample.get('class', [])
-                })
+            # Analyze card structure
+            has_image = bool(sample.find('img'))
+            has_heading = bool(sample.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']))
+            has_link = bool(sample.find('a'))
+            has_button = bool(sample.find('button'))
+            
+            # A card groups several pieces of content, not just a bare link
+            if avg_size < 3 or not (has_image or has_heading):
+                continue
+            
+            classes = [cls for cls in sample.get('class', []) if all(cls in item.get('class', []) for item in items)]
+            class_text = ' '.join(classes).lower()
+            keyword = next((kw for kw in card_keywords if kw in class_text), 'structure')
+            
+            card_patterns.append({
+                'keyword': keyword,
+                'count': len(items),
+                'structure': {
+                    'has_image': has_image,
+                    'has_heading': has_heading,
+                    'has_link': has_link,
+                    'has_button': has_button
+                },
+                'classes': classes,
+                'selector': self._structure_selector(parent, sample, classes)
+            })
         
         return sorted(card_patterns, key=lambda x: x['count'], reverse=True)[:5]
     
@@ -458,7 +613,7 @@ class IntelligentAnalyzerV2:
         """Analyze data table patterns"""
         patterns = []
         
-        for table in self.soup.find_all('table'):
+        for table in self.index.find_all('table'):
             headers = [th.get_text(strip=True) for th in table.find_all('th')]
             rows = table.find_all('tr')
             
@@ -476,39 +631,41 @@ class IntelligentAnalyzerV2:
     
     def _find_text_blocks_advanced(self):
         """Find significant text content with context"""
-        blocks = []
+        candidates = []
         
+        # Rank on cached text statistics; only the winners are serialized
         for tag in ['p', 'div', 'span', 'article', 'section']:
-            elements = self.soup.find_all(tag)
+            elements = self.index.find_all(tag)
             
             for elem in elements:
-                text = elem.get_text(strip=True)
+                text_length = self.index.text_length(elem)
                 
-                if len(text) > 100:
-                    # Analyze text characteristics
-                    word_count = len(text.split())
-                    has_links = bool(elem.find('a'))
-                    has_emphasis = bool(elem.find(['strong', 'em', 'b', 'i']))
-                    
-                    blocks.append({
-                        'tag': tag,
-                        'classes': elem.get('class', []),
-                        'id': elem.get('id', ''),
-                        'text_length': len(text),
-                        'word_count': word_count,
-                        'has_links': has_links,
-                        'has_emphasis': has_emphasis,
-                        'preview': text[:200]
-                    })
+                if text_length > 100:
+                    candidates.append((tag, elem, text_length))
+        
+        candidates.sort(key=lambda x: x[2], reverse=True)
         
-        blocks.sort(key=lambda x: x['text_length'], reverse=True)
-        return blocks[:15]
+        blocks = []
+        for tag, elem, text_length in candidates[:15]:
+            # Analyze text characteristics
+            blocks.append({
+                'tag': tag,
+                'classes': elem.get('class', []),
+                'id': elem.get('id', ''),
+                'text_length': text_length,
+                'word_count': self.index.word_count(elem),
+                'has_links': bool(elem.find('a')),
+                'has_emphasis': bool(elem.find(['strong', 'em', 'b', 'i'])),
+                'preview': elem.get_text(strip=True)[:200]
+            })
+        
+        return blocks
     
     def analyze_links(self):
         """Comprehensive link analysis"""
         self.logger.log_step(4, "Analyzing links", "START")
         
-        all_links = self.soup.find_all('a', href=True)
+        all_links = self.index.find_with_attr('a', 'href')
         
         internal_links = []
         external_links = []
@@ -537,7 +694,9 @@ class IntelligentAnalyzerV2:
             'anchors': len(anchor_links),
             'javascript': len(javascript_links),
             'sample_internal': list(set(internal_links))[:15],
-            'sample_external': list(set(external_links))[:10]
+            'sample_external': list(set(external_links))[:10],
+            # Every distinct internal link, in page order: the batch crawl feeds them to its frontier
+            'internal_urls': list(dict.fromkeys(internal_links))
         }
         
         self.logger.log_metric("Total Links", len(all_links))
@@ -549,7 +708,7 @@ class IntelligentAnalyzerV2:
         self.logger.info("Analyzing media elements")
         
         # Images
-        images = self.soup.find_all('img')
+        images = self.index.find_all('img')
         img_data = {
             'total': len(images),
             'with_alt': len([img for img in images if img.get('alt')]),
@@ -558,8 +717,12 @@ class IntelligentAnalyzerV2:
         }
         
         # Videos
-        videos = self.soup.find_all('video')
-        iframes = self.soup.find_all('iframe', src=re.compile(r'youtube|vimeo', re.I))
+        videos = self.index.find_all('video')
+        video_host = re.compile(r'youtube|vimeo', re.I)
+        iframes = [
+            iframe for iframe in self.index.find_with_attr('iframe', 'src')
+            if video_host.search(iframe['src'])
+        ]
         
         video_data = {
             'native_video': len(videos),
@@ -567,7 +730,7 @@ class IntelligentAnalyzerV2:
         }
         
         # Audio
-        audio = self.soup.find_all('audio')
+        audio = self.index.find_all('audio')
         
         self.analysis['structure']['media'] = {
             'images': img_data,
@@ -581,13 +744,12 @@ class IntelligentAnalyzerV2:
         
         data_attrs = defaultdict(list)
         
-        for elem in self.soup.find_all():
-            for attr, value in elem.attrs.items():
-                if attr.startswith('data-'):
-                    data_attrs[attr].append({
-                        'tag': elem.name,
-                        'value': str(value)[:100]
-                    })
+        for attr, occurrences in self.index.data_attrs.items():
+            for elem, value in occurrences:
+                data_attrs[attr].append({
+                    'tag': elem.name,
+                    'value': str(value)[:100]
+                })
         
         attr_summary = {
             attr: {
@@ -613,7 +775,10 @@ class IntelligentAnalyzerV2:
         }
         
         # JSON-LD
-        json_ld_scripts = self.soup.find_all('script', type='application/ld+json')
+        json_ld_scripts = [
+            script for script in self.index.find_all('script')
+            if script.get('type') == 'application/ld+json'
+        ]
         for script in json_ld_scripts:
             try:
                 data = json.loads(script.string)
@@ -622,14 +787,22 @@ class IntelligentAnalyzerV2:
                 pass
         
         # Open Graph
-        og_tags = self.soup.find_all('meta', property=re.compile(r'^og:'))
+        og_pattern = re.compile(r'^og:')
+        og_tags = [
+            tag for tag in self.index.find_with_attr('meta', 'property')
+            if og_pattern.search(tag['property'])
+        ]
         for tag in og_tags:
             prop = tag.get('property', '')
             content = tag.get('content', '')
             structured_data['opengraph'][prop] = content
         
         # Twitter Cards
-        twitter_tags = self.soup.find_all('meta', attrs={'name': re.compile(r'^twitter:')})
+        twitter_pattern = re.compile(r'^twitter:')
+        twitter_tags = [
+            tag for tag in self.index.find_with_attr('meta', 'name')
+            if twitter_pattern.search(tag['name'])
+        ]
         for tag in twitter_tags:
             name = tag.get('name', '')
             content = tag.get('content', '')
@@ -637,25 +810,33 @@ class IntelligentAnalyzerV2:
         
         self.analysis['data_structures']['structured_data'] = structured_data
     
+    @classmethod
+    def _keyword_scorer(cls):
+        """Keyword automaton for PATTERNS, built once per pattern table"""
+        key = tuple((site_type, tuple(keywords)) for site_type, keywords in cls.PATTERNS.items())
+        scorer = cls._keyword_scorers.get(key)
+        if scorer is None:
+            scorer = cls._keyword_scorers[key] = KeywordScorer(cls.PATTERNS)
+        return scorer
+    
     def detect_website_type(self):
         """Detect website type based on patterns"""
         self.logger.info("Detecting website type")
         
-        # Analyze page content for keywords
-        page_text = self.soup.get_text().lower()
-        class_text = ' '.join([
-            ' '.join(elem.get('class', []))
-            for elem in self.soup.find_all(class_=True)
-        ]).lower()
+        # Count every category keyword in one scan of the page text and of the class vocabulary
+        scorer = self._keyword_scorer()
+        page_counts = scorer.count_text(self.soup.get_text().lower())
         
-        scores = {}
+        if scorer.spans_whitespace:
+            # Multi-word keywords can straddle class boundaries, scan the joined class string
+            class_counts = scorer.count_text(' '.join([
+                ' '.join(elem.get('class', []))
+                for elem in self.index.with_class
+            ]).lower())
+        else:
+            class_counts = scorer.count_vocabulary(self.index.class_counts)
         
-        for site_type, keywords in self.PATTERNS.items():
-            score = 0
-            for keyword in keywords:
-                score += page_text.count(keyword) * 2
-                score += class_text.count(keyword) * 5
-            scores[site_type] = score
+        scores = scorer.category_scores([(page_counts, 2), (class_counts, 5)])
         
         # Get top 3 matches
         sorted_types = sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -683,8 +864,8 @@ class IntelligentAnalyzerV2:
         ]
         
         for keyword in pagination_keywords:
-            links = self.soup.find_all('a', string=re.compile(keyword, re.I))
-            buttons = self.soup.find_all('button', string=re.compile(keyword, re.I))
+            links = self.index.find_by_string('a', keyword)
+            buttons = self.index.find_by_string('button', keyword)
             
             if links or buttons:
                 pagination_data['detected'] = True
@@ -696,7 +877,7 @@ class IntelligentAnalyzerV2:
         
         # Look for numbered pagination
         numbered_links = []
-        for link in self.soup.find_all('a', href=True):
+        for link in self.index.find_with_attr('a', 'href'):
             href = link.get('href', '')
             text = link.get_text(strip=True)
             
@@ -704,6 +885,7 @@ class IntelligentAnalyzerV2:
                 numbered_links.append(href)
         
         if numbered_links:
+            pagination_data['detected'] = True
             pagination_data['type'] = 'numbered'
             pagination_data['sample_urls'] = numbered_links[:5]
         elif pagination_data['detected']:
@@ -725,12 +907,12 @@ class IntelligentAnalyzerV2:
         # Check for infinite scroll indicators
         infinite_scroll_classes = ['infinite', 'scroll', 'lazy-load']
         for cls in infinite_scroll_classes:
-            if self.soup.find(class_=re.compile(cls, re.I)):
+            if self.index.find_by_class_pattern(cls):
                 ajax_indicators['infinite_scroll'] = True
                 break
         
         # Check for SPA frameworks
-        scripts = self.soup.find_all('script', src=True)
+        scripts = self.index.find_with_attr('script', 'src')
         for script in scripts:
             src = script.get('src', '').lower()
             
@@ -758,6 +940,7 @@ class IntelligentAnalyzerV2:
         }
         
         # Determine approach based on patterns
+        repeated_structures = self.analysis['content_patterns'].get('repeated_structures', [])
         list_patterns = self.analysis['content_patterns'].get('list_patterns', [])
         card_patterns = self.analysis['content_patterns'].get('card_patterns', [])
         table_patterns = self.analysis['content_patterns'].get('table_patterns', [])
@@ -771,6 +954,17 @@ class IntelligentAnalyzerV2:
                 'description': 'Extract structured data from HTML tables'
             })
         
+        elif repeated_structures:
+            best_structure = repeated_structures[0]
+            strategy['recommended_approach'] = 'list_extraction'
+            strategy['complexity'] = 'medium'
+            
+            strategy['selectors'].append({
+                'type': 'repeated_elements',
+                'selector': best_structure['selector'],
+                'count': best_structure['item_count']
+            })
+        
         elif list_patterns:
             best_pattern = list_patterns[0]
             strategy['recommended_approach'] = 'list_extraction'
@@ -782,6 +976,16 @@ class IntelligentAnalyzerV2:
                     'selector': f"{best_pattern['tag']} > li",
                     'count': best_pattern['item_count']
                 })
+            elif best_pattern['type'] == 'grid_layout':
+                classes = '.'.join(best_pattern['container_classes'])
+                # A container without classes is selected by its structural path, never by '* > *'
+                selector = f".{classes} > *" if classes else best_pattern.get('selector')
+                if selector:
+                    strategy['selectors'].append({
+                        'type': 'repeated_elements',
+                        'selector': selector,
+                        'count': best_pattern['item_count']
+                    })
             else:
                 classes = '.'.join(best_pattern['item_classes'])
                 strategy['selectors'].append({
@@ -795,10 +999,9 @@ class IntelligentAnalyzerV2:
             strategy['recommended_approach'] = 'card_extraction'
             strategy['complexity'] = 'medium'
             
-            classes = '.'.join(best_card['classes'])
             strategy['selectors'].append({
                 'type': 'card_elements',
-                'selector': f".{classes}",
+                'selector': best_card['selector'],
                 'count': best_card['count']
             })
         
@@ -840,15 +1043,58 @@ class IntelligentAnalyzerV2:
             self.logger.error(f"Failed to save analysis: {str(e)}")
             return False
     
+    def load_cached_analysis(self, html):
+        """
+        Replace the analysis with a stored result for identical HTML
+        
+        Returns:
+            True on a cache hit
+        """
+        if self.analysis_cache is None:
+            return False
+        
+        self._cache_key = AnalysisCache.make_key(self.url, html, source_fingerprint(__file__))
+        cached = self.analysis_cache.get(self._cache_key)
+        if cached is None:
+            self.logger.info("Analysis cache MISS")
+            return False
+        
+        # Keep the details of this fetch, reuse everything derived from the HTML
+        cached['technical_details'] = self.analysis['technical_details']
+        self.analysis = cached
+        self.cache_hit = True
+        self.logger.info("Analysis cache HIT: skipping analysis passes")
+        return True
+    
     def run_full_analysis(self, output_path=None):
         """Execute complete analysis workflow"""
         self.logger.info("Starting comprehensive analysis")
         
         try:
-            # Step 1: Fetch
-            if not self.fetch_page():
+            # Step 1: Fetch (parsing waits until the analysis cache has been checked)
+            if not self.fetch_page(parse=self.analysis_cache is None):
                 return None
             
+            if self.analysis_cache is not None:
+                if self.load_cached_analysis(self.response.text):
+                    if output_path:
+                        self.save_analysis(output_path)
+                    return self.analysis
+                self.load_html(self.response.text)
+        except Exception as e:
+            self.logger.exception(f"Analysis failed: {str(e)}")
+            return None
+        
+        analysis = self.run_analysis_passes(output_path)
+        
+        if analysis is not None and self.analysis_cache is not None:
+            self.analysis_cache.put(self._cache_key, analysis)
+        
+        return analysis
+    
+    def run_analysis_passes(self, output_path=None):
+        """Run every analysis pass over the loaded page (see load_html)"""
+        try:
             # Step 2: Structure
             self.analyze_structure()
             
@@ -891,12 +1137,19 @@ class IntelligentAnalyzerV2:
             return None
 
 
-def analyze_url(url, output_path=None, logger=None):
-    """Convenience function for quick analysis"""
-    analyzer = IntelligentAnalyzerV2(url, logger=logger)
+def analyze_url(url, output_path=None, logger=None, analysis_cache=None, backend=None):
+    """Convenience function for quick analysis (backend: recorded responses to replay, see fetch_backend)"""
+    analyzer = IntelligentAnalyzerV2(url, logger=logger, analysis_cache=analysis_cache, backend=backend)
     return analyzer.run_full_analysis(output_path)
 
 
+def analyze_html(url, html, technical_details=None, encoding=None, output_path=None, logger=None):
+    """Analyze an already-fetched page (used by the batch analyzer)"""
+    analyzer = IntelligentAnalyzerV2(url, logger=logger)
+    analyzer.load_html(html, technical_details, encoding)
+    return analyzer.run_analysis_passes(output_path)
+
+
 if __name__ == '__main__':
     import sys
     
@@ -905,4 +1158,4 @@ if __name__ == '__main__':
         output = sys.argv[2] if len(sys.argv) > 2 else None
         analyze_url(url, output)
     else:
-        print("Usage: python intelligent_analyzer_v2.py <url> [output.json]")
+        print("Usage: python -m core.intelligent_analyzer_v2 <url> [output.json]")
@@ -0,0 +1,146 @@
+"""
+Keyword Scorer
+Counts many keywords in one pass using an Aho-Corasick automaton
+"""
+
+import re
+from collections import Counter, deque
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting non-overlapping counts per keyword"""
+
+    def __init__(self, keywords):
+        """
+        Build the trie and failure links
+
+        Args:
+            keywords: Iterable of keywords (duplicates and empty strings are ignored)
+        """
+        self.keywords = [kw for kw in dict.fromkeys(keywords) if kw]
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state].append(keyword)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        """Breadth-first pass linking each state to its longest proper suffix state"""
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def count(self, text):
+        """
+        Count keyword occurrences in text
+
+        Occurrences of the same keyword never overlap, matching str.count().
+
+        Returns:
+            Counter of keyword -> occurrences
+        """
+        counts = Counter()
+        last_end = {}
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for keyword in output[state]:
+                if position - len(keyword) >= last_end.get(keyword, -1):
+                    counts[keyword] += 1
+                    last_end[keyword] = position
+
+        return counts
+
+
+class KeywordScorer:
+    """Scores text against keyword categories with a single scan"""
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns: Mapping of category -> list of lowercase keywords
+        """
+        self.patterns = patterns
+        keywords = [kw for category_keywords in patterns.values() for kw in category_keywords]
+        self.automaton = KeywordAutomaton(keywords)
+
+        # A keyword can only occur inside a run of characters it is made of, so the
+        # text is reduced to those runs and each distinct run is scanned once
+        alphabet = sorted({char for kw in self.automaton.keywords for char in kw})
+        self._token_pattern = re.compile('[' + ''.join(re.escape(char) for char in alphabet) + ']+') if alphabet else None
+        self.spans_whitespace = any(char.isspace() for char in alphabet)
+
+    def count_text(self, text):
+        """Keyword occurrence counts in text (same totals as text.count(keyword))"""
+        if self._token_pattern is None:
+            return Counter()
+        return self.count_vocabulary(Counter(self._token_pattern.findall(text)), lowercase=False)
+
+    def count_vocabulary(self, vocabulary, lowercase=True):
+        """
+        Keyword occurrence counts over a token -> frequency mapping
+
+        Args:
+            vocabulary: Mapping of token -> number of occurrences
+            lowercase: Lowercase tokens before matching
+
+        Returns:
+            Counter of keyword -> occurrences weighted by token frequency
+        """
+        counts = Counter()
+        for token, frequency in vocabulary.items():
+            if lowercase:
+                token = token.lower()
+            for keyword, occurrences in self.automaton.count(token).items():
+                counts[keyword] += occurrences * frequency
+        return counts
+
+    def category_scores(self, weighted_counts):
+        """
+        Combine keyword counts into per-category scores
+
+        Args:
+            weighted_counts: List of (Counter, weight) pairs
+
+        Returns:
+            Dict of category -> score, in pattern order
+        """
+        scores = {}
+        for category, keywords in self.patterns.items():
+            score = 0
+            for keyword in keywords:
+                for counts, weight in weighted_counts:
+                    score += counts[keyword] * weight
+            scores[category] = score
+        return scores
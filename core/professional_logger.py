@@ -45,7 +45,10 @@ class ScraperLogger:
             'errors': 0,
             'warnings': 0,
             'info': 0,
-            'debug': 0
+            'debug': 0,
+            'cache_hits': 0,
+            'cache_revalidated': 0,
+            'cache_misses': 0
         }
     
     def _setup_file_handler(self):
@@ -169,6 +172,17 @@ class ScraperLogger:
             size_bytes=size
         )
     
+    def log_cache_event(self, status, url):
+        """Log HTTP cache lookup ('hit', 'revalidated' or 'miss')"""
+        if status == 'miss':
+            self.stats['cache_misses'] += 1
+        else:
+            # A 304 answered from disk is a hit that cost one round trip
+            self.stats['cache_hits'] += 1
+            if status == 'revalidated':
+                self.stats['cache_revalidated'] += 1
+        self.debug(f"Cache {status.upper()}", url=url)
+    
     def log_data_extraction(self, item_type, count):
         """Log data extraction"""
         self.info(f"Extracted {count} {item_type} items")
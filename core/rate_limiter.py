@@ -0,0 +1,228 @@
+"""
+Rate Limiter
+Per-host token buckets with burst allowance, robots.txt Crawl-delay and Retry-After
+"""
+
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+
+def host_key(url):
+    """Rate limits apply per scheme and host (including the port)"""
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc.lower()}'
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP-date)
+
+    Returns:
+        Non-negative float, or None when the header is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (now if now is not None else time.time()))
+
+
+class TokenBucket:
+    """
+    Token bucket kept in reservation form
+
+    Each acquire() reserves the next free slot and returns how long to wait
+    for it, so concurrent callers are spaced exactly 1/rate apart instead of
+    polling, and up to `burst` requests may go out back to back.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        """
+        Args:
+            rate: Requests per second
+            burst: Requests allowed back to back after an idle period
+            clock: Monotonic time source (injectable for tests)
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.clock = clock
+        self.interval = 1.0 / rate
+        self.min_interval = self.interval  # pace() never goes faster than this
+        self.burst = int(burst)
+        self._next_free = 0.0  # Theoretical arrival time of the next request
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return 1.0 / self.interval if self.interval else float('inf')
+
+    def set_interval(self, interval, burst=None):
+        """Slow the bucket down to at least `interval` seconds per request, for good"""
+        with self._lock:
+            self.min_interval = max(self.min_interval, interval)
+            self.interval = max(self.interval, interval)
+            if burst is not None:
+                self.burst = min(self.burst, burst)
+
+    def pace(self, interval):
+        """Space requests `interval` seconds apart, never closer than min_interval"""
+        with self._lock:
+            self.interval = max(self.min_interval, interval)
+
+    def block_for(self, seconds):
+        """No request may start for `seconds` (Retry-After)"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+
+    def reserve(self):
+        """Reserve the next slot; returns the delay in seconds before it may be used"""
+        with self._lock:
+            now = self.clock()
+            tolerance = (self.burst - 1) * self.interval
+            start = max(now, self._next_free - tolerance, self._blocked_until)
+            self._next_free = max(self._next_free, start) + self.interval
+            return start - now
+
+    def acquire(self):
+        """Block until a request may be sent; returns the time waited"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """acquire() for coroutines"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class RateLimiter:
+    """One token bucket per host, shared by every thread and coroutine fetching through it"""
+
+    def __init__(self, rate=1.0, burst=1, respect_robots=True, clock=time.monotonic):
+        """
+        Args:
+            rate: Requests per second allowed per host
+            burst: Requests a host may receive back to back after an idle period
+            respect_robots: Slow hosts down to their robots.txt Crawl-delay/Request-rate
+            clock: Monotonic time source (injectable for tests)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.respect_robots = respect_robots
+        self.clock = clock
+        self._buckets = {}
+        self._robots_checked = set()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'wait_seconds': 0.0,
+            'retry_after': 0
+        }
+
+    def bucket(self, url):
+        """Token bucket of the URL's host"""
+        key = host_key(url)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = self._new_bucket(key)
+            return self._buckets[key]
+
+    def _new_bucket(self, key):
+        """Bucket of a host seen for the first time (subclasses share schedules across processes)"""
+        return TokenBucket(self.rate, self.burst, clock=self.clock)
+
+    def needs_robots(self, url):
+        """True once per host when robots.txt should be consulted"""
+        if not self.respect_robots:
+            return False
+        key = host_key(url)
+        with self._lock:
+            if key in self._robots_checked:
+                return False
+            self._robots_checked.add(key)
+            return True
+
+    def apply_robots(self, url, robots_text, user_agent='*'):
+        """Apply a host's robots.txt Crawl-delay / Request-rate to its bucket"""
+        parser = RobotFileParser()
+        parser.parse(robots_text.splitlines())
+
+        delay = parser.crawl_delay(user_agent)
+        request_rate = parser.request_rate(user_agent)
+        intervals = [float(delay)] if delay else []
+        if request_rate and request_rate.requests:
+            intervals.append(request_rate.seconds / request_rate.requests)
+
+        if intervals:
+            # A crawl delay asks for spacing, so bursts are off for that host
+            self.bucket(url).set_interval(max(intervals), burst=1)
+        return max(intervals) if intervals else None
+
+    def pace(self, url, interval):
+        """
+        Let a concurrency controller set a host's pacing (see ConcurrencyController.interval())
+
+        The configured rate and any robots.txt delay stay the floor; None keeps the current pacing.
+        """
+        if interval is not None:
+            self.bucket(url).pace(interval)
+
+    def retry_after(self, url, value):
+        """Pause a host as requested by a Retry-After header value; returns the pause"""
+        seconds = parse_retry_after(value)
+        if seconds:
+            self.bucket(url).block_for(seconds)
+            self.stats['retry_after'] += 1
+        return seconds
+
+    def _record(self, delay):
+        self.stats['requests'] += 1
+        if delay > 0:
+            self.stats['throttled'] += 1
+            self.stats['wait_seconds'] += delay
+
+    def wait(self, url):
+        """Block until the URL's host may receive a request"""
+        delay = self.bucket(url).acquire()
+        self._record(delay)
+        return delay
+
+    async def wait_async(self, url):
+        """wait() for coroutines"""
+        delay = await self.bucket(url).acquire_async()
+        self._record(delay)
+        return delay
+
+
+def rate_limiter_from_delay(delay, burst=1, **kwargs):
+    """Convenience function: limiter from a 'seconds between requests' setting"""
+    return RateLimiter(rate=1.0 / delay if delay else float('inf'), burst=burst, **kwargs)
+
+
+if __name__ == '__main__':
+    import sys
+
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    limiter = RateLimiter(rate, burst, respect_robots=False)
+
+    print(f"Rate: {rate}/s  |  Burst: {burst}")
+    start = time.monotonic()
+    for i in range(burst + 4):
+        limiter.wait('https://example.com/')
+        print(f"   request {i + 1} at {time.monotonic() - start:.2f}s")
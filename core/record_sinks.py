@@ -0,0 +1,625 @@
+"""
+Record Sinks
+Streaming writers for scraped records (CSV, JSON Lines and their gzip variants)
+that append each page's records as it is extracted
+"""
+
+import csv
+import glob
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import zlib
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar sinks need pyarrow; CSV and JSON Lines work without it
+    pa = None
+
+
+# Column types of the columnar sinks, each one able to hold every value of the previous ones
+COLUMN_KINDS = ('null', 'int64', 'float64', 'string')
+
+INTEGER_TEXT = re.compile(r'-?[1-9][0-9]{0,17}|0')
+
+# Excel needs the byte order mark to read UTF-8 CSV files (as written by to_csv(encoding='utf-8-sig'))
+CSV_BOM = '\ufeff'
+
+
+def _open_text(path, mode, compress):
+    """Text handle on a plain or gzip file ('w' creates, 'a' appends a new gzip member)"""
+    if compress:
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'), encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+class RecordSink:
+    """
+    Base class: buffers records and hands them to _write_batch() in bounded batches
+
+    Every flush reaches the file, so an interrupted crawl leaves the records of
+    all flushed pages readable (gzip files are sync-flushed). checkpoint() and
+    resume() let a resumed crawl continue the file from a known state.
+    """
+
+    extension = None
+
+    def __init__(self, path, buffer_records=100):
+        """
+        Args:
+            path: Output file; a '.gz' suffix writes it gzip-compressed
+            buffer_records: Records held in memory before they are written out
+        """
+        self.path = path
+        self.compress = path.endswith('.gz')
+        self.buffer_records = max(1, buffer_records)
+        self.count = 0
+        self._buffer = []
+        self._file = None
+        self.closed = False
+
+    def write(self, record):
+        """Queue one record"""
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= self.buffer_records:
+            self.flush()
+
+    def write_many(self, records):
+        """Queue a page of records"""
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Write buffered records and push them to disk"""
+        if self._buffer:
+            if self._file is None:
+                self._open()
+            self._write_batch(self._buffer)
+            self._buffer = []
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """Flush and close; an empty sink still leaves an (empty) file"""
+        if self.closed:
+            return
+        self.flush()
+        if self._file is None:
+            self._open()
+        self._file.close()
+        self.closed = True
+
+    def abort(self):
+        """Close without finishing the file, leaving it as a resumed crawl expects it"""
+        if self._file is not None:
+            self._file.close()
+        self._buffer = []
+        self.closed = True
+
+    def checkpoint(self):
+        """
+        Flush and describe the file, for resume() after an interruption
+
+        Returns:
+            JSON-serializable state: the file's length and the records in it
+        """
+        self.flush()
+        if self._file is None:
+            self._open()
+        if self.compress:
+            # End the gzip member so the offset falls between members; appending starts a new one
+            self._file.close()
+            offset = os.path.getsize(self.path)
+            self._reopen()
+        else:
+            offset = os.path.getsize(self.path)
+        return {'offset': offset, 'count': self.count}
+
+    def resume(self, state):
+        """Continue the file of a checkpoint(), dropping whatever was written after it"""
+        with open(self.path, 'r+b') as f:
+            f.truncate(state['offset'])
+        self.count = state['count']
+        self._reopen()
+
+    def _open(self):
+        self._file = _open_text(self.path, 'w', self.compress)
+
+    def _reopen(self):
+        self._file = _open_text(self.path, 'a', self.compress)
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JSONLinesSink(RecordSink):
+    """One JSON object per line; every complete line is a usable record"""
+
+    extension = '.jsonl'
+
+    def _write_batch(self, records):
+        self._file.write(''.join(
+            json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in records
+        ))
+
+
+class CSVSink(RecordSink):
+    """
+    CSV with the columns of every record seen so far, in order of first appearance
+
+    Values are written as DataFrame.to_csv() writes them (lists and dicts
+    stringified, missing values empty). Records go straight into the file
+    until one brings a new column; from then on they go to a JSON Lines
+    sidecar next to it, and close() rewrites the file once under the final
+    header with the sidecar's records appended. The file is a valid CSV after
+    every flush, and read_records() reads the sidecar's records after its rows.
+    """
+
+    extension = '.csv'
+
+    def __init__(self, path, buffer_records=100):
+        super().__init__(path, buffer_records)
+        self.columns = []
+        self.header = None  # Columns of the rows in the file, once its header is written
+        self._writer = None
+        self._wide = None  # JSONLinesSink of the records written after the columns grew
+
+    def _open(self):
+        super()._open()
+        self._file.write(CSV_BOM)
+        self._writer = csv.writer(self._file, lineterminator='\n')
+
+    def _reopen(self):
+        # Appending to a gzip file starts a new member, which gzip readers concatenate
+        super()._reopen()
+        self._writer = csv.writer(self._file, lineterminator='\n')
+
+    def close(self):
+        """Flush, merge the sidecar into the file under the final header and close"""
+        if self.closed:
+            return
+        self.flush()
+        if self._wide is not None:
+            self._wide.close()
+            self._rewrite(self.columns, records=read_records(self._wide.path))
+            os.remove(self._wide.path)
+            self._wide = None
+        super().close()
+
+    def abort(self):
+        if self._wide is not None:
+            self._wide.abort()
+        super().abort()
+
+    def checkpoint(self):
+        state = super().checkpoint()
+        state['columns'] = list(self.columns)
+        state['header'] = self.header
+        state['wide'] = self._wide.checkpoint() if self._wide is not None else None
+        return state
+
+    def resume(self, state):
+        self.columns = list(state['columns'])
+        self.header = state.get('header', self.columns)
+        wide_path = _wide_path(self.path)
+        if self.header is not None and self._header_row() != self.header:
+            # Merged by a close() after the checkpoint: the first rows are the checkpoint's records
+            if os.path.exists(wide_path):
+                os.remove(wide_path)
+            self._rewrite(self.columns, rows=state['count'])
+            self.count = state['count']
+            return
+
+        if state.get('wide'):
+            self._wide = JSONLinesSink(wide_path, self.buffer_records)
+            self._wide.resume(state['wide'])
+        elif os.path.exists(wide_path):
+            os.remove(wide_path)
+        super().resume(state)
+
+    def _header_row(self):
+        return next(self._rows(), [])
+
+    def _rows(self):
+        # Tolerates the cut-off gzip member a killed crawl leaves behind
+        return csv.reader(line.lstrip(CSV_BOM) for line in _read_lines(self.path))
+
+    def _write_batch(self, records):
+        known = set(self.columns)
+        for record in records:
+            for key in record:
+                if key not in known:
+                    known.add(key)
+                    self.columns.append(key)
+
+        if self.header is None:
+            self.header = list(self.columns)
+            self._writer.writerow(self.header)
+        if self._wide is None and len(self.columns) == len(self.header):
+            self._writer.writerows([record.get(column) for column in self.header] for record in records)
+            return
+
+        # Rewriting the rows under every wider header would cost O(rows) per new column
+        if self._wide is None:
+            self._wide = JSONLinesSink(_wide_path(self.path), self.buffer_records)
+        self._wide.write_many(records)
+        self._wide.flush()
+
+    def _rewrite(self, columns, rows=None, records=()):
+        """
+        Stream the file into one with the given header: its first `rows` rows,
+        cells padded or cut to fit, then `records`
+        """
+        if self._file is not None:
+            self._file.close()
+        temp_path = self.path + '.tmp'
+
+        with _open_text(temp_path, 'w', self.compress) as target:
+            reader = self._rows()
+            next(reader, None)  # Old header
+            target.write(CSV_BOM)
+            writer = csv.writer(target, lineterminator='\n')
+            if columns:
+                writer.writerow(columns)
+            for row in itertools.islice(reader, rows):
+                writer.writerow((row + [''] * len(columns))[:len(columns)])
+            writer.writerows([record.get(column) for column in columns] for record in records)
+        os.replace(temp_path, self.path)
+
+        self.columns = columns
+        self.header = list(columns)
+        self._reopen()
+
+
+def _wide_path(path):
+    """Sidecar of a CSV file holding the records that brought new columns"""
+    if path.endswith('.gz'):
+        return path[:-3] + '.wide.jsonl.gz'
+    return path + '.wide.jsonl'
+
+
+def value_kind(value):
+    """
+    Narrowest column kind holding a value, following read_csv() on the text to_csv() writes
+
+    Numeric text only counts as a number when it is the number's canonical
+    spelling ('30', '12.5'), so '007' or '1.50' stay text and every value
+    survives a later promotion of its column to string unchanged.
+    """
+    if value is None or value == '':
+        return 'null'
+    if isinstance(value, bool):
+        return 'string'
+    if isinstance(value, int):
+        return 'int64' if -2 ** 63 <= value < 2 ** 63 else 'string'
+    if isinstance(value, float):
+        return 'float64'
+    if isinstance(value, str):
+        if INTEGER_TEXT.fullmatch(value):
+            return 'int64'
+        try:
+            if repr(float(value)) == value:
+                return 'float64'
+        except ValueError:
+            pass
+    return 'string'
+
+
+def column_value(value, kind):
+    """A record value converted for a column of the given kind"""
+    if value is None or value == '':
+        return None
+    if kind == 'int64':
+        return int(value)
+    if kind == 'float64':
+        return float(value)
+    # Nested values are stringified as to_csv() writes them
+    return value if isinstance(value, str) else str(value)
+
+
+class ColumnarSink(RecordSink):
+    """
+    Typed columnar output written one row group (record batch) per full buffer
+
+    Each column gets the narrowest type of COLUMN_KINDS that holds every value
+    seen so far, so readers get numbers without inferring dtypes again. Row
+    groups go to part files next to the output; a batch bringing a new column
+    or needing a wider type (and every checkpoint) finishes the current part.
+    close() merges the parts, one row group at a time, under the final schema.
+    Unlike CSV and JSON Lines the file is only readable once the sink is closed.
+    """
+
+    def __init__(self, path, buffer_records=10000, compression='zstd'):
+        """
+        Args:
+            path: Output file
+            buffer_records: Rows per row group
+            compression: Codec for the column chunks
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet and Feather output (pip install pyarrow)")
+        super().__init__(path, buffer_records)
+        self.compression = compression
+        self.kinds = {}  # Column -> kind, in order of first appearance
+        self.row_groups = 0
+        self.parts = []  # Finished part files
+        self._part = 0
+        self._writer = None
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    def schema(self):
+        # Columns without values yet are float, as read_csv() reads an empty column
+        return pa.schema([
+            (name, pa.float64() if kind == 'null' else getattr(pa, kind)()) for name, kind in self.kinds.items()
+        ])
+
+    def _part_path(self):
+        return f'{self.path}.part{self._part}'
+
+    def flush(self):
+        """Write buffered records as a row group (nothing reaches a readable file before close())"""
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+
+    def _write_batch(self, records):
+        kinds = dict(self.kinds)
+        for record in records:
+            for name, value in record.items():
+                kind = value_kind(value)
+                current = kinds.get(name, 'null')
+                if COLUMN_KINDS.index(kind) > COLUMN_KINDS.index(current) or name not in kinds:
+                    kinds[name] = max(kind, current, key=COLUMN_KINDS.index)
+
+        if kinds != self.kinds:
+            # Row groups of one part share a schema
+            self._finish_part()
+            self.kinds = kinds
+        if self._writer is None:
+            self._writer = self._new_writer(self._part_path(), self.schema())
+
+        columns = {
+            name: [column_value(record.get(name), kind) for record in records]
+            for name, kind in self.kinds.items()
+        }
+        self._writer.write_table(pa.table(columns, schema=self.schema()))
+        self.row_groups += 1
+
+    def _finish_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self.parts.append(self._part_path())
+            self._part += 1
+
+    def close(self):
+        """Write the last row group and merge the parts into the output file"""
+        if self.closed:
+            return
+        self.flush()
+        self._finish_part()
+        if len(self.parts) == 1:
+            # The last part already has the final schema
+            os.replace(self.parts[0], self.path)
+        else:
+            self._merge_parts()
+        self.parts = []
+        self.closed = True
+
+    def _merge_parts(self):
+        schema = self.schema()
+        writer = self._new_writer(self._part_path(), schema)
+        for part in self.parts:
+            for table in self._read_row_groups(part):
+                columns = [
+                    table.column(name).cast(field.type) if name in table.column_names
+                    else pa.nulls(table.num_rows, field.type)
+                    for name, field in zip(schema.names, schema)
+                ]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        writer.close()
+        os.replace(self._part_path(), self.path)
+        for part in self.parts:
+            os.remove(part)
+
+    def abort(self):
+        """Close the current part without merging, leaving the parts to resume()"""
+        if self._writer is not None:
+            self._writer.close()
+        self._buffer = []
+        self.closed = True
+
+    def checkpoint(self):
+        """Write buffered rows and finish the current part, which resume() can then build on"""
+        self.flush()
+        self._finish_part()
+        return {
+            'count': self.count,
+            'kinds': list(self.kinds.items()),
+            'parts': list(self.parts),
+            'part': self._part,
+            'row_groups': self.row_groups
+        }
+
+    def resume(self, state):
+        """Continue from a checkpoint(), removing the parts written after it"""
+        self.count = state['count']
+        self.kinds = dict(state['kinds'])
+        self.parts = list(state['parts'])
+        self._part = state['part']
+        self.row_groups = state['row_groups']
+        for path in glob.glob(glob.escape(self.path) + '.part*'):
+            if path not in self.parts:
+                os.remove(path)
+
+    def _new_writer(self, path, schema):
+        raise NotImplementedError
+
+    @staticmethod
+    def _read_row_groups(path):
+        raise NotImplementedError
+
+
+class ParquetSink(ColumnarSink):
+    """Parquet file, one row group per buffer of records"""
+
+    extension = '.parquet'
+
+    def _new_writer(self, path, schema):
+        return pq.ParquetWriter(path, schema, compression=self.compression)
+
+    @staticmethod
+    def _read_row_groups(path):
+        parquet_file = pq.ParquetFile(path)
+        for index in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(index)
+
+
+class FeatherSink(ColumnarSink):
+    """Feather (Arrow IPC file), one record batch per buffer of records"""
+
+    extension = '.feather'
+
+    def _new_writer(self, path, schema):
+        options = ipc.IpcWriteOptions(compression=self.compression)
+        return ipc.new_file(path, schema, options=options)
+
+    @staticmethod
+    def _read_row_groups(path):
+        with ipc.open_file(path) as reader:
+            for index in range(reader.num_record_batches):
+                yield pa.Table.from_batches([reader.get_batch(index)])
+
+
+SINK_TYPES = {
+    '.csv': CSVSink,
+    '.jsonl': JSONLinesSink,
+    '.ndjson': JSONLinesSink,
+    '.parquet': ParquetSink,
+    '.feather': FeatherSink,
+    '.arrow': FeatherSink
+}
+
+# Formats whose compression is internal rather than a '.gz' suffix
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather', '.arrow')
+COLUMNAR_AVAILABLE = pa is not None
+
+
+def sink_extension(path):
+    """Format extension of an output path, ignoring a '.gz' suffix"""
+    if path.endswith('.gz'):
+        path = path[:-3]
+    return os.path.splitext(path)[1].lower()
+
+
+def open_sink(path, buffer_records=None):
+    """
+    Convenience function: sink for an output path, chosen by its extension
+
+    Supported: .csv, .jsonl, .ndjson (each optionally followed by .gz), and
+    .parquet, .feather/.arrow (with pyarrow)
+
+    Args:
+        path: Output file
+        buffer_records: Records buffered before a write (rows per row group for
+                        the columnar formats); defaults to the sink's own default
+    """
+    extension = sink_extension(path)
+    sink_type = SINK_TYPES.get(extension)
+    if sink_type is None or (extension in COLUMNAR_EXTENSIONS and path.endswith('.gz')):
+        raise ValueError(f"Unsupported output format for {path}, use one of {sorted(SINK_TYPES)} (optionally .gz)")
+    if buffer_records is None:
+        return sink_type(path)
+    return sink_type(path, buffer_records=buffer_records)
+
+
+def _read_lines(path):
+    """Lines of a plain or gzip file, stopping quietly where an interrupted write left off"""
+    if not path.endswith('.gz'):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            yield from f
+        return
+
+    # zlib instead of gzip.open so a file without its end-of-stream marker stays readable
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    pending = b''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            while chunk:
+                pending += decompressor.decompress(chunk)
+                # Concatenated members (appended writes) start over after each end marker
+                chunk = decompressor.unused_data
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                else:
+                    break
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                yield line.decode('utf-8') + '\n'
+    if pending:
+        yield pending.decode('utf-8', errors='ignore')
+
+
+def read_records(path):
+    """
+    Iterate the records of a sink's output, including a partially written one
+
+    A truncated last line (the crawl was killed mid-write) is skipped.
+    """
+    extension = sink_extension(path)
+    if extension in COLUMNAR_EXTENSIONS:
+        # Row group by row group, so memory stays bounded by one group
+        for table in SINK_TYPES[extension]._read_row_groups(path):
+            for record in table.to_pylist():
+                yield {key: value for key, value in record.items() if value is not None}
+        return
+
+    lines = _read_lines(path)
+
+    if extension == '.csv':
+        for row in csv.DictReader(line.lstrip(CSV_BOM) for line in lines):
+            if None in row:  # More cells than columns: not a row this sink wrote
+                continue
+            yield {key: value for key, value in row.items() if value not in ('', None)}
+        # Records of a sink not closed yet that brought new columns, as the CSV will hold them
+        if os.path.exists(_wide_path(path)):
+            for record in read_records(_wide_path(path)):
+                yield {key: value if isinstance(value, str) else str(value)
+                       for key, value in record.items() if value not in ('', None)}
+        return
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            if line.endswith('\n'):
+                raise
+            return
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        total = sum(1 for _ in read_records(sys.argv[1]))
+        print(f"{total} records in {sys.argv[1]}")
+    else:
+        print("Usage: python -m core.record_sinks <records.csv|.jsonl[.gz]|.parquet|.feather>")
@@ -0,0 +1,291 @@
+"""
+Retry Policy
+Jittered exponential backoff for idempotent GETs and per-host circuit breakers
+that fail fast while a host is down
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+import requests
+
+from core.rate_limiter import host_key, parse_retry_after
+
+
+# Responses worth asking for again: throttling and server-side trouble
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Network failures that may go away on their own
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError
+)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to a host whose breaker is open"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"Circuit open for {host}, next attempt in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def is_transient(status=None, error=None):
+    """True for outcomes a retry may fix: connection errors, timeouts and RETRY_STATUSES"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if error is not None:
+        return isinstance(error, TRANSIENT_ERRORS)
+    return status in RETRY_STATUSES
+
+
+def is_host_failure(status=None, error=None):
+    """True when the host itself looks down (a 429 means busy, not broken)"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if error is not None:
+        return isinstance(error, TRANSIENT_ERRORS)
+    return status is not None and status >= 500
+
+
+class RetryPolicy:
+    """
+    How often and how long to wait before asking again
+
+    Delays follow "full jitter" exponential backoff: attempt n waits a random
+    time between 0 and min(max_delay, base_delay * 2**n), so clients that
+    failed together do not come back together. A Retry-After header sets the
+    minimum wait; one longer than max_delay ends the retries.
+    """
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=30.0, retry_statuses=RETRY_STATUSES,
+                 rng=random.random, sleep=time.sleep):
+        """
+        Args:
+            attempts: Requests per URL including the first one (1 disables retries)
+            base_delay: Backoff ceiling of the first retry, seconds
+            max_delay: Backoff ceiling of any retry, seconds
+            retry_statuses: Status codes that are retried
+            rng: Random source returning [0, 1) (injectable for tests)
+            sleep: Blocking sleep used by Fetcher.get() (injectable for tests)
+        """
+        if attempts < 1:
+            raise ValueError("attempts must be at least 1")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = tuple(retry_statuses)
+        self.rng = rng
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'retries': 0,
+            'recovered': 0,       # URLs that succeeded after at least one retry
+            'exhausted': 0,       # URLs still failing after the last attempt
+            'wait_seconds': 0.0,
+            'hosts': {}           # Retries per host
+        }
+
+    def should_retry(self, status=None, error=None):
+        if error is not None:
+            return is_transient(error=error)
+        return status in self.retry_statuses
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number `attempt` (0 for the first retry)
+
+        Returns:
+            Delay, or None when Retry-After asks for more than max_delay
+        """
+        delay = self.rng() * min(self.max_delay, self.base_delay * 2 ** attempt)
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            if seconds > self.max_delay:
+                return None
+            delay = max(delay, seconds)
+        return delay
+
+    def next_delay(self, url, attempt, status=None, error=None, retry_after=None):
+        """
+        Decide about a finished attempt (attempt counts from 0)
+
+        Returns:
+            Seconds to wait before trying again, or None to stop here
+        """
+        retry = self.should_retry(status, error)
+        if retry and attempt + 1 < self.attempts:
+            delay = self.backoff(attempt, retry_after)
+            if delay is not None:
+                with self._lock:
+                    self.stats['retries'] += 1
+                    self.stats['wait_seconds'] += delay
+                    hosts = self.stats['hosts']
+                    hosts[host_key(url)] = hosts.get(host_key(url), 0) + 1
+                return delay
+
+        if isinstance(error, CircuitOpenError):
+            return None
+        with self._lock:
+            if retry:
+                self.stats['exhausted'] += 1
+            elif attempt > 0:
+                self.stats['recovered'] += 1
+        return None
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, hosts=dict(self.stats['hosts']), wait_seconds=round(self.stats['wait_seconds'], 3))
+
+
+class HostBreaker:
+    """Breaker state of one host: closed, open or half-open"""
+
+    def __init__(self, host):
+        self.host = host
+        self.state = 'closed'
+        self.failures = 0          # Consecutive failures
+        self.opened_at = None
+        self.probing = False       # A half-open probe is in flight
+        self.stats = {
+            'failures': 0,
+            'opened': 0,
+            'rejected': 0
+        }
+
+    def metrics(self):
+        return {'state': self.state, 'consecutive_failures': self.failures, **self.stats}
+
+
+class CircuitBreaker:
+    """
+    One circuit breaker per host
+
+    After `failure_threshold` consecutive failures (connection errors,
+    timeouts, 5xx) a host's breaker opens and requests to it fail at once with
+    CircuitOpenError instead of hanging on a dead host. After `reset_timeout`
+    a single probe request goes through (half-open): success closes the
+    breaker, failure opens it for another period.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, history=200, clock=time.monotonic, logger=None):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open a host's breaker
+            reset_timeout: Seconds an open breaker rejects requests before a probe
+            history: State changes kept for metrics
+            clock: Monotonic time source (injectable for tests)
+            logger: Logger receiving state changes
+        """
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.logger = logger
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.transitions = deque(maxlen=history)
+
+    def host(self, url):
+        """Breaker of the URL's host"""
+        key = host_key(url)
+        with self._lock:
+            if key not in self._hosts:
+                self._hosts[key] = HostBreaker(key)
+            return self._hosts[key]
+
+    def before_request(self, url):
+        """Raise CircuitOpenError unless a request to the URL's host may go out now"""
+        state = self.host(url)
+        with self._lock:
+            if state.state == 'closed':
+                return
+            retry_in = state.opened_at + self.reset_timeout - self.clock()
+            if state.state == 'open' and retry_in <= 0:
+                self._transition(state, 'half_open')
+            if state.state == 'half_open' and not state.probing:
+                state.probing = True
+                return
+            state.stats['rejected'] += 1
+        raise CircuitOpenError(state.host, max(0.0, retry_in))
+
+    def record(self, url, status=None, error=None):
+        """Report how a request that before_request() let through ended"""
+        state = self.host(url)
+        with self._lock:
+            probe, state.probing = state.probing, False
+            if is_host_failure(status, error):
+                state.failures += 1
+                state.stats['failures'] += 1
+                if probe or (state.state == 'closed' and state.failures >= self.failure_threshold):
+                    self._transition(state, 'open')
+            elif status is not None or error is None:
+                # The host answered: whatever the status, it is up
+                state.failures = 0
+                if state.state != 'closed':
+                    self._transition(state, 'closed')
+
+    def _transition(self, state, new_state):
+        old = state.state
+        state.state = new_state
+        if new_state == 'open':
+            state.opened_at = self.clock()
+            state.stats['opened'] += 1
+        elif new_state == 'closed':
+            state.opened_at = None
+        self.transitions.append({'host': state.host, 'from': old, 'to': new_state, 'at': self.clock()})
+        if self.logger and new_state != 'half_open':
+            self.logger.warning(f"Circuit for {state.host}: {old} -> {new_state}")
+
+    def open_hosts(self):
+        """Hosts whose breaker is not closed"""
+        with self._lock:
+            return [key for key, state in self._hosts.items() if state.state != 'closed']
+
+    def metrics(self):
+        """State and counters per host, the hosts currently open and recent state changes"""
+        with self._lock:
+            return {
+                'hosts': {key: state.metrics() for key, state in self._hosts.items()},
+                'open': [key for key, state in self._hosts.items() if state.state != 'closed'],
+                'transitions': list(self.transitions)
+            }
+
+
+if __name__ == '__main__':
+    # A host answering 503 to its first 7 requests, fetched by URL with retries
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+    policy = RetryPolicy(attempts=3, base_delay=0.5, sleep=lambda seconds: now.__setitem__(0, now[0] + seconds))
+    outcomes = iter([503] * 7 + [200] * 10)
+
+    for page in range(6):
+        url = f'https://flaky.example/page/{page}'
+        for attempt in range(policy.attempts):
+            try:
+                breaker.before_request(url)
+            except CircuitOpenError as e:
+                print(f"   t={now[0]:5.1f}  page {page}: {e}")
+                break
+            status = next(outcomes)
+            breaker.record(url, status=status)
+            delay = policy.next_delay(url, attempt, status=status)
+            print(f"   t={now[0]:5.1f}  page {page}: HTTP {status}, breaker {breaker.host(url).state}")
+            if delay is None:
+                break
+            policy.sleep(delay)
+        now[0] += 5
+    print(policy.metrics())
+    print(breaker.metrics()['transitions'])
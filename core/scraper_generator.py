@@ -1,12 +1,21 @@
 """
 Dynamic Scraper Generator
-Automatically generates custom scraper scripts based on HTML analysis results
+Automatically generates custom scraper scripts based on HTML analysis results:
+a compiled extraction spec plus a thin script running it on the shared runtime
 """
 
 import json
 import os
+import pprint
+import re
 from datetime import datetime
 
+from core.extraction_spec import compile_spec, save_spec
+
+
+# Project root, so generated scripts can import the shared runtime
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 class ScraperGenerator:
     """Generates custom scraper code based on analysis"""
@@ -19,9 +28,30 @@ class ScraperGenerator:
         else:
             self.analysis = analysis_data
         
-        self.url = self.analysis['url']
-        self.domain = self.analysis['domain']
+        # V2 analyses keep the page identity under 'metadata'
+        source = self.analysis.get('metadata', self.analysis)
+        self.url = source['url']
+        self.domain = source['domain']
         self.strategy = self.analysis.get('scraping_strategy', {})
+        self.spec_file = f"{self.get_class_name().lower()}_spec.json"
+        self.max_pages = 1
+        self.rate_limit = 1.0
+    
+    def get_class_name(self):
+        """Scraper class name derived from the domain (a port or leading digit is allowed)"""
+        words = re.split(r'[^0-9A-Za-z]+', self.domain)
+        class_name = ''.join(word.capitalize() for word in words)
+        if not class_name or class_name[0].isdigit():
+            class_name = 'Site' + class_name
+        return class_name
+    
+    def generate_spec(self):
+        """Compile the analysis into the declarative extraction spec"""
+        return compile_spec(self.analysis, max_pages=self.max_pages, rate_limit=self.rate_limit)
+    
+    def get_spec_path(self, output_path):
+        """Spec file kept next to the generated script"""
+        return os.path.splitext(output_path)[0] + '_spec.json'
     
     def generate_imports(self):
         """Generate import statements"""
@@ -29,269 +59,75 @@ class ScraperGenerator:
 Auto-generated scraper for {domain}
 Generated on: {timestamp}
 Source URL: {url}
+
+Extraction is driven by the spec below and run by the shared ScraperRuntime.
+Edit {spec_file} to change it; running scrapers pick up the change.
 """
 
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-from datetime import datetime
-import json
-import time
-from urllib.parse import urljoin
+import os
+import sys
+
+# Shared runtime from the scraper project
+sys.path.insert(0, {project_root!r})
+from core.scraper_runtime import ScraperRuntime
 '''.format(
             domain=self.domain,
             timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            url=self.url
+            url=self.url,
+            spec_file=self.spec_file,
+            project_root=PROJECT_ROOT
         )
     
     def generate_scraper_class(self):
-        """Generate the main scraper class"""
-        class_name = ''.join(word.capitalize() for word in self.domain.replace('.', '_').replace('-', '_').split('_'))
+        """Generate the scraper class: the embedded spec bound to the shared runtime"""
+        class_name = self.get_class_name()
+        spec = pprint.pformat(self.generate_spec(), width=100, sort_dicts=False)
         
         code = f'''
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), {self.spec_file!r})
+
+SPEC = {spec}
 
-class {class_name}Scraper:
+
+class {class_name}Scraper(ScraperRuntime):
     """Auto-generated scraper for {self.domain}"""
     
-    def __init__(self, base_url="{self.url}"):
-        self.base_url = base_url
-        self.domain = "{self.domain}"
-        self.session = requests.Session()
-        self.session.headers.update({{
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-        }})
-        self.data = []
-    
-    def fetch_page(self, url=None):
-        """Fetch a page and return BeautifulSoup object"""
-        url = url or self.base_url
-        
-        try:
-            print(f"Fetching: {{url}}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            print(f"   Success ({{len(response.content)}} bytes)")
-            
-            # Respectful delay
-            time.sleep(1)
-            
-            return soup
-        
-        except Exception as e:
-            print(f"   Error: {{e}}")
-            return None
-'''
-        
-        return code
-    
-    def generate_extraction_methods(self):
-        """Generate data extraction methods based on strategy"""
-        code = '''
-    def extract_data(self, soup):
-        """Extract data from page based on learned patterns"""
-        if not soup:
-            return []
-        
-        items = []
-        
-'''
-        
-        # Generate based on strategy
-        selectors = self.strategy.get('selectors', [])
-        
-        if selectors:
-            for selector_info in selectors:
-                selector = selector_info.get('selector', '')
-                selector_type = selector_info.get('type', 'unknown')
-                
-                if selector_type == 'list_items':
-                    code += f'''        # Extract list items
-        list_items = soup.select("{selector}")
-        print(f"   Found {{len(list_items)}} items")
-        
-        for item in list_items:
-            data = {{}}
-            
-            # Extract text content
-            data['text'] = item.get_text(strip=True)
-            
-            # Extract links
-            link = item.find('a', href=True)
-            if link:
-                data['link'] = urljoin(self.base_url, link['href'])
-                data['link_text'] = link.get_text(strip=True)
-            
-            # Extract any images
-            img = item.find('img', src=True)
-            if img:
-                data['image'] = urljoin(self.base_url, img['src'])
-                data['image_alt'] = img.get('alt', '')
-            
-            # Extract any data attributes
-            for attr, value in item.attrs.items():
-                if attr.startswith('data-'):
-                    data[attr] = value
-            
-            if data:
-                items.append(data)
-'''
-                
-                elif selector_type == 'repeated_items':
-                    code += f'''        # Extract repeated items
-        repeated_items = soup.select("{selector}")
-        print(f"   Found {{len(repeated_items)}} repeated items")
-        
-        for item in repeated_items:
-            data = {{}}
-            
-            # Extract main text
-            data['content'] = item.get_text(strip=True)
-            
-            # Extract title (common patterns)
-            title = item.find(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
-            if title:
-                data['title'] = title.get_text(strip=True)
-            
-            # Extract links
-            links = item.find_all('a', href=True)
-            if links:
-                data['links'] = [urljoin(self.base_url, link['href']) for link in links]
-            
-            # Extract classes (might contain metadata)
-            data['classes'] = item.get('class', [])
-            
-            if data.get('content'):
-                items.append(data)
-'''
-        
-        else:
-            # Generic extraction
-            code += '''        # Generic extraction (no specific pattern detected)
-        
-        # Try to find article-like content
-        articles = soup.find_all(['article', 'div'], class_=True)
-        
-        for article in articles[:50]:  # Limit to first 50
-            text = article.get_text(strip=True)
-            if len(text) > 50:  # Meaningful content
-                data = {
-                    'content': text,
-                    'classes': article.get('class', []),
-                    'id': article.get('id', ''),
-                }
-                
-                # Try to find title
-                title = article.find(['h1', 'h2', 'h3'])
-                if title:
-                    data['title'] = title.get_text(strip=True)
-                
-                # Try to find links
-                link = article.find('a', href=True)
-                if link:
-                    data['link'] = urljoin(self.base_url, link['href'])
-                
-                items.append(data)
-'''
-        
-        code += '''
-        return items
-'''
-        
-        return code
-    
-    def generate_scrape_method(self):
-        """Generate main scrape method"""
-        code = '''
-    def scrape(self, url=None):
-        """Main scraping method"""
-        print("\\n" + "=" * 100)
-        print(f"Starting scrape of {self.domain}")
-        print("=" * 100)
-        
-        soup = self.fetch_page(url)
-        if not soup:
-            print("❌ Failed to fetch page")
-            return []
-        
-        items = self.extract_data(soup)
-        self.data.extend(items)
-        
-        print(f"\\nExtracted {len(items)} items")
-        
-        return items
-    
-    def save_to_csv(self, filename=None):
-        """Save scraped data to CSV"""
-        if not self.data:
-            print("No data to save")
-            return None
-        
-        if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'scraped_{self.domain.replace(".", "_")}_{timestamp}.csv'
-        
-        df = pd.DataFrame(self.data)
-        df.to_csv(filename, index=False, encoding='utf-8-sig')
-        
-        print(f"\\nSaved {len(self.data)} items to: {filename}")
-        return filename
-    
-    def save_to_json(self, filename=None):
-        """Save scraped data to JSON"""
-        if not self.data:
-            print("No data to save")
-            return None
-        
-        if filename is None:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'scraped_{self.domain.replace(".", "_")}_{timestamp}.json'
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
-        
-        print(f"Saved {len(self.data)} items to: {filename}")
-        return filename
-    
-    def get_summary(self):
-        """Get summary statistics"""
-        if not self.data:
-            return {"total_items": 0}
-        
-        df = pd.DataFrame(self.data)
-        
-        summary = {
-            "total_items": len(self.data),
-            "columns": list(df.columns),
-            "sample_data": self.data[:3] if len(self.data) >= 3 else self.data
-        }
-        
-        return summary
+    def __init__(self, base_url={self.url!r}, spec=None, **kwargs):
+        # The spec file wins over the embedded copy, and is hot-reloaded when edited
+        if spec is None:
+            spec = SPEC_PATH if os.path.exists(SPEC_PATH) else SPEC
+        super().__init__(spec, base_url=base_url, **kwargs)
 '''
         
         return code
     
     def generate_main(self):
         """Generate main execution block"""
-        class_name = ''.join(word.capitalize() for word in self.domain.replace('.', '_').replace('-', '_').split('_'))
+        class_name = self.get_class_name()
         
         code = f'''
 
 def main():
     """Main execution"""
     scraper = {class_name}Scraper()
+    if '--incremental' in sys.argv:
+        # Skip pages unchanged since the last --incremental run; only new or changed records are written
+        scraper.set_incremental(scraper.default_state_path())
+    if '--archive' in sys.argv:
+        # Keep the raw pages in warc_<domain>/, to re-extract them offline with archive_reprocess
+        scraper.set_archive(scraper.default_archive_dir())
+    elif '--replay' in sys.argv:
+        # Crawl the pages an earlier --archive run kept, without the network
+        scraper.set_backend(scraper.default_archive_dir())
     
-    # Scrape the page
-    items = scraper.scrape()
+    # Records go to CSV and JSON Lines page by page, so long crawls run in constant memory;
+    # --resume continues an interrupted crawl from its checkpoint instead of starting over
+    csv_file, jsonl_file = scraper.scrape_to_files(
+        checkpoint=scraper.default_checkpoint_path(),
+        resume='--resume' in sys.argv
+    )
     
-    if items:
-        # Save results
-        csv_file = scraper.save_to_csv()
-        json_file = scraper.save_to_json()
-        
+    if scraper.record_count:
         # Print summary
         print("\\n" + "=" * 100)
         print("SCRAPING SUMMARY")
@@ -302,6 +138,9 @@ def main():
         print("=" * 100)
         
         return csv_file
+    elif scraper.change_summary:
+        print("\\nNo new or changed items since the last run")
+        return None
     else:
         print("\\n⚠️  No data extracted")
         return None
@@ -313,20 +152,31 @@ if __name__ == '__main__':
         
         return code
     
-    def generate_full_scraper(self, output_path):
-        """Generate complete scraper script"""
+    def generate_full_scraper(self, output_path, max_pages=1, rate_limit=1.0):
+        """
+        Generate complete scraper script
+        
+        Args:
+            output_path: Where to write the scraper (the spec goes next to it)
+            max_pages: Pages the scraper crawls when pagination was detected
+            rate_limit: Seconds between requests to the site
+        """
         print(f"\n🔧 Generating custom scraper for {self.domain}...")
         
+        self.max_pages = max_pages
+        self.rate_limit = rate_limit
+        spec_path = self.get_spec_path(output_path)
+        self.spec_file = os.path.basename(spec_path)
+        
         code_parts = [
             self.generate_imports(),
             self.generate_scraper_class(),
-            self.generate_extraction_methods(),
-            self.generate_scrape_method(),
             self.generate_main()
         ]
         
         full_code = '\n'.join(code_parts)
         
+        save_spec(self.generate_spec(), spec_path)
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write(full_code)
         
@@ -334,10 +184,10 @@ if __name__ == '__main__':
         return output_path
 
 
-def generate_scraper(analysis_file, output_file):
+def generate_scraper(analysis_file, output_file, max_pages=1, rate_limit=1.0):
     """Convenience function"""
     generator = ScraperGenerator(analysis_file)
-    return generator.generate_full_scraper(output_file)
+    return generator.generate_full_scraper(output_file, max_pages=max_pages, rate_limit=rate_limit)
 
 
 if __name__ == '__main__':
@@ -346,6 +196,9 @@ if __name__ == '__main__':
     if len(sys.argv) > 2:
         analysis_file = sys.argv[1]
         output_file = sys.argv[2]
-        generate_scraper(analysis_file, output_file)
+        max_pages = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+        rate_limit = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+        generate_scraper(analysis_file, output_file, max_pages, rate_limit)
     else:
-        print("Usage: python scraper_generator.py <analysis.json> <output_scraper.py>")
+        print("Usage: python -m core.scraper_generator <analysis.json> <output_scraper.py> [max_pages] "
+              "[rate_limit_seconds]")
@@ -0,0 +1,318 @@
+"""
+Scraper Runner
+Runs generated scraper scripts in-process (or in an isolated subprocess) and
+hands their records over as a DataFrame
+"""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from core.record_sinks import JSONLinesSink, open_sink, read_records
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def project_environment():
+    """Environment of a child process running a core module (python -m core.<module>) from any directory"""
+    paths = [PROJECT_ROOT] + [path for path in os.environ.get('PYTHONPATH', '').split(os.pathsep) if path]
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(paths))
+
+
+def load_scraper_module(scraper_path):
+    """Import a generated scraper script as a module without running its main()"""
+    module_name = 'generated_' + os.path.splitext(os.path.basename(scraper_path))[0].replace('.', '_')
+    spec = importlib.util.spec_from_file_location(module_name, scraper_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_scraper_class(module):
+    """The *Scraper class defined by a generated module"""
+    for name, obj in vars(module).items():
+        if isinstance(obj, type) and name.endswith('Scraper') and obj.__module__ == module.__name__:
+            return obj
+    raise ValueError(f"No scraper class found in {module.__file__}")
+
+
+def load_scraper(scraper_path, **kwargs):
+    """
+    Instantiate the scraper defined in a generated script
+
+    Args:
+        scraper_path: Path to the generated *_scraper.py
+        **kwargs: Passed to the scraper constructor (e.g. base_url)
+
+    Returns:
+        Scraper instance
+    """
+    return find_scraper_class(load_scraper_module(scraper_path))(**kwargs)
+
+
+def records_to_dataframe(records):
+    """
+    Build the DataFrame the analysis would have read back from the scraper's CSV
+
+    Nested values are stringified the way to_csv() writes them and text columns
+    holding only numbers become numeric, as read_csv() would infer.
+    """
+    df = pd.DataFrame(records)
+
+    for col in df.columns:
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+
+        nested = df[col].map(lambda value: isinstance(value, (list, dict, tuple)))
+        if nested.any():
+            df[col] = df[col].map(lambda value: str(value) if isinstance(value, (list, dict, tuple)) else value)
+
+        # read_csv() reads empty fields as missing
+        values = df[col].map(lambda value: None if value == '' else value)
+        try:
+            df[col] = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            df[col] = values.astype(df[col].dtype) if values.notna().any() else pd.Series(float('nan'), index=df.index)
+
+    return df
+
+
+class ScraperRunner:
+    """Executes a generated scraper and collects its records"""
+
+    MODES = ('inprocess', 'subprocess')
+
+    def __init__(self, scraper_path, mode='inprocess', timeout=300, python=None, cwd=None, outputs=None,
+                 checkpoint=None, resume=False, incremental=None, archive=None, replay=None):
+        """
+        Args:
+            scraper_path: Path to the generated *_scraper.py
+            mode: 'inprocess' imports the script; 'subprocess' isolates it in a new interpreter
+            timeout: Subprocess timeout in seconds (records extracted until then are kept)
+            python: Interpreter for subprocess mode (defaults to the current one)
+            cwd: Working directory for subprocess mode
+            outputs: Files the scraper streams its records into while it runs
+                     (.csv or .jsonl, optionally .gz)
+            checkpoint: Checkpoint file the crawl updates while it runs; the records are
+                        then streamed next to it as well, so a resumed run returns them all
+            resume: Continue the crawl recorded in the checkpoint instead of starting over
+            incremental: State database of earlier runs; pages unchanged since then are
+                         skipped and only new or changed records are returned
+            archive: Directory the fetched pages are appended to as WARC files
+            replay: Recorded responses (WARC or mirror directory) the scraper fetches from
+                    instead of the network (in-process mode also takes a FetchBackend)
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown scraper mode '{mode}', use one of {self.MODES}")
+        if mode == 'subprocess' and replay is not None and not isinstance(replay, str):
+            raise ValueError("Subprocess mode replays a recording path, not a backend object")
+
+        self.scraper_path = os.path.abspath(scraper_path)
+        self.mode = mode
+        self.timeout = timeout
+        self.python = python or sys.executable
+        self.cwd = cwd
+        self.outputs = [os.path.abspath(path) for path in outputs or []]
+        self.checkpoint = os.path.abspath(checkpoint) if checkpoint else None
+        self.resume = resume
+        self.incremental = os.path.abspath(incremental) if incremental else None
+        self.archive = os.path.abspath(archive) if archive else None
+        self.replay = os.path.abspath(replay) if isinstance(replay, str) else replay
+
+    def records_path(self):
+        """Where a checkpointed run streams its records (they outlive an interrupted run)"""
+        return os.path.splitext(self.checkpoint)[0] + '.records.jsonl'
+
+    def run(self, html=None, url=None):
+        """
+        Run the scraper
+
+        Args:
+            html: Already-fetched first page (str or bytes); fetched by the scraper when None
+            url: Page URL (defaults to the scraper's base_url)
+
+        Returns:
+            Dict with records, dataframe, mode, captured output (subprocess mode),
+            fetch metrics (rate limiting, adaptive concurrency, retries and circuit
+            breakers, when the scraper reports them), the change summary of an
+            incremental run (None otherwise) and whether the subprocess timed out
+        """
+        timed_out = False
+        if self.mode == 'subprocess':
+            records, metrics, changes, output, timed_out = self._run_subprocess(html, url)
+        elif self.checkpoint is None:
+            records, metrics, changes = self._run_inprocess(html, url)
+            output = ''
+        else:
+            # Records of earlier, interrupted runs are only in the stream, so read them all back from it
+            records_sink = JSONLinesSink(self.records_path())
+            _, metrics, changes = self._run_inprocess(
+                html, url, outputs=self.outputs + [records_sink], keep_records=False
+            )
+            records = list(read_records(records_sink.path))
+            output = ''
+
+        if self.checkpoint is not None and not os.path.exists(self.checkpoint):
+            # The crawl finished (its checkpoint is gone): the stream was only kept for resuming
+            if os.path.exists(self.records_path()):
+                os.remove(self.records_path())
+
+        return {
+            'mode': self.mode,
+            'records': records,
+            'dataframe': records_to_dataframe(records),
+            'output': output,
+            'metrics': metrics,
+            'changes': changes,
+            'timed_out': timed_out
+        }
+
+    def _run_inprocess(self, html, url, outputs=None, keep_records=True):
+        scraper = load_scraper(self.scraper_path)
+        outputs = self.outputs if outputs is None else outputs
+
+        # Scripts generated before the shared runtime cannot stream; their records are written at the end
+        streaming = hasattr(scraper, 'add_sink')
+        sinks = []
+        if streaming:
+            scraper.keep_records = keep_records
+            sinks = [scraper.add_sink(sink) for sink in outputs]
+        # Nor can they checkpoint
+        options = {}
+        if self.checkpoint is not None and hasattr(scraper, 'set_checkpoint'):
+            scraper.set_checkpoint(self.checkpoint)
+            options['resume'] = self.resume
+        if self.incremental is not None and hasattr(scraper, 'set_incremental'):
+            scraper.set_incremental(self.incremental)
+        if self.replay is not None and hasattr(scraper, 'set_backend'):
+            scraper.set_backend(self.replay)
+        archive = None
+        if self.archive is not None and hasattr(scraper, 'set_archive'):
+            archive = scraper.set_archive(self.archive)
+
+        completed = False
+        try:
+            if html is None:
+                scraper.scrape(url, **options)  # Also works for scripts generated before scrape(html=...)
+            else:
+                scraper.scrape(url=url, html=html, **options)
+            completed = True
+        finally:
+            for sink in sinks:
+                # An interrupted checkpointed crawl leaves its outputs as the checkpoint expects them
+                if completed or not options:
+                    sink.close()
+                else:
+                    sink.abort()
+            if archive is not None:
+                archive.close()
+
+        if not streaming:
+            for output in outputs:
+                with open_sink(output) if isinstance(output, str) else output as sink:
+                    sink.write_many(scraper.data)
+
+        # Scripts generated before the shared runtime have no metrics to report
+        metrics = scraper.fetch_metrics() if hasattr(scraper, 'fetch_metrics') else {}
+        return scraper.data, metrics, getattr(scraper, 'change_summary', None)
+
+    def _run_subprocess(self, html, url):
+        with tempfile.TemporaryDirectory(prefix='scraper_run_') as temp_dir:
+            # The child streams records here, so a timeout still leaves the pages done so far
+            # (next to the checkpoint when there is one, so a resumed run continues the stream)
+            records_path = self.records_path() if self.checkpoint else os.path.join(temp_dir, 'records.jsonl')
+            command = [self.python, '-m', 'core.scraper_runner', self.scraper_path, records_path]
+
+            if html is not None:
+                html_path = os.path.join(temp_dir, 'page.html')
+                with open(html_path, 'wb') as f:
+                    f.write(html.encode('utf-8') if isinstance(html, str) else html)
+                command += ['--html', html_path]
+            if url:
+                command += ['--url', url]
+            for path in self.outputs:
+                command += ['--output', path]
+            if self.checkpoint:
+                command += ['--checkpoint', self.checkpoint]
+                if self.resume:
+                    command += ['--resume', 'yes']
+            if self.incremental:
+                command += ['--incremental', self.incremental]
+            if self.archive:
+                command += ['--archive', self.archive]
+            if self.replay:
+                command += ['--replay', self.replay]
+
+            try:
+                result = subprocess.run(
+                    command,
+                    cwd=self.cwd,
+                    env=project_environment(),
+                    capture_output=True,
+                    text=True,
+                    timeout=self.timeout
+                )
+            except subprocess.TimeoutExpired as e:
+                records = list(read_records(records_path)) if os.path.exists(records_path) else []
+                output = e.stdout.decode('utf-8', 'replace') if isinstance(e.stdout, bytes) else (e.stdout or '')
+                output += f"\nScraper timed out after {self.timeout}s; kept {len(records)} records extracted until then"
+                if self.checkpoint and os.path.exists(self.checkpoint):
+                    output += " (resumable from its checkpoint)"
+                return records, {}, None, output, True
+
+            if result.returncode != 0:
+                raise RuntimeError(f"Scraper exited with code {result.returncode}: {result.stderr[-500:]}")
+
+            records = list(read_records(records_path))
+
+            metrics, changes = {}, None
+            metrics_path = records_path + '.metrics'
+            if os.path.exists(metrics_path):
+                with open(metrics_path, 'r', encoding='utf-8') as f:
+                    report = json.load(f)
+                os.remove(metrics_path)
+                metrics, changes = report['metrics'], report['changes']
+            return records, metrics, changes, result.stdout, False
+
+
+def run_scraper(scraper_path, mode='inprocess', html=None, url=None, **kwargs):
+    """Convenience function"""
+    return ScraperRunner(scraper_path, mode=mode, **kwargs).run(html=html, url=url)
+
+
+if __name__ == '__main__':
+    # Child side of subprocess mode: run in-process here, write records as JSON
+    if len(sys.argv) > 2:
+        pairs = list(zip(sys.argv[3::2], sys.argv[4::2]))
+        options = dict(pairs)
+
+        page = None
+        if '--html' in options:
+            with open(options['--html'], 'rb') as f:
+                page = f.read()
+
+        # Records are flushed one by one, so the parent can read them back even after killing us
+        outputs = [JSONLinesSink(sys.argv[2], buffer_records=1)]
+        outputs += [path for flag, path in pairs if flag == '--output']
+        runner = ScraperRunner(
+            sys.argv[1], checkpoint=options.get('--checkpoint'), resume='--resume' in options,
+            incremental=options.get('--incremental'), archive=options.get('--archive'),
+            replay=options.get('--replay')
+        )
+        records, metrics, changes = runner._run_inprocess(
+            page, options.get('--url'), outputs=outputs, keep_records=False
+        )
+
+        with open(sys.argv[2] + '.metrics', 'w', encoding='utf-8') as f:
+            json.dump({'metrics': metrics, 'changes': changes}, f, default=str)
+        print(f"Extracted {outputs[0].count} records")
+    else:
+        print("Usage: python -m core.scraper_runner <scraper.py> <records.jsonl> [--html page.html] [--url URL] "
+              "[--output records.csv ...] [--checkpoint crawl.checkpoint.json [--resume yes]] [--incremental pages.sqlite] "
+              "[--archive warc_dir] [--replay warc_dir]")
@@ -0,0 +1,990 @@
+"""
+Scraper Runtime
+Single engine that executes extraction specs, replacing per-site generated extraction code.
+Selectors are compiled once per spec to XPath and run by lxml over the whole page;
+BeautifulSoup remains available as the reference engine.
+"""
+
+import json
+import os
+from datetime import datetime
+from urllib.parse import urldefrag, urljoin
+
+import requests
+from bs4 import BeautifulSoup, Tag, UnicodeDammit
+from bs4.builder import HTMLTreeBuilder
+from lxml import etree
+
+try:
+    from cssselect import HTMLTranslator, SelectorError, parse as parse_css
+except ImportError:  # Without cssselect every spec runs on the BeautifulSoup engine
+    HTMLTranslator = None
+
+from core.concurrency_controller import ConcurrencyController
+from core.crawl_checkpoint import open_checkpoint
+from core.extraction_spec import load_spec, spec_hash, validate_spec
+from core.fetcher import Fetcher
+from core.incremental_state import format_summary, open_incremental_state
+from core.rate_limiter import rate_limiter_from_delay
+from core.record_sinks import CSVSink, JSONLinesSink, open_sink
+from core.retry_policy import CircuitBreaker, RetryPolicy
+from core.warc_archive import open_warc_writer
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+ENGINES = ('lxml', 'bs4')
+
+# Pacing for specs without a rate_limit section (the one-second pause older scrapers slept)
+DEFAULT_RATE_LIMIT = {'delay': 1.0, 'burst': 1}
+
+# Pages per wave for pagination rules without a concurrency setting
+DEFAULT_CONCURRENCY = 4
+
+# Strings BeautifulSoup leaves out of get_text() (Script, Stylesheet, TemplateString, ruby text)
+ITEM_TEXT = etree.XPath(
+    'descendant::text()[not(ancestor::script or ancestor::style or ancestor::template'
+    ' or ancestor::rt or ancestor::rp)]',
+    smart_strings=False
+)
+TABLE_ROWS = etree.XPath('descendant::tr')
+ROW_HEADER_CELLS = etree.XPath('descendant::th | descendant::td')
+ROW_DATA_CELLS = etree.XPath('descendant::td')
+HAS_HEADER_CELL = etree.XPath('boolean(descendant::th)')
+NEXT_LINK_CANDIDATES = etree.XPath('descendant-or-self::a[@href] | descendant-or-self::link[@href]')
+
+# Attributes BeautifulSoup splits into lists
+CDATA_LIST_ATTRIBUTES = HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+# Plain etree elements: no per-element class lookup as with lxml.html
+UTF8_PARSER = etree.HTMLParser(encoding='utf-8')
+
+# Compiled rule plans shared by every runtime running the same spec
+_compiled_plans = {}
+
+
+def _compile_field(field):
+    value = field['value']
+    return (
+        field['name'],
+        field.get('source'),
+        'attr' if value.startswith('attr:') else value,
+        value[5:] if value.startswith('attr:') else None,
+        field.get('absolute', False),
+        field.get('all', False),
+        field.get('default')
+    )
+
+
+def _compile_xpaths(rule):
+    """
+    XPath for a rule's items, plus one whole-page XPath per sourced field
+
+    Field XPaths select the field's elements under every item at once, so a
+    field costs one query per page instead of one per item.
+    """
+    translator = HTMLTranslator()
+    items = ' | '.join(
+        translator.selector_to_xpath(selector, prefix='descendant-or-self::')
+        for selector in parse_css(rule['selector'])
+    )
+
+    sources = {}
+    for field in rule.get('fields', []):
+        source = field.get('source')
+        if source and source not in sources:
+            sources[source] = etree.XPath(' | '.join(
+                f'({items})/' + translator.selector_to_xpath(selector, prefix='descendant::')
+                for selector in parse_css(source)
+            ))
+    return etree.XPath(items), sources
+
+
+def compile_plan(spec):
+    """
+    Rule plans for a spec, compiled once and cached by spec hash
+
+    Field rules are pre-parsed into tuples and selectors translated to XPath;
+    'xpath' is None when a selector has no XPath equivalent (BeautifulSoup runs it).
+    """
+    key = spec_hash(spec)
+    if key not in _compiled_plans:
+        plan = []
+        for rule in validate_spec(spec)['rules']:
+            compiled = dict(rule, fields=[_compile_field(field) for field in rule.get('fields', [])])
+            compiled['xpath'], compiled['source_xpaths'] = None, {}
+            if HTMLTranslator is not None:
+                try:
+                    compiled['xpath'], compiled['source_xpaths'] = _compile_xpaths(rule)
+                except (SelectorError, etree.XPathError) as e:
+                    print(f"   Selector {rule['selector']!r} not supported by lxml ({e}), using BeautifulSoup")
+            plan.append(compiled)
+        _compiled_plans[key] = plan
+    return _compiled_plans[key]
+
+
+def element_text(element):
+    """lxml equivalent of BeautifulSoup's get_text(strip=True)"""
+    return ''.join(text.strip() for text in ITEM_TEXT(element) if text.strip())
+
+
+def _attribute(element, attr):
+    value = element.attrib[attr]
+    if attr in CDATA_LIST_ATTRIBUTES['*'] or attr in CDATA_LIST_ATTRIBUTES.get(element.tag, ()):
+        return value.split()
+    return value
+
+
+class ScraperRuntime:
+    """Fetches pages and extracts records as described by an extraction spec"""
+
+    def __init__(self, spec, base_url=None, fetcher=None, engine='lxml', sinks=None, keep_records=True):
+        """
+        Args:
+            spec: Spec dict, or path to a spec JSON file (reloaded when the file changes)
+            base_url: Start URL (defaults to the spec's url)
+            fetcher: Fetcher to use, keeping its own rate limiter and concurrency controller
+                     (by default a cached Fetcher on a browser-like session, paced by the
+                     spec's rate_limit, adapting the crawl's concurrency per host, retrying
+                     transient failures and failing fast on hosts that are down)
+            engine: 'lxml' (compiled XPath) or 'bs4' (BeautifulSoup with html.parser)
+            sinks: Record sinks (or output paths) receiving each page's records as it is extracted
+            keep_records: Also collect records in self.data; turn off for long crawls
+                          into sinks, which then run in constant memory
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', use one of {ENGINES}")
+
+        self.requested_engine = engine
+        self.spec_path = spec if isinstance(spec, str) else None
+        self._spec_mtime = None
+        self._rate_limit = None
+        self._concurrency_limits = None
+        self._owns_fetcher = fetcher is None
+        self.fetcher = None
+        self.load(spec)
+
+        self.base_url = base_url or self.spec['url']
+        self.domain = self.spec['domain']
+        self.session = fetcher.session if fetcher else requests.Session()
+        if not fetcher:
+            self.session.headers.update(DEFAULT_HEADERS)
+        self.fetcher = fetcher or Fetcher(
+            session=self.session, timeout=30, rate_limiter=self.rate_limiter,
+            concurrency_controller=self.concurrency_controller,
+            retry_policy=RetryPolicy(), circuit_breaker=CircuitBreaker()
+        )
+        self.data = []
+        self.keep_records = keep_records
+        self.sinks = []
+        self.record_count = 0
+        self.columns = {}  # Every column seen, in order of first appearance
+        self.sample_data = []
+        for sink in sinks or []:
+            self.add_sink(sink)
+        self.checkpoint = None
+        self._crawl_url = None
+        self.incremental = None
+        self.change_summary = None
+
+    def add_sink(self, sink):
+        """Stream records into a sink (RecordSink or output path such as 'items.jsonl.gz')"""
+        if isinstance(sink, str):
+            sink = open_sink(sink)
+        self.sinks.append(sink)
+        return sink
+
+    def close_sinks(self):
+        """Flush and close every sink; returns their paths"""
+        for sink in self.sinks:
+            sink.close()
+        return [sink.path for sink in self.sinks]
+
+    def set_checkpoint(self, checkpoint, interval=None):
+        """
+        Checkpoint crawls so scrape(resume=True) can continue an interrupted one
+
+        Args:
+            checkpoint: Checkpoint file path or CrawlCheckpoint (None turns checkpointing off)
+            interval: Minimum seconds between checkpoint writes (defaults to the checkpoint's own)
+        """
+        self.checkpoint = None if checkpoint is None else open_checkpoint(checkpoint, interval)
+        return self.checkpoint
+
+    def set_incremental(self, state, key_fields=None):
+        """
+        Re-scrape incrementally: pages unchanged since the last run are skipped
+        without parsing, and only new or changed records are emitted
+
+        Args:
+            state: State database path or IncrementalState (None turns incremental mode off)
+            key_fields: Record fields identifying a record across runs, so an edited
+                        record counts as changed rather than new (default: the whole record)
+        """
+        self.incremental = None if state is None else open_incremental_state(state, key_fields)
+        if self.incremental is not None and self._owns_fetcher:
+            # A fresh cache entry would hide changes; the state revalidates pages itself
+            self.fetcher.cache = None
+        return self.incremental
+
+    def set_archive(self, archive):
+        """
+        Append every page response to compressed WARC files, so the crawl can be
+        extracted again offline (see archive_reprocess)
+
+        A first page handed to scrape(html=...) was not fetched here and is not archived.
+
+        Args:
+            archive: Directory of the WARC files, or WARCWriter (None turns archiving off)
+        """
+        writer = open_warc_writer(archive, prefix=f'scraped_{self.domain.replace(".", "_")}')
+        if self.fetcher is not None:
+            self.fetcher.archive = writer
+        return writer
+
+    def set_backend(self, backend):
+        """
+        Fetch through a FetchBackend, e.g. a ReplayBackend serving the pages recorded
+        by an earlier --archive run, so the crawl runs offline and the same every time
+
+        Replayed pages bypass the HTTP cache (of a fetcher the runtime created).
+
+        Args:
+            backend: FetchBackend or WARC/mirror path(s) to replay (None goes back to the network)
+
+        Returns:
+            The backend
+        """
+        backend = self.fetcher.set_backend(backend)
+        if self._owns_fetcher and backend.name != 'live':
+            self.fetcher.cache = None
+        return backend
+
+    def default_archive_dir(self):
+        """warc_<domain>/ in the working directory (runs of the site add files to it)"""
+        return f'warc_{self.domain.replace(".", "_")}'
+
+    def default_state_path(self):
+        """scraped_<domain>.pages.sqlite in the working directory (stable across runs)"""
+        return f'scraped_{self.domain.replace(".", "_")}.pages.sqlite'
+
+    def default_checkpoint_path(self):
+        """scraped_<domain>.checkpoint.json in the working directory (stable across runs)"""
+        return f'scraped_{self.domain.replace(".", "_")}.checkpoint.json'
+
+    def save_checkpoint(self, cursor):
+        """
+        Write the crawl's position and the state of its outputs to the checkpoint
+
+        Args:
+            cursor: Where the crawl continues: 'mode' ('numbered' or 'next_links'), the next
+                    'page' number and either the 'previous' page's records or the
+                    'frontier' of next-page URLs and the 'visited' pages
+        """
+        self.checkpoint.save({
+            'url': self._crawl_url,
+            'spec': spec_hash(self.spec),
+            'cursor': cursor,
+            'record_count': self.record_count,
+            'columns': list(self.columns),
+            'sample_data': self.sample_data,
+            # Sinks flush here, so the offsets cover every record emitted before the cursor
+            'sinks': {os.path.abspath(sink.path): sink.checkpoint() for sink in self.sinks}
+        })
+        if self.incremental is not None:
+            # Pages recorded since the last checkpoint become permanent only now
+            self.incremental.commit()
+
+    def _progress(self, cursor):
+        # Called at page boundaries; writes only when the checkpoint's interval has passed
+        if self.checkpoint is not None and self.checkpoint.due():
+            self.save_checkpoint(cursor)
+
+    def emit(self, items):
+        """Hand one page's records to the sinks (and self.data when records are kept)"""
+        for sink in self.sinks:
+            sink.write_many(items)
+        if self.keep_records:
+            self.data.extend(items)
+        for item in items:
+            self.columns.update(dict.fromkeys(item))
+        self.sample_data.extend(items[:3 - len(self.sample_data)])
+        self.record_count += len(items)
+
+    def load(self, spec):
+        """Switch to a new spec (dict or path)"""
+        if isinstance(spec, str):
+            self._spec_mtime = os.path.getmtime(spec)
+            spec = load_spec(spec)
+        self.spec = spec
+        self.plan = compile_plan(spec)
+        self._configure_rate_limit(spec.get('rate_limit') or DEFAULT_RATE_LIMIT)
+        self._configure_concurrency(spec.get('pagination'))
+        self.engine = self.requested_engine
+        if self.engine == 'lxml' and any(rule['xpath'] is None for rule in self.plan):
+            self.engine = 'bs4'
+
+    def _configure_rate_limit(self, rate_limit):
+        """Per-host pacing from the spec (rebuilt only when a reload changes it)"""
+        if rate_limit == self._rate_limit:
+            return
+        self._rate_limit = rate_limit
+        self.rate_limiter = rate_limiter_from_delay(rate_limit['delay'], rate_limit.get('burst', 1))
+        if self._owns_fetcher and self.fetcher is not None:
+            self.fetcher.rate_limiter = self.rate_limiter
+
+    def _configure_concurrency(self, pagination):
+        """
+        Adaptive per-host concurrency for numbered pagination (rebuilt only when a reload changes it)
+
+        The rule's concurrency is the starting wave size; with a larger max_concurrency
+        the waves grow while the host answers quickly and shrink on 429/503/timeouts.
+        """
+        pagination = pagination or {}
+        limits = (pagination.get('concurrency') or DEFAULT_CONCURRENCY, pagination.get('max_concurrency'))
+        if limits == self._concurrency_limits:
+            return
+        self._concurrency_limits = limits
+
+        initial, maximum = limits
+        self.concurrency_controller = None
+        if maximum and maximum > initial:
+            self.concurrency_controller = ConcurrencyController(initial=initial, max_limit=maximum)
+        if self._owns_fetcher and self.fetcher is not None:
+            self.fetcher.concurrency_controller = self.concurrency_controller
+
+    def reload_if_changed(self):
+        """Hot-reload the spec file when it was edited; True when a new spec is in effect"""
+        if not self.spec_path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.spec_path)
+        except FileNotFoundError:
+            return False
+        if mtime == self._spec_mtime:
+            return False
+
+        try:
+            self.load(self.spec_path)
+        except ValueError as e:  # Keep running the previous spec
+            print(f"   Spec reload failed: {e}")
+            self._spec_mtime = mtime
+            return False
+        print(f"   Reloaded spec {spec_hash(self.spec)} from {self.spec_path}")
+        return True
+
+    def fetch_page(self, url=None):
+        """Fetch a page and return it parsed (lxml root or BeautifulSoup object)"""
+        response = self.fetch_response(url)
+        return self.parse_page(response.content) if response is not None else None
+
+    def fetch_response(self, url=None):
+        """
+        Fetch a page; returns the response, or None when the request failed
+
+        In incremental mode the validators of the last run go along, so an
+        unchanged page may come back as an empty 304.
+        """
+        url = url or self.base_url
+        headers = self.incremental.request_headers(url) if self.incremental is not None else {}
+
+        try:
+            print(f"Fetching: {url}")
+            if self.fetcher:
+                response = self.fetcher.get(url, headers=headers)
+            else:
+                self.rate_limiter.wait(url)
+                response = self.session.get(url, headers=headers, timeout=30)
+            response.raise_for_status()
+
+            print(f"   Success ({len(response.content)} bytes)")
+            return response
+
+        except Exception as e:
+            print(f"   Error: {e}")
+            return None
+
+    def extract_page(self, url, content, response=None):
+        """
+        Records of one fetched page, and what the crawl needs to go on from it
+
+        In incremental mode a page unchanged since the last run is neither
+        parsed nor extracted: it emits nothing, and its record fingerprints and
+        next-page link come from the stored state.
+
+        Args:
+            url: Page URL
+            content: Page body (str or bytes)
+            response: requests.Response it came from, when there is one
+
+        Returns:
+            Tuple of (records to emit, signature of all the page's records for the
+            "same page again" check, next-page link or None)
+        """
+        if self.incremental is None:
+            soup = self.parse_page(content)
+            items = self.extract_data(soup)
+            return items, items, self._next_link(soup, url)
+
+        check = self.incremental.check_page(url, content, response)
+        if check['status'] == 'unchanged':
+            self.incremental.skip_page(url, check)
+            return [], check['record_hashes'], check['next_url']
+
+        soup = self.parse_page(content)
+        items = self.extract_data(soup)
+        next_url = self._next_link(soup, url)
+        if not items and next_url is None:
+            # Past the end of the listing: nothing to remember
+            return [], [], None
+        emitted, signature = self.incremental.record_page(url, check, items, response, next_url)
+        return emitted, signature, next_url
+
+    def _next_link(self, soup, url):
+        pagination = self.spec.get('pagination')
+        if not pagination or pagination.get('url_template'):
+            return None
+        return self.find_next_url(soup, url)
+
+    def parse_page(self, html):
+        """Parse a page that was already fetched (str or raw bytes)"""
+        if self.engine == 'bs4':
+            return BeautifulSoup(html, 'html.parser')
+
+        # Decode the way BeautifulSoup does, so both engines see the same text
+        if isinstance(html, bytes):
+            html = UnicodeDammit(html, is_html=True).unicode_markup
+        return etree.fromstring(html.encode('utf-8'), UTF8_PARSER)  # None for an empty document
+
+    def _field_value(self, element, kind, attr, absolute, default):
+        if kind == 'text':
+            return element.get_text(strip=True)
+        if kind == 'classes':
+            return element.get('class', [])
+        value = element.get(attr, default) if default is not None else element[attr]
+        return urljoin(self.base_url, value) if absolute else value
+
+    def extract_item(self, item, fields):
+        """Record for one matched item"""
+        data = {}
+        for name, source, kind, attr, absolute, collect_all, default in fields:
+            if kind == 'data_attributes':
+                for key, value in item.attrs.items():
+                    if key.startswith('data-'):
+                        data[key] = value
+                continue
+
+            if source is None:
+                data[name] = self._field_value(item, kind, attr, absolute, default)
+            elif collect_all:
+                values = [self._field_value(el, kind, attr, absolute, default) for el in item.select(source)]
+                if values:
+                    data[name] = values
+            else:
+                element = item.select_one(source)
+                if element is not None:
+                    data[name] = self._field_value(element, kind, attr, absolute, default)
+        return data
+
+    def _lxml_value(self, element, kind, attr, absolute, default):
+        if kind == 'text':
+            return element_text(element)
+        if kind == 'classes':
+            return element.get('class', '').split()
+        value = element.get(attr, default) if default is not None else _attribute(element, attr)
+        return urljoin(self.base_url, value) if absolute else value
+
+    def extract_items_lxml(self, root, elements, rule):
+        """
+        Records for all items of a rule, built column by column
+
+        Sourced fields are selected for the whole page with one XPath and each
+        match is credited to the items it sits in (nested items included), in
+        document order, which is what select()/select_one() per item returns.
+        """
+        position = {element: i for i, element in enumerate(elements)}
+        columns = []
+
+        for name, source, kind, attr, absolute, collect_all, default in rule['fields']:
+            if kind == 'data_attributes':
+                columns.append([
+                    [(key, value) for key, value in element.attrib.items() if key.startswith('data-')]
+                    for element in elements
+                ])
+                continue
+
+            if source is None:
+                columns.append([self._lxml_value(element, kind, attr, absolute, default) for element in elements])
+                continue
+
+            column = {}
+            for match in rule['source_xpaths'][source](root):
+                owners = [position[ancestor] for ancestor in match.iterancestors() if ancestor in position]
+                if not owners:
+                    continue
+                value = self._lxml_value(match, kind, attr, absolute, default)
+                for i in owners:
+                    if collect_all:
+                        column.setdefault(i, []).append(value)
+                    elif i not in column:
+                        column[i] = value
+            columns.append(column)
+
+        records = []
+        for i in range(len(elements)):
+            data = {}
+            for (name, source, kind, *_), column in zip(rule['fields'], columns):
+                if kind == 'data_attributes':
+                    data.update(column[i])
+                elif source is None:
+                    data[name] = column[i]
+                elif i in column:
+                    data[name] = column[i]
+            records.append(data)
+        return records
+
+    def extract_table(self, table):
+        """Records for the data rows of a table, keyed by its header cells"""
+        rows = table.find_all('tr')
+        header_row = next((row for row in rows if row.find('th')), None)
+        headers = [cell.get_text(strip=True) for cell in header_row.find_all(['th', 'td'])] if header_row else []
+
+        records = []
+        for row in rows:
+            if row is header_row:
+                continue
+            cells = row.find_all('td')
+            if not cells:
+                continue
+            records.append({
+                (headers[i] if i < len(headers) and headers[i] else f'column_{i + 1}'): cell.get_text(strip=True)
+                for i, cell in enumerate(cells)
+            })
+        return records
+
+    def extract_table_lxml(self, table):
+        """lxml counterpart of extract_table()"""
+        rows = TABLE_ROWS(table)
+        header_row = next((row for row in rows if HAS_HEADER_CELL(row)), None)
+        headers = [element_text(cell) for cell in ROW_HEADER_CELLS(header_row)] if header_row is not None else []
+
+        records = []
+        for row in rows:
+            if row is header_row:
+                continue
+            cells = ROW_DATA_CELLS(row)
+            if not cells:
+                continue
+            records.append({
+                (headers[i] if i < len(headers) and headers[i] else f'column_{i + 1}'): element_text(cell)
+                for i, cell in enumerate(cells)
+            })
+        return records
+
+    def extract_data(self, soup):
+        """Extract data from page based on the spec's rules"""
+        if soup is None or (isinstance(soup, Tag) and not soup):
+            return []
+
+        items = []
+
+        for rule in self.plan:
+            if isinstance(soup, Tag):
+                elements = soup.select(rule['selector'])
+            else:
+                elements = rule['xpath'](soup)
+            if rule.get('limit'):
+                elements = elements[:rule['limit']]
+            print(f"   Found {len(elements)} items ({rule['type']}: {rule['selector']})")
+
+            if rule['type'] == 'table':
+                extract_table = self.extract_table if isinstance(soup, Tag) else self.extract_table_lxml
+                for table in elements:
+                    items.extend(extract_table(table))
+                continue
+
+            if isinstance(soup, Tag):
+                records = [self.extract_item(element, rule['fields']) for element in elements]
+            else:
+                records = self.extract_items_lxml(soup, elements, rule)
+
+            require = rule.get('require')
+            min_length = rule.get('min_length', 1)
+            for data in records:
+                if require and len(data.get(require) or '') < min_length:
+                    continue
+                items.append(data)
+
+        return items
+
+    def page_url(self, page, url):
+        """URL of a page number, from the pagination rule's URL template"""
+        pagination = self.spec['pagination']
+        step = pagination.get('page_step') or 1
+        value = page if step == 1 else (page - 1) * step
+        return urljoin(url, pagination['url_template'].replace('{page}', str(value)))
+
+    def find_next_url(self, soup, url):
+        """Next-page link of a parsed page (rel="next" first, then a next-like link text), or None"""
+        keywords = {keyword.lower() for keyword in self.spec['pagination'].get('next_keywords', [])}
+
+        if isinstance(soup, Tag):
+            links = [
+                (link.get('rel', []), link.get_text(strip=True), link['href'])
+                for link in soup.find_all(['a', 'link'], href=True)
+            ]
+        else:
+            links = [
+                (link.get('rel', '').split(), element_text(link), link.get('href'))
+                for link in NEXT_LINK_CANDIDATES(soup)
+            ]
+        links = [(rel, text, href) for rel, text, href in links if href and not href.startswith(('#', 'javascript:'))]
+
+        for rel, text, href in links:
+            if 'next' in (value.lower() for value in rel):
+                return urljoin(url, href)
+        for rel, text, href in links:
+            label = text.lower()
+            if label in keywords or label.strip('»›→> ') in keywords:
+                return urljoin(url, href)
+        return None
+
+    def _fetch_many(self, urls, concurrency):
+        headers = {}
+        if self.incremental is not None:
+            headers = {url: self.incremental.request_headers(url) for url in urls}
+        if self.fetcher:
+            return self.fetcher.get_many(urls, concurrency, headers=headers)
+
+        responses = []
+        for url in urls:
+            try:
+                self.rate_limiter.wait(url)
+                responses.append(self.session.get(url, headers=headers.get(url), timeout=30))
+            except Exception as e:
+                responses.append(e)
+        return responses
+
+    def _page_items(self, page, url, response):
+        """Records to emit and the signature of one page fetched by get_many()"""
+        if isinstance(response, Exception):
+            print(f"   Page {page}: error {response}")
+            return [], []
+        if response.status_code >= 400:
+            print(f"   Page {page}: HTTP {response.status_code}")
+            return [], []
+
+        items, signature, _ = self.extract_page(url, response.content, response)
+        self._report_page(page, url, items, signature)
+        return items, signature
+
+    def _report_page(self, page, url, items, signature):
+        if self.incremental is None:
+            print(f"   Page {page}: {len(items)} items ({url})")
+        elif signature and not items:
+            print(f"   Page {page}: unchanged, {len(signature)} items skipped ({url})")
+        else:
+            print(f"   Page {page}: {len(items)} of {len(signature)} items new or changed ({url})")
+
+    def crawl_numbered(self, url, first_items, max_pages, cursor=None):
+        """
+        Fetch pages 2..max_pages from the URL template, concurrently
+
+        Pages are requested in waves as large as the host's current concurrency
+        limit (the rule's fixed concurrency without a controller), so a short
+        listing costs at most one wave of requests past its end. The crawl
+        stops at the first page that fails, is empty or repeats the previous one.
+
+        Args:
+            url: Start page
+            first_items: Signature of the start page (its records, or their
+                         fingerprints in incremental mode; see extract_page())
+            max_pages: Last page number
+            cursor: Checkpoint cursor to continue from instead of page 2
+
+        Returns:
+            Number of records emitted
+        """
+        controller = self.fetcher.concurrency_controller if self.fetcher else None
+        count = 0
+        previous = first_items
+        wave_start = 2
+        if cursor is not None:
+            previous, wave_start = cursor['previous'], cursor['page']
+
+        while wave_start <= max_pages:
+            if controller is not None:
+                concurrency = controller.limit(url)
+            else:
+                concurrency = self.spec['pagination'].get('concurrency') or DEFAULT_CONCURRENCY
+            pages = list(range(wave_start, min(wave_start + concurrency, max_pages + 1)))
+            urls = [self.page_url(page, url) for page in pages]
+            print(f"Fetching pages {pages[0]}-{pages[-1]} concurrently")
+
+            for page, page_url, response in zip(pages, urls, self._fetch_many(urls, concurrency)):
+                items, signature = self._page_items(page, page_url, response)
+                if not signature or signature == previous:
+                    print(f"   Pagination ends at page {page - 1}")
+                    return count
+                self.emit(items)
+                count += len(items)
+                previous = signature
+                self._progress({'mode': 'numbered', 'page': page + 1, 'previous': signature})
+            wave_start = pages[-1] + 1
+
+        return count
+
+    def crawl_next_links(self, url, next_url, max_pages, cursor=None):
+        """
+        Follow next-page links one page at a time (URLs not predictable); returns the records emitted
+
+        Starts at the start page's next link; a resumed crawl passes the checkpoint's
+        cursor (next page URL and the pages visited so far) instead.
+        """
+        count = 0
+        if cursor is None:
+            page, visited = 2, {urldefrag(url)[0]}
+        else:
+            page, visited = cursor['page'], set(cursor['visited'])
+            next_url = cursor['frontier'][0] if cursor['frontier'] else None
+
+        while page <= max_pages:
+            if not next_url or urldefrag(next_url)[0] in visited:
+                break
+            visited.add(urldefrag(next_url)[0])
+
+            response = self.fetch_response(next_url)
+            if response is None:
+                break
+            items, signature, following = self.extract_page(next_url, response.content, response)
+            self._report_page(page, next_url, items, signature)
+            if not signature:
+                break
+            self.emit(items)
+            count += len(items)
+            next_url = following
+            page += 1
+            self._progress({
+                'mode': 'next_links', 'page': page, 'frontier': [next_url] if next_url else [], 'visited': visited
+            })
+
+        return count
+
+    def crawl(self, url, first_signature, next_url, max_pages):
+        """Emit the records of the pages after the start page, up to max_pages in total"""
+        pagination = self.spec.get('pagination')
+        if not pagination or max_pages <= 1 or not first_signature:
+            return 0
+        if pagination.get('url_template'):
+            return self.crawl_numbered(url, first_signature, max_pages)
+        return self.crawl_next_links(url, next_url, max_pages)
+
+    def resume_crawl(self, state, url, max_pages):
+        """
+        Continue a checkpointed crawl: restore the outputs and counters, then crawl on from the cursor
+
+        Returns:
+            Number of records emitted by this run
+        """
+        if state['url'] != url:
+            raise ValueError(f"Checkpoint {self.checkpoint.path} belongs to a crawl of {state['url']}, not {url}")
+        if state['spec'] != spec_hash(self.spec):
+            print(f"   Spec changed since the checkpoint ({state['spec']} -> {spec_hash(self.spec)})")
+
+        for sink in self.sinks:
+            sink_state = state['sinks'].get(os.path.abspath(sink.path))
+            if sink_state is None:
+                raise ValueError(f"{sink.path} is not an output of the checkpointed crawl")
+            sink.resume(sink_state)
+        self.record_count = state['record_count']
+        self.columns = dict.fromkeys(state['columns'])
+        self.sample_data = state['sample_data']
+
+        cursor = state['cursor']
+        print(f"Resuming at page {cursor['page']} ({self.record_count} records saved before the checkpoint)")
+        if cursor['mode'] == 'numbered':
+            return self.crawl_numbered(url, None, max_pages, cursor=cursor)
+        return self.crawl_next_links(url, None, max_pages, cursor=cursor)
+
+    def scrape(self, url=None, html=None, max_pages=None, resume=False):
+        """
+        Main scraping method
+
+        Args:
+            url: Start page (defaults to base_url)
+            html: Already-fetched start page, reused instead of fetching it again
+            max_pages: Pages to crawl when the spec has a pagination rule
+                       (defaults to the rule's max_pages)
+            resume: Continue from the checkpoint (see set_checkpoint()) when there is one,
+                    without fetching the pages it covers again
+
+        Returns:
+            Records of this run (empty when keep_records is off; they are in the sinks)
+        """
+        self.reload_if_changed()
+
+        print("\n" + "=" * 100)
+        print(f"Starting scrape of {self.domain}")
+        print("=" * 100)
+
+        url = url or self.base_url
+        self._crawl_url = url
+        if max_pages is None:
+            max_pages = (self.spec.get('pagination') or {}).get('max_pages', 1)
+        first_record = len(self.data)
+
+        state = self.checkpoint.load() if resume and self.checkpoint is not None else None
+        if self.incremental is not None:
+            # A checkpointed crawl commits the state with its checkpoints, never ahead of them
+            self.incremental.autocommit = self.checkpoint is None
+            self.incremental.begin_run(resume=state is not None)
+        if state is not None:
+            count = self.resume_crawl(state, url, max_pages)
+        else:
+            response, content = None, html
+            if html is None:
+                response = self.fetch_response(url)
+                if response is None:
+                    print("❌ Failed to fetch page")
+                    return []
+                content = response.content
+
+            items, signature, next_url = self.extract_page(url, content, response)
+            self.emit(items)
+            count = len(items) + self.crawl(url, signature, next_url, max_pages)
+
+        # Finished: a later resume starts over
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+
+        print(f"\nExtracted {count} items")
+        if self.incremental is not None:
+            self.change_summary = self.incremental.finish_run()
+            print(f"Changes since the last run: {format_summary(self.change_summary)}")
+
+        return self.data[first_record:]
+
+    def default_output_path(self, extension):
+        """scraped_<domain>_<timestamp><extension> in the working directory"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f'scraped_{self.domain.replace(".", "_")}_{timestamp}{extension}'
+
+    def scrape_to_files(self, outputs=None, url=None, html=None, max_pages=None, checkpoint=None, resume=False):
+        """
+        Scrape straight into output files, page by page, without keeping records in memory
+
+        Args:
+            outputs: Output paths (format from the extension: .csv, .jsonl, optionally .gz);
+                     defaults to a CSV and a JSON Lines file, or to the outputs of the
+                     checkpointed crawl when resuming
+            url, html, max_pages: As for scrape()
+            checkpoint: Checkpoint file (or CrawlCheckpoint) updated while crawling
+            resume: Continue the checkpointed crawl, appending to its outputs
+
+        Returns:
+            Paths of the written files
+        """
+        if checkpoint is not None:
+            self.set_checkpoint(checkpoint)
+        if outputs is None and resume and self.checkpoint is not None:
+            outputs = list((self.checkpoint.load() or {}).get('sinks', [])) or None
+        if outputs is None:
+            outputs = [self.default_output_path(CSVSink.extension), self.default_output_path(JSONLinesSink.extension)]
+        sinks = [self.add_sink(path) for path in outputs]
+        keep_records, self.keep_records = self.keep_records, False
+
+        completed = False
+        try:
+            self.scrape(url=url, html=html, max_pages=max_pages, resume=resume)
+            completed = True
+        finally:
+            self.keep_records = keep_records
+            for sink in sinks:
+                # An interrupted checkpointed crawl leaves its outputs as the checkpoint expects them
+                if completed or self.checkpoint is None:
+                    sink.close()
+                else:
+                    sink.abort()
+                self.sinks.remove(sink)
+
+        for sink in sinks:
+            print(f"Saved {sink.count} items to: {sink.path}")
+        return [sink.path for sink in sinks]
+
+    def save_to_csv(self, filename=None):
+        """Save scraped data to CSV"""
+        if not self.data:
+            print("No data to save")
+            return None
+
+        if filename is None:
+            filename = self.default_output_path('.csv')
+
+        # One pass over the records, without building a DataFrame copy
+        with CSVSink(filename, buffer_records=1000) as sink:
+            sink.write_many(self.data)
+
+        print(f"\nSaved {len(self.data)} items to: {filename}")
+        return filename
+
+    def save_to_json(self, filename=None):
+        """Save scraped data to JSON"""
+        if not self.data:
+            print("No data to save")
+            return None
+
+        if filename is None:
+            filename = self.default_output_path('.json')
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+
+        print(f"Saved {len(self.data)} items to: {filename}")
+        return filename
+
+    def fetch_metrics(self):
+        """Rate limiter counters, concurrency limits and decisions, retries, circuit breakers and archive counts"""
+        if self.fetcher:
+            return self.fetcher.metrics()
+        return {'rate_limiter': dict(self.rate_limiter.stats)} if self.rate_limiter is not None else {}
+
+    def get_summary(self):
+        """Get summary statistics (tracked as records are emitted, so also for streamed runs)"""
+        if not self.record_count:
+            return {"total_items": 0}
+
+        return {
+            "total_items": self.record_count,
+            "columns": list(self.columns),
+            "spec": spec_hash(self.spec),
+            "sample_data": self.sample_data
+        }
+
+
+def run_spec(spec, url=None, html=None, engine='lxml', max_pages=None):
+    """Convenience function"""
+    runtime = ScraperRuntime(spec, base_url=url, engine=engine)
+    return runtime.scrape(url=url, html=html, max_pages=max_pages)
+
+
+if __name__ == '__main__':
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if args:
+        runtime = ScraperRuntime(args[0], base_url=args[1] if len(args) > 1 else None)
+        if '--incremental' in sys.argv:
+            runtime.set_incremental(runtime.default_state_path())
+        runtime.scrape_to_files(
+            outputs=args[3:] or None,
+            max_pages=int(args[2]) if len(args) > 2 else None,
+            checkpoint=runtime.default_checkpoint_path(),
+            resume='--resume' in sys.argv
+        )
+    else:
+        print("Usage: python -m core.scraper_runtime <spec.json> [url] [max_pages] [output.csv|.jsonl[.gz] ...] "
+              "[--resume] [--incremental]")
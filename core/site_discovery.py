@@ -0,0 +1,484 @@
+"""
+Site Discovery
+robots.txt rules cached per host, and sitemap indexes / gzipped sitemaps
+stream-parsed into the URL frontier, so a site's pages are found without
+crawling its listings; lastmod dates skip what has not changed since last time
+"""
+
+import gzip
+import io
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from contextlib import closing
+from datetime import datetime, timezone
+from urllib.robotparser import RobotFileParser
+
+import requests
+
+from core.rate_limiter import host_key
+from core.url_frontier import canonicalize_url
+
+
+# The sitemap protocol caps a sitemap at 50 MB uncompressed; a bit more is tolerated
+MAX_SITEMAP_BYTES = 64 * 1024 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_lastmod(value):
+    """
+    Seconds since the epoch of a W3C datetime (2024, 2024-05, 2024-05-01, 2024-05-01T10:30:00+02:00)
+
+    Dates without a time zone are taken as UTC. Returns None when missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if len(value) == 4:
+        value += '-01-01'
+    elif len(value) == 7:
+        value += '-01'
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class _LimitedReader:
+    """Read-through wrapper failing once more than max_bytes came out (a gzip bomb stops here)"""
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.count = 0
+
+    def _counted(self, data):
+        self.count += len(data)
+        if self.count > self.max_bytes:
+            raise ValueError(f"Sitemap larger than {self.max_bytes} bytes")
+        return data
+
+    def read(self, size=-1):
+        return self._counted(self.stream.read(size))
+
+    def __iter__(self):
+        # Bounded lines: a "text sitemap" without newlines cannot load whole
+        return (self._counted(line) for line in iter(lambda: self.stream.readline(64 * 1024), b''))
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_sitemap(stream, max_bytes=MAX_SITEMAP_BYTES):
+    """
+    Entries of a sitemap or sitemap index, parsed as the stream is read
+
+    Gzip is detected from the content, so .xml.gz files and gzipped responses
+    work alike. Every <url>/<sitemap> element is dropped once yielded, so
+    memory stays flat however many entries the file has. Plain-text sitemaps
+    (one URL per line) are read too.
+
+    Args:
+        stream: Binary file-like object (file, response.raw, BytesIO)
+        max_bytes: Uncompressed size at which reading stops with ValueError
+
+    Yields:
+        ('url', entry) for pages and ('sitemap', entry) for the sitemaps of an index;
+        entry has 'loc' and, when present, 'lastmod', 'changefreq' and 'priority'
+    """
+    if not hasattr(stream, 'peek'):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    # The first bytes tell XML from a plain list of URLs
+    is_xml = stream.peek(512)[:512].lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<')
+    stream = _LimitedReader(stream, max_bytes)
+    if not is_xml:
+        for line in stream:
+            line = line.decode('utf-8', 'replace').strip()
+            if line:
+                yield 'url', {'loc': line}
+        return
+
+    root = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+        kind = _local_name(element.tag)
+        if kind not in ('url', 'sitemap'):
+            continue
+        entry = {_local_name(child.tag): (child.text or '').strip() for child in element}
+        # The elements are done with: drop them so the tree never grows
+        root.clear()
+        if entry.get('loc'):
+            yield kind, entry
+
+
+class RobotsRules:
+    """Parsed robots.txt of one host"""
+
+    def __init__(self, host, parser, status, fetched_at):
+        self.host = host
+        self.parser = parser
+        self.status = status          # 'ok', 'missing' (4xx: everything allowed) or 'unreachable'
+        self.fetched_at = fetched_at
+
+    def allowed(self, url, user_agent='*'):
+        return self.parser.can_fetch(user_agent, url)
+
+    def sitemaps(self):
+        return list(self.parser.site_maps() or [])
+
+    def crawl_delay(self, user_agent='*'):
+        return self.parser.crawl_delay(user_agent)
+
+
+class RobotsCache:
+    """
+    robots.txt rules per host, fetched once and kept for `ttl` seconds
+
+    As RFC 9309 asks, a robots.txt answering 4xx allows everything, while a
+    server error or an unreachable host disallows everything; those answers
+    are only kept for `error_ttl`, so the crawl finds out soon when the host
+    is back. The host's Crawl-delay is handed to the fetcher's rate limiter.
+    """
+
+    def __init__(self, fetcher=None, session=None, ttl=24 * 3600, error_ttl=300, timeout=30, user_agent=None,
+                 clock=time.time):
+        """
+        Args:
+            fetcher: Fetcher whose session and rate limiter are used
+            session: requests.Session to use without a fetcher
+            ttl: Seconds parsed rules are reused
+            error_ttl: Seconds the "disallow all" of an unreachable robots.txt is kept
+            timeout: Request timeout in seconds
+            user_agent: Product token matched against User-agent lines (defaults to the session's)
+            clock: Wall-clock time source (injectable for tests)
+        """
+        self.fetcher = fetcher
+        self.session = fetcher.session if fetcher is not None else (session or requests.Session())
+        self.rate_limiter = fetcher.rate_limiter if fetcher is not None else None
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self.user_agent = user_agent or self.session.headers.get('User-Agent', '*')
+        self.clock = clock
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'fetches': 0,
+            'hits': 0,
+            'unreachable': 0
+        }
+
+    def rules(self, url):
+        """RobotsRules of the URL's host (fetched when missing or expired)"""
+        host = host_key(url)
+        with self._lock:
+            rules = self._hosts.get(host)
+            if rules is not None:
+                ttl = self.error_ttl if rules.status == 'unreachable' else self.ttl
+                if self.clock() - rules.fetched_at < ttl:
+                    self.stats['hits'] += 1
+                    return rules
+
+        rules = self._fetch(host)
+        with self._lock:
+            self._hosts[host] = rules
+        return rules
+
+    def _fetch(self, host):
+        parser = RobotFileParser(host + '/robots.txt')
+        self.stats['fetches'] += 1
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(host)
+            response = self.session.get(host + '/robots.txt', timeout=self.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+
+        if status == 200:
+            parser.parse(response.text.splitlines())
+            if self.rate_limiter is not None and self.rate_limiter.needs_robots(host):
+                self.rate_limiter.apply_robots(host, response.text, self.user_agent)
+            return RobotsRules(host, parser, 'ok', self.clock())
+        if status is not None and 400 <= status < 500:
+            parser.allow_all = True
+            return RobotsRules(host, parser, 'missing', self.clock())
+        parser.disallow_all = True
+        self.stats['unreachable'] += 1
+        return RobotsRules(host, parser, 'unreachable', self.clock())
+
+    def allowed(self, url):
+        """True when the URL's host lets this crawler fetch it"""
+        return self.rules(url).allowed(url, self.user_agent)
+
+    def sitemaps(self, url):
+        """Sitemap URLs the host's robots.txt lists"""
+        return self.rules(url).sitemaps()
+
+    def metrics(self):
+        with self._lock:
+            hosts = {host: rules.status for host, rules in self._hosts.items()}
+        return {'hosts': hosts, **self.stats}
+
+
+class SitemapState:
+    """
+    lastmod of every URL and sitemap seen in earlier discoveries
+
+    A URL whose lastmod has not moved is not queued again; a sitemap whose
+    lastmod in its index has not moved is not even downloaded.
+    """
+
+    def __init__(self, path=':memory:'):
+        """
+        Args:
+            path: SQLite database file kept between runs (':memory:' forgets with the process)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, lastmod REAL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sitemaps (
+                url TEXT PRIMARY KEY,
+                lastmod REAL,
+                fetched_at REAL,
+                urls INTEGER
+            );
+        ''')
+
+    def lastmods(self, urls):
+        """Dict of url -> stored lastmod (None when it had none) for the URLs seen before"""
+        known = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                known.update(self._db.execute(
+                    f"SELECT url, lastmod FROM urls WHERE url IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return known
+
+    def update_urls(self, pairs):
+        """Store (url, lastmod) pairs"""
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO urls (url, lastmod) VALUES (?, ?)', pairs)
+            self._db.commit()
+
+    def sitemap_lastmod(self, url):
+        """lastmod the sitemap had when it was last read completely, or None"""
+        with self._lock:
+            row = self._db.execute('SELECT lastmod FROM sitemaps WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def record_sitemap(self, url, lastmod, count):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO sitemaps (url, lastmod, fetched_at, urls) VALUES (?, ?, ?, ?)',
+                (url, lastmod, time.time(), count)
+            )
+            self._db.commit()
+
+    def url_count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM urls').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class SiteDiscovery:
+    """
+    Finds a site's pages through robots.txt and its sitemaps, and queues them in a URLFrontier
+
+    Sitemaps are read one at a time as streams, and their URLs reach the
+    frontier in batches, so memory does not grow with the size of the site.
+    URLs on other hosts, disallowed by robots.txt or invalid are dropped.
+    """
+
+    def __init__(self, frontier, fetcher=None, robots=None, state=None, max_sitemaps=1000, batch_size=1000,
+                 max_bytes=MAX_SITEMAP_BYTES, timeout=30):
+        """
+        Args:
+            frontier: URLFrontier receiving the discovered URLs
+            fetcher: Fetcher whose session and rate limiter are used (None: a plain session)
+            robots: RobotsCache (defaults to one on the fetcher)
+            state: SitemapState or its path, for lastmod skipping across runs (None: this run only)
+            max_sitemaps: Sitemaps read per discovery at most
+            batch_size: URLs checked and queued per transaction
+            max_bytes: Uncompressed size limit of one sitemap
+            timeout: Request timeout in seconds
+        """
+        self.frontier = frontier
+        self.robots = robots or RobotsCache(fetcher=fetcher, timeout=timeout)
+        self.session = self.robots.session
+        self.rate_limiter = self.robots.rate_limiter
+        self.state = state if isinstance(state, SitemapState) else SitemapState(state or ':memory:')
+        self.max_sitemaps = max_sitemaps
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+        self.stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {
+            'sitemaps': 0,
+            'sitemaps_unchanged': 0,  # Skipped: their lastmod in the index did not move
+            'urls': 0,
+            'new': 0,
+            'changed': 0,             # Seen before, lastmod moved: queued again
+            'unchanged': 0,
+            'queued': 0,
+            'disallowed': 0,
+            'off_site': 0,
+            'invalid': 0,
+            'errors': []
+        }
+
+    def open_sitemap(self, url):
+        """Streamed response for a sitemap URL (caller closes it)"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(url)
+        response = self.session.get(url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        # Content-Encoding: gzip is undone by urllib3; .gz files stay gzip and are detected by iter_sitemap()
+        response.raw.decode_content = True
+        # Left open at EOF so the buffered reader iter_sitemap() wraps it in sees a clean end
+        response.raw.auto_close = False
+        return response
+
+    def discover(self, site_url, since=None):
+        """
+        Queue the pages listed in a site's sitemaps
+
+        Starts from the Sitemap: lines of robots.txt (or /sitemap.xml when there
+        are none) and follows sitemap indexes breadth-first.
+
+        Args:
+            site_url: Any URL of the site
+            since: Epoch seconds; URLs with an older lastmod are skipped
+
+        Returns:
+            Counts of this discovery: sitemaps read and skipped, URLs listed, new, changed,
+            unchanged, queued, disallowed, off-site and invalid, and errors per sitemap
+        """
+        self.stats = self._new_stats()
+        host = host_key(site_url)
+        rules = self.robots.rules(site_url)
+        pending = deque((url, None) for url in rules.sitemaps() or [host + '/sitemap.xml'])
+        visited = set()
+
+        while pending and self.stats['sitemaps'] < self.max_sitemaps:
+            sitemap_url, lastmod = pending.popleft()
+            if sitemap_url in visited:
+                continue
+            visited.add(sitemap_url)
+
+            stored = self.state.sitemap_lastmod(sitemap_url)
+            if lastmod is not None and stored is not None and lastmod <= stored:
+                self.stats['sitemaps_unchanged'] += 1
+                continue
+
+            self.stats['sitemaps'] += 1
+            count, batch = 0, []
+            try:
+                with closing(self.open_sitemap(sitemap_url)) as response:
+                    for kind, entry in iter_sitemap(response.raw, self.max_bytes):
+                        if kind == 'sitemap':
+                            pending.append((canonicalize_url(entry['loc'], sitemap_url) or entry['loc'],
+                                            parse_lastmod(entry.get('lastmod'))))
+                            continue
+                        batch.append(entry)
+                        count += 1
+                        if len(batch) >= self.batch_size:
+                            self._queue(batch, host, rules, since)
+                            batch = []
+                self._queue(batch, host, rules, since)
+            except (requests.RequestException, ET.ParseError, ValueError, OSError, EOFError) as e:
+                self._queue(batch, host, rules, since)
+                self.stats['errors'].append({'sitemap': sitemap_url, 'error': str(e)})
+                continue
+            # Only a sitemap read to the end may be skipped next time
+            self.state.record_sitemap(sitemap_url, lastmod, count)
+
+        return dict(self.stats)
+
+    def _queue(self, entries, host, rules, since):
+        """Check a batch of sitemap entries and queue the new and changed ones"""
+        candidates = {}
+        for entry in entries:
+            self.stats['urls'] += 1
+            url = canonicalize_url(entry['loc'])
+            if url is None:
+                self.stats['invalid'] += 1
+            elif host_key(url) != host:
+                self.stats['off_site'] += 1
+            elif not rules.allowed(url, self.robots.user_agent):
+                self.stats['disallowed'] += 1
+            else:
+                lastmod = parse_lastmod(entry.get('lastmod'))
+                if since is not None and lastmod is not None and lastmod < since:
+                    self.stats['unchanged'] += 1
+                else:
+                    candidates[url] = lastmod
+        if not candidates:
+            return
+
+        known = self.state.lastmods(list(candidates))
+        new, changed, updates = [], [], []
+        for url, lastmod in candidates.items():
+            if url not in known:
+                new.append(url)
+            elif lastmod is not None and (known[url] is None or lastmod > known[url]):
+                changed.append(url)
+            else:
+                self.stats['unchanged'] += 1
+                continue
+            updates.append((url, lastmod))
+
+        self.stats['new'] += len(new)
+        self.stats['changed'] += len(changed)
+        self.stats['queued'] += self.frontier.add_many(new)
+        self.stats['queued'] += self.frontier.add_many(changed, revisit=True)
+        self.state.update_urls(updates)
+
+    def metrics(self):
+        return {'discovery': dict(self.stats), 'robots': self.robots.metrics(), 'frontier': self.frontier.metrics()}
+
+
+def discover_site(site_url, frontier, state=None, fetcher=None, since=None):
+    """Convenience function: queue a site's sitemap URLs in a frontier; returns the counts"""
+    return SiteDiscovery(frontier, fetcher=fetcher, state=state).discover(site_url, since=since)
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    from core.url_frontier import URLFrontier
+
+    if len(sys.argv) > 2:
+        with URLFrontier(sys.argv[2]) as frontier:
+            state = sys.argv[3] if len(sys.argv) > 3 else sys.argv[2] + '.sitemaps'
+            print(json.dumps(discover_site(sys.argv[1], frontier, state=state), indent=2))
+            print(f"Frontier: {len(frontier)} URLs waiting, {frontier.seen_count()} seen")
+    else:
+        print("Usage: python -m core.site_discovery <site_url> <frontier.sqlite> [sitemap_state.sqlite]")
@@ -0,0 +1,430 @@
+"""
+URL Frontier
+Persistent crawl frontier: canonical URLs, a Bloom filter in front of an exact
+on-disk visited store, and a priority-ordered queue of URLs still to fetch
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from urllib.parse import quote, urljoin, urlsplit, urlunsplit
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only track the visitor; dropping them dedupes shared links
+TRACKING_PARAMS = frozenset((
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'utm_id',
+    'gclid', 'dclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', 'yclid'
+))
+
+PERCENT_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+# RFC 3986 unreserved characters: escaping them changes nothing, so they are decoded
+UNRESERVED = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~')
+
+PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+QUERY_SAFE = "/?:@!$'()*+,;-._~%"
+
+
+def _normalize_escapes(text, safe):
+    """Upper-case percent-escapes, decode escaped unreserved characters, escape what needs it"""
+    def unescape(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else '%' + match.group(1).upper()
+    return quote(PERCENT_ESCAPE.sub(unescape, text), safe=safe)
+
+
+def _remove_dot_segments(path):
+    output = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output) or '/'
+
+
+def canonicalize_url(url, base=None):
+    """
+    Canonical spelling of a URL, so different spellings of one page dedupe
+
+    Resolves the URL against base and drops the fragment and credentials; lower-cases
+    scheme and host (IDN hosts become punycode) and drops the default port; resolves
+    dot segments; normalizes percent-escapes; sorts the query parameters and drops
+    tracking ones.
+
+    Returns:
+        Canonical URL, or None for anything that is not an http(s) URL
+    """
+    if base:
+        url = urljoin(base, url)
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:  # Malformed netloc or port
+        return None
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if scheme not in DEFAULT_PORTS or not host:
+        return None
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if ':' in host:  # IPv6 literal
+        host = f'[{host}]'
+    netloc = host if port in (None, DEFAULT_PORTS[scheme]) else f'{host}:{port}'
+
+    path = _remove_dot_segments(_normalize_escapes(parts.path, PATH_SAFE) or '/')
+    params = sorted(
+        _normalize_escapes(param, QUERY_SAFE + '=&')
+        for param in parts.query.split('&')
+        if param and param.split('=', 1)[0].lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, netloc, path, '&'.join(params), ''))
+
+
+class BloomFilter:
+    """
+    Fixed-size set membership with false positives but no false negatives
+
+    Sized for `capacity` keys at `error_rate`: about 1.44 * log2(1 / error_rate)
+    bits per key (14.4 bits, under 2 bytes, at 0.1%). Past the capacity the
+    false-positive rate climbs; false_positive_rate() reports the current one.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        Args:
+            capacity: Keys the filter is sized for
+            error_rate: False-positive rate at capacity (0 < error_rate < 1)
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))  # Bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Add a key; True when it was (probably) there already"""
+        present = True
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                present = False
+                self.bits[position >> 3] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+    def false_positive_rate(self):
+        """Expected false-positive rate at the current fill"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+    def params(self):
+        return {'capacity': self.capacity, 'error_rate': self.error_rate, 'size': self.size, 'hashes': self.hashes}
+
+
+class URLFrontier:
+    """
+    URLs still to crawl, in priority order, and every URL ever queued
+
+    "Seen" checks go to the Bloom filter first: a miss is certain, so new URLs
+    never touch the disk to be recognized; a hit is confirmed against the exact
+    store in SQLite, so a false positive costs one indexed lookup and never
+    drops a URL. The queue lives in the same database, so memory stays at the
+    filter's size however many URLs are queued, and a crawl can be reopened.
+
+    A popped URL stays in the queue, claimed, until complete() is called for
+    it once its page has been processed: reopening the frontier after a crash
+    queues the URLs that were in flight again instead of losing them (they
+    are already seen, so nothing else would bring them back).
+    """
+
+    def __init__(self, path=None, capacity=1_000_000, error_rate=0.001, canonicalize=True):
+        """
+        Args:
+            path: SQLite database file (None uses a temporary file removed on close())
+            capacity: URLs the Bloom filter is sized for
+            error_rate: Bloom filter false-positive rate at capacity (only costs disk lookups)
+            canonicalize: Canonicalize URLs before dedupe (see canonicalize_url)
+        """
+        self.temporary = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='frontier_', suffix='.sqlite')
+            os.close(handle)
+        self.path = path
+        self.canonicalize = canonicalize
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                priority REAL NOT NULL,
+                depth INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                claimed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS queue_order ON queue (priority, id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+        ''')
+
+        if 'claimed' not in [row[1] for row in self._db.execute('PRAGMA table_info(queue)')]:
+            self._db.execute('ALTER TABLE queue ADD COLUMN claimed INTEGER NOT NULL DEFAULT 0')
+        # Claimed by an earlier process that never completed them: queue them again
+        reclaimed = self._db.execute('UPDATE queue SET claimed = 0 WHERE claimed = 1').rowcount
+        self._db.commit()
+        self._claimed = {}  # URL -> queue ids popped and not completed yet
+
+        self._seen = self._db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+        self._queue_indexed = False
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._load_bloom()
+
+        self.stats = {
+            'added': 0,
+            'duplicates': 0,
+            'revisits': 0,
+            'invalid': 0,
+            'popped': 0,
+            'completed': 0,
+            'reclaimed': reclaimed,
+            'disk_checks': 0,
+            'false_positives': 0
+        }
+
+    def _bloom_state(self):
+        return json.dumps(dict(self.bloom.params(), seen=self._seen))
+
+    def _load_bloom(self):
+        """
+        Reuse the filter saved by close() when it matches, else rebuild it from the store
+
+        A filter saved before more URLs were added (the process died without
+        close()) would miss them, so it must cover exactly the stored URLs.
+        """
+        rows = dict(self._db.execute("SELECT key, value FROM meta WHERE key IN ('bloom', 'bloom_state')"))
+        if rows.get('bloom_state') == self._bloom_state():
+            self.bloom.bits = bytearray(rows['bloom'])
+            self.bloom.count = self._seen
+            return
+        for (url,) in self._db.execute('SELECT url FROM seen'):
+            self.bloom.add(url)
+
+    def _canonical(self, url, base):
+        if self.canonicalize:
+            return canonicalize_url(url, base)
+        return urljoin(base, url) if base else url
+
+    def _is_seen(self, url):
+        if url not in self.bloom:
+            return False
+        self.stats['disk_checks'] += 1
+        if self._db.execute('SELECT 1 FROM seen WHERE url = ?', (url,)).fetchone():
+            return True
+        self.stats['false_positives'] += 1
+        return False
+
+    def _is_pending(self, url):
+        if not self._queue_indexed:
+            # Only revisits look URLs up in the queue: plain crawls don't pay for the index
+            self._db.execute('CREATE INDEX IF NOT EXISTS queue_url ON queue (url)')
+            self._queue_indexed = True
+        return self._db.execute('SELECT 1 FROM queue WHERE url = ? AND claimed = 0', (url,)).fetchone() is not None
+
+    def add(self, url, priority=None, depth=0, base=None):
+        """
+        Queue a URL unless it was queued before
+
+        Args:
+            url: URL (relative URLs are resolved against base)
+            priority: Lower values are fetched first (defaults to depth: breadth-first)
+            depth: Link distance from the start URLs
+            base: Page the URL was found on
+
+        Returns:
+            True when the URL was new and queued
+        """
+        return self.add_many([url], priority=priority, depth=depth, base=base) == 1
+
+    def add_many(self, urls, priority=None, depth=0, base=None, revisit=False):
+        """
+        Queue the new URLs among `urls` in one transaction; returns how many were queued
+
+        revisit=True queues URLs seen before too (pages known to have changed),
+        unless they are still waiting in the queue (a URL in flight is queued again).
+        """
+        priority = depth if priority is None else priority
+        added = requeued = 0
+        with self._lock:
+            for url in urls:
+                url = self._canonical(url, base)
+                if url is None:
+                    self.stats['invalid'] += 1
+                    continue
+                if self._is_seen(url):
+                    if not revisit or self._is_pending(url):
+                        self.stats['duplicates'] += 1
+                        continue
+                    self._db.execute('INSERT INTO queue (priority, depth, url) VALUES (?, ?, ?)',
+                                     (priority, depth, url))
+                    requeued += 1
+                    continue
+                self.bloom.add(url)
+                self._db.execute('INSERT INTO seen (url) VALUES (?)', (url,))
+                self._db.execute('INSERT INTO queue (priority, depth, url) VALUES (?, ?, ?)', (priority, depth, url))
+                added += 1
+            self._db.commit()
+            self._seen += added
+            self.stats['added'] += added
+            self.stats['revisits'] += requeued
+        return added + requeued
+
+    def seen(self, url, base=None):
+        """True when the URL (in any spelling with the same canonical form) was ever queued"""
+        url = self._canonical(url, base)
+        with self._lock:
+            return url is not None and self._is_seen(url)
+
+    def pop(self):
+        """
+        Take the next URL off the queue (call complete() once its page is processed)
+
+        Returns:
+            (url, depth), or None when the queue is empty
+        """
+        popped = self.pop_many(1)
+        return popped[0] if popped else None
+
+    def pop_many(self, count):
+        """Take up to `count` URLs off the queue, best priority first; returns [(url, depth), ...]"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, url, depth FROM queue WHERE claimed = 0 ORDER BY priority, id LIMIT ?', (count,)
+            ).fetchall()
+            self._db.executemany('UPDATE queue SET claimed = 1 WHERE id = ?', [(row[0],) for row in rows])
+            self._db.commit()
+            for row_id, url, _ in rows:
+                self._claimed.setdefault(url, []).append(row_id)
+            self.stats['popped'] += len(rows)
+        return [(url, depth) for _, url, depth in rows]
+
+    def _unclaim(self, url, statement):
+        with self._lock:
+            ids = self._claimed.get(url)
+            if not ids:
+                return False
+            row_id = ids.pop(0)
+            if not ids:
+                del self._claimed[url]
+            self._db.execute(statement, (row_id,))
+            self._db.commit()
+            return True
+
+    def complete(self, url):
+        """Drop a popped URL from the queue for good; False when it was not in flight"""
+        if self._unclaim(url, 'DELETE FROM queue WHERE id = ?'):
+            self.stats['completed'] += 1
+            return True
+        return False
+
+    def release(self, url):
+        """Put a popped URL back in the queue unprocessed; False when it was not in flight"""
+        return self._unclaim(url, 'UPDATE queue SET claimed = 0 WHERE id = ?')
+
+    def __len__(self):
+        """URLs waiting in the queue"""
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM queue WHERE claimed = 0').fetchone()[0]
+
+    def in_flight(self):
+        """URLs popped and not completed or released yet"""
+        with self._lock:
+            return sum(len(ids) for ids in self._claimed.values())
+
+    def seen_count(self):
+        """URLs ever queued"""
+        return self._seen
+
+    def memory_bytes(self):
+        """Memory held for the visited set (the Bloom filter; everything else is on disk)"""
+        return self.bloom.memory_bytes()
+
+    def metrics(self):
+        return {
+            'pending': len(self),
+            'in_flight': self.in_flight(),
+            'seen': self.seen_count(),
+            'bloom_bytes': self.memory_bytes(),
+            'bloom_false_positive_rate': round(self.bloom.false_positive_rate(), 6),
+            **self.stats
+        }
+
+    def close(self):
+        """Save the Bloom filter next to the store (a temporary frontier is removed instead)"""
+        with self._lock:
+            if not self.temporary:
+                self._db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+                    ('bloom', bytes(self.bloom.bits)),
+                    ('bloom_state', self._bloom_state())
+                ])
+                self._db.commit()
+            self._db.close()
+        if self.temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        with URLFrontier(sys.argv[1]) as frontier:
+            print(json.dumps(frontier.metrics(), indent=2))
+            for url, depth in frontier.pop_many(10) if '--pop' in sys.argv else []:
+                print(f"   depth {depth}: {url}")
+    else:
+        print("Usage: python -m core.url_frontier <frontier.sqlite> [--pop]")
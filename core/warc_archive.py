@@ -0,0 +1,414 @@
+"""
+WARC Archive
+Raw responses of every fetch appended to compressed WARC files (ISO 28500),
+and read back as a stream for offline reprocessing
+"""
+
+import base64
+import glob
+import gzip
+import hashlib
+import io
+import os
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.client import responses as HTTP_REASONS
+from urllib.parse import urlsplit
+
+from requests.structures import CaseInsensitiveDict
+
+
+WARC_VERSION = 'WARC/1.1'
+
+# The fetch layer hands over decoded bodies, so the archived headers must not claim otherwise
+DECODED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length')
+
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+
+def _digest(data):
+    return 'sha1:' + base64.b32encode(hashlib.sha1(data).digest()).decode('ascii')
+
+
+def _warc_date(timestamp=None):
+    moment = datetime.fromtimestamp(time.time() if timestamp is None else timestamp, timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _header_pairs(headers):
+    """(name, value) pairs of a dict, CaseInsensitiveDict, aiohttp multidict or pair list"""
+    if headers is None:
+        return []
+    return list(headers.items()) if hasattr(headers, 'items') else list(headers)
+
+
+def _head(first_line, pairs):
+    lines = [first_line] + [f'{name}: {value}' for name, value in pairs]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'replace')
+
+
+class WARCWriter:
+    """
+    Appends request/response record pairs to rotating .warc.gz files
+
+    Each record is its own gzip member, so files stay readable by standard
+    WARC tools and a crash loses at most the record being written. File names
+    carry the process id, so workers sharing a directory never share a file.
+    """
+
+    def __init__(self, directory, prefix='crawl', max_file_size=1024 ** 3, compress_level=6):
+        """
+        Args:
+            directory: Directory receiving the archive files (created if missing)
+            prefix: File name prefix
+            max_file_size: Compressed size at which the next file is started
+            compress_level: gzip level of each record (6 trades little size for a lot of speed)
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.max_file_size = max_file_size
+        self.compress_level = compress_level
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = None
+        self._file = None
+        self._pid = None
+        self._serial = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'responses': 0,
+            'records': 0,
+            'bytes': 0,
+            'files': 0
+        }
+
+    def _record(self, warc_type, block, content_type, url=None, fetched_at=None, fields=()):
+        """One gzip-compressed record; returns (its bytes, its record id)"""
+        record_id = f'<urn:uuid:{uuid.uuid4()}>'
+        pairs = [('WARC-Type', warc_type), ('WARC-Record-ID', record_id), ('WARC-Date', _warc_date(fetched_at))]
+        if url:
+            pairs.append(('WARC-Target-URI', url))
+        pairs += list(fields)
+        pairs += [('WARC-Block-Digest', _digest(block)), ('Content-Type', content_type),
+                  ('Content-Length', str(len(block)))]
+        data = _head(WARC_VERSION, pairs) + block + b'\r\n\r\n'
+        return gzip.compress(data, compresslevel=self.compress_level), record_id
+
+    def _open_file(self):
+        """Start a new file (also after a fork: the child must not append to its parent's file)"""
+        if self._file is not None:
+            self._file.close()
+        self._pid = os.getpid()
+        self._serial += 1
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+        self.path = os.path.join(self.directory, f'{self.prefix}-{stamp}-{self._pid}-{self._serial:05d}.warc.gz')
+        self._file = open(self.path, 'ab')
+        info = 'software: web-scraper\r\nformat: WARC File Format 1.1\r\n'.encode('utf-8')
+        data, _ = self._record('warcinfo', info, 'application/warc-fields',
+                               fields=[('WARC-Filename', os.path.basename(self.path))])
+        self._file.write(data)
+        self.stats['files'] += 1
+
+    def write_exchange(self, url, status, headers, body, reason=None, request_headers=None, method='GET',
+                       fetched_at=None):
+        """
+        Append a request record and the response record answering it
+
+        Args:
+            url: Final URL of the response
+            status: HTTP status code
+            headers: Response headers (mapping or (name, value) pairs)
+            body: Response body bytes, as decoded by the HTTP client
+            reason: Status reason phrase
+            request_headers: Headers the request was sent with
+            method: Request method
+            fetched_at: Epoch seconds of the fetch (defaults to now)
+
+        Returns:
+            Record id of the response record
+        """
+        body = body or b''
+        response_pairs = [(name, value) for name, value in _header_pairs(headers)
+                          if name.lower() not in DECODED_HEADERS]
+        response_pairs.append(('Content-Length', str(len(body))))
+        response_block = _head(f'HTTP/1.1 {status} {reason or HTTP_REASONS.get(status, "")}'.rstrip(),
+                               response_pairs) + body
+
+        parts = urlsplit(url)
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        request_pairs = _header_pairs(request_headers) or [('Host', parts.netloc)]
+        request_block = _head(f'{method} {target} HTTP/1.1', request_pairs)
+
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        response, record_id = self._record(
+            'response', response_block, 'application/http;msgtype=response', url, fetched_at,
+            fields=[('WARC-Payload-Digest', _digest(body))]
+        )
+        request, _ = self._record(
+            'request', request_block, 'application/http;msgtype=request', url, fetched_at,
+            fields=[('WARC-Concurrent-To', record_id)]
+        )
+
+        with self._lock:
+            if self._file is None or self._pid != os.getpid() or self._file.tell() >= self.max_file_size:
+                self._open_file()
+            self._file.write(response + request)
+            # Whole exchanges reach the file, so a killed crawl leaves a readable archive
+            self._file.flush()
+            self.stats['responses'] += 1
+            self.stats['records'] += 2
+            self.stats['bytes'] += len(response) + len(request)
+        return record_id
+
+    def write_response(self, response):
+        """Archive a requests.Response (fetched, or served by the HTTP cache)"""
+        request = getattr(response, 'request', None)
+        return self.write_exchange(
+            response.url, response.status_code, response.headers, response.content, response.reason,
+            request_headers=request.headers if request is not None else None,
+            method=request.method if request is not None else 'GET'
+        )
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats, path=self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_warc_writer(archive, prefix='crawl'):
+    """Convenience function: WARCWriter for a directory, or the writer passed in"""
+    if archive is None or isinstance(archive, WARCWriter):
+        return archive
+    return WARCWriter(archive, prefix=prefix)
+
+
+class ArchivedResponse:
+    """HTTP response read back from an archive"""
+
+    def __init__(self, url, status, reason, headers, body, date, record_id):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.date = date
+        self.record_id = record_id
+
+    @property
+    def content_type(self):
+        return self.headers.get('Content-Type', '')
+
+    def is_html(self):
+        """2xx page with an HTML (or no) content type"""
+        content_type = self.content_type.split(';')[0].strip().lower()
+        return 200 <= self.status < 300 and (not content_type or content_type in HTML_TYPES)
+
+    def encoding(self):
+        """Charset declared in the Content-Type header, or None"""
+        for param in self.content_type.split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'charset':
+                return value.strip().strip('"\'') or None
+        return None
+
+
+def _parse_head(data):
+    """First line and headers of an HTTP or WARC head"""
+    lines = data.decode('latin-1').split('\r\n')
+    headers = CaseInsensitiveDict()
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            # Repeated headers (Set-Cookie) are folded, as requests does
+            name, value = name.strip(), value.strip()
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+    return lines[0], headers
+
+
+# Compressed bytes read at a time while indexing
+INDEX_CHUNK_SIZE = 256 * 1024
+
+
+def _read_record(stream):
+    """(WARC headers, block bytes) of the next record of a stream, or None at its end"""
+    line = stream.readline()
+    while line and not line.strip():
+        line = stream.readline()
+    if not line:
+        return None
+    head = [line]
+    while True:
+        line = stream.readline()
+        if not line or not line.strip():
+            break
+        head.append(line)
+    _, headers = _parse_head(b''.join(head).rstrip(b'\r\n'))
+    length = int(headers.get('Content-Length', 0))
+    block = stream.read(length)
+    if len(block) < length:
+        return None
+    stream.read(4)  # The record's closing CRLF CRLF
+    return headers, block
+
+
+def _is_gzip(raw):
+    return raw.peek(2)[:2] == b'\x1f\x8b'
+
+
+def iter_records(path, offset=0):
+    """
+    (WARC headers, block bytes) of every record of a .warc or .warc.gz file, read as a stream
+
+    A record cut off by a crash ends the iteration instead of failing it.
+
+    Args:
+        path: WARC file
+        offset: Start reading here (an offset from iter_record_offsets())
+    """
+    with open(path, 'rb') as raw:
+        raw.seek(offset)
+        stream = gzip.GzipFile(fileobj=raw) if _is_gzip(raw) else raw
+        try:
+            while True:
+                record = _read_record(stream)
+                if record is None:
+                    return
+                yield record
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            return
+
+
+def iter_record_offsets(path):
+    """
+    (offset, position, WARC headers, block) of every record of a WARC file
+
+    iter_records(path, offset) finds the record again as its position-th record
+    (counting from 0): in a .warc.gz file the offset is where the record's gzip
+    member starts, and position counts the records before it in that member
+    (0 with one record per member, as WARCWriter and most WARC tools write them).
+    """
+    with open(path, 'rb') as raw:
+        if not _is_gzip(raw):
+            while True:
+                offset = raw.tell()
+                record = _read_record(raw)
+                if record is None:
+                    return
+                yield (offset, 0) + record
+
+        offset, buffer = 0, b''
+        try:
+            while True:
+                start, parts = offset, []
+                decompressor = zlib.decompressobj(31)
+                while not decompressor.eof:
+                    if not buffer:
+                        buffer = raw.read(INDEX_CHUNK_SIZE)
+                        if not buffer:
+                            return  # End of the file, or a member cut off by a crash
+                    parts.append(decompressor.decompress(buffer))
+                    offset += len(buffer) - len(decompressor.unused_data)
+                    buffer = decompressor.unused_data
+                member = io.BytesIO(b''.join(parts))
+                position = 0
+                while True:
+                    record = _read_record(member)
+                    if record is None:
+                        break
+                    yield (start, position) + record
+                    position += 1
+        except zlib.error:
+            return
+
+
+def archive_files(paths):
+    """WARC files of a list of files and directories, in name order within each directory"""
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '*.warc.gz')) + glob.glob(os.path.join(path, '*.warc')))
+        else:
+            files.append(path)
+    return files
+
+
+def iter_responses(paths):
+    """
+    ArchivedResponse of every response record in files and directories of WARC files
+
+    Args:
+        paths: WARC file or directory, or a list of them
+    """
+    for path in archive_files(paths):
+        for headers, block in iter_records(path):
+            response = _archived_response(headers, block)
+            if response is not None:
+                yield response
+
+
+def _is_response(headers, block):
+    return headers.get('WARC-Type') == 'response' and block.startswith(b'HTTP/')
+
+
+def _archived_response(headers, block):
+    """ArchivedResponse of a response record (None for other records)"""
+    if not _is_response(headers, block):
+        return None
+    head, _, body = block.partition(b'\r\n\r\n')
+    status_line, http_headers = _parse_head(head)
+    parts = status_line.split(' ', 2)
+    return ArchivedResponse(
+        headers.get('WARC-Target-URI'), int(parts[1]), parts[2] if len(parts) > 2 else '',
+        http_headers, body, headers.get('WARC-Date'), headers.get('WARC-Record-ID')
+    )
+
+
+def index_responses(paths):
+    """
+    (URL, location) of every response record, without keeping any body
+
+    Args:
+        paths: WARC file or directory, or a list of them
+
+    Yields:
+        The response's URL and its (file, offset, position) for read_response()
+    """
+    for path in archive_files(paths):
+        for offset, position, headers, block in iter_record_offsets(path):
+            if _is_response(headers, block):
+                yield headers.get('WARC-Target-URI'), (path, offset, position)
+
+
+def read_response(path, offset, position=0):
+    """ArchivedResponse at a location from index_responses(), read from the file (None if it is gone)"""
+    for index, (headers, block) in enumerate(iter_records(path, offset)):
+        if index == position:
+            return _archived_response(headers, block)
+    return None
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        for response in iter_responses(sys.argv[1:]):
+            print(f"{response.date}  {response.status}  {len(response.body):>9}  {response.url}")
+    else:
+        print("Usage: python -m core.warc_archive <archive_dir|file.warc.gz ...>")
@@ -0,0 +1,572 @@
+"""
+Work Queue
+Durable job queue in one SQLite file: worker processes on one or more machines
+lease tasks, heartbeat while they work and push results, without a broker
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+STATES = ('pending', 'leased', 'done', 'failed')
+
+
+class WorkQueue:
+    """
+    Tasks with lease and visibility-timeout semantics
+
+    lease() hands a task to one worker and hides it from the others for
+    `visibility_timeout` seconds. The worker extends the lease with
+    heartbeat() while it works and ends it with complete() or fail(); a
+    worker that dies simply stops heartbeating, and once the lease expires
+    the task is handed out again (up to max_attempts leases in all). Every
+    lease carries a fresh token, so a worker that lost its lease cannot
+    overwrite the outcome of the one that took the task over.
+
+    Claims run in BEGIN IMMEDIATE transactions: SQLite's write lock makes
+    them atomic across processes. WAL lets readers work alongside the writer
+    but needs shared memory, so it only works for processes on one machine;
+    for workers on several machines sharing the file over a network
+    filesystem, open the queue with journal_mode='delete'. Leases are timed
+    by the wall clock, which those machines must agree on.
+    """
+
+    def __init__(self, path, visibility_timeout=60.0, max_attempts=3, retry_delay=5.0, journal_mode='wal',
+                 busy_timeout=30.0, clock=time.time):
+        """
+        Args:
+            path: SQLite database file shared by every producer and worker
+            visibility_timeout: Seconds a lease hides a task before it is handed out again
+            max_attempts: Leases a task gets before it is marked failed
+            retry_delay: Seconds before a failed task is retried (doubling with every attempt)
+            journal_mode: 'wal' (processes on one machine) or 'delete' (a network filesystem)
+            busy_timeout: Seconds to wait for another process's write lock
+            clock: Wall-clock time source (injectable for tests)
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        # Autocommit mode: transactions are opened explicitly, so claims can take the write lock up front
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.execute(f'PRAGMA journal_mode={journal_mode}')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction():
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    key TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    priority REAL NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_token TEXT,
+                    worker TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            ''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (state, priority, id)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job, state)')
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    host TEXT,
+                    pid INTEGER,
+                    started_at REAL,
+                    last_seen REAL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS hosts (
+                    host TEXT PRIMARY KEY,
+                    next_free REAL NOT NULL DEFAULT 0,
+                    blocked_until REAL NOT NULL DEFAULT 0
+                )
+            ''')
+
+        self.stats = {
+            'put': 0,
+            'duplicates': 0,
+            'leased': 0,
+            'completed': 0,
+            'failed': 0,
+            'retried': 0,
+            'expired': 0,         # Leases that ran out and were taken over
+            'lost_leases': 0      # Outcomes rejected because the lease had passed to another worker
+        }
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    # ------------------------------------------------------------------
+    # Producers
+    # ------------------------------------------------------------------
+
+    def put(self, kind, payload, job='default', key=None, priority=0, delay=0):
+        """
+        Add a task
+
+        Args:
+            kind: Task type, selecting the worker's handler
+            payload: JSON-serializable task input
+            job: Group of tasks that are waited for and collected together
+            key: Unique key; a task whose key is already queued is not added again
+            priority: Lower values are handed out first
+            delay: Seconds before the task becomes available
+
+        Returns:
+            Task id, or None for a duplicate key
+        """
+        ids = self.put_many(kind, [payload], job=job, keys=[key], priority=priority, delay=delay)
+        return ids[0] if ids else None
+
+    def put_many(self, kind, payloads, job='default', keys=None, priority=0, delay=0):
+        """Add several tasks in one transaction; returns the ids of those added (duplicate keys are skipped)"""
+        now = self.clock()
+        keys = keys or [None] * len(payloads)
+        ids = []
+        with self._transaction():
+            for payload, key in zip(payloads, keys):
+                cursor = self._db.execute(
+                    'INSERT OR IGNORE INTO tasks (job, kind, key, payload, priority, state, available_at, created_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job, kind, key, json.dumps(payload), priority, 'pending', now + delay, now)
+                )
+                if cursor.rowcount:
+                    ids.append(cursor.lastrowid)
+            self.stats['put'] += len(ids)
+            self.stats['duplicates'] += len(payloads) - len(ids)
+        return ids
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def register_worker(self, worker):
+        """Record a worker (host and pid) so metrics() can show who is alive"""
+        now = self.clock()
+        with self._transaction():
+            self._db.execute(
+                'INSERT OR REPLACE INTO workers (id, host, pid, started_at, last_seen) VALUES (?, ?, ?, ?, ?)',
+                (worker, socket.gethostname(), os.getpid(), now, now)
+            )
+
+    def lease(self, worker, count=1, job=None, kinds=None, visibility_timeout=None):
+        """
+        Claim up to `count` available tasks
+
+        A task is available when it is pending and its delay has passed, or
+        leased with an expired lease. Expired tasks that used up max_attempts
+        are marked failed instead of being handed out again.
+
+        Args:
+            worker: Id of the claiming worker
+            count: Tasks to claim at most
+            job: Only tasks of this job
+            kinds: Only tasks of these kinds
+            visibility_timeout: Lease length (defaults to the queue's)
+
+        Returns:
+            List of task dicts: id, job, kind, payload, attempts and the lease token
+        """
+        now = self.clock()
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        where, params = '', []
+        if job is not None:
+            where += ' AND job = ?'
+            params.append(job)
+        if kinds:
+            where += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+
+        with self._transaction():
+            expired = self._db.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease expired', finished_at = ?"
+                " WHERE state = 'leased' AND lease_expires <= ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            ).rowcount
+            self.stats['failed'] += expired
+
+            rows = self._db.execute(
+                'SELECT id, job, kind, payload, attempts, state FROM tasks'
+                " WHERE ((state = 'pending' AND available_at <= ?) OR (state = 'leased' AND lease_expires <= ?))"
+                + where + ' ORDER BY priority, id LIMIT ?',
+                [now, now] + params + [count]
+            ).fetchall()
+
+            tasks = []
+            for task_id, task_job, kind, payload, attempts, state in rows:
+                token = uuid.uuid4().hex
+                self._db.execute(
+                    "UPDATE tasks SET state = 'leased', lease_token = ?, worker = ?, lease_expires = ?,"
+                    ' attempts = attempts + 1 WHERE id = ?',
+                    (token, worker, now + timeout, task_id)
+                )
+                if state == 'leased':
+                    self.stats['expired'] += 1
+                tasks.append({
+                    'id': task_id, 'job': task_job, 'kind': kind, 'payload': json.loads(payload),
+                    'attempts': attempts + 1, 'token': token
+                })
+            self._db.execute('UPDATE workers SET last_seen = ? WHERE id = ?', (now, worker))
+            self.stats['leased'] += len(tasks)
+        return tasks
+
+    def heartbeat(self, task, visibility_timeout=None):
+        """
+        Extend a lease by another visibility timeout
+
+        Returns:
+            False when the lease was lost (expired and taken over, or the task finished)
+        """
+        now = self.clock()
+        timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        with self._transaction():
+            extended = self._db.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND lease_token = ? AND state = 'leased'",
+                (now + timeout, task['id'], task['token'])
+            ).rowcount
+            self._db.execute(
+                'UPDATE workers SET last_seen = ? WHERE id = (SELECT worker FROM tasks WHERE id = ?)',
+                (now, task['id'])
+            )
+        return bool(extended)
+
+    def complete(self, task, result=None):
+        """
+        Finish a leased task with its (JSON-serializable) result
+
+        Returns:
+            False when the lease had passed to another worker; the result is dropped
+        """
+        with self._transaction():
+            done = self._finish(task, 'done', result=json.dumps(result))
+            if done:
+                self._db.execute(
+                    'UPDATE workers SET completed = completed + 1 WHERE id = (SELECT worker FROM tasks WHERE id = ?)',
+                    (task['id'],)
+                )
+                self.stats['completed'] += 1
+        return done
+
+    def fail(self, task, error, retry=True):
+        """
+        Give up on a leased task
+
+        Args:
+            task: Leased task
+            error: What went wrong (stored with the task)
+            retry: Make it available again after retry_delay (doubling per attempt) while
+                   attempts remain; False fails it for good
+
+        Returns:
+            False when the lease had passed to another worker
+        """
+        if retry and task['attempts'] < self.max_attempts:
+            delay = self.retry_delay * 2 ** (task['attempts'] - 1)
+            with self._transaction():
+                retried = self._finish(task, 'pending', error=str(error), available_at=self.clock() + delay)
+                self.stats['retried'] += retried
+            return retried
+
+        with self._transaction():
+            failed = self._finish(task, 'failed', error=str(error))
+            if failed:
+                self._db.execute(
+                    'UPDATE workers SET failed = failed + 1 WHERE id = (SELECT worker FROM tasks WHERE id = ?)',
+                    (task['id'],)
+                )
+                self.stats['failed'] += 1
+        return failed
+
+    def release(self, task):
+        """Hand a leased task back untouched (a worker shutting down); the attempt is not counted"""
+        with self._transaction():
+            released = self._finish(task, 'pending', available_at=self.clock())
+            if released:
+                self._db.execute('UPDATE tasks SET attempts = attempts - 1 WHERE id = ?', (task['id'],))
+        return released
+
+    def _finish(self, task, state, result=None, error=None, available_at=None):
+        finished = self._db.execute(
+            'UPDATE tasks SET state = ?, result = COALESCE(?, result), error = COALESCE(?, error),'
+            ' available_at = COALESCE(?, available_at), lease_token = NULL, lease_expires = NULL,'
+            ' finished_at = ? WHERE id = ? AND lease_token = ?',
+            (state, result, error, available_at, self.clock() if state in ('done', 'failed') else None,
+             task['id'], task['token'])
+        ).rowcount
+        if not finished:
+            self.stats['lost_leases'] += 1
+        return bool(finished)
+
+    # ------------------------------------------------------------------
+    # Per-host pacing shared by the workers
+    # ------------------------------------------------------------------
+
+    def reserve_host(self, host, interval, burst=1):
+        """
+        Reserve a host's next request slot in the schedule every worker shares
+
+        The token bucket of TokenBucket.reserve(), kept in the hosts table, so
+        any number of workers together send at most one request per `interval`
+        (after up to `burst` back to back) to the host.
+
+        Returns:
+            Seconds to wait before sending
+        """
+        with self._transaction():
+            now = self.clock()
+            row = self._db.execute('SELECT next_free, blocked_until FROM hosts WHERE host = ?', (host,)).fetchone()
+            next_free, blocked_until = row or (0.0, 0.0)
+            start = max(now, next_free - (burst - 1) * interval, blocked_until)
+            self._db.execute(
+                'INSERT OR REPLACE INTO hosts (host, next_free, blocked_until) VALUES (?, ?, ?)',
+                (host, max(next_free, start) + interval, blocked_until)
+            )
+        return start - now
+
+    def block_host(self, host, seconds):
+        """No worker may send the host a request for `seconds` (Retry-After)"""
+        with self._transaction():
+            until = self.clock() + seconds
+            self._db.execute(
+                'INSERT INTO hosts (host, blocked_until) VALUES (?, ?)'
+                ' ON CONFLICT (host) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)',
+                (host, until)
+            )
+
+    # ------------------------------------------------------------------
+    # Results
+    # ------------------------------------------------------------------
+
+    def results(self, job='default', kind=None):
+        """Yield (task id, payload, result) of the job's finished tasks in the order they were added"""
+        query = "SELECT id, payload, result FROM tasks WHERE job = ? AND state = 'done'"
+        params = [job]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY id', params).fetchall()
+        for task_id, payload, result in rows:
+            yield task_id, json.loads(payload), json.loads(result)
+
+    def outcomes(self, job='default', kind=None, after=0, limit=100):
+        """
+        Tasks of the job added after task `after`, finished or not, in the order they were added
+
+        Returns:
+            List of (task id, state, payload, result or None) of at most `limit` tasks
+        """
+        query = 'SELECT id, state, payload, result FROM tasks WHERE job = ? AND id > ?'
+        params = [job, after]
+        if kind is not None:
+            query += ' AND kind = ?'
+            params.append(kind)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY id LIMIT ?', params + [limit]).fetchall()
+        return [
+            (task_id, state, json.loads(payload), json.loads(result) if result is not None else None)
+            for task_id, state, payload, result in rows
+        ]
+
+    def failures(self, job='default'):
+        """Payloads and errors of the job's failed tasks"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, payload, error FROM tasks WHERE job = ? AND state = 'failed' ORDER BY id", (job,)
+            ).fetchall()
+        return [{'id': task_id, 'payload': json.loads(payload), 'error': error} for task_id, payload, error in rows]
+
+    def counts(self, job=None):
+        """Tasks per state (of one job, or of the whole queue)"""
+        query, params = 'SELECT state, COUNT(*) FROM tasks', ()
+        if job is not None:
+            query, params = query + ' WHERE job = ?', (job,)
+        with self._lock:
+            counts = dict(self._db.execute(query + ' GROUP BY state', params).fetchall())
+        return {state: counts.get(state, 0) for state in STATES}
+
+    def is_finished(self, job=None):
+        """True when no task of the job is pending or leased"""
+        counts = self.counts(job)
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    def wait(self, job=None, poll_interval=0.5, timeout=None):
+        """Block until the job is finished; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_finished(job):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def workers(self):
+        """Registered workers with their host, pid, last heartbeat and task counts"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, host, pid, started_at, last_seen, completed, failed FROM workers ORDER BY started_at'
+            ).fetchall()
+        return [
+            dict(zip(('id', 'host', 'pid', 'started_at', 'last_seen', 'completed', 'failed'), row))
+            for row in rows
+        ]
+
+    def metrics(self):
+        return {'tasks': self.counts(), 'workers': self.workers(), **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class QueueWorker:
+    """
+    Leases tasks and runs their handlers until the queue runs dry
+
+    A handler is called as handler(payload, worker) and returns the task's
+    result; it may add follow-up tasks with worker.spawn(). An exception
+    fails the task (retried while attempts remain). While a handler runs, a
+    background thread heartbeats its lease every third of the visibility
+    timeout.
+    """
+
+    def __init__(self, queue, handlers, worker_id=None, job=None, batch=1, poll_interval=0.5):
+        """
+        Args:
+            queue: WorkQueue (or the path of its database)
+            handlers: Dict of task kind -> handler
+            worker_id: Name in the workers table (defaults to host:pid:random)
+            job: Only work on this job's tasks
+            batch: Tasks leased per round trip to the database
+            poll_interval: Seconds between polls while other workers hold every remaining task
+        """
+        self.queue = queue if isinstance(queue, WorkQueue) else WorkQueue(queue)
+        self.handlers = handlers
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.job = job
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.current = None
+        self.stats = {'completed': 0, 'failed': 0, 'lost': 0}
+
+    def spawn(self, kind, payload, key=None, priority=0):
+        """Add a follow-up task to the job of the task being handled"""
+        job = self.current['job'] if self.current else (self.job or 'default')
+        return self.queue.put(kind, payload, job=job, key=key, priority=priority)
+
+    def run(self, stop_when_idle=True, max_tasks=None, idle_timeout=0):
+        """
+        Work until the job has nothing pending or leased (stop_when_idle) or max_tasks were handled
+
+        Args:
+            stop_when_idle: Stop once no task of the job is pending or leased
+            max_tasks: Stop after handling this many tasks
+            idle_timeout: Seconds to keep polling an idle queue before stopping, so workers
+                          started ahead of the producer wait for their tasks
+
+        Returns:
+            This worker's counts of completed, failed and lost tasks
+        """
+        self.queue.register_worker(self.worker_id)
+        handled = 0
+        idle_since = None
+        while max_tasks is None or handled < max_tasks:
+            count = self.batch if max_tasks is None else min(self.batch, max_tasks - handled)
+            tasks = self.queue.lease(self.worker_id, count=count, job=self.job, kinds=list(self.handlers))
+            if not tasks:
+                if stop_when_idle and self.queue.is_finished(self.job):
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since >= idle_timeout:
+                        break
+                else:
+                    idle_since = None
+                time.sleep(self.poll_interval)
+                continue
+            idle_since = None
+            for task in tasks:
+                self.process(task)
+                handled += 1
+        return dict(self.stats)
+
+    def process(self, task):
+        """Run one leased task's handler under a heartbeat and record its outcome"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.queue.visibility_timeout / 3):
+                if not self.queue.heartbeat(task):
+                    return
+
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        self.current = task
+        try:
+            result = self.handlers[task['kind']](task['payload'], self)
+        except Exception as e:
+            outcome = self.queue.fail(task, f'{type(e).__name__}: {e}')
+            self.stats['failed' if outcome else 'lost'] += 1
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+            self.current = None
+
+        if self.queue.complete(task, result):
+            self.stats['completed'] += 1
+            return True
+        self.stats['lost'] += 1
+        return False
+
+
+def open_work_queue(queue, **kwargs):
+    """Convenience function: WorkQueue for a path (an existing WorkQueue is returned as-is)"""
+    if isinstance(queue, WorkQueue):
+        return queue
+    return WorkQueue(queue, **kwargs)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        with WorkQueue(sys.argv[1]) as queue:
+            print(json.dumps(queue.counts(), indent=2))
+            for worker in queue.workers():
+                print(f"   {worker['id']} on {worker['host']}: {worker['completed']} done, {worker['failed']} failed")
+    else:
+        print("Usage: python -m core.work_queue <queue.sqlite>")
@@ -9,7 +9,6 @@ import sys
 from pathlib import Path
 from datetime import datetime
 import json
-import subprocess
 import pandas as pd
 import time
 
@@ -19,6 +18,8 @@ from core.scraper_generator import ScraperGenerator
 from core.data_analyzer import DataAnalyzer
 from core.pdf_generator import PDFGenerator
 from core.professional_logger import get_logger
+from core.analysis_cache import get_analysis_cache
+from core.scraper_runner import ScraperRunner
 
 # Page configuration
 st.set_page_config(
@@ -184,7 +185,8 @@ def run_intelligent_workflow(url, outputs_dir, options):
         
         logger = get_logger('streamlit_scraper')
         
-        analyzer = IntelligentAnalyzerV2(url, logger=logger)
+        analysis_cache = get_analysis_cache() if options.get('use_analysis_cache', True) else None
+        analyzer = IntelligentAnalyzerV2(url, logger=logger, analysis_cache=analysis_cache)
         analysis_path = outputs_dir / f"{base_name}_analysis.json"
         
         analysis = analyzer.run_full_analysis(str(analysis_path))
@@ -194,10 +196,15 @@ def run_intelligent_workflow(url, outputs_dir, options):
         
         results['files_generated'].append(str(analysis_path))
         results['steps_completed'] = 1
+        results['statistics']['analysis_cache_hit'] = analyzer.cache_hit
         st.session_state.analysis_data = analysis
         
-        add_log(f"HTML analysis complete: {analysis['structure'].get('total_elements', 0)} elements found", "SUCCESS")
-        step1_status.success("STEP 1/5: HTML structure analyzed successfully")
+        if analyzer.cache_hit:
+            add_log("Page unchanged since a previous run, analysis loaded from cache", "SUCCESS")
+            step1_status.success("STEP 1/5: HTML structure unchanged, cached analysis reused")
+        else:
+            add_log(f"HTML analysis complete: {analysis['structure'].get('total_elements', 0)} elements found", "SUCCESS")
+            step1_status.success("STEP 1/5: HTML structure analyzed successfully")
         
         time.sleep(0.5)
         
@@ -211,12 +218,14 @@ def run_intelligent_workflow(url, outputs_dir, options):
         scraper_path = outputs_dir / f"{base_name}_scraper.py"
         
         generator = ScraperGenerator(analysis)
-        scraper_code = generator.generate_full_scraper(
-            output_file=str(scraper_path),
+        generator.generate_full_scraper(
+            str(scraper_path),
+            max_pages=options['max_pages'],
             rate_limit=options['rate_limit']
         )
+        scraper_code = scraper_path.read_text(encoding='utf-8')
         
-        results['files_generated'].append(str(scraper_path))
+        results['files_generated'].extend([str(scraper_path), generator.get_spec_path(str(scraper_path))])
         results['steps_completed'] = 2
         
         add_log(f"Scraper generated: {len(scraper_code)} characters", "SUCCESS")
@@ -232,56 +241,58 @@ def run_intelligent_workflow(url, outputs_dir, options):
             step3_status = st.empty()
             step3_status.info("STEP 3/5: Extracting data from website...")
             
-            # Run scraper as subprocess
-            result = subprocess.run(
-                [sys.executable, str(scraper_path)],
+            # The scraper streams its records into the CSV export page by page
+            scraped_csv = outputs_dir / f"scraped_{base_name}.csv"
+            runner = ScraperRunner(
+                str(scraper_path),
+                mode=options.get('scraper_mode', 'inprocess'),
+                timeout=options['scraper_timeout'],
                 cwd=str(outputs_dir),
-                capture_output=True,
-                text=True,
-                timeout=options['scraper_timeout']
+                outputs=[str(scraped_csv)]
             )
+            # The first page comes from step 1, only further pages hit the network
+            page = analyzer.response.content if analyzer.response is not None else None
+            run_result = runner.run(html=page)
+            df = run_result['dataframe']
+            results['fetch_metrics'] = run_result['metrics']
+            if run_result['timed_out']:
+                add_log(f"Scraper timed out; keeping the {len(df)} records extracted so far", "WARNING")
             
-            # Find generated CSV files
-            csv_files = list(outputs_dir.glob(f"scraped_{domain}*.csv"))
-            
-            if csv_files:
-                csv_file = csv_files[-1]
+            csv_file = None
+            if run_result['records']:
+                # CSV export kept as an artifact; the analysis below uses the in-memory frame
+                csv_file = scraped_csv
                 results['files_generated'].append(str(csv_file))
                 results['steps_completed'] = 3
                 
-                # Load data to get statistics
-                df = pd.read_csv(csv_file)
                 results['statistics']['rows_extracted'] = len(df)
                 results['statistics']['columns'] = len(df.columns)
                 
                 add_log(f"Data extracted: {len(df)} rows, {len(df.columns)} columns", "SUCCESS")
                 step3_status.success(f"STEP 3/5: Data extracted successfully ({len(df)} rows)")
             else:
-                add_log("Scraper executed but no CSV file found", "WARNING")
+                add_log("Scraper executed but extracted no records", "WARNING")
                 step3_status.warning("STEP 3/5: Scraper executed with warnings")
             
             time.sleep(0.5)
             
             # STEP 4: Analyze Scraped Data
-            if csv_files and options['analyze_data']:
+            if csv_file and options['analyze_data']:
                 st.session_state.current_step = 4
                 add_log("Analyzing scraped data", "INFO")
                 
                 step4_status = st.empty()
                 step4_status.info("STEP 4/5: Performing statistical analysis...")
                 
-                data_analyzer = DataAnalyzer(str(csv_file), str(outputs_dir))
-                analysis_result = data_analyzer.analyze()
-                
                 data_analysis_path = outputs_dir / f"{base_name}_data_analysis.json"
-                with open(data_analysis_path, 'w', encoding='utf-8') as f:
-                    json.dump(analysis_result, f, indent=2, ensure_ascii=False)
+                data_analyzer = DataAnalyzer(str(csv_file), str(outputs_dir), dataframe=df)
+                analysis_result = data_analyzer.run_full_analysis(str(data_analysis_path))
                 
                 results['files_generated'].append(str(data_analysis_path))
                 
                 # Count charts generated
-                chart_files = list(outputs_dir.glob(f"chart_{domain}*.png"))
-                results['files_generated'].extend([str(f) for f in chart_files])
+                chart_files = analysis_result.get('charts', [])
+                results['files_generated'].extend(chart_files)
                 results['statistics']['charts_generated'] = len(chart_files)
                 results['statistics']['insights'] = len(analysis_result.get('insights', []))
                 results['steps_completed'] = 4
@@ -318,6 +329,7 @@ def run_intelligent_workflow(url, outputs_dir, options):
             'steps_completed': results['steps_completed'],
             'files_generated': results['files_generated'],
             'statistics': results['statistics'],
+            'fetch_metrics': results.get('fetch_metrics', {}),
             'options': options
         }
         
@@ -385,7 +397,8 @@ def main():
             max_value=5.0,
             value=1.0,
             step=0.5,
-            help="Delay between requests to respect server resources"
+            help="Time between requests to the same site (robots.txt Crawl-delay and Retry-After can slow it further). "
+                 "How many pages are fetched in parallel adapts to the site's response times and 429/503 answers"
         )
         
         scraper_timeout = st.number_input(
@@ -402,7 +415,19 @@ def main():
             min_value=1,
             max_value=100,
             value=10,
-            help="Limit the number of pages to scrape"
+            help="Follow detected pagination up to this many pages"
+        )
+        
+        use_analysis_cache = st.checkbox(
+            "Reuse cached analysis",
+            value=True,
+            help="Skip HTML analysis when the page is unchanged since a previous run"
+        )
+        
+        isolate_scraper = st.checkbox(
+            "Run scraper in a separate process",
+            value=False,
+            help="Isolate the generated scraper from the app (slower start-up)"
         )
         
         st.divider()
@@ -502,6 +527,8 @@ def main():
             options = {
                 'auto_run_scraper': auto_run_scraper,
                 'analyze_data': analyze_data,
+                'use_analysis_cache': use_analysis_cache,
+                'scraper_mode': 'subprocess' if isolate_scraper else 'inprocess',
                 'generate_pdf': generate_pdf,
                 'rate_limit': rate_limit,
                 'scraper_timeout': scraper_timeout,
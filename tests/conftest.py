@@ -0,0 +1,133 @@
+"""
+Shared Test Fixtures
+A clock the tests move by hand, local HTTP servers around a test's do_GET, and
+a product listing served over HTTP (paged by number and by next links) with
+the analysis that scrapes it
+"""
+
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeClock:
+    """time.monotonic stand-in that only moves when a test advances `now`"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class LocalServers:
+    """HTTP servers on 127.0.0.1, each answering with one do_GET function"""
+
+    def __init__(self):
+        self.servers = {}
+
+    def __call__(self, do_GET):
+        """Serve do_GET(handler) on a free port and return the base URL"""
+        handler = type('Handler', (BaseHTTPRequestHandler,),
+                       {'do_GET': do_GET, 'log_message': lambda self, *args: None})
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{httpd.server_address[1]}'
+        self.servers[url] = httpd
+        return url
+
+    def stop(self, url=None):
+        """Shut one server (or all of them) down; their port refuses connections from then on"""
+        for key in [url] if url else list(self.servers):
+            httpd = self.servers.pop(key)
+            httpd.shutdown()
+            httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    """Starts a server per call with the given do_GET and stops them all after the test"""
+    servers = LocalServers()
+    yield servers
+    servers.stop()
+
+
+@pytest.fixture
+def shop(serve):
+    """
+    Product listing of `pages` pages of `items` items, at /list?page=N and linked by /next-N
+
+    Prices can be edited and ETags turned on; a comment that changes with
+    `stamp` must not make a page look changed. Pages from `stall_from` on
+    never answer in time. `requests` logs the listing pages requested,
+    `times` the arrival time of every request.
+    """
+    state = {'pages': 6, 'items': 3, 'prices': {}, 'etags': False, 'stamp': 0, 'stall_from': 100,
+             'requests': [], 'times': [], 'not_modified': 0}
+
+    def do_GET(self):
+        state['times'].append(time.time())
+        if self.path.startswith('/next-'):
+            page = int(self.path.split('-')[1])
+        elif 'page=' in self.path:
+            page = int(self.path.rsplit('=', 1)[1])
+        else:
+            page = 1
+        if self.path.startswith(('/list', '/next-')):
+            state['requests'].append(page)
+        if page >= state['stall_from']:
+            time.sleep(30)
+
+        items = ''.join(
+            f'<li><a href="/item/{page}-{i}">Item {page}-{i}</a> '
+            f'{state["prices"].get(f"{page}-{i}", 10 * page + i)} EUR</li>'
+            for i in range(state['items'])
+        ) if page <= state['pages'] else ''
+        next_link = f'<a href="/next-{page + 1}">Next</a>' if page < state['pages'] else ''
+        body = (
+            f'<html><body><!-- rendered {state["stamp"]} --><ul class="items">{items}</ul>'
+            f'{next_link}</body></html>'
+        ).encode('utf-8')
+        etag = '"' + hashlib.md5(items.encode('utf-8')).hexdigest() + '"'
+
+        if state['etags'] and self.headers.get('If-None-Match') == etag:
+            state['not_modified'] += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        if state['etags']:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), state
+
+
+@pytest.fixture
+def shop_analysis(shop):
+    """Builds the analysis of the shop's listing for 'numbered' or 'next_links' pagination"""
+    site, _ = shop
+
+    def analysis(pagination):
+        if pagination == 'numbered':
+            rule = {'detected': True, 'type': 'numbered', 'sample_urls': ['/list?page=2', '/list?page=3']}
+        else:
+            rule = {'detected': True, 'type': 'next_prev'}
+        return {
+            'metadata': {'url': f'{site}/list', 'domain': '127.0.0.1'},
+            'semantic_analysis': {'pagination': rule},
+            'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+        }
+    return analysis
@@ -0,0 +1,97 @@
+"""
+Analysis Cache Tests
+Content-hash keys, eviction and cache hits in IntelligentAnalyzerV2
+"""
+
+import sys
+import os
+import json
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.analysis_cache import AnalysisCache, local_imports, source_fingerprint
+from core.fetcher import Fetcher
+from core.intelligent_analyzer_v2 import IntelligentAnalyzerV2
+
+
+PAGE = (
+    '<html><head><title>Shop</title></head><body><div class="grid">'
+    + ''.join(f'<div class="card"><h3>Item {i}</h3><a href="/p/{i}">View</a></div>' for i in range(5))
+    + '</div></body></html>'
+)
+
+
+def test_key_ignores_formatting_but_not_content():
+    url = 'https://shop.example.com/'
+    key = AnalysisCache.make_key(url, PAGE, 'v')
+
+    reformatted = PAGE.replace('<div class="card">', '\n  <!-- item -->\n  <div class="card">')
+    assert AnalysisCache.make_key(url, reformatted, 'v') == key
+    assert AnalysisCache.make_key(url, reformatted.encode('utf-8'), 'v') == key
+
+    assert AnalysisCache.make_key(url, PAGE.replace('Item 4', 'Item 5'), 'v') != key
+    assert AnalysisCache.make_key(url, PAGE, 'other-version') != key
+    assert AnalysisCache.make_key(url + 'page2', PAGE, 'v') != key
+
+
+def test_fingerprint_covers_the_helpers_an_analyzer_imports(tmp_path):
+    package = tmp_path / 'core'
+    package.mkdir()
+    (package / 'analyzer.py').write_text('import json\nfrom core.index import build\n')
+    (package / 'index.py').write_text('try:\n    from core.scorer import score\nexcept ImportError:\n'
+                                      '    from scorer import score\n')
+    (package / 'scorer.py').write_text('def score(): return 1\n')
+    (package / 'unused.py').write_text('')
+    analyzer = str(package / 'analyzer.py')
+
+    assert [os.path.basename(path) for path in local_imports(analyzer)] == ['analyzer.py', 'index.py', 'scorer.py']
+    before = source_fingerprint(analyzer)
+    # A helper two imports away changes the analysis, so it changes the key
+    (package / 'scorer.py').write_text('def score(): return 2\n')
+    source_fingerprint.cache_clear()
+    assert source_fingerprint(analyzer) != before
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnalysisCache(str(tmp_path), max_entries=2)
+
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    now = time.time()
+    os.utime(os.path.join(str(tmp_path), 'a.json'), (now - 20, now - 20))
+    os.utime(os.path.join(str(tmp_path), 'b.json'), (now - 10, now - 10))
+    assert cache.get('a') == {'n': 1}
+    cache.put('c', {'n': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1} and cache.get('c') == {'n': 3}
+
+
+def test_unchanged_page_skips_analysis_passes(serve, tmp_path):
+    def do_GET(self):
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    url = serve(do_GET) + '/'
+
+    analysis_cache = AnalysisCache(str(tmp_path / 'analysis'))
+    fetcher = Fetcher(use_cache=False)
+
+    first = IntelligentAnalyzerV2(url, fetcher=fetcher, analysis_cache=analysis_cache)
+    first_result = first.run_full_analysis()
+
+    second = IntelligentAnalyzerV2(url, fetcher=fetcher, analysis_cache=analysis_cache)
+    second.analyze_structure = None  # Would fail if the passes ran again
+    second_result = second.run_full_analysis(str(tmp_path / 'analysis.json'))
+
+    assert not first.cache_hit and second.cache_hit
+    assert second.soup is None
+    # Cached results come back as stored JSON
+    first_result = json.loads(json.dumps(first_result))
+    assert second_result['structure'] == first_result['structure']
+    assert second_result['scraping_strategy'] == first_result['scraping_strategy']
+    assert os.path.exists(tmp_path / 'analysis.json')
@@ -0,0 +1,135 @@
+"""
+Batch Analyzer Tests
+Runs the async batch API against a local aiohttp server
+"""
+
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiohttp import web
+
+from core.batch_analyzer import BatchAnalyzer, analyze_urls
+
+
+PAGE = """
+<html><head><title>Page {n}</title></head><body><main>
+{items}
+</main></body></html>
+"""
+
+
+def _page(n):
+    items = ''.join(
+        f'<div class="product-card"><a href="/p/{i}">Product {i}</a><span class="price">${i}.99</span></div>'
+        for i in range(5)
+    )
+    return PAGE.format(n=n, items=items)
+
+
+async def _run_batches(url_count, concurrency, per_host, worker_options=(None,)):
+    in_flight = {'now': 0, 'peak': 0}
+
+    async def handler(request):
+        in_flight['now'] += 1
+        in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+        await asyncio.sleep(0.05)
+        in_flight['now'] -= 1
+        if request.match_info['n'] == 'missing':
+            raise web.HTTPNotFound()
+        return web.Response(text=_page(request.match_info['n']), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/page/{n}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    urls = [f'http://127.0.0.1:{port}/page/{n}' for n in range(url_count)]
+    urls.append(f'http://127.0.0.1:{port}/page/missing')
+
+    runs = []
+    try:
+        for workers in worker_options:
+            runs.append([
+                r async for r in analyze_urls(urls, concurrency=concurrency, per_host=per_host, workers=workers)
+            ])
+    finally:
+        await runner.cleanup()
+
+    return urls, runs, in_flight['peak']
+
+
+def _run_batch(url_count, concurrency, per_host):
+    urls, runs, peak = asyncio.run(_run_batches(url_count, concurrency, per_host))
+    return urls, runs[0], peak
+
+
+def test_every_url_is_analyzed_within_per_host_limit():
+    urls, results, peak = _run_batch(8, concurrency=10, per_host=3)
+
+    assert sorted(r['metadata']['url'] for r in results) == sorted(urls)
+    assert peak <= 3
+
+    failed = [r for r in results if 'error' in r]
+    assert [r['metadata']['url'] for r in failed] == [urls[-1]]
+
+    analyzed = [r for r in results if 'error' not in r]
+    assert all(r['technical_details']['status_code'] == 200 for r in analyzed)
+    assert all(r['content_patterns']['repeated_structures'] for r in analyzed)
+
+
+def test_global_limit_applies_when_lower_than_per_host():
+    _, results, peak = _run_batch(6, concurrency=2, per_host=5)
+
+    assert len(results) == 7
+    assert peak <= 2
+
+
+def test_process_pool_matches_in_process_analysis():
+    _, (threaded, pooled), _ = asyncio.run(_run_batches(3, 4, 4, worker_options=(None, 2)))
+
+    def comparable(results):
+        by_url = {}
+        for result in results:
+            result = dict(result, technical_details=None)
+            result['metadata'] = dict(result['metadata'], analyzed_at=None)
+            if 'structure' in result:
+                # Sampled from a set, so the order depends on the process hash seed
+                links = result['structure']['links']
+                links['sample_internal'] = sorted(links['sample_internal'])
+            by_url[result['metadata']['url']] = result
+        return by_url
+
+    assert len(pooled) == 4
+    assert comparable(pooled) == comparable(threaded)
+
+
+def test_concurrent_batches_each_get_their_own_process_pool(tmp_path):
+    root = tmp_path / 'mirror' / 'shop.invalid'
+    root.mkdir(parents=True)
+    for n in range(6):
+        (root / f'page{n}').write_text(_page(n))
+    batch = BatchAnalyzer(concurrency=4, workers=1, backend=str(tmp_path / 'mirror'))
+    urls = [f'http://shop.invalid/page{n}' for n in range(6)]
+
+    async def first_only():
+        stream = batch.analyze(urls)
+        async for result in stream:
+            break
+        # Closing the stream early shuts its pool down without touching the other batch's
+        await stream.aclose()
+        return [result]
+
+    async def everything():
+        return [result async for result in batch.analyze(urls)]
+
+    async def run():
+        return await asyncio.gather(first_only(), everything())
+
+    early, full = asyncio.run(run())
+    assert len(early) == 1
+    assert len(full) == 6 and all('error' not in result for result in full)
@@ -0,0 +1,191 @@
+"""
+Concurrency Controller Tests
+Additive increase on healthy responses, multiplicative decrease on 429/503/timeouts,
+and adaptive limits on the get_many() and pagination fetch paths
+"""
+
+import sys
+import os
+import asyncio
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.concurrency_controller import ConcurrencyController
+from core.extraction_spec import compile_spec
+from core.fetch_backend import ReplayBackend
+from core.fetcher import Fetcher
+from core.rate_limiter import RateLimiter
+from core.scraper_runtime import ScraperRuntime
+
+
+URL = 'http://example.test/page'
+
+
+async def _round(controller, clock, statuses, latency=0.1):
+    """Take as many slots as the limit allows and complete them with the given statuses"""
+    tickets = [await controller.acquire_async(URL) for _ in range(controller.limit(URL))]
+    clock.now += latency
+    for ticket, status in zip(tickets, statuses):
+        controller.release(ticket, status=status)
+    return len(tickets)
+
+
+def test_limit_grows_by_one_per_healthy_round_and_halves_on_429(clock):
+    controller = ConcurrencyController(initial=2, max_limit=6, clock=clock)
+
+    async def scenario():
+        sizes = [await _round(controller, clock, [200] * 8) for _ in range(5)]
+        # One 429 cuts the limit once, even though the whole round was sent before the cut
+        sizes.append(await _round(controller, clock, [429] * 8))
+        sizes.append(await _round(controller, clock, [200] * 8))
+        return sizes
+
+    assert asyncio.run(scenario()) == [2, 3, 4, 5, 6, 6, 3]
+
+    metrics = controller.metrics()
+    host = metrics['hosts']['http://example.test']
+    assert host['limit'] == 4
+    assert (host['increases'], host['decreases'], host['overloads']) == (5, 1, 6)
+    assert [d['action'] for d in metrics['decisions']] == ['increase'] * 4 + ['decrease', 'increase']
+    assert metrics['decisions'][4] == {
+        'host': 'http://example.test', 'action': 'decrease', 'reason': 'HTTP 429', 'from': 6, 'to': 3,
+        'at': pytest.approx(clock.now - 0.1)
+    }
+
+
+def test_slow_responses_and_errors_stop_growth_and_idle_limits_stay_put(clock):
+    controller = ConcurrencyController(initial=2, max_limit=10, clock=clock)
+
+    async def scenario():
+        await _round(controller, clock, [200, 200], latency=0.1)
+        # Ten times the baseline latency: hold the limit
+        await _round(controller, clock, [200, 200, 200], latency=1.0)
+        await _round(controller, clock, [200, 200, 200], latency=1.0)
+        held = controller.limit(URL)
+        clock.now += 60
+        # A single request never uses a limit of 3, so it must not grow it
+        ticket = await controller.acquire_async(URL)
+        clock.now += 0.1
+        controller.release(ticket, status=200)
+        return held
+
+    assert asyncio.run(scenario()) == 3
+    assert controller.limit(URL) == 3
+
+    controller.record(URL, 30.0, error=TimeoutError())
+    assert controller.limit(URL) == 1
+
+
+def test_rate_limited_requests_do_not_grow_the_limit_and_the_limit_paces_the_bucket(tmp_path):
+    root = tmp_path / 'mirror' / 'example.test'
+    root.mkdir(parents=True)
+    for i in range(20):
+        (root / f'page{i}').write_bytes(b'<html><body>ok</body></html>')
+    urls = [f'http://example.test/page{i}' for i in range(20)]
+
+    # 20 requests behind a 25 rps bucket: the slots mostly wait for tokens, the host is never busy
+    controller = ConcurrencyController(initial=2, max_limit=16)
+    limiter = RateLimiter(rate=25, respect_robots=False)
+    fetcher = Fetcher(use_cache=False, rate_limiter=limiter, concurrency_controller=controller,
+                      backend=ReplayBackend(str(tmp_path / 'mirror'), latency=0.005))
+    assert all(response.status_code == 200 for response in fetcher.get_many(urls, concurrency=16))
+    host = controller.metrics()['hosts']['http://example.test']
+    assert (host['limit'], host['increases']) == (2, 0)
+    assert host['peak_in_flight'] <= 2
+    # Fast responses: the spec rate stays the floor of the pacing
+    assert limiter.bucket(URL).interval == pytest.approx(1 / 25)
+
+    # A slow host: the limit's sustainable rate (2 + 1 requests per 300 ms) is below the spec rate
+    fetcher.set_backend(ReplayBackend(str(tmp_path / 'mirror'), latency=0.3))
+    fetcher.get_many(urls[:4], concurrency=16)
+    bucket = limiter.bucket(URL)
+    assert bucket.interval > 0.05 and bucket.min_interval == pytest.approx(1 / 25)
+
+    # robots.txt delays raise the floor for good
+    limiter.apply_robots(URL, 'User-agent: *\nCrawl-delay: 2\n')
+    limiter.pace(URL, 0.01)
+    assert bucket.interval == 2.0
+
+
+@pytest.fixture
+def fragile_site(serve):
+    """Answers 429 while more than three requests are in flight"""
+    state = {'in_flight': 0, 'peak': 0, 'throttled': 0}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with lock:
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+            busy = state['in_flight'] > 3
+            state['throttled'] += busy
+        time.sleep(0.05)
+        body = b'<html><body><ul><li>one</li></ul></body></html>'
+        self.send_response(429 if busy else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with lock:
+            state['in_flight'] -= 1
+
+    return serve(do_GET), state
+
+
+def test_get_many_backs_off_a_host_that_answers_429(fragile_site):
+    site, state = fragile_site
+    controller = ConcurrencyController(initial=8, max_limit=16)
+    fetcher = Fetcher(use_cache=False, concurrency_controller=controller)
+
+    first = fetcher.get_many([f'{site}/a/{i}' for i in range(8)], concurrency=16)
+    assert sum(response.status_code == 429 for response in first) > 0
+    assert controller.limit(site) == 4
+
+    second = fetcher.get_many([f'{site}/b/{i}' for i in range(24)], concurrency=16)
+    host = controller.metrics()['hosts'][site]
+    assert host['decreases'] >= 1
+    assert controller.limit(site) <= 4
+    # After the cut the host sees far fewer 429s than with the fixed limit of 16
+    assert sum(response.status_code == 429 for response in second) <= 4
+
+
+def test_pagination_waves_grow_on_a_healthy_host(serve):
+    pages = 30
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'peak': 0}
+
+    def do_GET(self):
+        page = int(self.path.rsplit('=', 1)[-1]) if '=' in self.path else 1
+        with lock:
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+        time.sleep(0.02)
+        body = f'<html><body><ul class="items"><li>Item {page}</li></ul></body></html>'.encode()
+        self.send_response(200 if page <= pages else 404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with lock:
+            state['in_flight'] -= 1
+
+    site = serve(do_GET)
+    spec = compile_spec({
+        'metadata': {'url': f'{site}/list', 'domain': '127.0.0.1'},
+        'semantic_analysis': {'pagination': {
+            'detected': True, 'type': 'numbered', 'sample_urls': ['/list?page=2', '/list?page=3']
+        }},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }, max_pages=pages, rate_limit=0)
+    runtime = ScraperRuntime(spec)
+    runtime.fetcher.cache = None
+    runtime.rate_limiter.respect_robots = False
+
+    items = runtime.scrape(url=f'{site}/list')
+
+    assert len(items) == pages
+    concurrency = runtime.fetch_metrics()['concurrency']['hosts'][site]
+    assert concurrency['limit'] > 4
+    assert state['peak'] > 4
+    assert concurrency['decreases'] == 0
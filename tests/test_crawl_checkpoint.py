@@ -0,0 +1,145 @@
+"""
+Crawl Checkpoint Tests
+Sinks continuing from a checkpoint, and interrupted crawls (in-process and a
+timed-out subprocess) resuming without fetching the pages already done
+"""
+
+import sys
+import os
+import json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+import pytest
+
+from core.crawl_checkpoint import CrawlCheckpoint
+from core.extraction_spec import compile_spec
+from core.record_sinks import COLUMNAR_AVAILABLE, JSONLinesSink, open_sink, read_records
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner
+from core.scraper_runtime import ScraperRuntime
+
+
+SINK_NAMES = ['items.csv', 'items.csv.gz', 'items.jsonl.gz']
+if COLUMNAR_AVAILABLE:
+    SINK_NAMES.append('items.parquet')
+
+
+def _load(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if '.csv' in path:
+        return pd.read_csv(path, encoding='utf-8-sig')
+    return pd.DataFrame(list(read_records(path)))
+
+
+@pytest.mark.parametrize('name', SINK_NAMES)
+def test_sink_continues_from_its_checkpoint(tmp_path, name):
+    records = [{'title': f'Item {i}', 'rank': str(i)} for i in range(7)]
+    path = str(tmp_path / name)
+
+    sink = open_sink(path, buffer_records=2)
+    sink.write_many(records[:3])
+    state = json.loads(json.dumps(sink.checkpoint()))
+    # Written after the checkpoint, then the process dies; the new column sends CSV rows to a sidecar
+    sink.write_many([{'title': 'Lost', 'extra': 'x'}] * 3)
+    sink.flush()
+
+    resumed = open_sink(path, buffer_records=2)
+    resumed.resume(state)
+    resumed.write_many(records[3:])
+    resumed.close()
+
+    reference = str(tmp_path / ('reference_' + name))
+    with open_sink(reference) as complete:
+        complete.write_many(records)
+
+    assert resumed.count == 7
+    pd.testing.assert_frame_equal(_load(path), _load(reference))
+    assert sorted(os.listdir(tmp_path)) == sorted([name, 'reference_' + name])
+
+
+class CrashingSink(JSONLinesSink):
+    """Dies like a killed process once it holds `limit` records"""
+
+    def __init__(self, path, limit):
+        super().__init__(path, buffer_records=1)
+        self.limit = limit
+
+    def write_many(self, records):
+        if self.count >= self.limit:
+            raise RuntimeError('killed')
+        super().write_many(records)
+
+
+def _runtime(analysis):
+    runtime = ScraperRuntime(compile_spec(analysis, max_pages=40, rate_limit=0))
+    runtime.fetcher.cache = None
+    runtime.rate_limiter.respect_robots = False
+    return runtime
+
+
+EXPECTED = [f'Item {page}-{i}{10 * page + i} EUR' for page in range(1, 41) for i in range(3)]
+
+
+@pytest.mark.parametrize('pagination', ['numbered', 'next_links'])
+def test_interrupted_crawl_resumes_at_the_checkpointed_page(shop, shop_analysis, tmp_path, pagination):
+    _, state = shop
+    state['pages'] = 40
+    csv_path, jsonl_path = str(tmp_path / 'items.csv.gz'), str(tmp_path / 'items.jsonl')
+    checkpoint_path = str(tmp_path / 'crawl.checkpoint.json')
+
+    # Dies while emitting page 11: the CSV already holds some of its rows, the checkpoint does not
+    runtime = _runtime(shop_analysis(pagination))
+    with pytest.raises(RuntimeError):
+        runtime.scrape_to_files(
+            [csv_path, CrashingSink(jsonl_path, limit=30)], checkpoint=CrawlCheckpoint(checkpoint_path, interval=0)
+        )
+    saved = CrawlCheckpoint(checkpoint_path).load()
+    assert saved['cursor']['page'] == 11
+    assert saved['record_count'] == 30
+
+    state['requests'].clear()
+    resumed = _runtime(shop_analysis(pagination))
+    resumed.set_checkpoint(checkpoint_path, interval=0)
+    assert resumed.scrape_to_files(resume=True) == [os.path.abspath(csv_path), os.path.abspath(jsonl_path)]
+
+    assert min(state['requests']) == 11
+    assert resumed.record_count == 120
+    for path in [csv_path, jsonl_path]:
+        assert [record['text'] for record in read_records(path)] == EXPECTED
+    # Finished: nothing left to resume
+    assert not os.path.exists(checkpoint_path)
+
+
+def test_timed_out_subprocess_run_resumes_from_the_checkpoint(shop, shop_analysis, tmp_path):
+    site, state = shop
+    state['pages'] = 40
+    state['stall_from'] = 5
+    scraper_path = ScraperGenerator(shop_analysis('next_links')).generate_full_scraper(
+        str(tmp_path / 'site_scraper.py'), max_pages=40, rate_limit=0
+    )
+    csv_path = str(tmp_path / 'items.csv')
+    checkpoint_path = str(tmp_path / 'items.checkpoint.json')
+
+    runner = ScraperRunner(
+        scraper_path, mode='subprocess', timeout=8, cwd=str(tmp_path), outputs=[csv_path], checkpoint=checkpoint_path
+    )
+    first = runner.run(url=f'{site}/list')
+    assert first['timed_out']
+    assert 'resumable' in first['output']
+    assert len(first['records']) == 12
+
+    state['stall_from'] = 100
+    state['requests'].clear()
+    runner.resume = True
+    second = runner.run(url=f'{site}/list')
+
+    assert not second['timed_out']
+    # The start page and the checkpointed pages are not fetched again (the crawl continues at page 3,
+    # or later when pages after the checkpoint are in the HTTP cache)
+    assert min(state['requests']) >= 3
+    assert [record['text'] for record in second['records']] == EXPECTED
+    assert [record['text'] for record in read_records(csv_path)] == EXPECTED
+    assert not os.path.exists(checkpoint_path)
+    assert not os.path.exists(runner.records_path())
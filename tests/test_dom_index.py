@@ -0,0 +1,128 @@
+"""
+DOM Index Tests
+Checks that index lookups agree with the BeautifulSoup queries they replace
+"""
+
+import sys
+import os
+import re
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bs4 import BeautifulSoup
+
+from core.dom_index import DOMIndex
+
+
+SAMPLE_HTML = """
+<html><head><title>Shop</title>
+<meta property="og:title" content="Shop"><script src="/app.js"></script></head>
+<body>
+  <main id="main-content" class="content wrapper">
+    <ul class="nav"><li class="cat">A</li><li class="cat">B</li><li>C</li></ul>
+    <div class="product-card item" data-id="1"><a href="/p/1">Product 1</a></div>
+    <div class="product-card item" data-id="2"><a href="/p/2">Product 2</a></div>
+    <div class="" id="empty"><span>text <b>bold</b></span><!-- note --></div>
+    <a href="/shop?page=2">Next</a><a><b>Next</b></a><a href="#">x <i>y</i></a>
+  </main>
+</body></html>
+"""
+
+
+def _soup():
+    return BeautifulSoup(SAMPLE_HTML, 'lxml')
+
+
+def test_elements_and_tags_match_find_all():
+    soup = _soup()
+    index = DOMIndex(soup)
+
+    assert index.elements == soup.find_all()
+    assert index.find_all(['div', 'ul']) == soup.find_all(['div', 'ul'])
+    assert index.find_with_attr('a', 'href') == soup.find_all('a', href=True)
+    assert index.with_class == soup.find_all(class_=True)
+
+
+def test_class_and_id_patterns_match_regex_queries():
+    soup = _soup()
+    index = DOMIndex(soup)
+
+    for pattern in ['content', 'card', 'item', 'cat', 'nomatch']:
+        assert index.find_by_class_pattern(pattern) == soup.find_all(class_=re.compile(pattern, re.I))
+
+    assert index.find_by_id_pattern('main') is soup.find(id=re.compile('main', re.I))
+    assert index.find_by_id_pattern('missing') is None
+
+
+def test_string_lookup_and_data_attributes():
+    soup = _soup()
+    index = DOMIndex(soup)
+
+    assert index.find_by_string('a', 'next') == soup.find_all('a', string=re.compile('next', re.I))
+    assert [value for _, value in index.data_attrs['data-id']] == ['1', '2']
+
+
+def test_depth_and_child_counts():
+    soup = _soup()
+    index = DOMIndex(soup)
+
+    main = soup.find('main')
+    assert index.child_count[id(main)] == len(main.contents)
+    assert index.child_tag_count[id(main)] == len(main.find_all(recursive=False))
+    # body > main > div > span > b > "bold"
+    assert index.max_depth() == 5
+
+
+def test_sibling_groups_find_items_with_obfuscated_classes():
+    items = ''.join(
+        f'<div class="x{i}k"><a href="/p/{i}"><img src="/i/{i}.png"></a><h2>Item {i}</h2></div>'
+        for i in range(6)
+    )
+    soup = BeautifulSoup(f'<html><body><div id="grid">{items}</div><p>tail</p></body></html>', 'lxml')
+    index = DOMIndex(soup)
+
+    groups = index.sibling_groups(min_repeats=3)
+    parents = [parent for parent, _ in groups]
+
+    assert soup.find(id='grid') in parents
+    grid_items = next(children for parent, children in groups if parent.get('id') == 'grid')
+    assert len(grid_items) == 6
+    assert len({index.shape_id[id(item)] for item in grid_items}) == 1
+    assert len({index.structure_id[id(item)] for item in grid_items}) == 6
+
+
+def test_sibling_groups_tolerate_optional_children():
+    cards = ''.join(
+        f'<li class="card"><h3>T{i}</h3>{"<em>sale</em>" if i % 2 else ""}</li>' for i in range(4)
+    )
+    soup = BeautifulSoup(f'<ul>{cards}</ul>', 'lxml')
+    index = DOMIndex(soup)
+
+    groups = index.sibling_groups(min_repeats=3)
+    assert [len(children) for _, children in groups] == [4]
+
+
+def test_structure_ids_count_repeated_children():
+    soup = BeautifulSoup(
+        '<div><ul class="a"><li>1</li></ul><ul class="a"><li>1</li><li>2</li><li>3</li><li>4</li><li>5</li></ul>'
+        '<ul class="a"><li>x</li><b>y</b></ul><ul class="a"><b>y</b><li>x</li></ul></div>', 'lxml'
+    )
+    index = DOMIndex(soup)
+    one, five, first, swapped = [index.structure_id[id(ul)] for ul in soup.find_all('ul')]
+    # One child and five identical children are different structures; child order is not
+    assert one != five
+    assert first == swapped
+
+
+def test_cached_text_statistics_match_get_text():
+    soup = BeautifulSoup(
+        '<html><body><div id="a"> Hello  <b>wor</b>ld <script>var x = 1;</script>'
+        '<!-- hidden --><p>second   para <i>end</i></p><template><p>tpl</p></template>'
+        '</div><span>   </span><script>skip me</script></body></html>',
+        'lxml'
+    )
+    index = DOMIndex(soup)
+
+    for elem in soup.find_all():
+        text = elem.get_text(strip=True)
+        assert index.text_length(elem) == len(text), elem.name
+        assert index.word_count(elem) == len(text.split()), elem.name
@@ -0,0 +1,183 @@
+"""
+Fetch Backend Tests
+Replaying recorded responses (WARC archives and wget-style mirrors) through
+both fetch paths, deterministic latency and error injection, and the
+analyzers, batch analyzer and scraper running without any network
+"""
+
+import sys
+import os
+import asyncio
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+import requests
+
+from core.batch_analyzer import BatchAnalyzer
+from core.fetch_backend import LiveBackend, ReplayBackend
+from core.fetcher import Fetcher
+from core.intelligent_analyzer_v2 import IntelligentAnalyzerV2
+from core.retry_policy import RetryPolicy
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner
+from core.warc_archive import WARCWriter
+
+# Never resolved: a request that escaped the backend would fail
+SITE = 'http://shop.invalid'
+
+
+def _page(page, pages=5):
+    items = ''.join(f'<li><a href="/item/{page}-{i}">Item {page}-{i}</a> {page * 10 + i} EUR</li>' for i in range(3))
+    next_link = f'<a rel="next" href="/list?page={page + 1}">Next</a>' if page < pages else ''
+    return (f'<html><head><title>Page {page}</title></head><body><h1>Catalogue</h1>'
+            f'<ul class="items">{items}</ul>{next_link}</body></html>').encode('utf-8')
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """WARC archive of a 5-page listing, as an --archive run would have left it"""
+    directory = str(tmp_path / 'warc')
+    with WARCWriter(directory) as writer:
+        writer.write_exchange(f'{SITE}/list', 200, {'Content-Type': 'text/html; charset=utf-8'}, _page(1))
+        for page in range(2, 6):
+            writer.write_exchange(f'{SITE}/list?page={page}', 200, {'Content-Type': 'text/html; charset=utf-8'},
+                                  _page(page))
+    return directory
+
+
+def _analysis():
+    return {
+        'metadata': {'url': f'{SITE}/list', 'domain': 'shop.invalid'},
+        'semantic_analysis': {'pagination': {'detected': True, 'type': 'next_prev'}},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }
+
+
+def test_both_fetch_paths_replay_an_archive(recording):
+    fetcher = Fetcher(use_cache=False, backend=recording)
+    response = fetcher.get(f'{SITE}/list?page=2')
+    assert response.status_code == 200
+    assert response.content == _page(2)
+    assert response.encoding == 'utf-8'
+    assert fetcher.get(f'{SITE}/nowhere').status_code == 404
+
+    responses = fetcher.get_many([f'{SITE}/list', f'{SITE}/list?page=5', f'{SITE}/gone'])
+    assert [r.status_code for r in responses] == [200, 200, 404]
+    assert responses[1].content == _page(5)
+
+    metrics = fetcher.metrics()['backend']
+    assert (metrics['backend'], metrics['recorded']) == ('replay', 5)
+    assert (metrics['requests'], metrics['served'], metrics['missing']) == (5, 3, 2)
+
+    # Back to the network: the unresolvable host now fails for real
+    fetcher.set_backend(LiveBackend())
+    with pytest.raises(requests.ConnectionError):
+        fetcher.get(f'{SITE}/list')
+
+
+def test_get_many_works_from_inside_a_running_event_loop(recording):
+    fetcher = Fetcher(use_cache=False, backend=recording)
+    urls = [f'{SITE}/list', f'{SITE}/list?page=3']
+
+    async def caller():
+        blocking = fetcher.get_many(urls)
+        awaited = await fetcher.get_many_async(urls)
+        return blocking, awaited
+
+    blocking, awaited = asyncio.run(caller())
+    assert [r.content for r in blocking] == [r.content for r in awaited] == [_page(1), _page(3)]
+
+
+def test_mirror_directories_are_served_like_wget_left_them(tmp_path):
+    root = tmp_path / 'mirror' / 'shop.invalid'
+    (root / 'list').mkdir(parents=True)
+    (root / 'index.html').write_bytes(b'<html><body>Home</body></html>')
+    (root / 'list' / 'index.html').write_bytes(_page(1))
+    (root / 'list?page=2').write_bytes(_page(2))
+    (root / 'robots.txt').write_bytes(b'User-agent: *\nDisallow:\n')
+
+    backend = ReplayBackend(str(tmp_path / 'mirror'))
+    session = backend.mount(requests.Session())
+    assert session.get(f'{SITE}/').content == b'<html><body>Home</body></html>'
+    assert session.get(f'{SITE}/list').content == _page(1)
+    response = session.get(f'{SITE}/list?page=2#top')
+    assert response.content == _page(2) and response.headers['Content-Type'] == 'text/html'
+    assert session.get(f'{SITE}/robots.txt').headers['Content-Type'] == 'text/plain'
+    assert session.get(f'{SITE}/list?page=3').status_code == 404
+
+    # The analyzer runs end to end offline
+    analysis = IntelligentAnalyzerV2(f'{SITE}/list', backend=backend).run_full_analysis()
+    assert analysis['technical_details']['status_code'] == 200
+    assert analysis['structure']['links']['internal'] >= 4
+
+
+def test_injected_errors_are_deterministic_and_retried_away(recording):
+    urls = [f'{SITE}/list?page={page}' for page in range(2, 6)] * 5
+
+    def outcomes(backend):
+        session = backend.mount(requests.Session())
+        results = []
+        for url in urls:
+            try:
+                results.append(session.get(url).status_code)
+            except requests.ConnectionError:
+                results.append('error')
+        return results
+
+    first = outcomes(ReplayBackend(recording, error_rate=0.3, seed=7))
+    assert first == outcomes(ReplayBackend(recording, error_rate=0.3, seed=7))
+    assert 0 < first.count('error') < len(urls)
+    assert first != outcomes(ReplayBackend(recording, error_rate=0.3, seed=8))
+
+    assert outcomes(ReplayBackend(recording, error_rate=1.0, error=503)) == [503] * len(urls)
+    with pytest.raises(ValueError):
+        ReplayBackend(recording, error='dns')
+
+    # The fetcher's retries get through the injected failures, sync and async alike
+    backend = ReplayBackend(recording, error_rate=0.3, seed=7)
+    fetcher = Fetcher(use_cache=False, backend=backend,
+                      retry_policy=RetryPolicy(attempts=10, base_delay=0, sleep=lambda delay: None))
+    assert all(fetcher.get(url).status_code == 200 for url in urls)
+    assert all(response.status_code == 200 for response in fetcher.get_many(urls, concurrency=5))
+    assert backend.metrics()['injected_errors'] > 0
+
+
+def test_latency_is_simulated_and_overlaps_in_async_fetches(recording):
+    backend = ReplayBackend(recording, latency=(0.04, 0.06))
+    fetcher = Fetcher(use_cache=False, backend=backend)
+    start = time.perf_counter()
+    fetcher.get(f'{SITE}/list')
+    assert time.perf_counter() - start >= 0.04
+
+    start = time.perf_counter()
+    fetcher.get_many([f'{SITE}/list?page={page}' for page in range(2, 6)] * 4, concurrency=20)
+    # 16 requests of ~50 ms each, in flight together
+    assert time.perf_counter() - start < 0.5
+
+    slow = Fetcher(use_cache=False, timeout=0.02, backend=ReplayBackend(recording, latency=0.2))
+    with pytest.raises(requests.Timeout):
+        slow.get(f'{SITE}/list')
+    assert isinstance(slow.get_many([f'{SITE}/list'])[0], asyncio.TimeoutError)
+
+
+def test_batch_analyzer_and_scraper_run_offline(recording, tmp_path):
+    batch = BatchAnalyzer(concurrency=4, backend=recording)
+
+    async def run():
+        return [analysis async for analysis in batch.analyze([f'{SITE}/list', f'{SITE}/list?page=3', f'{SITE}/gone'])]
+
+    analyses = {analysis['metadata']['url']: analysis for analysis in asyncio.run(run())}
+    assert 'error' not in analyses[f'{SITE}/list'] and 'error' not in analyses[f'{SITE}/list?page=3']
+    assert '404' in analyses[f'{SITE}/gone']['error']
+    assert batch.metrics()['backend']['served'] == 2
+
+    scraper_path = ScraperGenerator(_analysis()).generate_full_scraper(
+        str(tmp_path / 'shop_scraper.py'), max_pages=10, rate_limit=0
+    )
+    for mode in ('inprocess', 'subprocess'):
+        result = ScraperRunner(scraper_path, mode=mode, cwd=str(tmp_path), replay=recording).run()
+        assert [record['text'] for record in result['records']][:2] == ['Item 1-010 EUR', 'Item 1-111 EUR']
+        assert len(result['records']) == 15
+    with pytest.raises(ValueError):
+        ScraperRunner(scraper_path, mode='subprocess', replay=ReplayBackend(recording))
@@ -0,0 +1,227 @@
+"""
+Fetch Retry Tests
+Jittered backoff, retries of transient failures on both fetch paths, and
+per-host circuit breakers that fail fast on a dead host and recover through
+a half-open probe
+"""
+
+import sys
+import os
+import asyncio
+import socket
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+import requests
+
+from core.batch_analyzer import BatchAnalyzer
+from core.extraction_spec import compile_spec
+from core.fetcher import Fetcher
+from core.retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy
+from core.scraper_runtime import ScraperRuntime
+
+
+@pytest.fixture
+def flaky_site(serve):
+    """Each path answers 503 (with Retry-After on /busy) `failures` times, then 200"""
+    state = {'failures': 2, 'hits': {}}
+
+    def do_GET(self):
+        hits = state['hits'][self.path] = state['hits'].get(self.path, 0) + 1
+        if self.path.startswith('/missing'):
+            status = 404
+        else:
+            status = 503 if hits <= state['failures'] else 200
+        body = f'<html><body><main><h1>{self.path}</h1><p>Served on attempt {hits}</p></main></body></html>'
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path.startswith('/busy') and status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), state
+
+
+@pytest.fixture
+def dead_host():
+    """URL of a port nothing listens on"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    return f'http://127.0.0.1:{port}'
+
+
+def test_backoff_is_full_jitter_capped_and_honors_retry_after():
+    policy = RetryPolicy(attempts=10, base_delay=0.5, max_delay=4, rng=lambda: 0.999999)
+    ceilings = [round(policy.backoff(attempt), 3) for attempt in range(6)]
+    assert ceilings == [0.5, 1.0, 2.0, 4.0, 4.0, 4.0]
+
+    policy.rng = lambda: 0.0
+    assert policy.backoff(3) == 0.0
+    assert policy.backoff(0, retry_after='3') == 3
+    # Asked to come back later than max_delay: give up instead
+    assert policy.backoff(0, retry_after='60') is None
+
+
+def test_only_transient_failures_are_retried():
+    policy = RetryPolicy(attempts=3, rng=lambda: 0.5)
+    url = 'http://example.test/a'
+    assert policy.next_delay(url, 0, status=503) == pytest.approx(0.25)
+    assert policy.next_delay(url, 0, error=requests.ConnectTimeout()) is not None
+    assert policy.next_delay(url, 0, error=asyncio.TimeoutError()) is not None
+    assert policy.next_delay(url, 0, status=404) is None
+    assert policy.next_delay(url, 0, error=requests.TooManyRedirects()) is None
+    # Last attempt used up
+    assert policy.next_delay(url, 2, status=503) is None
+
+    metrics = policy.metrics()
+    assert metrics['retries'] == 3
+    assert metrics['exhausted'] == 1
+    assert metrics['hosts'] == {'http://example.test': 3}
+
+
+def test_fetcher_retries_until_the_host_answers(flaky_site):
+    site, state = flaky_site
+    sleeps = []
+    policy = RetryPolicy(attempts=4, base_delay=0.2, sleep=sleeps.append)
+    fetcher = Fetcher(use_cache=False, retry_policy=policy)
+
+    response = fetcher.get(f'{site}/page')
+    assert response.status_code == 200
+    assert b'attempt 3' in response.content
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= 0.2 * 2 ** i for i, delay in enumerate(sleeps))
+
+    # Retry-After sets the minimum wait; a 404 is an answer, not a failure
+    assert fetcher.get(f'{site}/busy').status_code == 200
+    assert sleeps[2:] == [1.0, 1.0]
+    assert fetcher.get(f'{site}/missing').status_code == 404
+    assert state['hits']['/missing'] == 1
+
+    metrics = fetcher.metrics()['retries']
+    assert metrics['retries'] == 4
+    assert metrics['recovered'] == 2
+
+
+def test_last_response_is_returned_when_retries_run_out(flaky_site):
+    site, state = flaky_site
+    state['failures'] = 10
+    fetcher = Fetcher(use_cache=False, retry_policy=RetryPolicy(attempts=3, sleep=lambda seconds: None))
+
+    response = fetcher.get(f'{site}/page')
+    assert response.status_code == 503
+    assert state['hits']['/page'] == 3
+    assert fetcher.metrics()['retries']['exhausted'] == 1
+
+
+def test_breaker_fails_fast_on_a_dead_host_and_probes_after_the_timeout(clock, dead_host, flaky_site):
+    site, state = flaky_site
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    fetcher = Fetcher(
+        use_cache=False, timeout=2, circuit_breaker=breaker,
+        retry_policy=RetryPolicy(attempts=5, sleep=lambda seconds: None)
+    )
+
+    # The second failed attempt opens the breaker, the third attempt is never sent
+    with pytest.raises(CircuitOpenError):
+        fetcher.get(f'{dead_host}/a')
+    assert breaker.open_hosts() == [dead_host]
+    with pytest.raises(CircuitOpenError) as raised:
+        fetcher.get(f'{dead_host}/b')
+    assert raised.value.retry_in == 30
+    # Still a ConnectionError for callers that only know requests' exceptions
+    assert isinstance(raised.value, requests.ConnectionError)
+
+    # Other hosts are unaffected
+    state['failures'] = 0
+    assert fetcher.get(f'{site}/page').status_code == 200
+
+    # After the timeout one probe goes out; it fails and the breaker opens again
+    clock.now += 30
+    with pytest.raises(CircuitOpenError):
+        fetcher.get(f'{dead_host}/c')
+
+    metrics = fetcher.metrics()['circuit_breaker']
+    assert metrics['open'] == [dead_host]
+    assert metrics['hosts'][dead_host]['failures'] == 3
+    assert metrics['hosts'][dead_host]['opened'] == 2
+    assert metrics['hosts'][dead_host]['rejected'] == 3
+    assert metrics['hosts'][site]['state'] == 'closed'
+
+
+def test_half_open_probe_closes_the_breaker_when_the_host_is_back(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+    url = 'http://example.test/a'
+    for _ in range(3):
+        breaker.before_request(url)
+        breaker.record(url, error=requests.ConnectionError())
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(url)
+
+    clock.now += 10
+    breaker.before_request(url)
+    # Only the probe goes through while it is in flight
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(url)
+    breaker.record(url, status=200)
+
+    assert breaker.host(url).state == 'closed'
+    breaker.before_request(url)
+    assert [t['to'] for t in breaker.metrics()['transitions']] == ['open', 'half_open', 'closed']
+
+
+def test_get_many_retries_with_async_backoff(flaky_site):
+    site, state = flaky_site
+    state['failures'] = 1
+    # Six 503s in a row stay below the breaker's threshold
+    fetcher = Fetcher(use_cache=False, retry_policy=RetryPolicy(attempts=3, base_delay=0.01),
+                      circuit_breaker=CircuitBreaker(failure_threshold=8))
+
+    responses = fetcher.get_many([f'{site}/item/{i}' for i in range(6)], concurrency=3)
+    assert [response.status_code for response in responses] == [200] * 6
+    assert fetcher.metrics()['retries']['retries'] == 6
+    assert fetcher.metrics()['circuit_breaker']['open'] == []
+
+
+def test_get_many_fails_fast_once_the_breaker_opens(dead_host):
+    fetcher = Fetcher(use_cache=False, timeout=2, retry_policy=RetryPolicy(attempts=2, base_delay=0.01),
+                      circuit_breaker=CircuitBreaker(failure_threshold=2))
+
+    results = fetcher.get_many([f'{dead_host}/item/{i}' for i in range(8)], concurrency=1)
+    assert all(isinstance(result, Exception) for result in results)
+    assert sum(isinstance(result, CircuitOpenError) for result in results) >= 6
+
+
+def test_batch_analyzer_reports_retries_and_open_breakers(flaky_site, dead_host):
+    site, state = flaky_site
+    state['failures'] = 1
+    batch = BatchAnalyzer(
+        concurrency=2, per_host=1, retry_policy=RetryPolicy(attempts=3, base_delay=0.01),
+        circuit_breaker=CircuitBreaker(failure_threshold=4)
+    )
+    urls = [f'{site}/page/{i}' for i in range(3)] + [f'{dead_host}/page/{i}' for i in range(4)]
+
+    async def collect():
+        return [analysis async for analysis in batch.analyze(urls)]
+
+    results = {analysis['metadata']['url']: analysis for analysis in asyncio.run(collect())}
+    assert all('error' not in results[url] for url in urls[:3])
+    assert all('error' in results[url] for url in urls[3:])
+    assert any('Circuit open' in results[url]['error'] for url in urls[3:])
+
+    metrics = batch.metrics()
+    assert metrics['retries']['recovered'] == 3
+    assert metrics['circuit_breaker']['open'] == [dead_host]
+
+
+def test_runtime_reports_retries_and_breakers_in_its_fetch_metrics():
+    analysis = {
+        'metadata': {'url': 'http://example.test/list', 'domain': 'example.test'},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul > li'}]}
+    }
+    metrics = ScraperRuntime(compile_spec(analysis)).fetch_metrics()
+    assert metrics['retries']['retries'] == 0
+    assert metrics['circuit_breaker']['open'] == []
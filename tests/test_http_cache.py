@@ -0,0 +1,153 @@
+"""
+HTTP Cache Tests
+Cache-Control/Expires freshness, conditional revalidation, the TTL fallback and LRU
+eviction against a local HTTP server
+"""
+
+import sys
+import os
+import time
+from email.utils import formatdate
+from urllib.parse import unquote
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+import requests
+
+from core.http_cache import HTTPCache
+from core.fetcher import Fetcher
+from core.professional_logger import ScraperLogger
+
+
+class _Site:
+    """What the test server answers with, and the requests it saw"""
+    requests_seen = []
+    version = 'v1'
+
+
+def _do_GET(self):
+    _Site.requests_seen.append((self.path, self.headers.get('If-None-Match')))
+    etag = f'"{_Site.version}"'
+
+    if self.path.startswith('/etag') and self.headers.get('If-None-Match') == etag:
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        if '?cc=' in self.path:
+            self.send_header('Cache-Control', unquote(self.path.split('?cc=', 1)[1]))
+        self.end_headers()
+        return
+
+    body = f'<html><body><p>{self.path} {_Site.version}</p>{"x" * 400}</body></html>'.encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    if self.path.startswith('/etag'):
+        self.send_header('ETag', etag)
+    if '?cc=' in self.path:
+        self.send_header('Cache-Control', unquote(self.path.split('?cc=', 1)[1]))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+@pytest.fixture
+def server(serve):
+    _Site.requests_seen = []
+    _Site.version = 'v1'
+    return serve(_do_GET)
+
+
+def test_fresh_entries_are_served_from_disk(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=3600)
+    session = requests.Session()
+
+    first = cache.get(session, f'{server}/etag/a', timeout=5)
+    second = cache.get(session, f'{server}/etag/a', timeout=5)
+
+    assert (first.cache_status, second.cache_status) == ('miss', 'hit')
+    assert second.text == first.text
+    assert second.encoding == 'utf-8'
+    assert len(_Site.requests_seen) == 1
+
+
+def test_stale_entries_revalidate_with_etag(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=0)
+    session = requests.Session()
+
+    first = cache.get(session, f'{server}/etag/a', timeout=5)
+    second = cache.get(session, f'{server}/etag/a', timeout=5)
+    assert second.cache_status == 'revalidated'
+    assert second.status_code == 200 and second.text == first.text
+    assert _Site.requests_seen[-1] == ('/etag/a', '"v1"')
+
+    _Site.version = 'v2'
+    third = cache.get(session, f'{server}/etag/a', timeout=5)
+    assert third.cache_status == 'miss'
+    assert 'v2' in third.text
+    assert cache.lookup(f'{server}/etag/a')['etag'] == '"v2"'
+
+
+def test_cache_control_and_expires_override_the_ttl(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=3600)
+    session = requests.Session()
+
+    # no-cache and max-age=0 are revalidated on every use despite the long TTL
+    for directive in ('no-cache', 'max-age=0', 'private,%20max-age=0'):
+        url = f'{server}/etag/{directive}?cc={directive}'
+        cache.get(session, url, timeout=5)
+        assert cache.get(session, url, timeout=5).cache_status == 'revalidated'
+
+    # A short max-age expires before the TTL would
+    cache.get(session, f'{server}/etag/short?cc=max-age=1', timeout=5)
+    assert cache.get(session, f'{server}/etag/short?cc=max-age=1', timeout=5).cache_status == 'hit'
+    time.sleep(1.1)
+    assert cache.get(session, f'{server}/etag/short?cc=max-age=1', timeout=5).cache_status == 'revalidated'
+
+    # A long s-maxage is honored with a TTL of 0; no freshness information falls back to the TTL
+    cache.ttl = 0
+    cache.get(session, f'{server}/etag/long?cc=s-maxage=600,%20max-age=0', timeout=5)
+    assert cache.get(session, f'{server}/etag/long?cc=s-maxage=600,%20max-age=0', timeout=5).cache_status == 'hit'
+    cache.get(session, f'{server}/etag/plain', timeout=5)
+    assert cache.get(session, f'{server}/etag/plain', timeout=5).cache_status == 'revalidated'
+
+
+def test_expires_and_age_headers_set_the_lifetime(tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=3600)
+    now = time.time()
+
+    def entry(**headers):
+        return {'headers': headers, 'stored_at': now - 10}
+
+    assert cache.is_fresh(entry(Date=formatdate(now - 10, usegmt=True), Expires=formatdate(now + 60, usegmt=True)))
+    assert not cache.is_fresh(entry(Date=formatdate(now - 10, usegmt=True), Expires=formatdate(now - 1, usegmt=True)))
+    assert not cache.is_fresh(entry(Expires='0'))
+    assert not cache.is_fresh(entry(**{'Cache-Control': 'max-age=60', 'Age': '55'}))
+    assert cache.is_fresh(entry(**{'Cache-Control': 'max-age=60', 'Age': '5'}))
+    assert cache.is_fresh(entry())
+
+
+def test_lru_eviction_keeps_cache_under_size_cap(server, tmp_path):
+    cache = HTTPCache(str(tmp_path), ttl=3600, max_bytes=1200)
+    session = requests.Session()
+
+    for name in ['a', 'b', 'c']:
+        cache.get(session, f'{server}/plain/{name}', timeout=5)
+    # Touch 'a' so 'b' becomes the least recently used entry
+    cache.get(session, f'{server}/plain/a', timeout=5)
+    cache.get(session, f'{server}/plain/d', timeout=5)
+
+    assert cache.total_size() <= 1200
+    assert cache.lookup(f'{server}/plain/a') is not None
+    assert cache.lookup(f'{server}/plain/b') is None
+    assert cache.stats['evicted'] >= 1
+
+
+def test_fetcher_reports_cache_counters_to_logger(server, tmp_path):
+    logger = ScraperLogger('cache_test', log_dir=str(tmp_path / 'logs'))
+    fetcher = Fetcher(cache=HTTPCache(str(tmp_path / 'cache'), ttl=3600), logger=logger)
+
+    for _ in range(3):
+        fetcher.get(f'{server}/etag/a')
+
+    stats = logger.get_stats()
+    assert (stats['cache_misses'], stats['cache_hits']) == (1, 2)
+    logger.close()
@@ -0,0 +1,178 @@
+"""
+Incremental Scrape Tests
+Re-runs that skip unchanged pages without parsing them (by content hash or a
+304 to the stored validators), emit only new or changed records, keep
+pagination going through skipped pages and summarize what changed
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.crawl_checkpoint import CrawlCheckpoint
+from core.extraction_spec import compile_spec
+from core.incremental_state import IncrementalState, content_hash, record_hash
+from core.record_sinks import read_records
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner
+from core.scraper_runtime import ScraperRuntime
+
+
+class ParseCounter:
+    """Counts the pages a runtime parses"""
+
+    def __init__(self, runtime):
+        self.count = 0
+        parse_page = runtime.parse_page
+
+        def counting(html):
+            self.count += 1
+            return parse_page(html)
+        runtime.parse_page = counting
+
+
+def _run(analysis, state_path, key_fields=('link',)):
+    runtime = ScraperRuntime(compile_spec(analysis, max_pages=20, rate_limit=0))
+    runtime.fetcher.cache = None
+    runtime.rate_limiter.respect_robots = False
+    runtime.set_incremental(state_path, key_fields=list(key_fields))
+    parses = ParseCounter(runtime)
+    records = runtime.scrape()
+    return records, runtime.change_summary, parses.count
+
+
+def test_content_hash_ignores_formatting_and_record_hash_ignores_key_order():
+    assert content_hash('<p>a</p>\n  <!-- built 12:00 -->\n<p>b</p>') == content_hash(b'<p>a</p><p>b</p>')
+    assert content_hash('<p>a</p>') != content_hash('<p>b</p>')
+    assert record_hash({'a': 1, 'b': [2]}) == record_hash({'b': [2], 'a': 1})
+
+
+@pytest.mark.parametrize('pagination', ['numbered', 'next_links'])
+def test_unchanged_pages_are_skipped_and_only_changes_emitted(shop, shop_analysis, tmp_path, pagination):
+    _, state = shop
+    state_path = str(tmp_path / 'pages.sqlite')
+
+    records, summary, parsed = _run(shop_analysis(pagination), state_path)
+    assert len(records) == 18
+    assert summary['pages']['new'] == 6
+    assert summary['records']['new'] == 18
+
+    # Nothing changed (only the comment): no page is parsed, yet the crawl walks the whole listing
+    state['stamp'] += 1
+    state['requests'].clear()
+    records, summary, parsed = _run(shop_analysis(pagination), state_path)
+    assert records == []
+    # Numbered pagination also fetches (and parses) the empty page past the end
+    past_end = 1 if pagination == 'numbered' else 0
+    assert parsed == past_end
+    assert set(state['requests']) >= {1, 2, 3, 4, 5, 6}
+    assert summary['pages'] == {'new': 0, 'changed': 0, 'unchanged': 6, 'not_modified': 0}
+    assert summary['records']['unchanged'] == 18
+
+    # One price edited, one page added: only those records come out
+    state['prices']['3-1'] = 99
+    state['pages'] = 7
+    records, summary, parsed = _run(shop_analysis(pagination), state_path)
+    assert sorted(record['text'] for record in records) == [
+        'Item 3-199 EUR', 'Item 7-070 EUR', 'Item 7-171 EUR', 'Item 7-272 EUR'
+    ]
+    assert summary['records'] == {'new': 3, 'changed': 1, 'unchanged': 17, 'removed': 0}
+    # Page 3 changed; page 6 gained a next link (its records are unchanged)
+    assert summary['pages'] == {'new': 1, 'changed': 2, 'unchanged': 4, 'not_modified': 0}
+    assert parsed == 3 + past_end
+
+
+def test_validators_turn_unchanged_pages_into_304s(shop, shop_analysis, tmp_path):
+    _, state = shop
+    state['etags'] = True
+    state_path = str(tmp_path / 'pages.sqlite')
+    _run(shop_analysis('numbered'), state_path)
+
+    records, summary, parsed = _run(shop_analysis('numbered'), state_path)
+    assert records == []
+    assert parsed == 1  # The empty page past the end
+    assert state['not_modified'] == 6
+    assert summary['pages']['not_modified'] == 6
+    assert summary['pages']['unchanged'] == 6
+
+
+def test_removed_records_are_reported_and_forgotten(shop, shop_analysis, tmp_path):
+    _, state = shop
+    state_path = str(tmp_path / 'pages.sqlite')
+    _run(shop_analysis('next_links'), state_path, key_fields=())
+
+    state['pages'] = 4
+    records, summary, _ = _run(shop_analysis('next_links'), state_path, key_fields=())
+    assert records == []
+    # Page 4 lost its next link; pages 5 and 6 are no longer reached, so their records are kept
+    assert summary['records']['removed'] == 0
+
+    # Without key fields every record is identified by its content: an edit is a new record plus a removed one
+    state['prices']['2-0'] = 5
+    records, summary, _ = _run(shop_analysis('next_links'), state_path, key_fields=())
+    assert [record['text'] for record in records] == ['Item 2-05 EUR']
+    assert summary['records']['new'] == 1
+    assert summary['records']['removed'] == 1
+
+    with IncrementalState(state_path) as saved:
+        assert [run['records']['new'] for run in saved.previous_runs()] == [18, 0, 1]
+
+
+def test_interrupted_incremental_crawl_resumes_without_losing_changes(shop, shop_analysis, tmp_path):
+    _, state = shop
+    state_path = str(tmp_path / 'pages.sqlite')
+    _run(shop_analysis('next_links'), state_path)
+
+    # Every price changes; the crawl dies after page 4 was recorded but before its checkpoint
+    state['prices'] = {f'{page}-{i}': 1 for page in range(1, 7) for i in range(3)}
+    checkpoint_path = str(tmp_path / 'crawl.checkpoint.json')
+    runtime = ScraperRuntime(compile_spec(shop_analysis('next_links'), max_pages=20, rate_limit=0))
+    runtime.fetcher.cache = None
+    runtime.rate_limiter.respect_robots = False
+    runtime.set_incremental(state_path, key_fields=['link'])
+    runtime.set_checkpoint(CrawlCheckpoint(checkpoint_path, interval=0))
+    emit = runtime.emit
+
+    def dying_emit(items):
+        if items and items[0]['text'].startswith('Item 4-'):
+            raise RuntimeError('killed')
+        emit(items)
+    runtime.emit = dying_emit
+    with pytest.raises(RuntimeError):
+        runtime.scrape()
+    runtime.incremental.close()
+
+    resumed = ScraperRuntime(compile_spec(shop_analysis('next_links'), max_pages=20, rate_limit=0))
+    resumed.fetcher.cache = None
+    resumed.rate_limiter.respect_robots = False
+    resumed.set_incremental(state_path, key_fields=['link'])
+    resumed.set_checkpoint(checkpoint_path, interval=0)
+    records = resumed.scrape(resume=True)
+
+    # Page 4 was never committed to the state, so its changes are emitted by the resumed run
+    assert [record['text'][:8] for record in records] == [f'Item {page}-{i}' for page in (4, 5, 6) for i in range(3)]
+    assert resumed.change_summary['records']['changed'] == 18
+
+
+def test_runner_returns_only_changes_and_their_summary(shop, shop_analysis, tmp_path):
+    site, state = shop
+    scraper_path = ScraperGenerator(shop_analysis('next_links')).generate_full_scraper(
+        str(tmp_path / 'shop_scraper.py'), max_pages=20, rate_limit=0
+    )
+    state_path = str(tmp_path / 'pages.sqlite')
+    csv_path = str(tmp_path / 'items.csv')
+
+    for mode in ('inprocess', 'subprocess'):
+        runner = ScraperRunner(scraper_path, mode=mode, cwd=str(tmp_path), outputs=[csv_path], incremental=state_path)
+        result = runner.run(url=f'{site}/list')
+        if mode == 'inprocess':
+            assert len(result['records']) == 18
+            assert result['changes']['pages']['new'] == 6
+            state['prices']['5-2'] = 1
+        else:
+            assert [record['text'] for record in result['records']] == ['Item 5-21 EUR']
+            assert [record['text'] for record in read_records(csv_path)] == ['Item 5-21 EUR']
+            assert result['changes']['records']['new'] == 1
+            assert result['changes']['pages']['unchanged'] == 5
@@ -0,0 +1,46 @@
+"""
+Keyword Scorer Tests
+Checks the automaton against str.count() semantics
+"""
+
+import sys
+import os
+import random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collections import Counter
+
+from core.keyword_scorer import KeywordAutomaton, KeywordScorer
+from core.intelligent_analyzer_v2 import IntelligentAnalyzerV2
+
+
+def test_automaton_matches_str_count_on_random_text():
+    keywords = ['aa', 'aba', 'ab', 'b', 'bab', 'cart', 'art', 'load more']
+    automaton = KeywordAutomaton(keywords)
+    rng = random.Random(7)
+
+    for _ in range(300):
+        text = ''.join(rng.choice('abc tr') for _ in range(rng.randint(0, 60)))
+        counts = automaton.count(text)
+        for keyword in keywords:
+            assert counts[keyword] == text.count(keyword), (keyword, text)
+
+
+def test_scorer_matches_per_keyword_counts_for_site_patterns():
+    scorer = KeywordScorer(IntelligentAnalyzerV2.PATTERNS)
+    text = ('Breaking news: product prices drop! Shop the cart, buy now. '
+            'Postal jobs, job-board careers, document api reference guide. ' * 20).lower()
+
+    counts = scorer.count_text(text)
+    for keywords in IntelligentAnalyzerV2.PATTERNS.values():
+        for keyword in keywords:
+            assert counts[keyword] == text.count(keyword), keyword
+
+
+def test_vocabulary_counts_are_weighted_by_frequency():
+    scorer = KeywordScorer({'shop': ['product', 'cart']})
+    counts = scorer.count_vocabulary(Counter({'Product-Card': 3, 'add-cart': 2, 'cartcart': 1}))
+
+    assert counts['product'] == 3
+    assert counts['cart'] == 4
+    assert scorer.category_scores([(counts, 5)]) == {'shop': 35}
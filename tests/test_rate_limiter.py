@@ -0,0 +1,120 @@
+"""
+Rate Limiter Tests
+Token bucket pacing, burst allowance, Retry-After and robots.txt Crawl-delay/Request-rate
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.fetcher import Fetcher
+from core.rate_limiter import RateLimiter, TokenBucket, parse_retry_after
+
+
+def test_bucket_allows_burst_then_paces_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+    delays = [bucket.reserve() for _ in range(6)]
+    assert delays == [0, 0, 0, 0.5, 1.0, 1.5]
+
+    # After an idle period the burst is available again
+    clock.now += 10
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+
+
+def test_concurrent_workers_run_at_exactly_the_allowed_rate():
+    limiter = RateLimiter(rate=20, burst=1, respect_robots=False)
+    starts = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            limiter.wait('http://example.test/page')
+            with lock:
+                starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    starts.sort()
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert len(starts) == 20
+    assert min(gaps) > 0.04
+    # 20 requests at 20/s take 19 intervals, not 20 sleeps per worker
+    assert starts[-1] - starts[0] == pytest.approx(0.95, abs=0.15)
+
+
+def test_retry_after_pauses_only_that_host(clock):
+    limiter = RateLimiter(rate=100, burst=5, respect_robots=False, clock=clock)
+
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412470) == 10
+    assert parse_retry_after('soon') is None
+
+    limiter.retry_after('http://slow.test/a', '30')
+    assert limiter.bucket('http://slow.test/b').reserve() == 30
+    assert limiter.bucket('http://fast.test/a').reserve() == 0
+
+
+def test_robots_crawl_delay_slows_the_host_and_disables_bursts(clock):
+    limiter = RateLimiter(rate=10, burst=4, clock=clock)
+    robots = 'User-agent: *\nCrawl-delay: 2\n\nUser-agent: FastBot\nCrawl-delay: 0\n'
+
+    assert limiter.apply_robots('http://polite.test/', robots, 'Mozilla/5.0') == 2
+    bucket = limiter.bucket('http://polite.test/list')
+    assert (bucket.interval, bucket.burst) == (2, 1)
+    assert [bucket.reserve() for _ in range(3)] == [0, 2, 4]
+
+    # A robots.txt can only slow a host down, never speed it up
+    assert limiter.apply_robots('http://polite.test/', 'User-agent: *\nRequest-rate: 100/1\n') == 0.01
+    assert bucket.interval == 2
+
+
+@pytest.fixture
+def polite_site(serve):
+    hits = []
+
+    def do_GET(self):
+        hits.append(self.path)
+        if self.path == '/robots.txt':
+            body = b'User-agent: *\nRequest-rate: 5/1\n'
+        elif self.path == '/busy':
+            self.send_response(429)
+            self.send_header('Retry-After', '2')
+            self.end_headers()
+            return
+        else:
+            body = b'<html><body>ok</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), hits
+
+
+def test_fetcher_honors_robots_request_rate_and_retry_after(polite_site):
+    site, hits = polite_site
+    limiter = RateLimiter(rate=50, burst=5)
+    fetcher = Fetcher(use_cache=False, rate_limiter=limiter)
+
+    start = time.monotonic()
+    for page in range(3):
+        fetcher.get(f'{site}/page/{page}')
+    elapsed = time.monotonic() - start
+
+    assert hits[0] == '/robots.txt'
+    assert limiter.bucket(site).interval == pytest.approx(0.2)
+    assert limiter.bucket(site).burst == 1
+    assert elapsed >= 0.35
+
+    fetcher.get(f'{site}/busy')
+    assert limiter.stats['retry_after'] == 1
+    assert limiter.bucket(site).reserve() > 1.5
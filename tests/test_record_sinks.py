@@ -0,0 +1,148 @@
+"""
+Record Sink Tests
+Streaming CSV/JSON Lines output (plain and gzip), Parquet/Feather row groups,
+partial output of interrupted crawls and constant-memory scraping into files
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+import pytest
+
+from core.extraction_spec import compile_spec
+from core.record_sinks import COLUMNAR_AVAILABLE, open_sink, read_records
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner
+from core.scraper_runtime import ScraperRuntime
+
+
+RECORDS = [
+    {'title': 'Lamp', 'links': ['/a', '/b'], 'price': '30'},
+    {'title': 'Desk, oak', 'price': '120'},
+    # New columns after the header was written
+    {'title': 'Chair', 'classes': ['card', 'sale'], 'note': 'two\nlines'},
+    {'title': 'Été', 'price': None}
+]
+
+
+@pytest.mark.parametrize('name', ['items.csv', 'items.csv.gz'])
+def test_csv_sink_matches_dataframe_to_csv(tmp_path, name):
+    path = str(tmp_path / name)
+    with open_sink(path, buffer_records=1) as sink:
+        sink.write_many(RECORDS)
+
+    expected = tmp_path / 'pandas.csv'
+    pd.DataFrame(RECORDS).to_csv(expected, index=False, encoding='utf-8-sig')
+
+    pd.testing.assert_frame_equal(
+        pd.read_csv(path, encoding='utf-8-sig'),
+        pd.read_csv(expected, encoding='utf-8-sig')
+    )
+    assert [record['title'] for record in read_records(path)] == ['Lamp', 'Desk, oak', 'Chair', 'Été']
+
+
+@pytest.mark.parametrize('name', ['items.csv', 'items.csv.gz'])
+def test_csv_sink_rewrites_the_file_once_however_often_columns_are_added(tmp_path, name):
+    path = str(tmp_path / name)
+    records = [{'title': f'Item {i}', f'spec_{i}': str(i)} for i in range(50)]
+    sink = open_sink(path, buffer_records=1)
+    sink.write_many(records[:20])
+    state = sink.checkpoint()
+    sink.write_many(records[20:])
+    sink.flush()
+
+    # Open: the file keeps its first header, the rest waits in the sidecar and reads back in order
+    assert sink.header == ['title', 'spec_0'] and len(sink.columns) == 51
+    assert list(read_records(path)) == records
+
+    resumed = open_sink(path, buffer_records=1)
+    resumed.resume(state)
+    resumed.write_many(records[20:])
+    resumed.close()
+    assert sorted(os.listdir(tmp_path)) == [name]
+    expected = tmp_path / 'pandas.csv'
+    pd.DataFrame(records).to_csv(expected, index=False, encoding='utf-8-sig')
+    pd.testing.assert_frame_equal(pd.read_csv(path, encoding='utf-8-sig'), pd.read_csv(expected, encoding='utf-8-sig'))
+
+
+@pytest.mark.skipif(not COLUMNAR_AVAILABLE, reason='pyarrow is not installed')
+@pytest.mark.parametrize('name', ['items.parquet', 'items.feather'])
+def test_columnar_sink_loads_like_the_csv_export(tmp_path, name):
+    records = [{'title': f'Item {i}', 'rank': str(i), 'price': f'{i}.5'} for i in range(5)]
+    # A row group later widens 'rank' to float, adds a column and holds a non-numeric price
+    records += [{'title': 'Odd', 'rank': '2.5', 'price': 'call', 'badge': 'sale'}, {'title': 'Last'}]
+
+    path = str(tmp_path / name)
+    csv_path = str(tmp_path / 'items.csv')
+    for target in [path, csv_path]:
+        with open_sink(target, buffer_records=5) as sink:
+            sink.write_many(records)
+
+    expected = pd.read_csv(csv_path, encoding='utf-8-sig')
+    loaded = pd.read_parquet(path) if name.endswith('.parquet') else pd.read_feather(path)
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert list(read_records(path))[5] == {'title': 'Odd', 'rank': 2.5, 'price': 'call', 'badge': 'sale'}
+
+    # Column pruning reads only what the analysis needs
+    pruned = pd.read_parquet(path, columns=['title']) if name.endswith('.parquet') else \
+        pd.read_feather(path, columns=['title'])
+    assert list(pruned.columns) == ['title']
+
+
+@pytest.mark.parametrize('name', ['items.jsonl', 'items.jsonl.gz'])
+def test_flushed_records_survive_an_interrupted_write(tmp_path, name):
+    path = str(tmp_path / name)
+    sink = open_sink(path, buffer_records=2)
+    sink.write_many(RECORDS[:3])
+
+    # Never closed, as when the process is killed: the first full buffer is on disk
+    assert list(read_records(path)) == RECORDS[:2]
+
+    sink.close()
+    assert list(read_records(path)) == RECORDS[:3]
+
+    if not name.endswith('.gz'):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"title": "cut of')
+        assert len(list(read_records(path))) == 3
+
+
+def test_scrape_to_files_streams_without_keeping_records(shop, shop_analysis, tmp_path):
+    site, state = shop
+    state['pages'] = 40
+    runtime = ScraperRuntime(compile_spec(shop_analysis('next_links'), max_pages=40, rate_limit=0))
+    runtime.fetcher.cache = None
+
+    outputs = [str(tmp_path / 'items.csv.gz'), str(tmp_path / 'items.jsonl')]
+    if COLUMNAR_AVAILABLE:
+        outputs.append(str(tmp_path / 'items.parquet'))
+    assert runtime.scrape_to_files(outputs) == outputs
+
+    assert runtime.data == []
+    assert runtime.record_count == 120
+    assert runtime.get_summary()['columns'] == ['text', 'link', 'link_text']
+    for path in outputs:
+        records = list(read_records(path))
+        assert len(records) == 120
+        assert records[-1] == {'text': 'Item 40-2402 EUR', 'link': f'{site}/item/40-2', 'link_text': 'Item 40-2'}
+
+
+def test_subprocess_timeout_keeps_the_records_extracted_so_far(shop, shop_analysis, tmp_path):
+    site, state = shop
+    state['pages'] = 40
+    state['stall_from'] = 4
+    scraper_path = ScraperGenerator(shop_analysis('next_links')).generate_full_scraper(
+        str(tmp_path / 'site_scraper.py'), max_pages=40, rate_limit=0
+    )
+    csv_path = str(tmp_path / 'items.csv')
+
+    runner = ScraperRunner(scraper_path, mode='subprocess', timeout=8, cwd=str(tmp_path), outputs=[csv_path])
+    result = runner.run(url=f'{site}/list')
+
+    assert result['timed_out']
+    assert [record['text'] for record in result['records']] == [
+        f'Item {page}-{i}{10 * page + i} EUR' for page in range(1, 4) for i in range(3)
+    ]
+    assert 'timed out' in result['output']
@@ -0,0 +1,90 @@
+"""
+Scraper Runner Tests
+Generated scrapers loaded in-process and run on an already-fetched page
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pandas as pd
+import pytest
+
+from core.fetcher import Fetcher
+from core.intelligent_analyzer import IntelligentAnalyzer
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner, load_scraper, records_to_dataframe
+
+
+PAGE = (
+    '<html><head><title>Quotes</title></head><body><div class="container">'
+    + ''.join(
+        f'<div class="quote"><span class="text">Quote {i}</span>'
+        f'<a href="/author/{i}">Author {i}</a></div>'
+        for i in range(6)
+    )
+    + '</div></body></html>'
+).encode('utf-8')
+
+
+@pytest.fixture
+def site(serve):
+    hits = []
+
+    def do_GET(self):
+        hits.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    return serve(do_GET) + '/', hits
+
+
+def test_first_page_is_extracted_from_the_analysis_fetch(site, tmp_path):
+    url, hits = site
+
+    analyzer = IntelligentAnalyzer(url, fetcher=Fetcher(use_cache=False))
+    analysis = analyzer.run_full_analysis()
+    scraper_path = ScraperGenerator(analysis).generate_full_scraper(str(tmp_path / 'site_scraper.py'))
+    assert hits == ['/']
+
+    scraper = load_scraper(scraper_path)
+    scraper.fetcher = None  # Plain session, so a refetch would reach the test server
+    items = scraper.scrape(html=analyzer.response.content)
+
+    assert hits == ['/']
+    assert len(items) == 6
+    assert items == scraper.extract_data(scraper.fetch_page(url))
+
+
+def test_inprocess_and_subprocess_modes_return_the_same_records(site, tmp_path):
+    url, hits = site
+
+    analyzer = IntelligentAnalyzer(url, fetcher=Fetcher(use_cache=False))
+    analysis = analyzer.run_full_analysis()
+    scraper_path = ScraperGenerator(analysis).generate_full_scraper(str(tmp_path / 'site_scraper.py'))
+
+    inprocess = ScraperRunner(scraper_path).run(html=analyzer.response.content)
+    isolated = ScraperRunner(scraper_path, mode='subprocess', cwd=str(tmp_path)).run(html=analyzer.response.content)
+
+    assert hits == ['/']
+    assert inprocess['records'] == isolated['records']
+    assert len(inprocess['records']) == 6
+    pd.testing.assert_frame_equal(inprocess['dataframe'], isolated['dataframe'])
+
+
+def test_dataframe_matches_csv_round_trip(tmp_path):
+    records = [
+        {'title': 'A', 'price': '10', 'rating': '4.5', 'links': ['/a', '/b'], 'note': ''},
+        {'title': 'B', 'price': '12', 'rating': '', 'classes': ['card']},
+    ]
+
+    csv_path = tmp_path / 'records.csv'
+    pd.DataFrame(records).to_csv(csv_path, index=False, encoding='utf-8-sig')
+
+    pd.testing.assert_frame_equal(
+        records_to_dataframe(records),
+        pd.read_csv(csv_path, encoding='utf-8-sig')
+    )
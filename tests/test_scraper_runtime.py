@@ -0,0 +1,247 @@
+"""
+Scraper Runtime Tests
+Spec compilation, field semantics, lxml/BeautifulSoup parity, diffing, hot reload
+and pagination crawling
+"""
+
+import sys
+import os
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+import requests
+
+from core.extraction_spec import compile_spec, diff_specs, infer_url_template, load_spec, save_spec, spec_hash
+from core.fetcher import Fetcher
+from core.intelligent_analyzer_v2 import IntelligentAnalyzerV2
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import load_scraper
+from core.scraper_runtime import ScraperRuntime
+
+
+BASE_URL = 'https://shop.example.com/catalog/'
+
+LIST_PAGE = (
+    '<html><body><ul class="products">'
+    '<li data-sku="A1"><a href="/p/1">First</a> in stock <img src="img/1.png" alt="one"></li>'
+    '<li>No link here</li>'
+    '</ul></body></html>'
+)
+
+CARD_PAGE = (
+    '<html><body>'
+    '<div class="card"><h3>Lamp</h3><p>Warm light</p><a href="/p/lamp">View</a><a href="#reviews">Reviews</a></div>'
+    '<div class="card"><h3>Desk</h3><p>Oak</p></div>'
+    '<div class="card"></div>'
+    '</body></html>'
+)
+
+
+def _analysis(selectors, pagination=None):
+    return {
+        'metadata': {'url': BASE_URL, 'domain': 'shop.example.com'},
+        'semantic_analysis': {'pagination': pagination or {'detected': False}},
+        'scraping_strategy': {'selectors': selectors}
+    }
+
+
+def _runtime(spec):
+    return ScraperRuntime(spec, fetcher=Fetcher(use_cache=False))
+
+
+def test_list_items_keep_generated_field_semantics():
+    spec = compile_spec(_analysis([{'type': 'list_items', 'selector': 'ul > li'}]))
+    runtime = _runtime(spec)
+
+    items = runtime.extract_data(runtime.parse_page(LIST_PAGE))
+
+    assert items == [
+        {
+            'text': 'Firstin stock',
+            'link': 'https://shop.example.com/p/1',
+            'link_text': 'First',
+            'image': 'https://shop.example.com/catalog/img/1.png',
+            'image_alt': 'one',
+            'data-sku': 'A1'
+        },
+        {'text': 'No link here'}
+    ]
+    assert list(items[0]) == ['text', 'link', 'link_text', 'image', 'image_alt', 'data-sku']
+
+
+def test_v2_card_and_table_selectors_compile_to_rules():
+    spec = compile_spec(_analysis(
+        [{'type': 'card_elements', 'selector': 'div.card'}, {'type': 'table', 'selector': 'table'}],
+        pagination={'detected': True, 'type': 'numbered', 'sample_urls': ['?page=2']}
+    ))
+    assert [rule['type'] for rule in spec['rules']] == ['repeated_items', 'table']
+    assert spec['pagination']['url_template'] == '?page={page}'
+    assert spec['pagination']['max_pages'] == 1
+
+    runtime = _runtime(spec)
+    page = CARD_PAGE.replace('</body>', (
+        '<table><tr><th>Name</th><th>Price</th></tr>'
+        '<tr><td>Lamp</td><td>30</td></tr><tr><td>Desk</td><td>120</td></tr></table></body>'
+    ))
+    items = runtime.extract_data(runtime.parse_page(page))
+
+    # Empty cards are dropped, as the generated scrapers did
+    assert items == [
+        {
+            'content': 'LampWarm lightViewReviews',
+            'title': 'Lamp',
+            'links': ['https://shop.example.com/p/lamp', 'https://shop.example.com/catalog/#reviews'],
+            'classes': ['card']
+        },
+        {'content': 'DeskOak', 'title': 'Desk', 'classes': ['card']},
+        {'Name': 'Lamp', 'Price': '30'},
+        {'Name': 'Desk', 'Price': '120'}
+    ]
+
+
+def test_generated_scraper_runs_the_spec_file_and_hot_reloads(tmp_path):
+    analysis = _analysis([{'type': 'list_items', 'selector': 'ul > li'}])
+    scraper_path = ScraperGenerator(analysis).generate_full_scraper(str(tmp_path / 'shop_scraper.py'))
+    spec_path = tmp_path / 'shop_scraper_spec.json'
+
+    scraper = load_scraper(scraper_path)
+    assert len(scraper.scrape(html=LIST_PAGE)) == 2
+
+    edited = load_spec(str(spec_path))
+    edited['rules'][0]['selector'] = 'ul > li[data-sku]'
+    save_spec(edited, str(spec_path))
+    # Make sure the edit is visible even on filesystems with coarse mtimes
+    stamp = time.time() + 5
+    os.utime(spec_path, (stamp, stamp))
+
+    assert len(scraper.scrape(html=LIST_PAGE)) == 1
+    assert spec_hash(scraper.spec) == spec_hash(edited)
+
+
+def test_lxml_engine_matches_beautifulsoup_records():
+    page = (
+        '<html><body><ul class="menu">'
+        '<li data-id="1">Top &amp; more <a href="/t" rel="nofollow next">t</a>'
+        '<ul><li><a href="/n1">n1</a><img src="n1.png"></li><li>&eacute;t&eacute; &#169;</li></ul></li>'
+        '<li>Second<!-- hidden --> part<script>track()</script><style>li {}</style></li>'
+        '</ul>'
+        '<table><tr><th>Name</th><th></th></tr><tr><td>Lamp</td><td><b>30</b> EUR</td><td>x</td></tr></table>'
+        '</body></html>'
+    ).encode('utf-8')
+    spec = compile_spec(_analysis([
+        {'type': 'list_items', 'selector': 'ul li'},
+        {'type': 'card_elements', 'selector': 'ul.menu > li'},
+        {'type': 'table', 'selector': 'table'}
+    ]))
+    spec['rules'][0]['fields'].append({'name': 'rel', 'source': 'a[rel]', 'value': 'attr:rel'})
+
+    records = {}
+    for engine in ['bs4', 'lxml']:
+        runtime = ScraperRuntime(spec, fetcher=Fetcher(use_cache=False), engine=engine)
+        records[engine] = runtime.extract_data(runtime.parse_page(page))
+
+    # Serialized, so key order (CSV column order) is compared as well
+    assert json.dumps(records['lxml']) == json.dumps(records['bs4'])
+    assert records['lxml'][0]['rel'] == ['nofollow', 'next']
+    assert len(records['lxml']) == 7
+
+
+def test_spec_diff_and_hash():
+    old = compile_spec(_analysis([{'type': 'list_items', 'selector': 'ul > li'}]))
+    new = json.loads(json.dumps(old))
+    new['rules'][0]['selector'] = 'ol > li'
+
+    assert spec_hash(old) == spec_hash(json.loads(json.dumps(old, sort_keys=True)))
+    assert spec_hash(old) != spec_hash(new)
+    assert diff_specs(old, new) == [('rules[0].selector', 'ul > li', 'ol > li')]
+
+
+def test_invalid_specs_are_rejected():
+    spec = compile_spec(_analysis([{'type': 'list_items', 'selector': 'ul > li'}]))
+    spec['rules'][0]['fields'].append({'name': 'price', 'value': 'regex'})
+
+    with pytest.raises(ValueError):
+        ScraperRuntime(spec)
+
+
+def test_sampled_page_numbers_are_not_mistaken_for_offsets():
+    # Widgets that skip pages still number them
+    assert infer_url_template(['/list?page=2', '/list?page=4', '/list?page=6']) == ('/list?page={page}', 1)
+    assert infer_url_template(['/list/page/3', '/list/page/30']) == ('/list/page/{page}', 1)
+    assert infer_url_template(['/list/2', '/list/4']) == ('/list/{page}', 1)
+    # Offsets: behind an offset parameter, starting at 0, or far apart
+    assert infer_url_template(['/list?start=20', '/list?start=40']) == ('/list?start={page}', 20)
+    assert infer_url_template(['/list?skip=2', '/list?skip=4']) == ('/list?skip={page}', 2)
+    assert infer_url_template(['/list?o=0', '/list?o=24']) == ('/list?o={page}', 24)
+    assert infer_url_template(['/list/20', '/list/40']) == ('/list/{page}', 20)
+
+
+def _listing_page(page, last_page, numbered=True):
+    items = ''.join(f'<li><a href="/item/{page}-{i}">Item {page}-{i}</a></li>' for i in range(3))
+    if numbered:
+        nav = ''.join(f'<a href="/list?page={n}">{n}</a>' for n in range(1, last_page + 1))
+    else:
+        nav = f'<a href="/next-{page + 1}">Next »</a>' if page < last_page else ''
+    return f'<html><body><ul class="items">{items}</ul><div class="pagination">{nav}</div></body></html>'
+
+
+@pytest.fixture
+def listing_site(serve):
+    hits = []
+
+    def do_GET(self):
+        hits.append(self.path)
+        query = parse_qs(urlparse(self.path).query)
+        if self.path.startswith('/next-'):
+            page, numbered = int(self.path.split('-')[1]), False
+        else:
+            page, numbered = int(query.get('page', ['1'])[0]), True
+
+        if page > 5:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = _listing_page(page, 5, numbered).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), hits
+
+
+def test_numbered_pagination_is_fetched_concurrently_from_the_url_template(listing_site):
+    site, hits = listing_site
+    analyzer = IntelligentAnalyzerV2(f'{site}/list', fetcher=Fetcher(use_cache=False))
+    analysis = analyzer.run_full_analysis()
+
+    spec = compile_spec(analysis, max_pages=10)
+    assert spec['pagination']['url_template'] == '/list?page={page}'
+
+    runtime = _runtime(spec)
+    items = runtime.scrape(url=f'{site}/list', html=analyzer.response.content)
+
+    assert len(items) == 15
+    assert items[-1]['links'] == [f'{site}/item/5-2']
+    # Pages go out in waves of 4, so the crawl overshoots the last page by at most one wave
+    assert sorted(hits[1:]) == sorted(f'/list?page={page}' for page in range(2, 10))
+
+
+def test_next_links_are_followed_when_urls_are_not_predictable(listing_site):
+    site, hits = listing_site
+    spec = compile_spec(_analysis(
+        [{'type': 'list_items', 'selector': 'ul.items > li'}],
+        pagination={'detected': True, 'type': 'next_prev'}
+    ), max_pages=3)
+    assert spec['pagination']['url_template'] is None
+
+    runtime = _runtime(spec)
+    runtime.fetch_page = lambda url=None: runtime.parse_page(requests.get(url, timeout=5).content)
+    items = runtime.scrape(url=f'{site}/next-1', html=_listing_page(1, 5, numbered=False))
+
+    assert len(items) == 9
+    assert hits == ['/next-2', '/next-3']
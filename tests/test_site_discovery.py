@@ -0,0 +1,220 @@
+"""
+Site Discovery Tests
+lastmod parsing, streaming (gzipped) sitemaps in bounded memory, robots.txt
+rules cached per host with a TTL, and sitemap discovery into the frontier
+with lastmod-based incremental skipping
+"""
+
+import sys
+import os
+import gzip
+import io
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.batch_analyzer import crawl_site_to_dir
+from core.fetcher import Fetcher
+from core.rate_limiter import RateLimiter
+from core.site_discovery import RobotsCache, SiteDiscovery, iter_sitemap, parse_lastmod
+from core.url_frontier import URLFrontier
+
+
+def _urlset(entries):
+    urls = ''.join(
+        f'<url><loc>{loc}</loc>' + (f'<lastmod>{lastmod}</lastmod>' if lastmod else '') + '</url>'
+        for loc, lastmod in entries
+    )
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>').encode('utf-8')
+
+
+def _index(entries):
+    sitemaps = ''.join(f'<sitemap><loc>{loc}</loc><lastmod>{lastmod}</lastmod></sitemap>' for loc, lastmod in entries)
+    return (f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>'
+            ).encode('utf-8')
+
+
+@pytest.fixture
+def site(serve):
+    """Local site serving whatever `routes` maps a path to; every request path is logged"""
+    routes = {}
+    requested = []
+
+    def do_GET(self):
+        requested.append(self.path)
+        status, body = routes.get(self.path, (404, b''))
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), routes, requested
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-05-01', 1714521600.0),
+    ('2024-05-01T10:30:00+02:00', 1714552200.0),
+    ('2024-05-01T08:30:00Z', 1714552200.0),
+    ('2024-05', 1714521600.0),
+    ('2024', 1704067200.0),
+    ('yesterday', None),
+    (None, None),
+])
+def test_parse_lastmod(value, expected):
+    assert parse_lastmod(value) == expected
+
+
+def test_sitemaps_are_parsed_as_a_stream_in_bounded_memory():
+    count = 50_000
+    xml = _urlset((f'https://shop.example.com/product/{i}', '2024-05-01') for i in range(count))
+    compressed = gzip.compress(xml)
+
+    tracemalloc.start()
+    seen = 0
+    for kind, entry in iter_sitemap(io.BytesIO(compressed)):
+        assert kind == 'url'
+        seen += 1
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert seen == count
+    assert entry == {'loc': f'https://shop.example.com/product/{count - 1}', 'lastmod': '2024-05-01'}
+    # The document is several MB; the parse holds a small, constant fraction of it
+    assert peak < len(xml) / 5
+
+
+def test_sitemap_indexes_plain_text_and_oversized_sitemaps():
+    index = _index([('https://example.com/a.xml.gz', '2024-05-01')])
+    assert list(iter_sitemap(io.BytesIO(index))) == [
+        ('sitemap', {'loc': 'https://example.com/a.xml.gz', 'lastmod': '2024-05-01'})
+    ]
+    assert [entry['loc'] for _, entry in iter_sitemap(io.BytesIO(b'https://example.com/1\n\nhttps://example.com/2\n'))] \
+        == ['https://example.com/1', 'https://example.com/2']
+
+    # 20 MB of whitespace compressed into a few KB
+    bomb = gzip.compress(b'<urlset>' + b' ' * (20 * 1024 * 1024) + b'</urlset>')
+    with pytest.raises(ValueError):
+        list(iter_sitemap(io.BytesIO(bomb), max_bytes=1024 * 1024))
+
+
+def test_robots_rules_are_cached_per_host_until_their_ttl(clock, site):
+    base, routes, requested = site
+    routes['/robots.txt'] = (200, f'User-agent: *\nDisallow: /private/\nCrawl-delay: 2\n'
+                                  f'Sitemap: {base}/sitemap_index.xml\n'.encode('utf-8'))
+    rate_limiter = RateLimiter(rate=100)
+    robots = RobotsCache(fetcher=Fetcher(use_cache=False, rate_limiter=rate_limiter), ttl=3600, error_ttl=60,
+                         clock=clock)
+
+    assert robots.allowed(f'{base}/products/1')
+    assert not robots.allowed(f'{base}/private/orders')
+    assert robots.sitemaps(base) == [f'{base}/sitemap_index.xml']
+    assert requested.count('/robots.txt') == 1
+    # The Crawl-delay reached the fetcher's rate limiter, which won't fetch robots.txt again
+    assert rate_limiter.bucket(base).interval == 2
+    assert not rate_limiter.needs_robots(base)
+
+    clock.now += 3601
+    routes['/robots.txt'] = (404, b'')
+    assert robots.allowed(f'{base}/private/orders')
+    assert requested.count('/robots.txt') == 2
+
+    # A server error disallows everything, but only for error_ttl
+    clock.now += 3601
+    routes['/robots.txt'] = (503, b'')
+    assert not robots.allowed(f'{base}/products/1')
+    clock.now += 30
+    assert not robots.allowed(f'{base}/products/1')
+    assert requested.count('/robots.txt') == 3
+    clock.now += 31
+    routes['/robots.txt'] = (200, b'User-agent: *\nAllow: /\n')
+    assert robots.allowed(f'{base}/products/1')
+    assert robots.metrics()['unreachable'] == 1
+
+
+def test_discovery_feeds_the_frontier_and_skips_what_did_not_change(site, tmp_path):
+    base, routes, requested = site
+    routes['/robots.txt'] = (200, f'User-agent: *\nDisallow: /private/\nSitemap: {base}/sitemap_index.xml\n'
+                             .encode('utf-8'))
+
+    def publish(shoes_lastmod, shoes_entries):
+        routes['/sitemap_index.xml'] = (200, _index([(f'{base}/shoes.xml.gz', shoes_lastmod),
+                                                     (f'{base}/hats.xml', '2024-05-01')]))
+        routes['/shoes.xml.gz'] = (200, gzip.compress(_urlset(shoes_entries)))
+
+    shoes = [(f'{base}/shoes/{i}', '2024-05-01') for i in range(30)]
+    publish('2024-05-01', shoes + [(f'{base}/private/admin', None), ('https://elsewhere.example.com/x', None)])
+    routes['/hats.xml'] = (200, _urlset([(f'{base}/hats/{i}', None) for i in range(10)] + [(f'{base}/shoes/0', None)]))
+
+    frontier_path = str(tmp_path / 'frontier.sqlite')
+    state_path = str(tmp_path / 'sitemaps.sqlite')
+    with URLFrontier(frontier_path) as frontier:
+        stats = SiteDiscovery(frontier, state=state_path, batch_size=7).discover(base + '/')
+        assert stats['sitemaps'] == 3
+        assert stats['new'] == 40
+        assert stats['disallowed'] == 1
+        assert stats['off_site'] == 1
+        assert stats['queued'] == 40
+        assert stats['errors'] == []
+        crawled = [url for url, _ in frontier.pop_many(100)]
+        assert set(crawled) == {f'{base}/shoes/{i}' for i in range(30)} | {f'{base}/hats/{i}' for i in range(10)}
+        for url in crawled:
+            frontier.complete(url)
+
+    # Nothing changed: the child sitemaps are not even downloaded
+    requested.clear()
+    with URLFrontier(frontier_path) as frontier:
+        stats = SiteDiscovery(frontier, state=state_path).discover(base)
+        assert stats['sitemaps'] == 1
+        assert stats['sitemaps_unchanged'] == 2
+        assert stats['queued'] == 0
+        assert '/shoes.xml.gz' not in requested and '/hats.xml' not in requested
+
+    # Two products changed and one was added: only those are queued again
+    shoes[3] = (f'{base}/shoes/3', '2024-06-02')
+    shoes[7] = (f'{base}/shoes/7', '2024-06-02T09:00:00+00:00')
+    publish('2024-06-02', shoes + [(f'{base}/shoes/new', '2024-06-02')])
+    with URLFrontier(frontier_path) as frontier:
+        stats = SiteDiscovery(frontier, state=state_path).discover(base)
+        assert stats['sitemaps'] == 2
+        assert (stats['new'], stats['changed'], stats['unchanged']) == (1, 2, 28)
+        assert {url for url, _ in frontier.pop_many(100)} == \
+            {f'{base}/shoes/3', f'{base}/shoes/7', f'{base}/shoes/new'}
+
+
+def test_discovery_falls_back_to_sitemap_xml_and_reports_broken_sitemaps(site):
+    base, routes, _ = site
+    routes['/sitemap.xml'] = (200, _index([(f'{base}/ok.xml', '2024-05-01'), (f'{base}/gone.xml', '2024-05-01'),
+                                           (f'{base}/broken.xml', '2024-05-01')]))
+    routes['/ok.xml'] = (200, _urlset([(f'{base}/page/{i}', None) for i in range(5)]))
+    routes['/broken.xml'] = (200, _urlset([(f'{base}/page/{i}', None) for i in range(5, 8)])[:-20])
+
+    with URLFrontier() as frontier:
+        # No robots.txt (404): everything is allowed and /sitemap.xml is tried
+        stats = SiteDiscovery(frontier).discover(base)
+        assert stats['sitemaps'] == 4
+        assert [error['sitemap'] for error in stats['errors']] == [f'{base}/gone.xml', f'{base}/broken.xml']
+        # URLs parsed before the broken sitemap was cut off (inside its last <url>) are kept
+        assert len(frontier) == 7
+
+
+def test_site_crawl_starts_from_the_sitemap_instead_of_listing_pages(site, tmp_path):
+    base, routes, requested = site
+    page = '<html><head><title>{0}</title></head><body><h1>{0}</h1><a href="/list?page=2">More</a></body></html>'
+    routes['/'] = (200, page.format('Home').encode('utf-8'))
+    routes['/sitemap.xml'] = (200, _urlset([(f'{base}/product/{i}', '2024-05-01') for i in range(5)]))
+    for i in range(5):
+        routes[f'/product/{i}'] = (200, page.format(f'Product {i}').encode('utf-8'))
+
+    files = crawl_site_to_dir([base + '/'], str(tmp_path / 'out'), max_pages=20,
+                              frontier_path=str(tmp_path / 'frontier.sqlite'), sitemaps=True, max_depth=0)
+    assert len(files) == 6
+    assert {f'/product/{i}' for i in range(5)} <= set(requested)
+    # Listing pages were never needed
+    assert '/list?page=2' not in requested
+
+    # Second run: the sitemap did not change and the frontier is empty
+    assert crawl_site_to_dir([base + '/'], str(tmp_path / 'again'), frontier_path=str(tmp_path / 'frontier.sqlite'),
+                             sitemaps=True, max_depth=0) == []
@@ -0,0 +1,183 @@
+"""
+WARC Archive Tests
+Record round trips, rotation and crash tolerance, capture by the fetcher,
+the batch analyzer and the scraper runner, and offline reprocessing that
+matches the live crawl without touching the network
+"""
+
+import sys
+import os
+import asyncio
+import gzip
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.archive_reprocess import reprocess_archives
+from core.batch_analyzer import BatchAnalyzer
+from core.extraction_spec import compile_spec, save_spec
+from core.fetcher import Fetcher
+from core.record_sinks import read_records
+from core.scraper_generator import ScraperGenerator
+from core.scraper_runner import ScraperRunner
+from core.scraper_runtime import ScraperRuntime
+from core.warc_archive import WARCWriter, archive_files, index_responses, iter_records, iter_responses, read_response
+
+
+@pytest.fixture
+def listing(serve):
+    """Listing of 5 pages of 3 items linked by next links, served gzip-compressed"""
+    requests_seen = []
+
+    def do_GET(self):
+        requests_seen.append(self.path)
+        if self.path == '/robots.txt':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        page = int(self.path.rsplit('=', 1)[1]) if 'page=' in self.path else 1
+        items = ''.join(f'<li><a href="/item/{page}-{i}">Item {page}-{i}</a> {page * 10 + i} EUR</li>'
+                        for i in range(3))
+        next_link = f'<a rel="next" href="/list?page={page + 1}">Next</a>' if page < 5 else ''
+        body = gzip.compress(f'<html><head><title>Page {page}</title></head><body><h1>Catalogue</h1>'
+                             f'<ul class="items">{items}</ul>{next_link}</body></html>'.encode('utf-8'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    return serve(do_GET), requests_seen
+
+
+def _analysis(site):
+    return {
+        'metadata': {'url': f'{site}/list', 'domain': '127.0.0.1'},
+        'semantic_analysis': {'pagination': {'detected': True, 'type': 'next_prev'}},
+        'scraping_strategy': {'selectors': [{'type': 'list_items', 'selector': 'ul.items > li'}]}
+    }
+
+
+def test_records_round_trip_and_rotate(tmp_path):
+    with WARCWriter(str(tmp_path), max_file_size=1) as writer:
+        for i in range(3):
+            writer.write_exchange(
+                f'https://example.com/p/{i}?q=1', 200,
+                {'Content-Type': 'text/html', 'Content-Encoding': 'gzip', 'Set-Cookie': 'a=1'},
+                f'<html>page {i} é</html>'.encode('utf-8'), request_headers={'User-Agent': 'test'}
+            )
+        writer.write_exchange('https://example.com/missing', 404, [('Content-Type', 'text/html')], b'gone')
+        assert writer.metrics()['files'] == 4
+
+    responses = list(iter_responses(str(tmp_path)))
+    assert [response.url for response in responses] == \
+        [f'https://example.com/p/{i}?q=1' for i in range(3)] + ['https://example.com/missing']
+    first = responses[0]
+    assert first.status == 200 and first.reason == 'OK'
+    assert first.body == '<html>page 0 é</html>'.encode('utf-8')
+    # The body was stored decoded, so the archived headers must not claim gzip
+    assert 'Content-Encoding' not in first.headers
+    assert first.headers['Content-Length'] == str(len(first.body))
+    assert first.is_html() and not responses[3].is_html()
+
+    types = [headers['WARC-Type'] for headers, _ in iter_records(archive_files(str(tmp_path))[0])]
+    assert types == ['warcinfo', 'response', 'request']
+    _, request = list(iter_records(archive_files(str(tmp_path))[0]))[2]
+    assert request.startswith(b'GET /p/0?q=1 HTTP/1.1\r\nUser-Agent: test')
+
+
+def test_a_crash_mid_record_leaves_the_earlier_records_readable(tmp_path):
+    writer = WARCWriter(str(tmp_path))
+    writer.write_exchange('https://example.com/1', 200, {}, b'one')
+    first_exchange_end = os.path.getsize(writer.path)
+    writer.write_exchange('https://example.com/2', 200, {}, os.urandom(20000))
+    path = writer.path
+    writer.close()
+
+    # The process died halfway through the second response record
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:first_exchange_end + 10000])
+    assert [response.body for response in iter_responses(path)] == [b'one']
+
+
+def test_responses_are_indexed_and_read_back_one_at_a_time(tmp_path):
+    with WARCWriter(str(tmp_path / 'members')) as writer:
+        for i in range(3):
+            writer.write_exchange(f'https://example.com/{i}', 200, {}, os.urandom(5000) + f'page {i}'.encode())
+    # One gzip member for the whole file, and an uncompressed file, as other tools may leave them
+    records = b''.join(gzip.decompress(open(path, 'rb').read()) for path in archive_files(str(tmp_path / 'members')))
+    (tmp_path / 'whole.warc.gz').write_bytes(gzip.compress(records))
+    (tmp_path / 'plain.warc').write_bytes(records)
+
+    expected = {response.url: response.body for response in iter_responses(str(tmp_path / 'members'))}
+    for source in ('members', 'whole.warc.gz', 'plain.warc'):
+        index = dict(index_responses(str(tmp_path / source)))
+        assert sorted(index) == sorted(expected)
+        # Read out of order, straight from the file
+        for url in reversed(sorted(index)):
+            assert read_response(*index[url]).body == expected[url]
+
+
+def test_fetcher_archives_every_response_it_hands_out(listing, tmp_path):
+    site, _ = listing
+    writer = WARCWriter(str(tmp_path / 'warc'))
+    fetcher = Fetcher(use_cache=False, archive=writer)
+    fetcher.get(f'{site}/list?page=1')
+    fetcher.get_many([f'{site}/list?page=2', f'{site}/list?page=3'])
+    assert fetcher.metrics()['archive']['responses'] == 3
+
+    archived = {response.url: response for response in iter_responses(str(tmp_path / 'warc'))}
+    assert sorted(archived) == [f'{site}/list?page={page}' for page in (1, 2, 3)]
+    assert b'Item 2-0' in archived[f'{site}/list?page=2'].body
+
+
+def test_reprocessing_an_archived_crawl_matches_it_offline(listing, serve, tmp_path):
+    site, requests_seen = listing
+    spec_path = save_spec(compile_spec(_analysis(site), max_pages=10, rate_limit=0), str(tmp_path / 'spec.json'))
+    runtime = ScraperRuntime(spec_path)
+    runtime.fetcher.cache = None
+    runtime.set_archive(str(tmp_path / 'warc'))
+    live = runtime.scrape()
+    assert len(live) == 15
+
+    # Nothing below may reach the site
+    serve.stop(site)
+    requests_seen.clear()
+    for workers in (None, 2):
+        csv_path = str(tmp_path / f'records_{workers}.csv')
+        summary = reprocess_archives(str(tmp_path / 'warc'), analyses_dir=str(tmp_path / f'analyses_{workers}'),
+                                     spec=spec_path, outputs=[csv_path], workers=workers, batch_size=2)
+        assert summary['responses'] == summary['pages'] == 5
+        assert summary['failed'] == 0
+        assert summary['records'] == 15
+        assert [record['text'] for record in read_records(csv_path)] == [record['text'] for record in live]
+        assert len(summary['files']) == 5
+    assert requests_seen == []
+
+
+def test_batch_analyzer_and_runner_capture_their_fetches(listing, tmp_path):
+    site, _ = listing
+    archive = str(tmp_path / 'batch')
+    batch = BatchAnalyzer(concurrency=2, archive=archive)
+
+    async def run():
+        return [analysis async for analysis in batch.analyze([f'{site}/list?page={page}' for page in (1, 2)])]
+
+    assert all('error' not in analysis for analysis in asyncio.run(run()))
+    assert batch.metrics()['archive']['responses'] == 2
+    summary = reprocess_archives(archive, analyses_dir=str(tmp_path / 'analyses'))
+    assert summary['analyzed'] == 2
+
+    scraper_path = ScraperGenerator(_analysis(site)).generate_full_scraper(
+        str(tmp_path / 'shop_scraper.py'), max_pages=10, rate_limit=0
+    )
+    for mode in ('inprocess', 'subprocess'):
+        archive = str(tmp_path / f'warc_{mode}')
+        result = ScraperRunner(scraper_path, mode=mode, cwd=str(tmp_path), archive=archive).run(url=f'{site}/list')
+        assert len(result['records']) == 15
+        pages = [response.url for response in iter_responses(archive) if response.is_html()]
+        assert pages == [f'{site}/list'] + [f'{site}/list?page={page}' for page in range(2, 6)]
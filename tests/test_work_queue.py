@@ -0,0 +1,298 @@
+"""
+Work Queue Tests
+Leases and visibility timeouts, heartbeats, retries, exactly-once completion
+across processes, and a domain crawl fanned out over worker processes
+"""
+
+import sys
+import os
+import multiprocessing
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from core.distributed_crawl import (HANDLERS, PageStream, QueueRateLimiter, collect_records, enqueue_crawl,
+                                    run_distributed_crawl, run_worker)
+from core.extraction_spec import compile_spec, save_spec
+from core.scraper_runtime import ScraperRuntime
+from core.work_queue import QueueWorker, WorkQueue
+
+
+def test_lease_hides_a_task_until_its_visibility_timeout_expires(clock, tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), visibility_timeout=30, clock=clock)
+    queue.put('fetch', {'url': 'https://example.test/1'})
+
+    [first] = queue.lease('worker-a')
+    assert first['payload'] == {'url': 'https://example.test/1'}
+    assert queue.lease('worker-b') == []
+
+    # worker-a stops heartbeating (it died); the task goes to worker-b
+    clock.now += 31
+    [second] = queue.lease('worker-b')
+    assert second['id'] == first['id']
+    assert second['attempts'] == 2
+
+    # worker-a comes back: its lease is gone, so its result is rejected
+    assert not queue.complete(first, {'by': 'a'})
+    assert not queue.heartbeat(first)
+    assert queue.complete(second, {'by': 'b'})
+    assert [result for _, _, result in queue.results()] == [{'by': 'b'}]
+
+    metrics = queue.metrics()
+    assert metrics['expired'] == 1
+    assert metrics['lost_leases'] == 1
+    assert metrics['tasks']['done'] == 1
+
+
+def test_heartbeat_keeps_the_lease(clock, tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), visibility_timeout=10, clock=clock)
+    queue.put('fetch', {'n': 1})
+
+    [task] = queue.lease('worker-a')
+    for _ in range(5):
+        clock.now += 8
+        assert queue.heartbeat(task)
+    assert queue.lease('worker-b') == []
+    assert queue.complete(task, 'ok')
+
+
+def test_failed_tasks_are_retried_with_backoff_then_given_up(clock, tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=3, retry_delay=5, clock=clock)
+    queue.put('fetch', {'n': 1})
+
+    [task] = queue.lease('w')
+    assert queue.fail(task, 'HTTP 503')
+    assert queue.lease('w') == []
+    clock.now += 5
+    [task] = queue.lease('w')
+    queue.fail(task, 'HTTP 503')
+    clock.now += 9
+    assert queue.lease('w') == []
+    clock.now += 1
+    [task] = queue.lease('w')
+    # Third attempt: no retries left
+    queue.fail(task, 'HTTP 503')
+
+    clock.now += 1000
+    assert queue.lease('w') == []
+    assert queue.counts() == {'pending': 0, 'leased': 0, 'done': 0, 'failed': 1}
+    assert queue.failures()[0]['error'] == 'HTTP 503'
+
+    # A lease that runs out on the last attempt fails the task too
+    queue.put('fetch', {'n': 2})
+    for _ in range(3):
+        assert queue.lease('w', visibility_timeout=1)
+        clock.now += 1
+    assert queue.lease('w') == []
+    assert queue.failures()[1]['error'] == 'lease expired'
+
+
+def test_duplicate_keys_are_not_queued_twice(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    ids = queue.put_many('fetch', [{'n': 1}, {'n': 2}, {'n': 1}], keys=['a', 'b', 'a'])
+    assert len(ids) == 2
+    assert queue.put('fetch', {'n': 2}, key='b') is None
+    assert queue.counts()['pending'] == 2
+    assert queue.metrics()['duplicates'] == 2
+
+
+def test_jobs_and_kinds_are_leased_separately(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.put('fetch', 1, job='shop')
+    queue.put('extract', 2, job='shop')
+    queue.put('fetch', 3, job='news')
+
+    assert [task['payload'] for task in queue.lease('w', count=5, job='news')] == [3]
+    assert [task['payload'] for task in queue.lease('w', count=5, kinds=['extract'])] == [2]
+    assert not queue.is_finished('shop')
+    assert queue.counts('shop')['pending'] == 1
+
+
+def test_worker_heartbeats_a_slow_task_so_nobody_else_takes_it(tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    queue = WorkQueue(path, visibility_timeout=0.3)
+    queue.put('slow', {'seconds': 1.0})
+    other = WorkQueue(path, visibility_timeout=0.3)
+    stolen = []
+
+    def slow(payload, worker):
+        for _ in range(5):
+            time.sleep(payload['seconds'] / 5)
+            stolen.extend(other.lease('thief'))
+        return 'finished'
+
+    counts = QueueWorker(queue, {'slow': slow}, poll_interval=0.05).run()
+    assert counts == {'completed': 1, 'failed': 0, 'lost': 0}
+    assert stolen == []
+
+
+def test_handlers_spawn_follow_up_tasks_in_the_same_job(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.put('count', {'n': 3}, job='countdown')
+
+    def count(payload, worker):
+        if payload['n'] > 0:
+            worker.spawn('count', {'n': payload['n'] - 1})
+        return payload['n']
+
+    QueueWorker(queue, {'count': count}, job='countdown', poll_interval=0.05).run()
+    assert [result for _, _, result in queue.results('countdown')] == [3, 2, 1, 0]
+
+
+def _square_worker(path, worker_id):
+    def square(payload, worker):
+        time.sleep(0.002)
+        return {'square': payload * payload, 'worker': worker.worker_id}
+    QueueWorker(WorkQueue(path, journal_mode='wal'), {'square': square}, worker_id=worker_id,
+                batch=4, poll_interval=0.05).run()
+
+
+def test_worker_processes_complete_every_task_exactly_once(tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    with WorkQueue(path) as queue:
+        queue.put_many('square', list(range(200)))
+
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_square_worker, args=(path, f'w{i}')) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    with WorkQueue(path) as queue:
+        results = [result for _, _, result in queue.results()]
+        assert sorted(result['square'] for result in results) == [n * n for n in range(200)]
+        assert queue.counts() == {'pending': 0, 'leased': 0, 'done': 200, 'failed': 0}
+        workers = queue.workers()
+        assert len(workers) == 4
+        assert sum(worker['completed'] for worker in workers) == 200
+        assert len({result['worker'] for result in results}) > 1
+
+
+def test_workers_pace_a_host_through_one_shared_schedule(clock, tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    # Two workers' connections, each with its own limiter at 2 requests per second
+    limiters = [QueueRateLimiter(WorkQueue(path, clock=clock), rate=2.0, respect_robots=False) for _ in range(2)]
+    url = 'http://example.test/page'
+
+    delays = [limiters[i % 2].bucket(url).reserve() for i in range(4)]
+    assert delays == [0.0, 0.5, 1.0, 1.5]
+    assert limiters[0].bucket('http://other.test/').reserve() == 0.0
+
+    # A Retry-After seen by one worker holds the other back too
+    clock.now += 10
+    limiters[0].retry_after(url, '30')
+    assert limiters[1].bucket(url).reserve() == 30.0
+
+
+def test_distributed_workers_together_keep_the_spec_rate(listing, shop_analysis, tmp_path):
+    spec_path = save_spec(_spec(shop_analysis('numbered'), rate_limit=0.1), str(tmp_path / 'spec.json'))
+    result = run_distributed_crawl(spec_path, str(tmp_path / 'queue.sqlite'), workers=3, timeout=120,
+                                   cwd=str(tmp_path))
+    assert len(result['records']) == 32
+
+    # Page and robots.txt requests of all three workers, 0.1s apart as for a single process: the shared
+    # schedule is exact, arrival times carry each process' scheduling jitter
+    times = sorted(listing['times'])
+    assert len(times) >= 12
+    assert min(later - earlier for earlier, later in zip(times, times[1:])) >= 0.07
+    assert (times[-1] - times[0]) / (len(times) - 1) >= 0.095
+
+
+@pytest.fixture
+def listing(shop):
+    """The shop's listing at 8 pages of 4 items; returns its state"""
+    _, state = shop
+    state.update(pages=8, items=4)
+    return state
+
+
+def _spec(analysis, rate_limit=0):
+    return compile_spec(analysis, max_pages=12, rate_limit=rate_limit)
+
+
+@pytest.mark.parametrize('pagination', ['numbered', 'next_links'])
+def test_distributed_crawl_matches_a_single_process_crawl(listing, shop_analysis, tmp_path, pagination):
+    spec_path = save_spec(_spec(shop_analysis(pagination)), str(tmp_path / 'spec.json'))
+    expected = ScraperRuntime(spec_path).scrape()
+    assert len(expected) == 32
+
+    queue_path = str(tmp_path / 'queue.sqlite')
+    csv_path = str(tmp_path / 'items.csv')
+    result = run_distributed_crawl(spec_path, queue_path, workers=3, outputs=[csv_path], timeout=120,
+                                   cwd=str(tmp_path))
+    assert not result['timed_out']
+    assert result['records'] == expected
+    assert len(result['dataframe']) == 32
+    assert os.path.getsize(csv_path) > 0
+    assert result['metrics']['failed_pages'] == []
+    # Numbered: the 8 pages and a window of 3 empty ones past them
+    assert result['metrics']['queue']['tasks']['done'] == (11 if pagination == 'numbered' else 8)
+
+
+def test_rerunning_a_crawl_job_does_not_fetch_finished_pages_again(listing, shop_analysis, tmp_path):
+    spec = _spec(shop_analysis('numbered'))
+    queue_path = str(tmp_path / 'queue.sqlite')
+    job = enqueue_crawl(queue_path, spec, job='shop')
+    # One worker does three pages, then the process "dies"
+    QueueWorker(queue_path, HANDLERS, job=job).run(max_tasks=3)
+
+    assert enqueue_crawl(queue_path, spec, job='shop') == 'shop'
+    with WorkQueue(queue_path) as queue:
+        # Pages 1-4 queued up front, pages 5-7 by the pages done
+        assert queue.counts('shop') == {'pending': 4, 'leased': 0, 'done': 3, 'failed': 0}
+    assert run_worker(queue_path, job='shop')['completed'] == 9
+    assert len(collect_records(queue_path, 'shop')) == 32
+
+
+def test_a_short_listing_costs_one_window_of_requests_past_its_end(shop, shop_analysis, tmp_path):
+    _, state = shop
+    state['pages'] = 3
+    spec = compile_spec(shop_analysis('numbered'), max_pages=40, rate_limit=0)
+    spec_path = save_spec(spec, str(tmp_path / 'spec.json'))
+
+    result = run_distributed_crawl(spec_path, str(tmp_path / 'queue.sqlite'), workers=2, timeout=120,
+                                   cwd=str(tmp_path))
+    assert len(result['records']) == 9
+    # Pages 1-3 and a window of two empty pages, not all 40
+    assert sorted(set(state['requests'])) == [1, 2, 3, 4, 5]
+    assert result['metrics']['queue']['tasks']['done'] == 5
+
+
+def test_pages_are_handed_out_in_order_while_the_crawl_runs(listing, shop_analysis, tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite')
+    job = enqueue_crawl(queue_path, _spec(shop_analysis('numbered')), job='shop')
+    stream = PageStream(queue_path, job)
+    assert stream.poll() == []
+
+    QueueWorker(queue_path, HANDLERS, job=job).run(max_tasks=3)
+    first = stream.poll()
+    assert [record['text'] for record in first][::4] == ['Item 1-010 EUR', 'Item 2-020 EUR', 'Item 3-030 EUR']
+    assert not stream.ended
+
+    run_worker(queue_path, job=job)
+    assert len(stream.poll()) == 20
+    assert stream.ended and stream.pages == 8
+    assert first + collect_records(queue_path, job)[12:] == collect_records(queue_path, job)
+
+
+def test_distributed_crawl_takes_the_first_page_and_reruns_incrementally(listing, shop_analysis, tmp_path):
+    spec_path = save_spec(_spec(shop_analysis('next_links')), str(tmp_path / 'spec.json'))
+    state_path = str(tmp_path / 'pages.sqlite')
+    first_page = b'<html><body><ul class="items"><li>Cached item</li></ul>' \
+                 b'<a rel="next" href="/list?page=2">Next</a></body></html>'
+
+    first = run_distributed_crawl(spec_path, str(tmp_path / 'first.sqlite'), workers=2, timeout=120,
+                                  cwd=str(tmp_path), html=first_page, incremental=state_path)
+    assert [record['text'] for record in first['records']][:2] == ['Cached item', 'Item 2-020 EUR']
+    assert len(first['records']) == 29
+    assert first['changes']['pages']['new'] == 8
+
+    again = run_distributed_crawl(spec_path, str(tmp_path / 'again.sqlite'), workers=2, timeout=120,
+                                  cwd=str(tmp_path), html=first_page, incremental=state_path)
+    assert again['records'] == []
+    # Unchanged pages still lead on to the next ones
+    assert again['changes']['pages'] == {'new': 0, 'changed': 0, 'unchanged': 8, 'not_modified': 0}
+    assert again['changes']['records']['unchanged'] == 29